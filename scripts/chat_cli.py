@@ -170,6 +170,7 @@ def main():
     
     # EVO-TR başlat
     try:
+        # Kalıcı TTT cache EVO_TTT_CACHE_PATH ile açılır (web sunucusuyla paylaşılır)
         evo = EvoTR(verbose=False)
         feedback_db = FeedbackDatabase("./data/feedback.db")
     except Exception as e:
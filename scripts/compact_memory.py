@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+EVO-TR Memory Compaction
+========================
+ChromaDB hafıza collection'ındaki yakın kopyaları birleştirir ve eski,
+az kullanılan konuşmaları siler.
+
+Kullanım:
+    # Önce ne yapılacağını gör
+    python scripts/compact_memory.py --dry-run
+
+    # Sadece kopya temizliği (varsayılan: yaşa göre silme yok)
+    python scripts/compact_memory.py --threshold 0.97
+
+    # Konuşmalarda 30 günden eski, az tekrarlananları da kalıcı olarak sil
+    python scripts/compact_memory.py --type conversation --max-age-days 30 --dry-run
+    python scripts/compact_memory.py --type conversation --max-age-days 30
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+
+def print_report(report) -> None:
+    """Sıkıştırma raporunu yazdır."""
+    title = "🔍 Deneme (değişiklik yapılmadı)" if report.dry_run else "✅ Sıkıştırma tamamlandı"
+    print(f"\n{title}: {report.collection}")
+    print(f"  • Belge: {report.before_count} → {report.after_count} (-{report.removed})")
+    print(f"  • Kopya kümesi: {report.clusters} ({report.duplicates_removed} kopya silindi)")
+    print(f"  • Süresi dolan: {report.expired_removed}")
+    print(f"  • Metadata güncellenen: {report.merged_updated}")
+    print(f"  • Arama gecikmesi: {report.before_latency_ms:.2f}ms → {report.after_latency_ms:.2f}ms")
+    print(f"  • Süre: {report.elapsed:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EVO-TR hafıza sıkıştırma")
+    # Varsayılanlar EvoTR'ın konuşmaları kaydettiği hafıza ile aynı
+    parser.add_argument("--persist-path", default="./data/chromadb/evo_main", help="ChromaDB dizini")
+    parser.add_argument("--collection", default="conversations", help="Collection adı")
+    parser.add_argument("--type", dest="memory_type", default=None,
+                        help="Sadece bu hafıza tipini sıkıştır (varsayılan: tümü)")
+    parser.add_argument("--threshold", type=float, default=0.95, help="Yakın kopya benzerlik eşiği")
+    parser.add_argument("--neighbors", type=int, default=10, help="Belge başına incelenecek komşu")
+    parser.add_argument("--max-age-days", type=float, default=0,
+                        help="Bundan eski, az tekrarlanan belgeleri kalıcı olarak sil (0 = kapalı, varsayılan)")
+    parser.add_argument("--keep-if-merged", type=int, default=3,
+                        help="Bu kadar tekrarlanan belgeler yaşlansa da kalır")
+    parser.add_argument("--batch-size", type=int, default=500, help="Okuma/yazma batch boyutu")
+    parser.add_argument("--dry-run", action="store_true", help="Değişiklik yapmadan raporla")
+    parser.add_argument("--json", action="store_true", help="Raporu JSON olarak yazdır")
+
+    args = parser.parse_args()
+
+    from src.memory.chromadb_handler import MemoryHandler
+    from src.memory.compaction import CompactionPolicy, MemoryCompactor
+
+    policy = CompactionPolicy(
+        similarity_threshold=args.threshold,
+        neighbors=args.neighbors,
+        max_age_days=args.max_age_days or None,
+        keep_if_merged=args.keep_if_merged,
+        memory_type=args.memory_type,
+        batch_size=args.batch_size
+    )
+
+    handler = MemoryHandler(persist_path=args.persist_path, collection_name=args.collection)
+    report = MemoryCompactor(handler, policy).run(dry_run=args.dry_run)
+    handler.close()
+
+    if args.json:
+        print(json.dumps(report.to_dict(), ensure_ascii=False, indent=2))
+    else:
+        print_report(report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
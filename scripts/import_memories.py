@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+EVO-TR Memory Import
+====================
+JSONL dosyalarını uzun süreli hafızaya (ChromaDB) toplu aktarır.
+
+Desteklenen satır formatları:
+    {"messages": [{"role": "user", ...}, {"role": "assistant", ...}]}   # eğitim verisi
+    {"user_input": "...", "assistant_response": "...", "intent": "..."}  # konuşma logları
+    {"instruction": "...", "output": "..."}                              # instruction verisi
+    {"text": "...", "metadata": {...}, "type": "fact"}                   # düz metin
+
+Kullanım:
+    # Eğitim verisini içe aktar
+    python scripts/import_memories.py data/training/history/*.jsonl
+
+    # Konuşma loglarını (sıkıştırılmış dahil) farklı collection'a aktar
+    python scripts/import_memories.py logs/ --collection evo_logs --type conversation
+
+    # Deneme: ilk 1000 satır, 512'lik batch
+    python scripts/import_memories.py data/training --limit 1000 --batch-size 512
+"""
+
+import argparse
+import gzip
+import itertools
+import json
+import sys
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+
+def iter_files(paths: List[str]) -> Iterator[Path]:
+    """Dosya ve dizinlerden .jsonl / .jsonl.gz dosyalarını sırala."""
+    for raw in paths:
+        path = Path(raw)
+        if path.is_dir():
+            yield from sorted(p for p in path.rglob("*") if p.name.endswith((".jsonl", ".jsonl.gz")))
+        elif path.exists():
+            yield path
+        else:
+            print(f"⚠️ Bulunamadı: {path}")
+
+
+def iter_lines(path: Path) -> Iterator[str]:
+    """Dosyayı satır satır oku (gzip destekli, tamamını belleğe almadan)."""
+    opener = gzip.open if path.suffix == ".gz" else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield line
+
+
+def _conversation_text(user: str, assistant: str) -> str:
+    # MemoryHandler.add_conversation ile aynı format
+    return f"Kullanıcı: {user}\nAsistan: {assistant}"
+
+
+def record_to_item(
+    record: Dict[str, Any],
+    default_type: Optional[str],
+    text_field: str
+) -> Optional[Tuple[str, Dict[str, Any], Optional[str]]]:
+    """
+    JSONL kaydını (text, metadata, memory_type) demetine çevir.
+
+    Returns:
+        Demet veya tanınmayan kayıtlar için None
+    """
+    if "messages" in record:
+        messages = [m for m in record["messages"] if m.get("role") in ("user", "assistant")]
+        users = [m["content"] for m in messages if m["role"] == "user"]
+        assistants = [m["content"] for m in messages if m["role"] == "assistant"]
+        if not users or not assistants:
+            return None
+        text = "\n".join(
+            f"{'Kullanıcı' if m['role'] == 'user' else 'Asistan'}: {m['content']}" for m in messages
+        )
+        meta = {"user_message": users[0][:500], "assistant_response": assistants[-1][:500]}
+        return text, meta, default_type or "conversation"
+
+    if "user_input" in record and "assistant_response" in record:
+        if record.get("success") is False:
+            return None
+        meta = {
+            "user_message": record["user_input"][:500],
+            "assistant_response": record["assistant_response"][:500],
+            "intent": record.get("intent"),
+            "session_id": record.get("session_id")
+        }
+        text = _conversation_text(record["user_input"], record["assistant_response"])
+        return text, meta, default_type or "conversation"
+
+    if "instruction" in record and "output" in record:
+        question = record["instruction"]
+        if record.get("input"):
+            question = f"{question}\n{record['input']}"
+        return _conversation_text(question, record["output"]), {}, default_type or "conversation"
+
+    if record.get(text_field):
+        meta = record.get("metadata") if isinstance(record.get("metadata"), dict) else {}
+        return record[text_field], dict(meta), default_type or record.get("type") or "fact"
+
+    return None
+
+
+def iter_items(
+    files: List[Path],
+    default_type: Optional[str],
+    text_field: str,
+    counters: Dict[str, int]
+) -> Iterator[Tuple[str, Dict[str, Any], Optional[str]]]:
+    """Tüm dosyalardaki kayıtları akış halinde hafıza girdisine çevir."""
+    for path in files:
+        for line in iter_lines(path):
+            counters["lines"] += 1
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                counters["invalid"] += 1
+                continue
+
+            item = record_to_item(record, default_type, text_field) if isinstance(record, dict) else None
+            if item is None:
+                counters["unrecognized"] += 1
+                continue
+
+            text, meta, memory_type = item
+            meta["source"] = path.name
+            yield text, meta, memory_type
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EVO-TR JSONL -> ChromaDB toplu hafıza aktarımı")
+    parser.add_argument("paths", nargs="+", help="JSONL dosyaları veya dizinler")
+    parser.add_argument("--persist-path", default="./data/chromadb", help="ChromaDB dizini")
+    parser.add_argument("--collection", default="evo_memory", help="Collection adı")
+    parser.add_argument("--type", dest="memory_type", default=None,
+                        help="Hafıza tipi (varsayılan: formattan çıkarılır)")
+    parser.add_argument("--text-field", default="text", help="Düz metin kayıtlarında metin alanı")
+    parser.add_argument("--batch-size", type=int, default=256, help="Encode/yazma batch boyutu")
+    parser.add_argument("--limit", type=int, default=None, help="En fazla bu kadar kayıt aktar")
+    parser.add_argument("--no-dedupe", action="store_true", help="İçerik hash'i ile tekilleştirme yapma")
+    parser.add_argument("--quiet", action="store_true", help="Sessiz mod")
+
+    args = parser.parse_args()
+    verbose = not args.quiet
+
+    files = list(iter_files(args.paths))
+    if not files:
+        print("❌ İçe aktarılacak dosya yok")
+        return 1
+
+    from src.memory.chromadb_handler import MemoryHandler
+
+    handler = MemoryHandler(persist_path=args.persist_path, collection_name=args.collection)
+
+    counters = {"lines": 0, "invalid": 0, "unrecognized": 0}
+    items = iter_items(files, args.memory_type, args.text_field, counters)
+    if args.limit:
+        items = itertools.islice(items, args.limit)
+
+    def report(stats: Dict[str, Any]) -> None:
+        if verbose:
+            print(f"  📥 {stats['added']:>8} eklendi | {stats['duplicates']:>6} tekrar | "
+                  f"{stats['docs_per_second']:.0f} belge/sn", end="\r", flush=True)
+
+    if verbose:
+        print(f"📂 {len(files)} dosya -> {args.collection} ({args.persist_path})")
+
+    stats = handler.add_memories_bulk(
+        items,
+        memory_type=args.memory_type or "fact",
+        batch_size=args.batch_size,
+        deduplicate=not args.no_dedupe,
+        progress=report
+    )
+
+    if verbose:
+        print()
+        print(f"\n✅ Aktarım tamamlandı")
+        print(f"  • Satır: {counters['lines']} (geçersiz: {counters['invalid']}, "
+              f"tanınmayan: {counters['unrecognized']})")
+        print(f"  • Eklenen: {stats['added']}")
+        print(f"  • Tekrar: {stats['duplicates']}")
+        print(f"  • Süre: {stats['elapsed']:.1f}s ({stats['docs_per_second']} belge/sn)")
+        print(f"  • Toplam belge: {handler.collection.count()}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
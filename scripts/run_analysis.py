@@ -13,6 +13,9 @@ Kullanım:
     
     # Son N gün için
     python scripts/run_analysis.py --days 7
+    
+    # Analiz sonrası hafızayı da sıkıştır
+    python scripts/run_analysis.py --compact-memory --max-age-days 30
 """
 
 import argparse
@@ -28,14 +31,18 @@ from src.lifecycle.async_processor import create_async_processor
 from src.lifecycle.logger import create_logger
 
 
-def run_analysis(date: str, verbose: bool = True):
+def run_analysis(date: str, verbose: bool = True, compaction_handler=None, compaction_policy=None):
     """Tek bir gün için analiz çalıştır"""
     if verbose:
         print(f"\n{'='*50}")
         print(f"📊 Running analysis for {date}")
         print('='*50)
     
-    processor = create_async_processor()
+    # Hafıza sadece sıkıştırılır; çıkarılan bilgiler hafızaya yazılmaz
+    processor = create_async_processor(
+        compaction_policy=compaction_policy,
+        compaction_handler=compaction_handler
+    )
     results = processor.run_full_analysis(date)
     
     if verbose:
@@ -55,17 +62,28 @@ def run_analysis(date: str, verbose: bool = True):
             print(f"\n📚 Training Suggestions:")
             for sug in results['training_suggestions']:
                 print(f"  [{sug['priority']}/5] {sug['category']}: {sug['reason']}")
+        
+        compaction = results.get("memory_compaction")
+        if compaction:
+            print(f"\n🗜️ Memory Compaction:")
+            print(f"  • Documents: {compaction['before_count']} → {compaction['after_count']}")
+            print(f"  • Duplicates removed: {compaction['duplicates_removed']}")
+            print(f"  • Expired removed: {compaction['expired_removed']}")
+            print(f"  • Search latency: {compaction['before_latency_ms']:.2f}ms → "
+                  f"{compaction['after_latency_ms']:.2f}ms")
     
     return results
 
 
-def run_multi_day_analysis(days: int, verbose: bool = True):
+def run_multi_day_analysis(days: int, verbose: bool = True, compaction_handler=None, compaction_policy=None):
     """Birden fazla gün için analiz çalıştır"""
     all_results = []
     
     for i in range(days):
         date = (datetime.now() - timedelta(days=i)).strftime("%Y-%m-%d")
-        results = run_analysis(date, verbose)
+        # Sıkıştırma gün başına değil, tüm günler işlendikten sonra bir kez
+        policy = compaction_policy if i == days - 1 else None
+        results = run_analysis(date, verbose, compaction_handler, policy)
         all_results.append(results)
     
     return all_results
@@ -76,23 +94,40 @@ def main():
     parser.add_argument("--date", type=str, help="Analiz tarihi (YYYY-MM-DD)")
     parser.add_argument("--days", type=int, help="Son N gün için analiz")
     parser.add_argument("--quiet", action="store_true", help="Sessiz mod")
+    parser.add_argument("--compact-memory", action="store_true",
+                        help="Analiz sonrası hafızayı sıkıştır")
+    # Varsayılanlar EvoTR'ın konuşmaları kaydettiği hafıza ile aynı
+    parser.add_argument("--memory-path", type=str, default="./data/chromadb/evo_main", help="ChromaDB dizini")
+    parser.add_argument("--collection", type=str, default="conversations", help="Hafıza collection adı")
+    parser.add_argument("--max-age-days", type=float, default=0,
+                        help="Sıkıştırmada bundan eski, az tekrarlanan konuşmaları kalıcı olarak sil "
+                             "(0 = kapalı, varsayılan)")
     
     args = parser.parse_args()
     
     verbose = not args.quiet
     
+    compaction_handler = None
+    compaction_policy = None
+    if args.compact_memory:
+        from src.memory.chromadb_handler import MemoryHandler
+        from src.memory.compaction import CompactionPolicy
+        
+        compaction_handler = MemoryHandler(persist_path=args.memory_path, collection_name=args.collection)
+        compaction_policy = CompactionPolicy(max_age_days=args.max_age_days or None)
+    
     if verbose:
         print("🌙 EVO-TR Night Analysis Started")
         print(f"⏰ Time: {datetime.now().isoformat()}")
     
     try:
         if args.days:
-            results = run_multi_day_analysis(args.days, verbose)
+            results = run_multi_day_analysis(args.days, verbose, compaction_handler, compaction_policy)
             if verbose:
                 print(f"\n✅ Completed analysis for {args.days} days")
         else:
             date = args.date or datetime.now().strftime("%Y-%m-%d")
-            results = run_analysis(date, verbose)
+            results = run_analysis(date, verbose, compaction_handler, compaction_policy)
             if verbose:
                 print(f"\n✅ Analysis completed")
         
@@ -5,5 +5,8 @@ LoRA adapter yönetimi.
 """
 
 from .lora_manager import LoRAManager, AdapterInfo
+from .adapter_pool import SharedAdapterPool
+from .adapter_cache import AdapterCache
+from .prefetcher import AdapterPrefetcher
 
-__all__ = ["LoRAManager", "AdapterInfo"]
+__all__ = ["LoRAManager", "AdapterInfo", "SharedAdapterPool", "AdapterCache", "AdapterPrefetcher"]
@@ -0,0 +1,284 @@
+"""
+EVO-TR: Adapter Cache
+
+Bellek bütçeli adapter cache'i ve değiştirilebilir eviction politikaları.
+"""
+
+from typing import Dict, List, Optional, Any, Callable, Union
+from pathlib import Path
+from dataclasses import dataclass, field
+import time
+
+
+def estimate_safetensors_bytes(path: Union[str, Path]) -> int:
+    """
+    Safetensors dosya(lar)ının toplam boyutu.
+
+    Args:
+        path: .safetensors dosyası veya bu dosyaları içeren dizin
+
+    Returns:
+        Byte cinsinden toplam boyut (bulunamazsa 0)
+    """
+    path = Path(path)
+    if path.is_file():
+        return path.stat().st_size
+    if path.is_dir():
+        return sum(f.stat().st_size for f in path.glob("*.safetensors"))
+    return 0
+
+
+@dataclass
+class CacheRecord:
+    """Cache'deki tek bir adapter kaydı."""
+    name: str
+    value: Any
+    size_bytes: int
+    load_time: float = 0.0
+    hits: int = 0
+    last_access: float = field(default_factory=time.monotonic)
+
+
+class EvictionPolicy:
+    """Eviction politikası arayüzü: en düşük skorlu kayıt çıkarılır."""
+
+    name = "base"
+
+    def score(self, record: CacheRecord) -> float:
+        raise NotImplementedError
+
+    def choose_victim(self, candidates: List[CacheRecord]) -> CacheRecord:
+        """Çıkarılacak kaydı seç."""
+        return min(candidates, key=self.score)
+
+
+class LRUPolicy(EvictionPolicy):
+    """En uzun süredir kullanılmayanı çıkar."""
+
+    name = "lru"
+
+    def score(self, record: CacheRecord) -> float:
+        return record.last_access
+
+
+class LFUPolicy(EvictionPolicy):
+    """En az kullanılanı çıkar (eşitlikte LRU)."""
+
+    name = "lfu"
+
+    def score(self, record: CacheRecord) -> float:
+        return record.hits
+
+    def choose_victim(self, candidates: List[CacheRecord]) -> CacheRecord:
+        return min(candidates, key=lambda r: (r.hits, r.last_access))
+
+
+class CostAwarePolicy(EvictionPolicy):
+    """
+    Yeniden yükleme maliyeti düşük olanı çıkar.
+
+    Skor = load_time * istek frekansı / boyut
+    Yani sık istenen, yavaş yüklenen ve küçük adapter'lar cache'de kalır.
+    """
+
+    name = "cost"
+
+    def __init__(self, frequency_fn: Optional[Callable[[str], float]] = None):
+        """
+        Args:
+            frequency_fn: Adapter adı -> istek frekansı (örn. router intent sayıları).
+                Verilmezse cache hit sayısı kullanılır.
+        """
+        self.frequency_fn = frequency_fn
+
+    def score(self, record: CacheRecord) -> float:
+        if self.frequency_fn is not None:
+            frequency = self.frequency_fn(record.name)
+        else:
+            frequency = record.hits
+        return max(record.load_time, 1e-3) * (frequency + 1) / max(record.size_bytes, 1)
+
+    def choose_victim(self, candidates: List[CacheRecord]) -> CacheRecord:
+        return min(candidates, key=lambda r: (self.score(r), r.last_access))
+
+
+EVICTION_POLICIES = {
+    "lru": LRUPolicy,
+    "lfu": LFUPolicy,
+    "cost": CostAwarePolicy,
+}
+
+
+class AdapterCache:
+    """
+    Bellek bütçeli adapter cache'i.
+
+    Özellikler:
+    - Byte cinsinden bütçe (safetensors boyutlarından)
+    - Değiştirilebilir eviction (lru, lfu, cost)
+    - Hit/miss/eviction sayaçları
+    - Eviction callback (örn. pool'dan ağırlıkları silmek için)
+    """
+
+    def __init__(
+        self,
+        max_bytes: Optional[int] = None,
+        policy: Union[str, EvictionPolicy] = "lru",
+        on_evict: Optional[Callable[[str, Any], None]] = None
+    ):
+        """
+        AdapterCache başlat.
+
+        Args:
+            max_bytes: Bellek bütçesi (None = sınırsız)
+            policy: Politika adı ("lru", "lfu", "cost") veya EvictionPolicy
+            on_evict: Kayıt çıkarıldığında çağrılır (name, value)
+        """
+        if isinstance(policy, str):
+            if policy not in EVICTION_POLICIES:
+                raise ValueError(f"Bilinmeyen eviction politikası: {policy}")
+            policy = EVICTION_POLICIES[policy]()
+
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.on_evict = on_evict
+        self._records: Dict[str, CacheRecord] = {}
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "rejected": 0}
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._records
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def keys(self) -> List[str]:
+        """Cache'deki adapter adları."""
+        return list(self._records.keys())
+
+    @property
+    def total_bytes(self) -> int:
+        """Cache'deki kayıtların toplam boyutu."""
+        return sum(r.size_bytes for r in self._records.values())
+
+    def get(self, name: str) -> Optional[Any]:
+        """Cache'den al (hit/miss sayılır)."""
+        record = self._records.get(name)
+        if record is None:
+            self.stats["misses"] += 1
+            return None
+
+        record.hits += 1
+        record.last_access = time.monotonic()
+        self.stats["hits"] += 1
+        return record.value
+
+    def peek(self, name: str) -> Optional[CacheRecord]:
+        """Sayaçları değiştirmeden kaydı getir."""
+        return self._records.get(name)
+
+    def put(
+        self,
+        name: str,
+        value: Any,
+        size_bytes: int,
+        load_time: float = 0.0,
+        protect: Optional[List[str]] = None
+    ) -> List[str]:
+        """
+        Cache'e ekle, bütçe aşılırsa eviction uygula.
+
+        Args:
+            name: Adapter adı
+            value: Saklanacak nesne
+            size_bytes: Kaydın bellek maliyeti
+            load_time: Yükleme süresi (cost-aware politika için)
+            protect: Çıkarılmaması gereken adapter adları (örn. aktif adapter)
+
+        Returns:
+            Çıkarılan adapter adları
+        """
+        if name in self._records:
+            self._drop(name, notify=False)
+
+        if self.max_bytes is not None and size_bytes > self.max_bytes:
+            self.stats["rejected"] += 1
+            return []
+
+        evicted = self._make_room(size_bytes, protected=set(protect or []))
+
+        self._records[name] = CacheRecord(
+            name=name,
+            value=value,
+            size_bytes=size_bytes,
+            load_time=load_time
+        )
+        return evicted
+
+    def enforce_budget(self, protect: Optional[List[str]] = None) -> List[str]:
+        """
+        Bütçeyi tekrar uygula (örn. korunan adapter aktif olmaktan çıkınca).
+
+        Returns:
+            Çıkarılan adapter adları
+        """
+        return self._make_room(0, protected=set(protect or []))
+
+    def _make_room(self, size_bytes: int, protected: set) -> List[str]:
+        """Yeni kayıt sığana kadar politika ile kayıt çıkar."""
+        evicted = []
+        if self.max_bytes is None:
+            return evicted
+
+        while self.total_bytes + size_bytes > self.max_bytes:
+            candidates = [r for r in self._records.values() if r.name not in protected]
+            if not candidates:
+                break
+            victim = self.policy.choose_victim(candidates)
+            self._drop(victim.name, notify=True)
+            self.stats["evictions"] += 1
+            evicted.append(victim.name)
+
+        return evicted
+
+    def _drop(self, name: str, notify: bool) -> None:
+        """Kaydı sil ve (isteğe bağlı) callback'i çağır."""
+        record = self._records.pop(name)
+        if notify and self.on_evict is not None:
+            self.on_evict(record.name, record.value)
+
+    def remove(self, name: str) -> bool:
+        """Kaydı çıkar (eviction sayılmaz)."""
+        if name not in self._records:
+            return False
+        self._drop(name, notify=True)
+        return True
+
+    def clear(self) -> None:
+        """Tüm kayıtları çıkar."""
+        for name in list(self._records.keys()):
+            self._drop(name, notify=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Cache istatistikleri."""
+        total = self.stats["hits"] + self.stats["misses"]
+        hit_rate = self.stats["hits"] / total if total > 0 else 0
+
+        return {
+            "policy": self.policy.name,
+            "entries": len(self._records),
+            "size_mb": round(self.total_bytes / (1024 * 1024), 2),
+            "max_mb": round(self.max_bytes / (1024 * 1024), 2) if self.max_bytes is not None else None,
+            "hits": self.stats["hits"],
+            "misses": self.stats["misses"],
+            "hit_rate": round(hit_rate * 100, 2),
+            "evictions": self.stats["evictions"],
+            "rejected": self.stats["rejected"],
+            "adapters": {
+                r.name: {
+                    "size_mb": round(r.size_bytes / (1024 * 1024), 2),
+                    "hits": r.hits,
+                    "load_time": round(r.load_time, 3)
+                }
+                for r in self._records.values()
+            }
+        }
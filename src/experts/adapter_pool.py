@@ -0,0 +1,224 @@
+"""
+EVO-TR: Shared Adapter Pool
+
+Tek base model üzerinde çoklu LoRA adapter yönetimi.
+Base ağırlıklar bir kez yüklenir, her adapter için sadece LoRA A/B
+matrisleri tutulur ve adapter değişimi bu matrislerin modele
+yerleştirilmesiyle (pointer swap) yapılır.
+"""
+
+from typing import Dict, List, Optional, Any
+from pathlib import Path
+import json
+import threading
+import mlx.core as mx
+from mlx.utils import tree_flatten
+from mlx_lm.tuner.utils import linear_to_lora_layers
+
+
+LORA_PARAM_SUFFIXES = ("lora_a", "lora_b")
+
+
+def read_adapter_config(adapter_path: str) -> Dict[str, Any]:
+    """Adapter dizinindeki adapter_config.json'u oku."""
+    config_file = Path(adapter_path) / "adapter_config.json"
+    if not config_file.exists():
+        return {}
+    with open(config_file, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class SharedAdapterPool:
+    """
+    Paylaşımlı base model + adapter başına LoRA ağırlıkları.
+
+    Akış:
+    1. Base modelin linear katmanları bir kez LoRA katmanına çevrilir
+       (scale=1.0, adapter scale'i lora_b içine katlanır)
+    2. Her adapter için sadece A/B matrisleri bellekte tutulur
+    3. activate() ile ağırlıklar modele yerleştirilir; None = base model
+       (tüm lora_b sıfır → LoRA katkısı yok)
+
+    Model paylaşıldığı için aktivasyon `lock` ile korunur; decode backend'i
+    lock'u tutarak kendi adapter'ını aktif eder ve adımı bitirir, böylece
+    istek yolundaki activate() süren bir adımın ağırlıklarını değiştiremez.
+    """
+
+    def __init__(
+        self,
+        model: Any,
+        tokenizer: Any,
+        adapter_configs: Dict[str, Dict[str, Any]]
+    ):
+        """
+        SharedAdapterPool başlat.
+
+        Args:
+            model: Yüklenmiş base model (adapter'sız)
+            tokenizer: Paylaşılan tokenizer
+            adapter_configs: Adapter adı -> adapter_config.json içeriği.
+                LoRA katman yapısı uyumlu adapter'ların birleşimine göre kurulur.
+        """
+        self.model = model
+        self.tokenizer = tokenizer
+
+        compatible = {
+            name: cfg for name, cfg in adapter_configs.items()
+            if cfg.get("fine_tune_type", "lora") == "lora"
+        }
+        self.keys = self._common_keys(compatible.values())
+        self.num_layers = self._union_num_layers(compatible.values())
+        rank = max(
+            (cfg.get("lora_parameters", {}).get("rank", 8) for cfg in compatible.values()),
+            default=8
+        )
+
+        linear_to_lora_layers(
+            self.model,
+            self.num_layers,
+            {"rank": rank, "scale": 1.0, "dropout": 0.0, "keys": self.keys}
+        )
+        self.model.eval()
+
+        # Base durum: lora_b = 0 → LoRA katkısı yok
+        self._base_weights: Dict[str, mx.array] = {}
+        for name, value in tree_flatten(self.model.parameters()):
+            if name.endswith(LORA_PARAM_SUFFIXES):
+                if name.endswith("lora_b"):
+                    value = mx.zeros_like(value)
+                self._base_weights[name] = value
+        mx.eval(self._base_weights)
+        self.model.load_weights(list(self._base_weights.items()), strict=False)
+
+        self._adapters: Dict[str, Dict[str, mx.array]] = {}
+        self._adapter_bytes: Dict[str, int] = {}
+        self._active: Optional[str] = None
+        self.lock = threading.RLock()
+
+    @staticmethod
+    def _common_keys(configs) -> Optional[List[str]]:
+        """İlk adapter'ın LoRA key listesi (None = model varsayılanı)."""
+        for cfg in configs:
+            keys = cfg.get("lora_parameters", {}).get("keys")
+            return sorted(keys) if keys else None
+        return None
+
+    @staticmethod
+    def _union_num_layers(configs) -> int:
+        """Tüm adapter'ları kapsayan katman sayısı (-1 = tüm katmanlar)."""
+        num_layers = 0
+        for cfg in configs:
+            n = cfg.get("num_layers", 16)
+            if n < 0:
+                return -1
+            num_layers = max(num_layers, n)
+        return num_layers or 16
+
+    def is_compatible(self, config: Dict[str, Any]) -> bool:
+        """Adapter bu pool'a yüklenebilir mi?"""
+        if config.get("fine_tune_type", "lora") != "lora":
+            return False
+
+        keys = config.get("lora_parameters", {}).get("keys")
+        if (sorted(keys) if keys else None) != self.keys:
+            return False
+
+        num_layers = config.get("num_layers", 16)
+        if self.num_layers >= 0 and (num_layers < 0 or num_layers > self.num_layers):
+            return False
+
+        return True
+
+    def add_adapter(self, name: str, adapter_path: str) -> int:
+        """
+        Adapter'ın LoRA ağırlıklarını yükle (modeli değiştirmeden).
+
+        Args:
+            name: Adapter adı
+            adapter_path: adapters.safetensors içeren dizin
+
+        Returns:
+            Adapter'a özel ağırlıkların byte cinsinden boyutu
+        """
+        if name in self._adapters:
+            return self._adapter_bytes[name]
+
+        config = read_adapter_config(adapter_path)
+        if not self.is_compatible(config):
+            raise ValueError(f"Adapter pool ile uyumsuz: {name}")
+
+        scale = config.get("lora_parameters", {}).get("scale", 20.0)
+        raw = mx.load(str(Path(adapter_path) / "adapters.safetensors"))
+
+        unknown = [k for k in raw if k not in self._base_weights]
+        if unknown:
+            raise ValueError(f"Bilinmeyen LoRA parametreleri ({name}): {unknown[:3]}")
+
+        own: Dict[str, mx.array] = {}
+        for key, value in raw.items():
+            if key.endswith("lora_b"):
+                value = value * scale
+            own[key] = value
+        mx.eval(own)
+
+        # Kapsanmayan katmanlar base değerleri (sıfır katkı) ile paylaşılır
+        weights = dict(self._base_weights)
+        weights.update(own)
+
+        self._adapters[name] = weights
+        self._adapter_bytes[name] = sum(v.nbytes for v in own.values())
+        return self._adapter_bytes[name]
+
+    def remove_adapter(self, name: str) -> None:
+        """Adapter ağırlıklarını bellekten çıkar."""
+        with self.lock:
+            if name not in self._adapters:
+                return
+            if self._active == name:
+                self.activate(None)
+            del self._adapters[name]
+            del self._adapter_bytes[name]
+
+    def activate(self, name: Optional[str]) -> None:
+        """
+        Adapter'ı modele yerleştir.
+
+        Args:
+            name: Adapter adı veya None (base model)
+        """
+        with self.lock:
+            if name == self._active:
+                return
+            if name is not None and name not in self._adapters:
+                raise ValueError(f"Adapter pool'da yok: {name}")
+
+            weights = self._base_weights if name is None else self._adapters[name]
+            self.model.load_weights(list(weights.items()), strict=False)
+            self._active = name
+
+    def has_adapter(self, name: str) -> bool:
+        """Adapter pool'da yüklü mü?"""
+        return name in self._adapters
+
+    def get_active(self) -> Optional[str]:
+        """Aktif adapter adı."""
+        return self._active
+
+    def list_adapters(self) -> List[str]:
+        """Yüklü adapter adları."""
+        return list(self._adapters.keys())
+
+    def adapter_bytes(self, name: str) -> int:
+        """Adapter'a özel ağırlık boyutu."""
+        return self._adapter_bytes.get(name, 0)
+
+    def resident_bytes(self) -> int:
+        """Pool'daki tüm adapter ağırlıklarının toplam boyutu."""
+        return sum(self._adapter_bytes.values())
+
+    def clear(self) -> None:
+        """Tüm adapter'ları çıkar, base modele dön."""
+        with self.lock:
+            self.activate(None)
+            self._adapters.clear()
+            self._adapter_bytes.clear()
@@ -7,10 +7,14 @@ LoRA adapter yönetimi - yükleme, değiştirme ve caching.
 from typing import Dict, Optional, Tuple, Any
 from pathlib import Path
 from dataclasses import dataclass
+import threading
 import time
 import mlx.core as mx
 from mlx_lm import load
 
+from .adapter_pool import SharedAdapterPool, read_adapter_config
+from .adapter_cache import AdapterCache, CostAwarePolicy, estimate_safetensors_bytes
+
 
 @dataclass
 class AdapterInfo:
@@ -31,7 +35,8 @@ class LoRAManager:
     - Adapter registry (hangi intent -> hangi adapter)
     - Lazy loading (ihtiyaç olunca yükle)
     - Hot-swap (adapter değiştirme)
-    - Caching (son kullanılan adapter'ı tut)
+    - Caching (bellek bütçeli, lru/lfu/cost eviction)
+    - Shared base (tek base model + adapter başına LoRA ağırlıkları)
     """
     
     # Intent -> Adapter mapping
@@ -53,7 +58,10 @@ class LoRAManager:
         self,
         base_model_path: str = "./models/base/qwen-2.5-3b-instruct",
         adapters_dir: str = "./adapters",
-        cache_adapters: bool = True
+        cache_adapters: bool = True,
+        shared_base: bool = False,
+        cache_max_bytes: Optional[int] = None,
+        eviction_policy: str = "lru"
     ):
         """
         LoRAManager başlat.
@@ -62,16 +70,33 @@ class LoRAManager:
             base_model_path: Base model dizini
             adapters_dir: Adapter'ların bulunduğu dizin
             cache_adapters: Adapter caching aktif mi
+            shared_base: Base model bir kez yüklensin, adapter'lar
+                sadece LoRA ağırlıkları olarak tutulup değiştirilsin
+            cache_max_bytes: Adapter cache bellek bütçesi (None = sınırsız)
+            eviction_policy: "lru", "lfu" veya "cost" (load_time x intent frekansı)
         """
         self.base_model_path = Path(base_model_path)
         self.adapters_dir = Path(adapters_dir)
         self.cache_adapters = cache_adapters
+        self.shared_base = shared_base
         
         # State
         self._model = None
         self._tokenizer = None
         self._current_adapter: Optional[str] = None
-        self._adapter_cache: Dict[str, Tuple[Any, Any]] = {}
+        self._pool: Optional[SharedAdapterPool] = None
+        self._base_model_bytes: Optional[int] = None
+        self._intent_counts: Dict[str, int] = {}
+        
+        # Prefetch worker'ı ile istek yolu aynı state'e dokunur
+        self._lock = threading.RLock()
+        
+        policy = CostAwarePolicy(self._adapter_frequency) if eviction_policy == "cost" else eviction_policy
+        self._adapter_cache = AdapterCache(
+            max_bytes=cache_max_bytes,
+            policy=policy,
+            on_evict=self._on_cache_evict
+        )
         
         # Adapter registry
         self._adapters: Dict[str, AdapterInfo] = {}
@@ -148,6 +173,17 @@ class LoRAManager:
     
     def load_base_model(self) -> Tuple[Any, Any]:
         """Base modeli yükle (adapter'sız)."""
+        with self._lock:
+            return self._load_base_model()
+    
+    def _load_base_model(self) -> Tuple[Any, Any]:
+        if self.shared_base:
+            pool = self._get_pool()
+            pool.activate(None)
+            self._model, self._tokenizer = pool.model, pool.tokenizer
+            self._current_adapter = None
+            return self._model, self._tokenizer
+        
         if self._model is not None and self._current_adapter is None:
             return self._model, self._tokenizer
         
@@ -175,14 +211,28 @@ class LoRAManager:
         if adapter_name not in self._adapters:
             raise ValueError(f"Adapter bulunamadı: {adapter_name}")
         
+        with self._lock:
+            return self._load_adapter(adapter_name)
+    
+    def _load_adapter(self, adapter_name: str) -> Tuple[Any, Any]:
         # Zaten yüklü mü?
         if self._current_adapter == adapter_name:
             return self._model, self._tokenizer
         
+        # Shared base: sadece LoRA ağırlıklarını değiştir
+        if self.shared_base:
+            pool = self._get_pool()
+            if pool.has_adapter(adapter_name) or pool.is_compatible(
+                read_adapter_config(self._adapters[adapter_name].path)
+            ):
+                return self._activate_shared(adapter_name)
+            print(f"⚠️ Adapter pool ile uyumsuz ({adapter_name}), tam model yükleniyor")
+        
         # Cache'de var mı?
-        if self.cache_adapters and adapter_name in self._adapter_cache:
+        cached = self._adapter_cache.get(adapter_name) if self.cache_adapters else None
+        if cached is not None:
             print(f"📦 Cache'den yükleniyor: {adapter_name}")
-            self._model, self._tokenizer = self._adapter_cache[adapter_name]
+            self._model, self._tokenizer = cached
             self._current_adapter = adapter_name
             return self._model, self._tokenizer
         
@@ -201,14 +251,165 @@ class LoRAManager:
         adapter_info.load_time = load_time
         self._current_adapter = adapter_name
         
-        # Cache'e ekle
+        # Cache'e ekle (base model + adapter boyutu kadar yer kaplar)
         if self.cache_adapters:
-            self._adapter_cache[adapter_name] = (self._model, self._tokenizer)
+            evicted = self._adapter_cache.put(
+                adapter_name,
+                (self._model, self._tokenizer),
+                size_bytes=self._get_base_model_bytes() + estimate_safetensors_bytes(adapter_info.path),
+                load_time=load_time
+            )
+            if evicted:
+                print(f"♻️ Cache'den çıkarıldı: {evicted}")
         
         print(f"✅ Adapter hazır: {adapter_name} ({load_time:.2f}s)")
         
         return self._model, self._tokenizer
     
+    def prefetch(self, adapter_name: str) -> bool:
+        """
+        Adapter'ı aktif etmeden cache'e (shared base'de pool'a) yükle.
+        
+        Ağır yükleme kilit dışında yapılır, böylece istek yolu aktif
+        adapter ile generation'a devam edebilir.
+        
+        Args:
+            adapter_name: Adapter adı
+        
+        Returns:
+            Yeni yükleme yapıldıysa True (zaten hazırsa veya yüklenemezse False)
+        """
+        if adapter_name not in self._adapters or not self.cache_adapters:
+            return False
+        
+        adapter_info = self._adapters[adapter_name]
+        with self._lock:
+            if adapter_name == self._current_adapter or adapter_name in self._adapter_cache:
+                return False
+            if self.shared_base:
+                pool = self._get_pool()
+                if not pool.has_adapter(adapter_name) and not pool.is_compatible(
+                    read_adapter_config(adapter_info.path)
+                ):
+                    return False
+        
+        print(f"🔮 Adapter önceden yükleniyor: {adapter_name}")
+        start = time.time()
+        
+        if self.shared_base:
+            size = pool.add_adapter(adapter_name, adapter_info.path)
+            value = pool
+        else:
+            value = load(str(self.base_model_path), adapter_path=adapter_info.path)
+            size = self._get_base_model_bytes() + estimate_safetensors_bytes(adapter_info.path)
+        
+        load_time = time.time() - start
+        
+        with self._lock:
+            if adapter_name == self._current_adapter or adapter_name in self._adapter_cache:
+                return False
+            # Yükleme sırasında istek yolu pool'u temizlemiş olabilir
+            if self.shared_base and not pool.has_adapter(adapter_name):
+                return False
+
+            adapter_info.loaded = True
+            adapter_info.load_time = load_time
+            evicted = self._adapter_cache.put(
+                adapter_name,
+                value,
+                size_bytes=size,
+                load_time=load_time,
+                protect=[self._current_adapter] if self._current_adapter else None
+            )
+            if evicted:
+                print(f"♻️ Cache'den çıkarıldı: {evicted}")
+            
+            # Bütçeye sığmadıysa pool'a eklenen ağırlıkları bırak
+            if adapter_name not in self._adapter_cache:
+                if self.shared_base:
+                    pool.remove_adapter(adapter_name)
+                return False
+        
+        return True
+    
+    def _get_pool(self) -> SharedAdapterPool:
+        """Paylaşımlı base model pool'unu (gerekirse) oluştur."""
+        if self._pool is not None:
+            return self._pool
+        
+        print("📥 Paylaşımlı base model yükleniyor...")
+        start = time.time()
+        
+        model, tokenizer = load(str(self.base_model_path))
+        adapter_configs = {
+            name: read_adapter_config(info.path)
+            for name, info in self._adapters.items()
+        }
+        self._pool = SharedAdapterPool(model, tokenizer, adapter_configs)
+        
+        load_time = time.time() - start
+        print(f"✅ Paylaşımlı base model hazır ({load_time:.2f}s)")
+        
+        return self._pool
+    
+    def _activate_shared(self, adapter_name: str) -> Tuple[Any, Any]:
+        """Adapter'ı paylaşımlı base model üzerinde aktif et."""
+        pool = self._get_pool()
+        adapter_info = self._adapters[adapter_name]
+        
+        cached = self._adapter_cache.get(adapter_name) if self.cache_adapters else None
+        if cached is None and (self.cache_adapters or not pool.has_adapter(adapter_name)):
+            print(f"📥 Adapter ağırlıkları yükleniyor: {adapter_name}")
+            start = time.time()
+            size = pool.add_adapter(adapter_name, adapter_info.path)
+            adapter_info.loaded = True
+            adapter_info.load_time = time.time() - start
+            print(f"✅ Adapter hazır: {adapter_name} ({adapter_info.load_time:.2f}s, {size / 1024 / 1024:.1f}MB)")
+            
+            if self.cache_adapters:
+                evicted = self._adapter_cache.put(
+                    adapter_name,
+                    pool,
+                    size_bytes=size,
+                    load_time=adapter_info.load_time,
+                    protect=[self._current_adapter] if self._current_adapter else None
+                )
+                if evicted:
+                    print(f"♻️ Cache'den çıkarıldı: {evicted}")
+        
+        pool.activate(adapter_name)
+        self._model, self._tokenizer = pool.model, pool.tokenizer
+        self._current_adapter = adapter_name
+        
+        # Önceki aktif adapter artık korunmuyor, bütçeyi tekrar uygula
+        self._adapter_cache.enforce_budget(protect=[adapter_name])
+        
+        # Bütçeye sığmayan (cache dışı) ağırlıkları aktif değilse bırak;
+        # cache kapalıysa sadece aktif adapter pool'da kalır
+        for name in pool.list_adapters():
+            if name != adapter_name and name not in self._adapter_cache:
+                pool.remove_adapter(name)
+        
+        return self._model, self._tokenizer
+    
+    def _on_cache_evict(self, adapter_name: str, value: Any) -> None:
+        """Cache'den çıkan adapter'ın belleğini serbest bırak."""
+        if isinstance(value, SharedAdapterPool) and adapter_name != self._current_adapter:
+            value.remove_adapter(adapter_name)
+    
+    def _get_base_model_bytes(self) -> int:
+        """Base model safetensors boyutu (bir kez hesaplanır)."""
+        if self._base_model_bytes is None:
+            self._base_model_bytes = estimate_safetensors_bytes(self.base_model_path)
+        return self._base_model_bytes
+    
+    def _adapter_frequency(self, adapter_name: str) -> float:
+        """Adapter'a yönlenen intent'lerin toplam istek sayısı."""
+        return sum(
+            count for intent, count in self._intent_counts.items()
+            if self.ADAPTER_REGISTRY.get(intent) == adapter_name
+        )
+    
     def load_for_intent(self, intent: str) -> Tuple[Any, Any]:
         """
         Intent'e göre uygun model/adapter yükle.
@@ -219,6 +420,8 @@ class LoRAManager:
         Returns:
             (model, tokenizer) tuple
         """
+        with self._lock:
+            self._intent_counts[intent] = self._intent_counts.get(intent, 0) + 1
         adapter_name = self.get_adapter_for_intent(intent)
         
         if adapter_name is None:
@@ -231,6 +434,13 @@ class LoRAManager:
         print(f"⚠️ Adapter bulunamadı ({adapter_name}), base model kullanılıyor")
         return self.load_base_model()
     
+    def get_adapter_pool(self) -> Optional[SharedAdapterPool]:
+        """Shared-base modda paylaşımlı pool (batching backend'i için), değilse None."""
+        if not self.shared_base:
+            return None
+        with self._lock:
+            return self._get_pool()
+    
     def get_current_adapter(self) -> Optional[str]:
         """Şu an yüklü adapter adını döndür."""
         return self._current_adapter
@@ -247,17 +457,31 @@ class LoRAManager:
     
     def get_status(self) -> Dict[str, Any]:
         """Manager durumu."""
-        return {
+        status = {
             "base_model": str(self.base_model_path),
             "current_adapter": self._current_adapter,
             "available_adapters": list(self._adapters.keys()),
-            "cached_adapters": list(self._adapter_cache.keys()),
-            "model_loaded": self._model is not None
+            "cached_adapters": self._adapter_cache.keys(),
+            "model_loaded": self._model is not None,
+            "shared_base": self.shared_base,
+            "cache": self._adapter_cache.get_stats(),
+            "intent_requests": dict(self._intent_counts)
         }
+        
+        if self._pool is not None:
+            status["pooled_adapters"] = self._pool.list_adapters()
+            status["pooled_adapter_mb"] = round(self._pool.resident_bytes() / (1024 * 1024), 2)
+        
+        return status
     
     def clear_cache(self) -> None:
         """Adapter cache'ini temizle."""
-        self._adapter_cache.clear()
+        with self._lock:
+            self._adapter_cache.clear()
+            if self._pool is not None:
+                self._pool.clear()
+                if self._model is self._pool.model:
+                    self._current_adapter = None
         print("🧹 Adapter cache temizlendi")
 
 
@@ -0,0 +1,252 @@
+"""
+EVO-TR: Adapter Prefetcher
+
+Router skorları ve oturum içi intent geçişlerinden bir sonraki adapter'ı
+tahmin edip arka planda önceden yükler. Böylece adapter değişim gecikmesi
+mevcut generation süresince gizlenir.
+"""
+
+from typing import Dict, List, Optional, Tuple, Any
+from collections import defaultdict, deque
+import math
+import queue
+import threading
+
+
+class AdapterPrefetcher:
+    """
+    Tahmine dayalı adapter ön yükleyici.
+
+    Tahmin:
+    - Router dağılımı: all_scores üzerinde softmax
+    - Geçiş modeli: P(sonraki intent | mevcut intent), oturum geçişlerinden
+    - İkisi transition_weight ile karıştırılır, intent'ler adapter'lara toplanır
+
+    Ölçüm:
+    - Tahmin doğruluğu (tahmin edilen adapter bir sonraki istekte kullanıldı mı)
+    - Boşa yükleme (önceden yüklenip kullanılmayan adapter'lar)
+    """
+
+    def __init__(
+        self,
+        lora_manager: Any,
+        min_probability: float = 0.25,
+        max_prefetch: int = 1,
+        transition_weight: float = 0.5,
+        temperature: float = 0.05,
+        history_size: int = 20
+    ):
+        """
+        AdapterPrefetcher başlat.
+
+        Args:
+            lora_manager: prefetch(), get_adapter_for_intent() sağlayan LoRAManager
+            min_probability: Ön yükleme için minimum tahmin olasılığı
+            max_prefetch: İstek başına en fazla kaç adapter ön yüklensin
+            transition_weight: Geçiş modelinin ağırlığı (0-1)
+            temperature: Router skorları softmax sıcaklığı
+            history_size: Oturum başına tutulacak son intent sayısı
+        """
+        self.lora_manager = lora_manager
+        self.min_probability = min_probability
+        self.max_prefetch = max_prefetch
+        self.transition_weight = transition_weight
+        self.temperature = temperature
+        self.history_size = history_size
+
+        self._transitions: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self._history: Dict[str, deque] = {}
+        self._outstanding: Dict[str, Dict[str, Dict[str, bool]]] = {}
+
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[Optional[Tuple[str, Dict[str, bool]]]]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+
+        self.stats = {
+            "requests": 0,
+            "predictions": 0,
+            "correct_predictions": 0,
+            "loads": 0,
+            "useful_loads": 0,
+            "wasted_loads": 0,
+            "errors": 0
+        }
+
+    # ============ Tahmin ============
+
+    def _router_distribution(self, all_scores: Dict[str, float]) -> Dict[str, float]:
+        """Router skorlarını olasılık dağılımına çevir."""
+        if not all_scores:
+            return {}
+        top = max(all_scores.values())
+        exps = {
+            intent: math.exp((score - top) / self.temperature)
+            for intent, score in all_scores.items()
+        }
+        total = sum(exps.values())
+        return {intent: v / total for intent, v in exps.items()}
+
+    def _transition_distribution(self, intent: str) -> Dict[str, float]:
+        """Mevcut intent'ten sonraki intent dağılımı."""
+        counts = self._transitions.get(intent)
+        if not counts:
+            return {}
+        total = sum(counts.values())
+        return {nxt: c / total for nxt, c in counts.items()}
+
+    def predict(
+        self,
+        intent: str,
+        all_scores: Optional[Dict[str, float]] = None,
+        exclude: Optional[str] = None
+    ) -> List[Tuple[str, float]]:
+        """
+        Bir sonraki istekte gerekecek adapter'ları tahmin et.
+
+        Args:
+            intent: Mevcut isteğin intent'i
+            all_scores: Router'ın tüm intent skorları
+            exclude: Hariç tutulacak adapter (zaten aktif olan)
+
+        Returns:
+            [(adapter_adı, olasılık)] - olasılığa göre azalan
+        """
+        router_dist = self._router_distribution(all_scores or {})
+        with self._lock:
+            trans_dist = self._transition_distribution(intent)
+
+        if trans_dist and router_dist:
+            w = self.transition_weight
+            intents = set(router_dist) | set(trans_dist)
+            intent_probs = {
+                i: w * trans_dist.get(i, 0.0) + (1 - w) * router_dist.get(i, 0.0)
+                for i in intents
+            }
+        else:
+            intent_probs = trans_dist or router_dist
+
+        adapter_probs: Dict[str, float] = defaultdict(float)
+        for i, p in intent_probs.items():
+            adapter = self.lora_manager.get_adapter_for_intent(i)
+            if adapter is not None and adapter != exclude:
+                adapter_probs[adapter] += p
+
+        return sorted(adapter_probs.items(), key=lambda x: x[1], reverse=True)
+
+    # ============ İstek akışı ============
+
+    def on_request(
+        self,
+        session_id: str,
+        intent: str,
+        adapter_used: Optional[str],
+        all_scores: Optional[Dict[str, float]] = None
+    ) -> List[str]:
+        """
+        Yeni isteği kaydet ve bir sonraki adapter'ı ön yüklemeye başla.
+
+        Args:
+            session_id: Oturum kimliği
+            intent: Tespit edilen intent
+            adapter_used: Bu istek için yüklenen adapter (None = base)
+            all_scores: Router skorları
+
+        Returns:
+            Ön yükleme kuyruğuna alınan adapter adları
+        """
+        self._observe(session_id, intent, adapter_used)
+
+        candidates = [
+            (adapter, p) for adapter, p in self.predict(intent, all_scores, exclude=adapter_used)
+            if p >= self.min_probability
+        ][:self.max_prefetch]
+
+        with self._lock:
+            outstanding = {adapter: {"loaded": False} for adapter, _ in candidates}
+            self._outstanding[session_id] = outstanding
+            self.stats["predictions"] += len(outstanding)
+            # Kuyruğa konacak bayraklar lock altında alınır (worker / yeni istek değiştirebilir)
+            jobs = list(outstanding.items())
+
+        for job in jobs:
+            self._ensure_worker()
+            self._queue.put(job)
+
+        return [adapter for adapter, _ in jobs]
+
+    def _observe(self, session_id: str, intent: str, adapter_used: Optional[str]) -> None:
+        """Geçişi kaydet, önceki tahminlerin sonucunu say."""
+        with self._lock:
+            self.stats["requests"] += 1
+
+            history = self._history.setdefault(session_id, deque(maxlen=self.history_size))
+            if history:
+                self._transitions[history[-1]][intent] += 1
+            history.append(intent)
+
+            for adapter, flags in self._outstanding.pop(session_id, {}).items():
+                used = adapter == adapter_used
+                if used:
+                    self.stats["correct_predictions"] += 1
+                if flags["loaded"]:
+                    self.stats["useful_loads" if used else "wasted_loads"] += 1
+
+    def forget_session(self, session_id: str) -> None:
+        """Biten oturumun intent geçmişini ve bekleyen tahminlerini at."""
+        with self._lock:
+            self._history.pop(session_id, None)
+            self._outstanding.pop(session_id, None)
+
+    # ============ Worker ============
+
+    def _ensure_worker(self) -> None:
+        """Arka plan worker'ını (gerekirse) başlat."""
+        if self._worker is not None and self._worker.is_alive():
+            return
+        self._worker = threading.Thread(target=self._run, name="adapter-prefetch", daemon=True)
+        self._worker.start()
+
+    def _run(self) -> None:
+        """Kuyruktaki adapter'ları sırayla yükle."""
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                adapter, flags = item
+                try:
+                    if self.lora_manager.prefetch(adapter):
+                        with self._lock:
+                            flags["loaded"] = True
+                            self.stats["loads"] += 1
+                except Exception as e:
+                    print(f"⚠️ Prefetch hatası ({adapter}): {e}")
+                    with self._lock:
+                        self.stats["errors"] += 1
+            finally:
+                self._queue.task_done()
+
+    def wait_idle(self) -> None:
+        """Kuyruktaki tüm ön yüklemeler bitene kadar bekle."""
+        self._queue.join()
+
+    def close(self) -> None:
+        """Worker'ı durdur."""
+        if self._worker is not None and self._worker.is_alive():
+            self._queue.put(None)
+            self._worker.join(timeout=5)
+        self._worker = None
+
+    # ============ İstatistikler ============
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Prefetch istatistikleri."""
+        with self._lock:
+            stats = dict(self.stats)
+
+        predictions = stats["predictions"]
+        loads = stats["useful_loads"] + stats["wasted_loads"]
+        stats["accuracy"] = round(stats["correct_predictions"] / predictions * 100, 2) if predictions else 0
+        stats["waste_rate"] = round(stats["wasted_loads"] / loads * 100, 2) if loads else 0
+        stats["queue_size"] = self._queue.qsize()
+        return stats
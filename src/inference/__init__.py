@@ -5,5 +5,16 @@ MLX tabanlı inference engine.
 """
 
 from .mlx_inference import MLXInference, GenerationConfig
+from .prefix_cache import PromptPrefixCache
+from .scheduler import ContinuousBatchScheduler, DecodeBackend, DecodeStep, GenerationRequest, MLXDecodeBackend
 
-__all__ = ["MLXInference", "GenerationConfig"]
+__all__ = [
+    "MLXInference",
+    "GenerationConfig",
+    "ContinuousBatchScheduler",
+    "DecodeBackend",
+    "DecodeStep",
+    "GenerationRequest",
+    "MLXDecodeBackend",
+    "PromptPrefixCache"
+]
@@ -4,10 +4,13 @@ EVO-TR: MLX Inference Engine
 MLX-LM ile text generation yönetimi.
 """
 
-from typing import Dict, List, Optional, Any, Generator
+from typing import Callable, Dict, List, Optional, Any, Generator
 from dataclasses import dataclass
 import time
-from mlx_lm import generate, stream_generate
+from mlx_lm import stream_generate
+
+from .prefix_cache import PromptPrefixCache, encode_prompt
+from .scheduler import ContinuousBatchScheduler, DecodeBackend, MLXDecodeBackend
 
 
 @dataclass
@@ -24,6 +27,8 @@ class GenerationResult:
     generation_time: float
     tokens_per_second: float
     prompt_tokens: int
+    queue_time: float = 0.0
+    stopped_early: bool = False  # stop_fn üretimi max_tokens'tan önce kesti
 
 
 class MLXInference:
@@ -35,6 +40,8 @@ class MLXInference:
     - Configurable generation parametreleri
     - Performance metrikleri
     - System prompt yönetimi
+    - İsteğe bağlı continuous batching (eşzamanlı istekler tek decode döngüsünde)
+    - İsteğe bağlı prompt prefix KV cache (turlar arası prefill tekrarını önler)
     """
     
     # Intent'e göre system prompt'lar
@@ -92,21 +99,80 @@ Bilmediğin konularda dürüst ol."""
     
     def __init__(
         self,
-        default_config: Optional[GenerationConfig] = None
+        default_config: Optional[GenerationConfig] = None,
+        scheduler: Optional[ContinuousBatchScheduler] = None,
+        prefix_cache: Optional[PromptPrefixCache] = None
     ):
         """
         MLXInference başlat.
         
         Args:
             default_config: Varsayılan generation config
+            scheduler: Continuous batching scheduler (None = istek başına generate)
+            prefix_cache: Prompt prefix KV cache (None = her istekte tam prefill)
         """
         self.default_config = default_config or GenerationConfig()
+        self.scheduler = scheduler
+        self.prefix_cache = prefix_cache
         self._generation_count = 0
         self._total_tokens = 0
         self._total_time = 0.0
+        self._total_queue_time = 0.0
         
         print("✅ MLXInference hazır")
     
+    def enable_batching(
+        self,
+        max_batch_size: int = 8,
+        backend: Optional[DecodeBackend] = None,
+        adapter_pool: Optional[Any] = None
+    ) -> ContinuousBatchScheduler:
+        """
+        generate/generate_stream çağrılarını continuous batching scheduler'a yönlendir.
+        
+        Args:
+            max_batch_size: Aynı anda decode edilen maksimum dizi sayısı
+            backend: Decode backend'i (None = MLX, prefix cache açıksa onu kullanır)
+            adapter_pool: Shared-base modda LoRAManager'ın SharedAdapterPool'u;
+                her adım doğru adapter aktif edilerek çalıştırılır
+        
+        Returns:
+            Scheduler
+        """
+        self.disable_batching()
+        backend = backend or MLXDecodeBackend(prefix_cache=self.prefix_cache, adapter_pool=adapter_pool)
+        self.scheduler = ContinuousBatchScheduler(backend=backend, max_batch_size=max_batch_size)
+        return self.scheduler
+    
+    def disable_batching(self) -> None:
+        """Scheduler'ı kapat (çalışan istekler tamamlanır)."""
+        if self.scheduler is not None:
+            scheduler, self.scheduler = self.scheduler, None
+            scheduler.close()
+    
+    def enable_prefix_cache(
+        self,
+        max_memory_mb: int = 512,
+        max_entries: int = 64
+    ) -> PromptPrefixCache:
+        """
+        System prompt ve önceki turların KV durumunu yeniden kullanmaya başla.
+        
+        Args:
+            max_memory_mb: KV cache bellek bütçesi
+            max_entries: Maksimum önbellek girdisi
+        
+        Returns:
+            PromptPrefixCache
+        """
+        self.prefix_cache = PromptPrefixCache(
+            max_bytes=max_memory_mb * 1024 * 1024,
+            max_entries=max_entries
+        )
+        if self.scheduler is not None and isinstance(self.scheduler.backend, MLXDecodeBackend):
+            self.scheduler.backend.prefix_cache = self.prefix_cache
+        return self.prefix_cache
+    
     def get_system_prompt(self, intent: str) -> str:
         """Intent için system prompt döndür."""
         return self.SYSTEM_PROMPTS.get(intent, self.SYSTEM_PROMPTS["general_chat"])
@@ -165,7 +231,9 @@ Bilmediğin konularda dürüst ol."""
         model: Any,
         tokenizer: Any,
         prompt: str,
-        config: Optional[GenerationConfig] = None
+        config: Optional[GenerationConfig] = None,
+        adapter: Optional[str] = None,
+        stop_fn: Optional[Callable[[str], bool]] = None
     ) -> GenerationResult:
         """
         Text generation yap.
@@ -175,45 +243,152 @@ Bilmediğin konularda dürüst ol."""
             tokenizer: Tokenizer
             prompt: Input prompt
             config: Generation config (optional)
+            adapter: Adapter adı (batching'de gruplama anahtarı)
+            stop_fn: Her parça ile çağrılır; True dönerse üretim kesilir
+                (ör. StreamQualityMonitor.feed)
         
         Returns:
             GenerationResult
         """
         cfg = config or self.default_config
         
-        # Prompt token sayısı (yaklaşık)
-        prompt_tokens = len(prompt) // 4
+        if self.scheduler is not None:
+            return self._generate_scheduled(model, tokenizer, prompt, cfg, adapter, stop_fn)
         
-        start_time = time.time()
-        
-        # Generate
-        response = generate(
-            model,
-            tokenizer,
-            prompt=prompt,
-            max_tokens=cfg.max_tokens,
-            verbose=False
+        return self._generate_direct(model, tokenizer, prompt, cfg, adapter, stop_fn)
+    
+    def _generate_scheduled(
+        self,
+        model: Any,
+        tokenizer: Any,
+        prompt: str,
+        cfg: GenerationConfig,
+        adapter: Optional[str],
+        stop_fn: Optional[Callable[[str], bool]] = None
+    ) -> GenerationResult:
+        """Scheduler üzerinden generation (gerçek token sayıları ile)."""
+        request = self.scheduler.submit(model, tokenizer, prompt, cfg.max_tokens, adapter, on_finish=self._record)
+        stopped = False
+        try:
+            if stop_fn is None:
+                response = request.result()
+            else:
+                parts = []
+                for text in request:
+                    parts.append(text)
+                    if stop_fn(text):
+                        stopped = True
+                        break
+                response = "".join(parts)
+        finally:
+            # Erken durulduysa dizi bir sonraki adımda batch'ten çıkar
+            request.cancel()
+        
+        # Metrikler dizi batch'ten çıkınca kesinleşir (_record orada çağrılır)
+        request.wait()
+        return GenerationResult(
+            text=response,
+            tokens_generated=request.tokens,
+            generation_time=request.generation_time,
+            tokens_per_second=request.tokens_per_second,
+            prompt_tokens=request.prompt_tokens,
+            queue_time=request.queue_wait,
+            stopped_early=stopped
         )
+    
+    def _stream_responses(
+        self,
+        model: Any,
+        tokenizer: Any,
+        prompt_ids: List[int],
+        cfg: GenerationConfig,
+        adapter: Optional[str]
+    ) -> Generator[Any, None, None]:
+        """
+        stream_generate ile generation; token sayıları modelin kendisinden gelir.
+        
+        Prefix cache açıksa önbellekteki önek prefill edilmez; bitişte (veya
+        tüketici erken durduğunda) prompt + üretilen token'ların KV durumu
+        saklanır. Bitişte istatistikler güncellenir.
+        
+        Yields:
+            mlx_lm GenerationResponse
+        """
+        cache, reused = None, 0
+        if self.prefix_cache is not None:
+            cache, reused = self.prefix_cache.fetch(adapter, prompt_ids, model)
+        generated: List[int] = []
+        eos_seen = False
+        failed = False
+        start_time = time.time()
         
+        try:
+            for response in stream_generate(
+                model,
+                tokenizer,
+                prompt=prompt_ids[reused:],
+                max_tokens=cfg.max_tokens,
+                prompt_cache=cache
+            ):
+                generated.append(response.token)
+                eos_seen = getattr(response, "finish_reason", None) == "stop"
+                yield response
+        except Exception:
+            failed = True
+            raise
+        finally:
+            if self.prefix_cache is not None and not failed:
+                self.prefix_cache.store(adapter, prompt_ids + generated, cache)
+            self._generation_count += 1
+            self._total_tokens += len(generated) - int(eos_seen)
+            self._total_time += time.time() - start_time
+    
+    def _generate_direct(
+        self,
+        model: Any,
+        tokenizer: Any,
+        prompt: str,
+        cfg: GenerationConfig,
+        adapter: Optional[str],
+        stop_fn: Optional[Callable[[str], bool]] = None
+    ) -> GenerationResult:
+        """Scheduler olmadan generation (gerçek token sayıları ile)."""
+        start_time = time.time()
+        prompt_ids = encode_prompt(tokenizer, prompt)
+        parts = []
+        tokens_generated = 0
+        stopped = False
+        responses = self._stream_responses(model, tokenizer, prompt_ids, cfg, adapter)
+        for response in responses:
+            parts.append(response.text)
+            # EOS token'ı yanıt token'ı sayılmaz
+            if getattr(response, "finish_reason", None) != "stop":
+                tokens_generated += 1
+            if stop_fn is not None and stop_fn(response.text):
+                stopped = True
+                break
+        # Erken durunca da prefix cache ve istatistikler hemen güncellensin
+        responses.close()
         generation_time = time.time() - start_time
         
-        # Token sayısı (yaklaşık)
-        tokens_generated = len(response) // 4
         tokens_per_second = tokens_generated / generation_time if generation_time > 0 else 0
         
-        # İstatistikleri güncelle
-        self._generation_count += 1
-        self._total_tokens += tokens_generated
-        self._total_time += generation_time
-        
         return GenerationResult(
-            text=response,
+            text="".join(parts),
             tokens_generated=tokens_generated,
             generation_time=generation_time,
             tokens_per_second=tokens_per_second,
-            prompt_tokens=prompt_tokens
+            prompt_tokens=len(prompt_ids),
+            stopped_early=stopped
         )
     
+    def _record(self, request: Any) -> None:
+        """Batch'ten çıkan scheduler isteğinin metriklerini toplam istatistiklere ekle."""
+        self._generation_count += 1
+        self._total_tokens += request.tokens
+        self._total_time += request.generation_time
+        self._total_queue_time += request.queue_wait
+    
     def generate_response(
         self,
         model: Any,
@@ -222,7 +397,9 @@ Bilmediğin konularda dürüst ol."""
         intent: str = "general_chat",
         chat_history: Optional[List[Dict[str, str]]] = None,
         context: Optional[str] = None,
-        config: Optional[GenerationConfig] = None
+        config: Optional[GenerationConfig] = None,
+        adapter: Optional[str] = None,
+        stop_fn: Optional[Callable[[str], bool]] = None
     ) -> GenerationResult:
         """
         Tam yanıt oluştur (prompt building + generation).
@@ -235,6 +412,8 @@ Bilmediğin konularda dürüst ol."""
             chat_history: Önceki mesajlar
             context: RAG context
             config: Generation config
+            adapter: Adapter adı (batching'de gruplama anahtarı)
+            stop_fn: Parça bazlı erken durdurma kontrolü
         
         Returns:
             GenerationResult
@@ -249,14 +428,15 @@ Bilmediğin konularda dürüst ol."""
         )
         
         # Generate
-        return self.generate(model, tokenizer, prompt, config)
+        return self.generate(model, tokenizer, prompt, config, adapter, stop_fn)
     
     def generate_stream(
         self,
         model: Any,
         tokenizer: Any,
         prompt: str,
-        config: Optional[GenerationConfig] = None
+        config: Optional[GenerationConfig] = None,
+        adapter: Optional[str] = None
     ) -> Generator[str, None, None]:
         """
         Streaming text generation.
@@ -266,18 +446,24 @@ Bilmediğin konularda dürüst ol."""
             tokenizer: Tokenizer
             prompt: Input prompt
             config: Generation config (optional)
+            adapter: Adapter adı (batching'de gruplama anahtarı)
         
         Yields:
             Token strings one by one
         """
         cfg = config or self.default_config
         
-        for response in stream_generate(
-            model,
-            tokenizer,
-            prompt=prompt,
-            max_tokens=cfg.max_tokens
-        ):
+        if self.scheduler is not None:
+            request = self.scheduler.submit(model, tokenizer, prompt, cfg.max_tokens, adapter, on_finish=self._record)
+            try:
+                yield from request
+            finally:
+                # Tüketici erken durursa dizi batch'ten çıkar (istatistikler o an kaydedilir)
+                request.cancel()
+            return
+        
+        prompt_ids = encode_prompt(tokenizer, prompt)
+        for response in self._stream_responses(model, tokenizer, prompt_ids, cfg, adapter):
             yield response.text
     
     def generate_response_stream(
@@ -288,7 +474,8 @@ Bilmediğin konularda dürüst ol."""
         intent: str = "general_chat",
         chat_history: Optional[List[Dict[str, str]]] = None,
         context: Optional[str] = None,
-        config: Optional[GenerationConfig] = None
+        config: Optional[GenerationConfig] = None,
+        adapter: Optional[str] = None
     ) -> Generator[str, None, None]:
         """
         Streaming yanıt oluştur (prompt building + streaming generation).
@@ -301,6 +488,7 @@ Bilmediğin konularda dürüst ol."""
             chat_history: Önceki mesajlar
             context: RAG context
             config: Generation config
+            adapter: Adapter adı (batching'de gruplama anahtarı)
         
         Yields:
             Token strings one by one
@@ -315,24 +503,32 @@ Bilmediğin konularda dürüst ol."""
         )
         
         # Stream generate
-        yield from self.generate_stream(model, tokenizer, prompt, config)
+        yield from self.generate_stream(model, tokenizer, prompt, config, adapter)
     
     def get_stats(self) -> Dict[str, Any]:
         """Inference istatistikleri."""
         avg_tokens_per_sec = self._total_tokens / self._total_time if self._total_time > 0 else 0
         
-        return {
+        stats = {
             "total_generations": self._generation_count,
             "total_tokens": self._total_tokens,
             "total_time": round(self._total_time, 2),
             "avg_tokens_per_second": round(avg_tokens_per_sec, 1)
         }
+        if self.scheduler is not None:
+            avg_queue = self._total_queue_time / self._generation_count if self._generation_count else 0
+            stats["avg_queue_time_ms"] = round(avg_queue * 1000, 2)
+            stats["scheduler"] = self.scheduler.get_stats()
+        if self.prefix_cache is not None:
+            stats["prefix_cache"] = self.prefix_cache.get_stats()
+        return stats
     
     def reset_stats(self) -> None:
         """İstatistikleri sıfırla."""
         self._generation_count = 0
         self._total_tokens = 0
         self._total_time = 0.0
+        self._total_queue_time = 0.0
 
 
 # Test
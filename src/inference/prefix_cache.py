@@ -0,0 +1,285 @@
+"""
+EVO-TR: Prompt Prefix KV Cache
+
+Aynı adapter ile başlayan prompt'ların ortak token önekine ait KV
+durumunu saklar. Intent system prompt'u ve konuşmanın önceki turları
+önbellekteyse yeni turda sadece eklenen kısım (yeni kullanıcı mesajı)
+prefill edilir.
+
+- Anahtar: (adapter, token öneki)
+- En uzun ortak önek eşleşmesi; fazlası trim_prompt_cache ile kırpılır
+- Bellek bütçesi (byte) ve LRU eviction
+"""
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from collections import OrderedDict
+from dataclasses import dataclass
+import copy
+import itertools
+import threading
+
+import numpy as np
+
+
+@dataclass
+class _PrefixEntry:
+    """Önbellekteki tek KV durumu."""
+    adapter: Optional[str]
+    tokens: np.ndarray
+    cache: List[Any]
+    nbytes: int
+
+
+def encode_prompt(tokenizer: Any, prompt: Any) -> List[int]:
+    """Prompt metnini token listesine çevir (stream_generate ile aynı kural)."""
+    if not isinstance(prompt, str):
+        return [int(t) for t in prompt]
+    bos_token = getattr(tokenizer, "bos_token", None)
+    add_special_tokens = bos_token is None or not prompt.startswith(bos_token)
+    return list(tokenizer.encode(prompt, add_special_tokens=add_special_tokens))
+
+
+def _common_prefix_length(a: np.ndarray, b: np.ndarray) -> int:
+    """İki token dizisinin ortak önek uzunluğu."""
+    n = min(len(a), len(b))
+    if n == 0:
+        return 0
+    mismatch = np.flatnonzero(a[:n] != b[:n])
+    return int(mismatch[0]) if len(mismatch) else n
+
+
+def _cache_nbytes(cache: List[Any]) -> int:
+    """KV cache'in bellekteki boyutu."""
+    total = 0
+    for layer in cache:
+        nbytes = getattr(layer, "nbytes", None)
+        if nbytes is None:
+            nbytes = sum(getattr(arr, "nbytes", 0) for arr in getattr(layer, "state", ()) or ())
+        total += int(nbytes)
+    return total
+
+
+def _cache_offset(cache: List[Any]) -> int:
+    """KV cache'te tutulan token sayısı."""
+    return int(getattr(cache[0], "offset", 0)) if cache else 0
+
+
+class PromptPrefixCache:
+    """
+    (adapter, token öneki) anahtarlı KV cache havuzu.
+
+    Kullanım:
+        cache, reused = prefix_cache.fetch(adapter, prompt_ids, model)
+        ... prompt_ids[reused:] ile generate (prompt_cache=cache) ...
+        prefix_cache.store(adapter, prompt_ids + generated_ids, cache)
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 512 * 1024 * 1024,
+        max_entries: int = 64,
+        min_prefix_tokens: int = 8
+    ):
+        """
+        PromptPrefixCache başlat.
+
+        Args:
+            max_bytes: Toplam KV bellek bütçesi
+            max_entries: Maksimum önbellek girdisi
+            min_prefix_tokens: Bundan kısa eşleşmeler kullanılmaz
+        """
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.min_prefix_tokens = min_prefix_tokens
+
+        self._entries: "OrderedDict[int, _PrefixEntry]" = OrderedDict()
+        self._ids = itertools.count()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.stats = {
+            "lookups": 0,
+            "hits": 0,
+            "misses": 0,
+            "reused_tokens": 0,
+            "prefilled_tokens": 0,
+            "stores": 0,
+            "evictions": 0,
+            "rejected": 0
+        }
+
+    # ============ Okuma ============
+
+    def _best_match(self, adapter: Optional[str], tokens: np.ndarray) -> Tuple[Optional[int], int]:
+        """Aynı adapter'daki en uzun ortak öneki bul."""
+        best_id, best_len = None, 0
+        for entry_id, entry in self._entries.items():
+            if entry.adapter != adapter:
+                continue
+            length = _common_prefix_length(entry.tokens, tokens)
+            if length > best_len:
+                best_id, best_len = entry_id, length
+        return best_id, best_len
+
+    def fetch(
+        self,
+        adapter: Optional[str],
+        tokens: Sequence[int],
+        model: Any = None
+    ) -> Tuple[Optional[List[Any]], int]:
+        """
+        Prompt için kullanılabilir KV cache'i al.
+
+        Dönen cache saklanan girdinin sadece ortak önekini içeren kopyasıdır
+        (generation onu değiştirir); son prompt token'ı her zaman prefill'e
+        bırakılır.
+
+        Args:
+            adapter: Adapter adı
+            tokens: Prompt token'ları
+            model: Verilirse eşleşme yoksa boş cache oluşturulur
+
+        Returns:
+            (KV cache veya None, önbellekten gelen token sayısı)
+        """
+        tokens = np.asarray(tokens, dtype=np.int64)
+
+        with self._lock:
+            self.stats["lookups"] += 1
+            entry_id, length = self._best_match(adapter, tokens)
+            length = min(length, len(tokens) - 1)
+
+            if entry_id is None or length < self.min_prefix_tokens:
+                self.stats["misses"] += 1
+                self.stats["prefilled_tokens"] += len(tokens)
+                entry = None
+            else:
+                entry = self._entries[entry_id]
+                self._entries.move_to_end(entry_id)
+
+        if entry is None:
+            return (self._make_cache(model) if model is not None else None), 0
+
+        cache = self._copy_prefix(entry.cache, length)
+        if cache is None:
+            with self._lock:
+                self.stats["misses"] += 1
+                self.stats["prefilled_tokens"] += len(tokens)
+            return (self._make_cache(model) if model is not None else None), 0
+
+        with self._lock:
+            self.stats["hits"] += 1
+            self.stats["reused_tokens"] += length
+            self.stats["prefilled_tokens"] += len(tokens) - length
+        return cache, length
+
+    # ============ Yazma ============
+
+    def store(self, adapter: Optional[str], tokens: Sequence[int], cache: List[Any]) -> bool:
+        """
+        Generation sonrası KV durumunu sakla.
+
+        Args:
+            adapter: Adapter adı
+            tokens: Cache'e beslenen token'lar (prompt + üretilen)
+            cache: KV cache (sahipliği önbelleğe geçer)
+
+        Returns:
+            Saklandıysa True
+        """
+        tokens = np.asarray(tokens, dtype=np.int64)
+        offset = _cache_offset(cache)
+
+        # Cache, bilinen token'lardan fazlasını içeriyorsa fazlayı at
+        if offset > len(tokens) and not self._trim(cache, offset - len(tokens)):
+            return False
+        tokens = tokens[:min(offset, len(tokens))]
+        if len(tokens) < self.min_prefix_tokens:
+            return False
+
+        nbytes = _cache_nbytes(cache)
+        with self._lock:
+            if nbytes > self.max_bytes:
+                self.stats["rejected"] += 1
+                return False
+
+            # Yeni girdinin öneki olan eski girdiler gereksiz (trim ile karşılanır)
+            for entry_id, entry in list(self._entries.items()):
+                if entry.adapter == adapter and len(entry.tokens) <= len(tokens) \
+                        and _common_prefix_length(entry.tokens, tokens) == len(entry.tokens):
+                    self._remove(entry_id)
+
+            self._entries[next(self._ids)] = _PrefixEntry(adapter, tokens, cache, nbytes)
+            self._bytes += nbytes
+            self.stats["stores"] += 1
+
+            while self._entries and (self._bytes > self.max_bytes or len(self._entries) > self.max_entries):
+                self._remove(next(iter(self._entries)))
+                self.stats["evictions"] += 1
+        return True
+
+    def _remove(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id)
+        self._bytes -= entry.nbytes
+
+    def clear(self, adapter: Optional[str] = None) -> None:
+        """Önbelleği (veya tek adapter'ın girdilerini) temizle."""
+        with self._lock:
+            for entry_id, entry in list(self._entries.items()):
+                if adapter is None or entry.adapter == adapter:
+                    self._remove(entry_id)
+
+    # ============ MLX yardımcıları ============
+
+    @staticmethod
+    def _make_cache(model: Any) -> List[Any]:
+        from mlx_lm.models.cache import make_prompt_cache
+        return make_prompt_cache(model)
+
+    @classmethod
+    def _copy_prefix(cls, cache: List[Any], length: int) -> Optional[List[Any]]:
+        """
+        Saklanan cache'in ilk `length` token'ını kopyala (önce kırp, sonra kopyala).
+
+        Düz KVCache katmanlarında sadece önek dilimlenir; diğer cache türleri
+        tamamı kopyalanıp kırpılır. Kırpılamıyorsa None döner.
+        """
+        from mlx_lm.models.cache import KVCache
+        if all(type(layer) is KVCache and layer.keys is not None for layer in cache):
+            copied = []
+            for layer in cache:
+                prefix = KVCache()
+                prefix.keys = layer.keys[..., :length, :]
+                prefix.values = layer.values[..., :length, :]
+                prefix.offset = length
+                copied.append(prefix)
+            return copied
+
+        copied = copy.deepcopy(cache)
+        excess = _cache_offset(copied) - length
+        if excess > 0 and not cls._trim(copied, excess):
+            return None
+        return copied
+
+    @staticmethod
+    def _trim(cache: List[Any], n: int) -> bool:
+        from mlx_lm.models.cache import can_trim_prompt_cache, trim_prompt_cache
+        if not can_trim_prompt_cache(cache):
+            return False
+        return trim_prompt_cache(cache, n) == n
+
+    # ============ İstatistikler ============
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Hit oranı, yeniden kullanılan token ve bellek istatistikleri."""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["entries"] = len(self._entries)
+            stats["memory_mb"] = round(self._bytes / (1024 * 1024), 2)
+
+        lookups = stats["lookups"]
+        total_tokens = stats["reused_tokens"] + stats["prefilled_tokens"]
+        stats["hit_rate"] = round(stats["hits"] / lookups * 100, 2) if lookups else 0
+        stats["reused_token_rate"] = round(stats["reused_tokens"] / total_tokens * 100, 2) if total_tokens else 0
+        stats["max_memory_mb"] = round(self.max_bytes / (1024 * 1024), 2)
+        return stats
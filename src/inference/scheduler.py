@@ -0,0 +1,518 @@
+"""
+EVO-TR: Continuous Batching Scheduler
+
+Birden fazla eşzamanlı generation isteğini tek bir decode döngüsünde
+yürütür:
+- Yeni istekler çalışan batch'e bir sonraki token sınırında katılır
+- Aktif diziler adapter'a (model + adapter adı) göre gruplanır; bir grup
+  group_quantum adım ilerletilip sıradakine geçilir (round-robin), böylece
+  shared-base modda adapter ağırlıkları her token'da değil her quantum'da değişir
+- Biten/iptal edilen diziler diğerlerini bekletmeden batch'ten çıkar
+
+Model erişimi DecodeBackend arayüzü üzerinden yapılır; bu sayede
+scheduler deterministik sahte bir backend ile CPU'da test edilebilir.
+"""
+
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+import copy
+import itertools
+import queue
+import threading
+import time
+
+from .prefix_cache import PromptPrefixCache, encode_prompt
+
+
+_DONE = object()
+
+
+@dataclass
+class DecodeStep:
+    """Bir dizinin tek decode adımındaki çıktısı."""
+    text: str
+    finished: bool = False
+    finish_reason: Optional[str] = None
+    tokens: int = 1  # Bu adımda üretilen token (EOS adımında 0)
+
+
+@dataclass
+class GenerationRequest:
+    """
+    Scheduler'a gönderilen tek generation isteği.
+
+    Aynı zamanda çağıranın handle'ıdır: parçalar iter() ile akış halinde,
+    tam metin result() ile alınır; cancel() diziyi bir sonraki adımda
+    batch'ten çıkarır. on_finish verilirse scheduler diziyi çıkardığında
+    (tamamlanma, iptal veya hata) son metriklerle bir kez çağrılır.
+    """
+    model: Any
+    tokenizer: Any
+    prompt: Any
+    max_tokens: int
+    adapter: Optional[str] = None
+    request_id: int = 0
+
+    enqueued_at: float = field(default_factory=time.monotonic)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    prompt_tokens: int = 0
+    tokens: int = 0
+    finish_reason: Optional[str] = None
+    error: Optional[BaseException] = None
+    on_finish: Optional[Callable[["GenerationRequest"], None]] = field(default=None, repr=False)
+
+    _state: Any = field(default=None, repr=False)
+    _parts: List[str] = field(default_factory=list, repr=False)
+    _chunks: "queue.Queue" = field(default_factory=queue.Queue, repr=False)
+    _done: threading.Event = field(default_factory=threading.Event, repr=False)
+    _cancelled: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    @property
+    def group_key(self) -> Tuple[int, Optional[str]]:
+        """Aynı forward pass'i paylaşabilecek isteklerin anahtarı."""
+        return (id(self.model), self.adapter)
+
+    @property
+    def queue_wait(self) -> float:
+        """Kuyrukta bekleme süresi (saniye)."""
+        end = self.started_at if self.started_at is not None else time.monotonic()
+        return end - self.enqueued_at
+
+    @property
+    def generation_time(self) -> float:
+        """Prefill dahil üretim süresi (saniye)."""
+        if self.started_at is None:
+            return 0.0
+        end = self.finished_at if self.finished_at is not None else time.monotonic()
+        return end - self.started_at
+
+    @property
+    def tokens_per_second(self) -> float:
+        """Bu isteğin üretim hızı."""
+        elapsed = self.generation_time
+        return self.tokens / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def cancel(self) -> None:
+        """İsteği iptal et (kuyruktaysa hiç başlamaz)."""
+        self._cancelled.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Scheduler istek ile işini bitirene kadar bekle (metrikler kesinleşir)."""
+        return self._done.wait(timeout)
+
+    def __iter__(self) -> Iterator[str]:
+        while True:
+            item = self._chunks.get()
+            if item is _DONE:
+                if self.error is not None:
+                    raise self.error
+                return
+            yield item
+
+    def result(self, timeout: Optional[float] = None) -> str:
+        """
+        İstek bitene kadar bekle ve tam metni döndür.
+
+        Raises:
+            TimeoutError: timeout dolarsa
+        """
+        if not self._done.wait(timeout):
+            raise TimeoutError("Generation zaman aşımına uğradı")
+        if self.error is not None:
+            raise self.error
+        return "".join(self._parts)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """İstek bazlı metrikler."""
+        return {
+            "request_id": self.request_id,
+            "adapter": self.adapter,
+            "prompt_tokens": self.prompt_tokens,
+            "tokens": self.tokens,
+            "queue_wait_ms": round(self.queue_wait * 1000, 2),
+            "generation_time": round(self.generation_time, 3),
+            "tokens_per_second": round(self.tokens_per_second, 1),
+            "finish_reason": self.finish_reason
+        }
+
+
+class DecodeBackend(ABC):
+    """
+    Scheduler'ın model erişim arayüzü.
+
+    prefill() isteğin prompt'unu işleyip dizi durumunu döndürür;
+    step() aynı gruptaki dizileri birer token ilerletir.
+    """
+
+    @abstractmethod
+    def prefill(self, request: GenerationRequest) -> Any:
+        """Prompt'u işle, request.prompt_tokens'ı doldur ve dizi durumunu döndür."""
+
+    @abstractmethod
+    def step(self, model: Any, states: List[Any]) -> List[DecodeStep]:
+        """Dizileri birer token ilerlet (states ile aynı sırada sonuç döner)."""
+
+    def release(self, state: Any) -> None:
+        """Batch'ten çıkan dizinin kaynaklarını bırak."""
+
+
+@dataclass
+class _MLXSequence:
+    """MLX backend'inde tek dizinin decode durumu."""
+    tokens: Iterator
+    detokenizer: Any
+    eos_token_ids: Any
+    max_tokens: int
+    generated: int = 0
+    adapter: Optional[str] = None
+    prompt_ids: List[int] = field(default_factory=list)
+    token_ids: List[int] = field(default_factory=list)
+    cache: Optional[List[Any]] = None
+
+
+class MLXDecodeBackend(DecodeBackend):
+    """
+    mlx_lm.generate_step tabanlı backend.
+
+    Not: Her dizi kendi KV cache'i ile ayrı ayrı ilerletilir; adımlar
+    token sınırında iç içe geçer (interleaved) ama tek bir matris
+    çarpımında birleştirilmez. Gerçek batched forward için bu arayüzü
+    uygulayan başka bir backend verilebilir.
+
+    prefix_cache verilirse prompt'un önbellekteki öneki prefill edilmez,
+    dizi bittiğinde KV durumu tekrar önbelleğe yazılır.
+
+    adapter_pool verilirse (shared-base mod) tüm adapter'lar aynı model
+    nesnesini paylaşır; her grup adımı pool lock'u altında grubun kendi
+    adapter'ı aktif edilerek çalıştırılır.
+    """
+
+    def __init__(
+        self,
+        prefix_cache: Optional[PromptPrefixCache] = None,
+        adapter_pool: Optional[Any] = None
+    ):
+        self.prefix_cache = prefix_cache
+        self.adapter_pool = adapter_pool
+
+    def prefill(self, request: GenerationRequest) -> _MLXSequence:
+        import mlx.core as mx
+        from mlx_lm.generate import generate_step
+        from mlx_lm.tokenizer_utils import TokenizerWrapper
+
+        tokenizer = request.tokenizer
+        if not isinstance(tokenizer, TokenizerWrapper):
+            tokenizer = TokenizerWrapper(tokenizer)
+
+        prompt_ids = encode_prompt(tokenizer, request.prompt)
+        request.prompt_tokens = len(prompt_ids)
+
+        cache, reused = None, 0
+        if self.prefix_cache is not None:
+            cache, reused = self.prefix_cache.fetch(request.adapter, prompt_ids, request.model)
+
+        # Eski mlx_lm sürümlerinde detokenizer paylaşımlı, kopyala
+        detokenizer = copy.copy(tokenizer.detokenizer)
+        detokenizer.reset()
+
+        return _MLXSequence(
+            tokens=generate_step(
+                mx.array(prompt_ids[reused:]),
+                request.model,
+                max_tokens=request.max_tokens,
+                prompt_cache=cache
+            ),
+            detokenizer=detokenizer,
+            eos_token_ids=tokenizer.eos_token_ids,
+            max_tokens=request.max_tokens,
+            adapter=request.adapter,
+            prompt_ids=prompt_ids,
+            cache=cache
+        )
+
+    def step(self, model: Any, states: List[_MLXSequence]) -> List[DecodeStep]:
+        if self.adapter_pool is None:
+            return [self._step_one(seq) for seq in states]
+
+        # İstek yolu aradaki sürede başka adapter'a geçmiş olabilir
+        # (grup anahtarı aynı adapter'ı garanti eder)
+        with self.adapter_pool.lock:
+            self.adapter_pool.activate(states[0].adapter)
+            return [self._step_one(seq) for seq in states]
+
+    @staticmethod
+    def _step_one(seq: _MLXSequence) -> DecodeStep:
+        token = next(seq.tokens, None)
+        if token is None:
+            seq.detokenizer.finalize()
+            return DecodeStep(seq.detokenizer.last_segment, True, "length", tokens=0)
+
+        token = token[0] if isinstance(token, tuple) else token
+        token = token.item() if hasattr(token, "item") else token
+        seq.token_ids.append(token)
+        if token in seq.eos_token_ids:
+            seq.detokenizer.finalize()
+            return DecodeStep(seq.detokenizer.last_segment, True, "stop", tokens=0)
+
+        seq.generated += 1
+        seq.detokenizer.add_token(token)
+        if seq.generated >= seq.max_tokens:
+            seq.detokenizer.finalize()
+            return DecodeStep(seq.detokenizer.last_segment, True, "length")
+        return DecodeStep(seq.detokenizer.last_segment)
+
+    def release(self, state: _MLXSequence) -> None:
+        close = getattr(state.tokens, "close", None)
+        if close is not None:
+            close()
+        if self.prefix_cache is not None and state.cache is not None:
+            self.prefix_cache.store(state.adapter, state.prompt_ids + state.token_ids, state.cache)
+
+
+class ContinuousBatchScheduler:
+    """
+    Continuous batching scheduler.
+
+    Akış (her döngü bir token sınırıdır):
+    1. İptal edilen diziler batch'ten çıkarılır
+    2. Kuyruktaki istekler boş slotlara alınır (prefill)
+    3. Adapter grubu bir token ilerletilir (quantum dolunca sıradaki grup)
+    4. Biten diziler tamamlanır, slotları boşalır
+    """
+
+    def __init__(
+        self,
+        backend: Optional[DecodeBackend] = None,
+        max_batch_size: int = 8,
+        group_quantum: int = 8
+    ):
+        """
+        ContinuousBatchScheduler başlat.
+
+        Args:
+            backend: Decode backend'i (None = MLXDecodeBackend)
+            max_batch_size: Aynı anda decode edilen maksimum dizi sayısı
+            group_quantum: Başka grup beklerken bir grubun art arda
+                ilerletileceği adım sayısı (adapter geçişi başına token)
+        """
+        self.backend = backend or MLXDecodeBackend()
+        self.max_batch_size = max_batch_size
+        self.group_quantum = max(1, group_quantum)
+
+        self._waiting: deque = deque()
+        self._active: "OrderedDict[int, GenerationRequest]" = OrderedDict()
+        self._last_group: Optional[Tuple[int, Optional[str]]] = None
+        self._group_steps = 0
+        self._ids = itertools.count(1)
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+
+        self.stats = {
+            "requests": 0,
+            "completed": 0,
+            "cancelled": 0,
+            "failed": 0,
+            "steps": 0,
+            "group_switches": 0,
+            "tokens": 0,
+            "total_step_sequences": 0,
+            "total_queue_wait": 0.0,
+            "total_decode_time": 0.0,
+            "max_active_seen": 0
+        }
+
+    # ============ İstek tarafı ============
+
+    def submit(
+        self,
+        model: Any,
+        tokenizer: Any,
+        prompt: Any,
+        max_tokens: int = 512,
+        adapter: Optional[str] = None,
+        on_finish: Optional[Callable[[GenerationRequest], None]] = None
+    ) -> GenerationRequest:
+        """
+        İsteği kuyruğa al.
+
+        Args:
+            model: Model (aynı model + adapter istekleri aynı grupta ilerler)
+            tokenizer: Tokenizer
+            prompt: Prompt metni veya token listesi
+            max_tokens: Maksimum üretilecek token
+            adapter: Adapter adı (gruplama anahtarı)
+            on_finish: İstek batch'ten çıkınca çağrılır (scheduler thread'inde)
+
+        Returns:
+            GenerationRequest handle'ı
+        """
+        request = GenerationRequest(
+            model=model,
+            tokenizer=tokenizer,
+            prompt=prompt,
+            max_tokens=max_tokens,
+            adapter=adapter,
+            request_id=next(self._ids),
+            on_finish=on_finish
+        )
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("ContinuousBatchScheduler kapatıldı")
+            self._waiting.append(request)
+            self.stats["requests"] += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="batch-scheduler", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return request
+
+    def generate(self, model: Any, tokenizer: Any, prompt: Any, max_tokens: int = 512,
+                 adapter: Optional[str] = None) -> str:
+        """Senkron generation (istek bitene kadar bekler)."""
+        return self.submit(model, tokenizer, prompt, max_tokens, adapter).result()
+
+    # ============ Decode döngüsü ============
+
+    def _finish(self, request: GenerationRequest, outcome: str) -> None:
+        """İsteği tamamla ve bekleyenleri uyandır."""
+        request.finished_at = time.monotonic()
+        if request._state is not None:
+            try:
+                self.backend.release(request._state)
+            finally:
+                request._state = None
+        if request.on_finish is not None:
+            # Bekleyenler uyanmadan önce: wait() dönünce metrikler kaydedilmiş olur
+            try:
+                request.on_finish(request)
+            except Exception as e:
+                print(f"⚠️ on_finish hatası (istek {request.request_id}): {e}")
+        request._done.set()
+        request._chunks.put(_DONE)
+        self.stats[outcome] += 1
+
+    def _retire_cancelled(self) -> None:
+        """İptal edilen aktif ve bekleyen istekleri çıkar."""
+        for rid in [rid for rid, r in self._active.items() if r._cancelled.is_set()]:
+            self._finish(self._active.pop(rid), "cancelled")
+        with self._cond:
+            if any(r._cancelled.is_set() for r in self._waiting):
+                kept = deque()
+                for r in self._waiting:
+                    if r._cancelled.is_set():
+                        self._finish(r, "cancelled")
+                    else:
+                        kept.append(r)
+                self._waiting = kept
+
+    def _admit(self) -> None:
+        """Boş slotlara bekleyen istekleri al (prefill)."""
+        while self._waiting and len(self._active) < self.max_batch_size:
+            with self._cond:
+                request = self._waiting.popleft()
+            request.started_at = time.monotonic()
+            self.stats["total_queue_wait"] += request.queue_wait
+            try:
+                request._state = self.backend.prefill(request)
+            except Exception as e:
+                request.error = e
+                self._finish(request, "failed")
+                continue
+            self._active[request.request_id] = request
+        self.stats["max_active_seen"] = max(self.stats["max_active_seen"], len(self._active))
+
+    def _next_group(self) -> List[GenerationRequest]:
+        """Son grup quantum'unu doldurana kadar onu, sonra sıradaki grubu seç (round-robin)."""
+        groups: "OrderedDict[Tuple, List[GenerationRequest]]" = OrderedDict()
+        for request in self._active.values():
+            groups.setdefault(request.group_key, []).append(request)
+
+        keys = list(groups)
+        if self._last_group not in groups:
+            key = keys[0]
+        elif self._group_steps < self.group_quantum or len(keys) == 1:
+            key = self._last_group
+        else:
+            key = keys[(keys.index(self._last_group) + 1) % len(keys)]
+
+        if key != self._last_group:
+            self.stats["group_switches"] += 1
+            self._group_steps = 0
+        self._last_group = key
+        self._group_steps += 1
+        return groups[key]
+
+    def _step(self) -> None:
+        """Bir adapter grubunu bir token ilerlet."""
+        batch = self._next_group()
+        started = time.monotonic()
+        try:
+            outputs = self.backend.step(batch[0].model, [r._state for r in batch])
+        except Exception as e:
+            for request in batch:
+                request.error = e
+                self._finish(self._active.pop(request.request_id), "failed")
+            return
+        self.stats["total_decode_time"] += time.monotonic() - started
+        self.stats["steps"] += 1
+        self.stats["total_step_sequences"] += len(batch)
+
+        for request, out in zip(batch, outputs):
+            if out.text:
+                request._parts.append(out.text)
+                request._chunks.put(out.text)
+            request.tokens += out.tokens
+            self.stats["tokens"] += out.tokens
+            if out.finished:
+                request.finish_reason = out.finish_reason
+                self._finish(self._active.pop(request.request_id), "completed")
+
+    def _run(self) -> None:
+        """Scheduler thread döngüsü."""
+        while True:
+            with self._cond:
+                while not self._waiting and not self._active and not self._closed:
+                    self._cond.wait()
+                if self._closed and not self._waiting and not self._active:
+                    return
+
+            self._retire_cancelled()
+            self._admit()
+            if self._active:
+                self._step()
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Yeni istek almayı durdur, çalışanları bitir."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+
+    # ============ İstatistikler ============
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Throughput, batch doluluğu ve kuyruk bekleme istatistikleri."""
+        with self._cond:
+            stats = dict(self.stats)
+            stats["waiting"] = len(self._waiting)
+        stats["active"] = len(self._active)
+
+        steps = stats["steps"]
+        started = stats["requests"] - stats["waiting"]
+        decode_time = stats.pop("total_decode_time")
+        stats["avg_batch_size"] = round(stats.pop("total_step_sequences") / steps, 2) if steps else 0
+        stats["avg_queue_wait_ms"] = round(stats.pop("total_queue_wait") / started * 1000, 2) if started else 0
+        stats["tokens_per_second"] = round(stats["tokens"] / decode_time, 1) if decode_time > 0 else 0
+        stats["max_batch_size"] = self.max_batch_size
+        stats["group_quantum"] = self.group_quantum
+        stats["backend"] = type(self.backend).__name__
+        return stats
@@ -10,6 +10,7 @@ Gece modu - Log analizi, bilgi çıkarımı ve self-improvement.
 - Bilgi çıkarımı (facts extraction)
 - ChromaDB'ye yeni bilgi yazımı
 - Eğitim verisi önerileri
+- Hafıza sıkıştırma (yakın kopya temizliği, eski konuşmaların silinmesi)
 """
 
 import json
@@ -143,13 +144,19 @@ class AsyncProcessor:
         self,
         log_dir: str = "./logs",
         memory_handler = None,
-        output_dir: str = "./logs/analysis"
+        output_dir: str = "./logs/analysis",
+        compaction_policy = None,
+        compaction_handler = None
     ):
         self.log_dir = Path(log_dir)
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True, exist_ok=True)
         
         self.memory_handler = memory_handler
+        # CompactionPolicy verilirse tam analiz sonunda hafıza sıkıştırılır;
+        # compaction_handler sadece sıkıştırılır (bilgi yazılmaz), yoksa memory_handler
+        self.compaction_policy = compaction_policy
+        self.compaction_handler = compaction_handler or memory_handler
         self.logger = create_logger(log_dir)
         
         # Analysis results
@@ -504,24 +511,46 @@ class AsyncProcessor:
         if not self.memory_handler:
             return 0
         
-        count = 0
-        for fact in facts:
-            try:
-                self.memory_handler.add_memory(
-                    text=fact.fact_text,
-                    memory_type="fact",
-                    metadata={
-                        "source": "async_extraction",
-                        "category": fact.category,
-                        "confidence": fact.confidence,
-                        "source_query": fact.source_query
-                    }
-                )
-                count += 1
-            except Exception as e:
-                self.logger.log_error(f"Memory sync error: {e}")
-        
-        return count
+        items = (
+            (fact.fact_text, {
+                "source": "async_extraction",
+                "category": fact.category,
+                "confidence": fact.confidence,
+                "source_query": fact.source_query
+            })
+            for fact in facts
+        )
+        
+        # Hata olursa o ana kadar yazılan batch'ler yine sayılır
+        written = {"added": 0}
+        try:
+            # Tek batch encode; daha önce kaydedilen bilgiler tekrar eklenmez
+            stats = self.memory_handler.add_memories_bulk(
+                items,
+                memory_type="fact",
+                progress=lambda progress: written.update(added=progress["added"])
+            )
+        except Exception as e:
+            self.logger.log_error(f"Memory sync error: {e}")
+            return written["added"]
+        
+        return stats["added"]
+    
+    def compact_memory(self, dry_run: bool = False) -> Optional[Dict[str, Any]]:
+        """Hafıza collection'ını sıkıştır (yakın kopyalar + saklama politikası)"""
+        if not self.compaction_handler:
+            return None
+        
+        from ..memory.compaction import MemoryCompactor
+        
+        try:
+            report = MemoryCompactor(self.compaction_handler, self.compaction_policy).run(dry_run=dry_run)
+        except Exception as e:
+            self.logger.log_error(f"Memory compaction error: {e}")
+            return None
+        
+        self.logger.log_system("Memory compaction completed", report.to_dict())
+        return report.to_dict()
     
     # ============ Report Management ============
     
@@ -574,6 +603,10 @@ class AsyncProcessor:
         # 7. Öneriler
         results["recommendations"] = daily_report.recommendations
         
+        # 8. Hafıza sıkıştırma (sync'ten sonra: yeni bilgiler de kopya kontrolüne girer)
+        if self.compaction_handler and self.compaction_policy is not None:
+            results["memory_compaction"] = self.compact_memory()
+        
         # Sonuç raporunu kaydet
         report_path = self.output_dir / f"full_analysis_{date}.json"
         with open(report_path, 'w', encoding='utf-8') as f:
@@ -591,10 +624,17 @@ class AsyncProcessor:
 
 def create_async_processor(
     log_dir: str = "./logs",
-    memory_handler = None
+    memory_handler = None,
+    compaction_policy = None,
+    compaction_handler = None
 ) -> AsyncProcessor:
     """AsyncProcessor oluştur"""
-    return AsyncProcessor(log_dir=log_dir, memory_handler=memory_handler)
+    return AsyncProcessor(
+        log_dir=log_dir,
+        memory_handler=memory_handler,
+        compaction_policy=compaction_policy,
+        compaction_handler=compaction_handler
+    )
 
 
 if __name__ == "__main__":
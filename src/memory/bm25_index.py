@@ -0,0 +1,317 @@
+"""
+EVO-TR: BM25 Lexical Index
+
+Hafıza için süreç içi BM25 ters indeksi. Yoğun (dense) aramanın
+kaçırdığı birebir terimleri (Türkçe özel isimler, kod tanımlayıcıları,
+yıllar) bulur; MemoryHandler hibrit aramada sonuçları RRF ile birleştirir.
+
+- Türkçe normalizasyon: I/ı, İ/i doğru küçültülür, ş/ğ/ç/ö/ü/ı katlanır
+  ("Atatürk" == "ataturk"), kesme işaretli ekler ayrılır ("İstanbul'da")
+- Hafif kök bulma: alfabetik terimler ilk 5 harfe kırpılır (F5)
+- Artımlı ekleme/silme; kalıcılık = sıkıştırılmış snapshot + işlem günlüğü
+- Sorgu zaman bütçesi: terimler nadirden sık olana işlenir, süre dolunca durulur
+"""
+
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from collections import Counter
+from pathlib import Path
+import gzip
+import json
+import math
+import re
+import threading
+import time
+import unicodedata
+
+
+# Türkçe küçük harf + diakritik katlama
+_TURKISH_LOWER = str.maketrans({"I": "ı", "İ": "i"})
+_FOLD = str.maketrans({"ı": "i", "ş": "s", "ğ": "g", "ç": "c", "ö": "o", "ü": "u", "â": "a", "î": "i", "û": "u"})
+_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+# Bu uzunluktan uzun alfabetik terimler kırpılır (Türkçe için F5 kök bulma)
+STEM_PREFIX = 5
+
+
+def normalize_turkish(text: str) -> str:
+    """Türkçe kurallarıyla küçült ve diakritikleri katla."""
+    text = unicodedata.normalize("NFC", text).translate(_TURKISH_LOWER).lower()
+    # "i̇" (i + birleşik nokta) gibi kalıntıları temizle
+    text = unicodedata.normalize("NFKD", text.translate(_FOLD))
+    return "".join(ch for ch in text if not unicodedata.combining(ch))
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Metni BM25 terimlerine ayır.
+
+    Sayılar ve '_' içeren kod tanımlayıcıları olduğu gibi kalır,
+    alfabetik kelimeler ilk STEM_PREFIX harfe kırpılır.
+    """
+    terms = []
+    for token in _TOKEN_PATTERN.findall(normalize_turkish(text)):
+        if token.isalpha():
+            if len(token) < 2:
+                continue
+            token = token[:STEM_PREFIX]
+        terms.append(token)
+    return terms
+
+
+class BM25Index:
+    """
+    Artımlı BM25 ters indeksi.
+
+    Kullanım:
+        index = BM25Index(path="./data/chromadb/bm25_evo_memory")
+        index.add(doc_id, text, memory_type)
+        index.search("1923 cumhuriyet", top_k=5)  # [(doc_id, skor), ...]
+        index.remove(doc_id)
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        k1: float = 1.2,
+        b: float = 0.75,
+        snapshot_every: int = 1000
+    ):
+        """
+        BM25Index başlat (path verilirse diskten yükler).
+
+        Args:
+            path: Dosya öneki (<path>.json.gz snapshot, <path>.log günlük)
+            k1: Terim frekansı doygunluğu
+            b: Belge uzunluğu normalizasyonu
+            snapshot_every: Günlük bu kadar işleme ulaşınca snapshot alınır
+        """
+        self.path = Path(path) if path else None
+        self.k1 = k1
+        self.b = b
+        self.snapshot_every = snapshot_every
+
+        # doc_id -> (memory_type, {term: tf}, uzunluk)
+        self._docs: Dict[str, Tuple[Optional[str], Dict[str, int], int]] = {}
+        # term -> {doc_id: tf}
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._total_length = 0
+        self._log_ops = 0
+        self._lock = threading.RLock()
+
+        self.stats = {
+            "queries": 0,
+            "budget_cutoffs": 0,
+            "snapshots": 0
+        }
+
+        if self.path is not None:
+            self._load()
+
+    # ============ Güncelleme ============
+
+    def add(self, doc_id: str, text: str, memory_type: Optional[str] = None) -> None:
+        """Belgeyi indeksle (aynı ID varsa değiştirilir)."""
+        terms = dict(Counter(tokenize(text)))
+        with self._lock:
+            self._insert(doc_id, memory_type, terms)
+            self._append_log({"op": "add", "id": doc_id, "type": memory_type, "terms": terms})
+
+    def add_many(self, docs: Iterable[Tuple[str, str, Optional[str]]]) -> int:
+        """(doc_id, text, memory_type) listesini indeksle. Returns: eklenen sayısı."""
+        entries = [(doc_id, memory_type, dict(Counter(tokenize(text)))) for doc_id, text, memory_type in docs]
+        with self._lock:
+            for doc_id, memory_type, terms in entries:
+                self._insert(doc_id, memory_type, terms)
+            self._append_log(*[
+                {"op": "add", "id": doc_id, "type": memory_type, "terms": terms}
+                for doc_id, memory_type, terms in entries
+            ])
+        return len(entries)
+
+    def remove(self, doc_id: str) -> bool:
+        """Belgeyi indeksten çıkar."""
+        with self._lock:
+            if not self._delete(doc_id):
+                return False
+            self._append_log({"op": "remove", "id": doc_id})
+            return True
+
+    def remove_many(self, doc_ids: Iterable[str]) -> int:
+        """Birden fazla belgeyi çıkar. Returns: çıkarılan sayısı."""
+        with self._lock:
+            removed = [doc_id for doc_id in doc_ids if self._delete(doc_id)]
+            self._append_log(*[{"op": "remove", "id": doc_id} for doc_id in removed])
+        return len(removed)
+
+    def clear(self) -> None:
+        """Tüm indeksi temizle."""
+        with self._lock:
+            self._docs.clear()
+            self._postings.clear()
+            self._total_length = 0
+            self.save()
+
+    def _insert(self, doc_id: str, memory_type: Optional[str], terms: Dict[str, int]) -> None:
+        self._delete(doc_id)
+        length = sum(terms.values())
+        self._docs[doc_id] = (memory_type, terms, length)
+        self._total_length += length
+        for term, tf in terms.items():
+            self._postings.setdefault(term, {})[doc_id] = tf
+
+    def _delete(self, doc_id: str) -> bool:
+        entry = self._docs.pop(doc_id, None)
+        if entry is None:
+            return False
+        _, terms, length = entry
+        self._total_length -= length
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+        return True
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._docs
+
+    # ============ Arama ============
+
+    def search(
+        self,
+        query: str,
+        top_k: int = 10,
+        memory_type: Optional[str] = None,
+        budget_ms: Optional[float] = None
+    ) -> List[Tuple[str, float]]:
+        """
+        BM25 araması.
+
+        Args:
+            query: Sorgu metni
+            top_k: Döndürülecek maksimum belge
+            memory_type: Sadece bu tipteki belgeler
+            budget_ms: Süre bütçesi; dolunca kalan (sık) terimler atlanır
+
+        Returns:
+            Skora göre azalan [(doc_id, skor), ...]
+        """
+        deadline = time.monotonic() + budget_ms / 1000 if budget_ms else None
+        query_terms = list(dict.fromkeys(tokenize(query)))
+
+        with self._lock:
+            self.stats["queries"] += 1
+            n_docs = len(self._docs)
+            if not n_docs or not query_terms:
+                return []
+            avg_length = self._total_length / n_docs
+
+            weighted = []
+            for term in query_terms:
+                postings = self._postings.get(term)
+                if postings:
+                    df = len(postings)
+                    idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                    weighted.append((idf, postings))
+            # Nadir (ayırt edici) terimler önce: bütçe dolarsa kaybedilen en az bilgi
+            weighted.sort(key=lambda item: -item[0])
+
+            scores: Dict[str, float] = {}
+            for i, (idf, postings) in enumerate(weighted):
+                if deadline is not None and i > 0 and time.monotonic() > deadline:
+                    self.stats["budget_cutoffs"] += 1
+                    break
+                for doc_id, tf in postings.items():
+                    doc_type, _, length = self._docs[doc_id]
+                    if memory_type is not None and doc_type != memory_type:
+                        continue
+                    norm = self.k1 * (1 - self.b + self.b * length / avg_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: -item[1])
+        return ranked[:top_k]
+
+    # ============ Kalıcılık ============
+
+    def _snapshot_path(self) -> Path:
+        return self.path.with_name(self.path.name + ".json.gz")
+
+    def _log_path(self) -> Path:
+        return self.path.with_name(self.path.name + ".log")
+
+    def _append_log(self, *ops: Dict[str, Any]) -> None:
+        """İşlemi günlüğe yaz; günlük büyüdüyse snapshot al. Lock tutulurken çağrılır."""
+        if self.path is None or not ops:
+            return
+        self._log_ops += len(ops)
+        if self._log_ops >= self.snapshot_every:
+            self.save()
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self._log_path(), "a", encoding="utf-8") as f:
+            for op in ops:
+                f.write(json.dumps(op, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+    def save(self) -> None:
+        """Sıkıştırılmış snapshot yaz ve günlüğü sıfırla."""
+        if self.path is None:
+            return
+        with self._lock:
+            data = {
+                "k1": self.k1,
+                "b": self.b,
+                "docs": {doc_id: [doc_type, terms] for doc_id, (doc_type, terms, _) in self._docs.items()}
+            }
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self._snapshot_path().with_suffix(".tmp")
+            with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+            tmp_path.replace(self._snapshot_path())
+            self._log_path().unlink(missing_ok=True)
+            self._log_ops = 0
+            self.stats["snapshots"] += 1
+
+    def _load(self) -> None:
+        """Snapshot + günlükten indeksi kur (ChromaDB'den yeniden hesaplama yok)."""
+        snapshot = self._snapshot_path()
+        if snapshot.exists():
+            try:
+                with gzip.open(snapshot, "rt", encoding="utf-8") as f:
+                    data = json.load(f)
+                for doc_id, (doc_type, terms) in data.get("docs", {}).items():
+                    self._insert(doc_id, doc_type, terms)
+            except (OSError, ValueError) as e:
+                print(f"⚠️ BM25 snapshot okunamadı: {e}")
+                self._docs.clear()
+                self._postings.clear()
+                self._total_length = 0
+
+        log_path = self._log_path()
+        if log_path.exists():
+            with open(log_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        op = json.loads(line)
+                    except ValueError:
+                        continue  # yarım yazılmış son satır
+                    if op.get("op") == "add":
+                        self._insert(op["id"], op.get("type"), op["terms"])
+                    elif op.get("op") == "remove":
+                        self._delete(op["id"])
+                    self._log_ops += 1
+
+    # ============ İstatistikler ============
+
+    def get_stats(self) -> Dict[str, Any]:
+        """İndeks boyutu ve sorgu istatistikleri."""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["documents"] = len(self._docs)
+            stats["terms"] = len(self._postings)
+            stats["avg_doc_length"] = round(self._total_length / len(self._docs), 2) if self._docs else 0
+            stats["pending_log_ops"] = self._log_ops
+        return stats
@@ -6,12 +6,29 @@ Uzun süreli hafıza yönetimi için ChromaDB entegrasyonu.
 
 import chromadb
 from chromadb.config import Settings
-from sentence_transformers import SentenceTransformer
-from typing import List, Dict, Any, Optional
+from typing import Callable, Iterable, List, Dict, Any, Optional, Tuple, Union
 from datetime import datetime
+import hashlib
+import itertools
+import time
 import uuid
 import json
 from pathlib import Path
+import numpy as np
+
+from ..services.embedding_service import EmbeddingService, get_embedding_service, normalize_text
+from ..services.token_counter import get_token_counter
+from .write_behind import WriteBehindBuffer
+from .search_cache import SearchResultCache, bump_generation
+from .bm25_index import BM25Index
+
+
+# Hibrit aramada her kaynaktan top_k * bu kadar aday alınır
+HYBRID_CANDIDATE_FACTOR = 4
+# Reciprocal-rank fusion sabiti (1 / (RRF_K + sıra))
+RRF_K = 60
+# search / search_batch mode değerleri
+SEARCH_MODES = ("dense", "hybrid")
 
 
 class MemoryHandler:
@@ -23,13 +40,25 @@ class MemoryHandler:
     - Semantic search (anlamsal arama)
     - Metadata filtreleme
     - Türkçe/İngilizce destek
+    - İsteğe bağlı write-behind (konuşmalar toplu yazılır)
+    - Toplu içe aktarma (batch encode, içerik hash'i ile tekilleştirme)
+    - Arama sonucu cache'i (TTL + yazmada geçersiz kılma)
+    - İsteğe bağlı hibrit arama (BM25 + dense, reciprocal-rank fusion)
     """
     
     def __init__(
         self, 
         persist_path: str = "./data/chromadb",
         collection_name: str = "evo_memory",
-        embedding_model: str = "paraphrase-multilingual-MiniLM-L12-v2"
+        embedding_model: str = "paraphrase-multilingual-MiniLM-L12-v2",
+        embedding_service: Optional[EmbeddingService] = None,
+        write_behind: bool = False,
+        write_batch_size: int = 32,
+        write_flush_interval: float = 2.0,
+        search_cache_size: int = 1024,
+        search_cache_ttl: float = 300.0,
+        hybrid_search: bool = False,
+        hybrid_budget_ms: float = 20.0
     ):
         """
         MemoryHandler başlat.
@@ -38,6 +67,14 @@ class MemoryHandler:
             persist_path: ChromaDB veritabanı yolu
             collection_name: Collection adı
             embedding_model: Sentence-transformer model adı
+            embedding_service: Paylaşımlı encoder (None = süreç geneli servis)
+            write_behind: Konuşmaları kuyruğa alıp arka planda toplu yaz
+            write_batch_size: Write-behind flush boyut eşiği
+            write_flush_interval: Write-behind flush süre eşiği (saniye)
+            search_cache_size: Önbellekte tutulacak arama sonucu (0 = kapalı)
+            search_cache_ttl: Arama sonucunun geçerlilik süresi (saniye)
+            hybrid_search: BM25 indeksi tut, search varsayılan olarak hibrit çalışsın
+            hybrid_budget_ms: Sorgu başına BM25 süre bütçesi
         """
         self.persist_path = Path(persist_path)
         self.persist_path.mkdir(parents=True, exist_ok=True)
@@ -45,8 +82,8 @@ class MemoryHandler:
         # ChromaDB client
         self.client = chromadb.PersistentClient(path=str(self.persist_path))
         
-        # Embedding modeli yükle
-        self._embedding_model = SentenceTransformer(embedding_model)
+        # Embedding modeli (router ile paylaşılır)
+        self._embedding_model = embedding_service or get_embedding_service(embedding_model)
         self._embedding_dim = self._embedding_model.get_sentence_embedding_dimension()
         
         # Collection oluştur/al
@@ -55,21 +92,115 @@ class MemoryHandler:
             metadata={"hnsw:space": "cosine"}  # Cosine similarity
         )
         
+        # Aynı collection'a yazan tüm handler'lar aynı generation sayacını artırır
+        self._collection_key = (str(self.persist_path.resolve()), collection_name)
+        self.search_cache: Optional[SearchResultCache] = None
+        if search_cache_size > 0:
+            self.search_cache = SearchResultCache(
+                self._collection_key,
+                max_size=search_cache_size,
+                ttl=search_cache_ttl
+            )
+        
+        self.write_behind: Optional[WriteBehindBuffer] = None
+        if write_behind:
+            self.write_behind = WriteBehindBuffer(
+                self,
+                max_batch_size=write_batch_size,
+                flush_interval=write_flush_interval
+            )
+        
+        # Leksikal indeks (collection ile aynı dizinde, artımlı güncellenir)
+        self.bm25: Optional[BM25Index] = None
+        self.hybrid_budget_ms = hybrid_budget_ms
+        if hybrid_search:
+            self.bm25 = BM25Index(path=str(self.persist_path / f"bm25_{collection_name}"))
+            if len(self.bm25) != self.collection.count():
+                self._rebuild_lexical_index()
+        self.search_mode = "hybrid" if self.bm25 is not None else "dense"
+        
         print(f"✅ MemoryHandler hazır | Collection: {collection_name} | Docs: {self.collection.count()}")
     
+    def _rebuild_lexical_index(self, page_size: int = 1000) -> None:
+        """BM25 indeksini collection'dan baştan kur (indeks yoksa / uyuşmuyorsa)."""
+        print(f"🔤 BM25 indeksi oluşturuluyor ({self.collection.count()} belge)...")
+        self.bm25.clear()
+        offset = 0
+        while True:
+            page = self.collection.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+            if not page["ids"]:
+                break
+            self.bm25.add_many(
+                (doc_id, doc or "", (meta or {}).get("type"))
+                for doc_id, doc, meta in zip(page["ids"], page["documents"], page["metadatas"])
+            )
+            offset += len(page["ids"])
+        self.bm25.save()
+    
+    def _on_documents_written(
+        self,
+        ids: List[str],
+        texts: List[str],
+        metadatas: List[Dict[str, Any]]
+    ) -> None:
+        """
+        Write-behind flush'ı sonrası: arama cache'ini geçersiz kıl, belgeleri BM25'e ekle.
+        
+        Belgeler artık overlay'de değil collection'da; flush'tan önce başlamış bir
+        aramanın eksik sonucu cache'te kalmasın diye her modda nesil artırılır.
+        """
+        self._mark_written()
+        if self.bm25 is None:
+            return
+        self.bm25.add_many(zip(ids, texts, (m.get("type") for m in metadatas)))
+        # Arada yapılan hibrit arama leksikal sonuçları eksik cache'lemiş olabilir
+        self._mark_written()
+    
     def _generate_id(self) -> str:
         """Benzersiz ID üret."""
         return str(uuid.uuid4())[:8]
     
+    def _mark_written(self) -> None:
+        """Collection değişti; önbellekteki arama sonuçları geçersiz."""
+        bump_generation(self._collection_key)
+    
     def _get_embedding(self, text: str) -> List[float]:
         """Metin için embedding vektörü üret."""
         return self._embedding_model.encode(text).tolist()
     
+    @staticmethod
+    def _content_hash(text: str, memory_type: str) -> str:
+        """Aynı içerik (ve tip) için sabit hash."""
+        return hashlib.sha1(f"{memory_type}\n{normalize_text(text)}".encode("utf-8")).hexdigest()
+    
+    @staticmethod
+    def _build_metadata(
+        text: str,
+        metadata: Optional[Dict[str, Any]],
+        memory_type: str
+    ) -> Dict[str, Any]:
+        """ChromaDB metadata'sı (None değerler atılır, liste/dict JSON'a çevrilir)."""
+        meta = {
+            "type": memory_type,
+            "timestamp": datetime.now().isoformat(),
+            "text_length": len(text)
+        }
+        
+        for key, value in (metadata or {}).items():
+            if value is None:
+                continue
+            if isinstance(value, (list, dict)):
+                value = json.dumps(value, ensure_ascii=False)
+            meta[key] = value
+        
+        return meta
+    
     def add_memory(
         self, 
         text: str, 
         metadata: Optional[Dict[str, Any]] = None,
-        memory_type: str = "conversation"
+        memory_type: str = "conversation",
+        defer: bool = False
     ) -> str:
         """
         Yeni hafıza ekle.
@@ -78,6 +209,7 @@ class MemoryHandler:
             text: Kaydedilecek metin
             metadata: Ek bilgiler (intent, topic, vb.)
             memory_type: Hafıza tipi (conversation, fact, preference, code)
+            defer: Write-behind açıksa kuyruğa al (encode/yazma arka planda)
         
         Returns:
             Oluşturulan belge ID'si
@@ -85,14 +217,12 @@ class MemoryHandler:
         doc_id = self._generate_id()
         
         # Metadata hazırla
-        meta = {
-            "type": memory_type,
-            "timestamp": datetime.now().isoformat(),
-            "text_length": len(text)
-        }
+        meta = self._build_metadata(text, metadata, memory_type)
         
-        if metadata:
-            meta.update(metadata)
+        if defer and self.write_behind is not None:
+            self.write_behind.add(doc_id, text, meta)
+            self._mark_written()
+            return doc_id
         
         # Embedding oluştur ve ekle
         embedding = self._get_embedding(text)
@@ -103,9 +233,107 @@ class MemoryHandler:
             documents=[text],
             metadatas=[meta]
         )
+        if self.bm25 is not None:
+            self.bm25.add(doc_id, text, memory_type)
+        self._mark_written()
         
         return doc_id
     
+    def add_memories_bulk(
+        self,
+        items: Iterable[Union[str, Tuple]],
+        memory_type: str = "fact",
+        batch_size: int = 256,
+        deduplicate: bool = True,
+        progress: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> Dict[str, Any]:
+        """
+        Çok sayıda hafızayı toplu ekle.
+        
+        Girdiler akış halinde okunur (generator verilebilir); her batch tek
+        encode çağrısıyla vektörleştirilir ve ChromaDB'ye parça parça yazılır.
+        Belge ID'si içerik hash'inden türetilir, böylece aynı içerik hem aynı
+        çağrı içinde hem de tekrar içe aktarımlarda atlanır.
+        
+        Args:
+            items: Metin veya (text, metadata[, memory_type]) demetleri
+            memory_type: Tipi verilmeyen girdiler için hafıza tipi
+            batch_size: Encode batch boyutu
+            deduplicate: İçerik hash'i ile tekrarları atla
+            progress: Her batch sonrası istatistik sözlüğüyle çağrılır
+        
+        Returns:
+            {"added", "duplicates", "skipped", "batches", "elapsed", "docs_per_second"}
+        """
+        stats = {"added": 0, "duplicates": 0, "skipped": 0, "batches": 0}
+        started = time.time()
+        seen = set()
+        chunk_size = min(batch_size, self.client.get_max_batch_size())
+        
+        def normalized(stream):
+            for item in stream:
+                if isinstance(item, str):
+                    text, metadata, item_type = item, None, memory_type
+                else:
+                    text = item[0]
+                    metadata = item[1] if len(item) > 1 else None
+                    item_type = item[2] if len(item) > 2 and item[2] else memory_type
+                
+                if not text or not text.strip():
+                    stats["skipped"] += 1
+                    continue
+                
+                content_hash = self._content_hash(text, item_type)
+                if deduplicate:
+                    if content_hash in seen:
+                        stats["duplicates"] += 1
+                        continue
+                    seen.add(content_hash)
+                
+                # Yüz binlerce belgede 8 haneli ID çakışır (ChromaDB çakışan add'i sessizce atlar)
+                doc_id = content_hash[:16] if deduplicate else uuid.uuid4().hex
+                meta = self._build_metadata(text, metadata, item_type)
+                meta["content_hash"] = content_hash
+                yield doc_id, text, meta
+        
+        stream = normalized(items)
+        while True:
+            batch = list(itertools.islice(stream, chunk_size))
+            if not batch:
+                break
+            
+            if deduplicate:
+                existing = set(self.collection.get(ids=[b[0] for b in batch], include=[])["ids"])
+                if existing:
+                    stats["duplicates"] += len(existing)
+                    batch = [b for b in batch if b[0] not in existing]
+            
+            if batch:
+                embeddings = self._embedding_model.encode(
+                    [b[1] for b in batch], batch_size=batch_size, use_cache=False
+                )
+                self.collection.add(
+                    ids=[b[0] for b in batch],
+                    embeddings=np.asarray(embeddings).tolist(),
+                    documents=[b[1] for b in batch],
+                    metadatas=[b[2] for b in batch]
+                )
+                stats["added"] += len(batch)
+                if self.bm25 is not None:
+                    self.bm25.add_many((b[0], b[1], b[2]["type"]) for b in batch)
+                self._mark_written()
+            
+            stats["batches"] += 1
+            if progress is not None:
+                elapsed = time.time() - started
+                progress({**stats, "elapsed": elapsed,
+                          "docs_per_second": stats["added"] / elapsed if elapsed > 0 else 0})
+        
+        elapsed = time.time() - started
+        stats["elapsed"] = round(elapsed, 3)
+        stats["docs_per_second"] = round(stats["added"] / elapsed, 1) if elapsed > 0 else 0
+        return stats
+    
     def add_conversation(
         self, 
         user_message: str, 
@@ -141,7 +369,8 @@ class MemoryHandler:
         return self.add_memory(
             text=combined_text,
             metadata=metadata,
-            memory_type="conversation"
+            memory_type="conversation",
+            defer=True
         )
     
     def search(
@@ -149,7 +378,8 @@ class MemoryHandler:
         query: str, 
         top_k: int = 3,
         memory_type: Optional[str] = None,
-        min_score: float = 0.3
+        min_score: float = 0.3,
+        mode: Optional[str] = None
     ) -> List[Dict[str, Any]]:
         """
         Semantik arama yap.
@@ -159,45 +389,211 @@ class MemoryHandler:
             top_k: Döndürülecek maksimum sonuç sayısı
             memory_type: Filtrelenecek hafıza tipi
             min_score: Minimum benzerlik skoru (0-1)
+            mode: "dense" veya "hybrid" (None = handler varsayılanı)
         
         Returns:
             Bulunan belgeler listesi
         """
-        # Embedding oluştur
-        query_embedding = self._get_embedding(query)
-        
-        # Where filtresi
-        where_filter = None
-        if memory_type:
-            where_filter = {"type": memory_type}
-        
-        # Arama yap
-        results = self.collection.query(
-            query_embeddings=[query_embedding],
-            n_results=top_k,
-            where=where_filter,
-            include=["documents", "metadatas", "distances"]
-        )
+        return self.search_batch(
+            [query], top_k=top_k, memory_type=memory_type, min_score=min_score, mode=mode
+        )[0]
+    
+    def search_batch(
+        self,
+        queries: List[str],
+        top_k: int = 3,
+        memory_type: Optional[str] = None,
+        min_score: float = 0.3,
+        mode: Optional[str] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Birden fazla sorgu için semantik arama.
+        
+        Önbellekte olmayan sorgular tek encode çağrısıyla vektörleştirilir
+        ve tek collection.query (çoklu embedding) ile aranır.
+        
+        Args:
+            queries: Arama sorguları
+            top_k: Sorgu başına maksimum sonuç sayısı
+            memory_type: Filtrelenecek hafıza tipi
+            min_score: Minimum benzerlik skoru (0-1)
+            mode: "dense" veya "hybrid" (None = handler varsayılanı)
+        
+        Returns:
+            Her sorgu için search() formatında sonuç listesi (aynı sırada)
+        
+        Raises:
+            ValueError: Bilinmeyen mode
+        """
+        mode = mode or self.search_mode
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Geçersiz arama modu: {mode} (beklenen: {', '.join(SEARCH_MODES)})")
+        hybrid = mode == "hybrid" and self.bm25 is not None
+        n_results = top_k * HYBRID_CANDIDATE_FACTOR if hybrid else top_k
+        
+        output: List[Optional[List[Dict[str, Any]]]] = [None] * len(queries)
+        keys = [(normalize_text(q), top_k, memory_type, min_score, hybrid) for q in queries]
+        
+        # Generation aramadan önce okunur: arada yazma olursa sonuç bayat sayılır
+        generation = self.search_cache.generation if self.search_cache is not None else 0
+        if self.search_cache is not None:
+            for i, key in enumerate(keys):
+                output[i] = self.search_cache.get(key)
+        
+        # Önbellekte olmayan tekrarsız sorgular
+        todo = list(dict.fromkeys(key for key, out in zip(keys, output) if out is None))
+        if todo:
+            embeddings = np.asarray(self._embedding_model.encode([key[0] for key in todo]))
+            
+            # Where filtresi
+            where_filter = None
+            if memory_type:
+                where_filter = {"type": memory_type}
+            
+            # Arama yap
+            results = self.collection.query(
+                query_embeddings=embeddings.tolist(),
+                n_results=n_results,
+                where=where_filter,
+                include=["documents", "metadatas", "distances"]
+            )
+            
+            found = {}
+            for row, key in enumerate(todo):
+                if hybrid:
+                    # Füzyon için eşik uygulanmamış aday sıralaması gerekir
+                    candidates = self._merge_pending(
+                        self._format_query_row(results, row, -1.0),
+                        embeddings[row], n_results, memory_type, min_score
+                    )
+                    formatted_results = self._fuse_hybrid(
+                        key[0], candidates, embeddings[row], top_k, memory_type, min_score
+                    )
+                else:
+                    formatted_results = self._format_query_row(results, row, min_score)
+                    formatted_results = self._merge_pending(
+                        formatted_results, embeddings[row], top_k, memory_type, min_score
+                    )
+                if self.search_cache is not None:
+                    self.search_cache.put(key, formatted_results, generation)
+                found[key] = formatted_results
+            
+            for i, key in enumerate(keys):
+                if output[i] is None:
+                    # Aynı sorgu birden fazla kez geldiyse her biri kendi kopyasını alır
+                    output[i] = [{**r, "metadata": dict(r["metadata"] or {})} for r in found[key]]
         
-        # Sonuçları formatla
+        return output
+    
+    @staticmethod
+    def _format_query_row(
+        results: Dict[str, Any],
+        row: int,
+        min_score: float
+    ) -> List[Dict[str, Any]]:
+        """collection.query çıktısının bir satırını search() formatına çevir."""
         formatted_results = []
         
-        if results["documents"] and results["documents"][0]:
-            for i, doc in enumerate(results["documents"][0]):
+        if results["documents"] and results["documents"][row]:
+            for i, doc in enumerate(results["documents"][row]):
                 # Distance'ı similarity'ye çevir (cosine distance -> similarity)
-                distance = results["distances"][0][i]
+                distance = results["distances"][row][i]
                 similarity = 1 - distance  # Cosine distance için
                 
                 if similarity >= min_score:
                     formatted_results.append({
-                        "id": results["ids"][0][i],
+                        "id": results["ids"][row][i],
                         "text": doc,
-                        "metadata": results["metadatas"][0][i],
+                        "metadata": results["metadatas"][row][i],
                         "similarity": round(similarity, 3)
                     })
         
         return formatted_results
     
+    def _fuse_hybrid(
+        self,
+        query: str,
+        dense: List[Dict[str, Any]],
+        query_embedding: np.ndarray,
+        top_k: int,
+        memory_type: Optional[str],
+        min_score: float
+    ) -> List[Dict[str, Any]]:
+        """
+        Dense ve BM25 sıralamalarını reciprocal-rank fusion ile birleştir.
+        
+        Sadece BM25'in bulduğu belgeler ChromaDB'den çekilir ve benzerlikleri
+        hesaplanır. Dense benzerliği min_score altında kalan belgeler ancak
+        leksikal eşleşme varsa döner (yıl, kod tanımlayıcısı gibi birebir terimler).
+        """
+        lexical = self.bm25.search(
+            query,
+            top_k=top_k * HYBRID_CANDIDATE_FACTOR,
+            memory_type=memory_type,
+            budget_ms=self.hybrid_budget_ms
+        )
+        bm25_scores = dict(lexical)
+        by_id = {r["id"]: r for r in dense}
+        
+        fused: Dict[str, float] = {}
+        for rank, r in enumerate(dense, 1):
+            fused[r["id"]] = 1 / (RRF_K + rank)
+        for rank, (doc_id, _) in enumerate(lexical, 1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1 / (RRF_K + rank)
+        
+        missing = [doc_id for doc_id, _ in lexical if doc_id not in by_id]
+        if missing:
+            fetched = self.collection.get(ids=missing, include=["documents", "metadatas", "embeddings"])
+            query_vec = np.asarray(query_embedding, dtype=np.float32)
+            query_norm = max(float(np.linalg.norm(query_vec)), 1e-12)
+            for doc_id, doc, meta, emb in zip(
+                fetched["ids"], fetched["documents"], fetched["metadatas"], fetched["embeddings"]
+            ):
+                emb = np.asarray(emb, dtype=np.float32)
+                similarity = float(emb @ query_vec) / max(float(np.linalg.norm(emb)) * query_norm, 1e-12)
+                by_id[doc_id] = {
+                    "id": doc_id,
+                    "text": doc,
+                    "metadata": meta,
+                    "similarity": round(similarity, 3)
+                }
+        
+        ranked = sorted(
+            (doc_id for doc_id in fused
+             if doc_id in by_id and (by_id[doc_id]["similarity"] >= min_score or doc_id in bm25_scores)),
+            key=lambda doc_id: -fused[doc_id]
+        )[:top_k]
+        
+        results = []
+        for doc_id in ranked:
+            r = dict(by_id[doc_id])
+            r["rrf_score"] = round(fused[doc_id], 5)
+            if doc_id in bm25_scores:
+                r["bm25_score"] = round(bm25_scores[doc_id], 3)
+            results.append(r)
+        return results
+    
+    def _merge_pending(
+        self,
+        formatted_results: List[Dict[str, Any]],
+        query_embedding: np.ndarray,
+        top_k: int,
+        memory_type: Optional[str],
+        min_score: float
+    ) -> List[Dict[str, Any]]:
+        """Henüz yazılmamış belgeleri sonuçlara kat (read-your-writes)."""
+        if self.write_behind is None or not self.write_behind.pending_count:
+            return formatted_results
+        
+        pending = self.write_behind.search_pending(query_embedding, top_k, memory_type, min_score)
+        if not pending:
+            return formatted_results
+        
+        seen = {r["id"] for r in formatted_results}
+        merged = formatted_results + [r for r in pending if r["id"] not in seen]
+        merged.sort(key=lambda r: r["similarity"], reverse=True)
+        return merged[:top_k]
+    
     def get_relevant_context(
         self, 
         query: str, 
@@ -210,18 +606,45 @@ class MemoryHandler:
         Args:
             query: Kullanıcı sorgusu
             top_k: Maksimum belge sayısı
-            max_tokens: Maksimum karakter (yaklaşık token)
+            max_tokens: Bağlamın token bütçesi
         
         Returns:
             Formatlanmış bağlam metni
         """
         results = self.search(query, top_k=top_k)
+        return self._format_context(results, max_tokens)
+    
+    def get_relevant_context_batch(
+        self,
+        queries: List[str],
+        top_k: int = 3,
+        max_tokens: int = 500
+    ) -> List[str]:
+        """
+        Birden fazla sorgu için RAG bağlamı (tek encode + tek sorgu).
+        
+        Args:
+            queries: Kullanıcı sorguları
+            top_k: Sorgu başına maksimum belge sayısı
+            max_tokens: Sorgu başına bağlam token bütçesi
         
+        Returns:
+            Her sorgu için formatlanmış bağlam metni (aynı sırada)
+        """
+        return [
+            self._format_context(results, max_tokens)
+            for results in self.search_batch(queries, top_k=top_k)
+        ]
+    
+    @staticmethod
+    def _format_context(results: List[Dict[str, Any]], max_tokens: int) -> str:
+        """Arama sonuçlarını token bütçesine sığan bağlam metnine çevir."""
         if not results:
             return ""
         
+        counter = get_token_counter()
         context_parts = []
-        total_chars = 0
+        total_tokens = counter.count("📚 İlgili Hafıza:\n")
         
         for i, result in enumerate(results, 1):
             text = result["text"]
@@ -234,11 +657,12 @@ class MemoryHandler:
             
             part = f"[Hafıza {i}] (Benzerlik: {sim:.0%})\n{text}"
             
-            if total_chars + len(part) > max_tokens * 4:  # ~4 char/token
+            part_tokens = counter.count(part)
+            if total_tokens + part_tokens > max_tokens:
                 break
             
             context_parts.append(part)
-            total_chars += len(part)
+            total_tokens += part_tokens
         
         if context_parts:
             return "📚 İlgili Hafıza:\n" + "\n\n".join(context_parts)
@@ -247,16 +671,49 @@ class MemoryHandler:
     
     def delete(self, doc_id: str) -> bool:
         """Belge sil."""
+        if self.write_behind is not None:
+            self.write_behind.discard(doc_id)
         try:
             self.collection.delete(ids=[doc_id])
+            if self.bm25 is not None:
+                self.bm25.remove(doc_id)
+            self._mark_written()
             return True
         except Exception as e:
             print(f"⚠️ Silme hatası: {e}")
             return False
     
+    def delete_many(self, doc_ids: List[str], batch_size: int = 1000) -> int:
+        """
+        Birden fazla belgeyi batch halinde sil.
+        
+        Args:
+            doc_ids: Silinecek belge ID'leri
+            batch_size: collection.delete çağrısı başına ID sayısı
+        
+        Returns:
+            Silinmesi istenen belge sayısı
+        """
+        doc_ids = list(dict.fromkeys(doc_ids))
+        if not doc_ids:
+            return 0
+        if self.write_behind is not None:
+            for doc_id in doc_ids:
+                self.write_behind.discard(doc_id)
+        
+        batch_size = min(batch_size, self.client.get_max_batch_size())
+        for start in range(0, len(doc_ids), batch_size):
+            self.collection.delete(ids=doc_ids[start:start + batch_size])
+        if self.bm25 is not None:
+            self.bm25.remove_many(doc_ids)
+        self._mark_written()
+        return len(doc_ids)
+    
     def clear_all(self) -> int:
         """Tüm hafızayı temizle."""
         count = self.collection.count()
+        if self.write_behind is not None:
+            count += self.write_behind.clear()
         
         # Collection'ı yeniden oluştur
         collection_name = self.collection.name
@@ -265,21 +722,44 @@ class MemoryHandler:
             name=collection_name,
             metadata={"hnsw:space": "cosine"}
         )
+        if self.bm25 is not None:
+            self.bm25.clear()
+        self._mark_written()
         
         print(f"🧹 {count} belge silindi")
         return count
     
+    def flush(self) -> int:
+        """Write-behind kuyruğundaki belgeleri hemen yaz."""
+        return self.write_behind.flush() if self.write_behind is not None else 0
+    
+    def close(self) -> None:
+        """Bekleyen yazmaları bitir (kapanışta çağrılır)."""
+        if self.write_behind is not None:
+            self.write_behind.close()
+        if self.bm25 is not None:
+            self.bm25.save()
+    
     def get_stats(self) -> Dict[str, Any]:
         """Hafıza istatistikleri."""
         count = self.collection.count()
+        pending = self.write_behind.pending_count if self.write_behind is not None else 0
         
         stats = {
-            "total_documents": count,
+            "total_documents": count + pending,
             "collection_name": self.collection.name,
             "persist_path": str(self.persist_path),
             "embedding_dim": self._embedding_dim
         }
         
+        if self.write_behind is not None:
+            stats["write_behind"] = self.write_behind.get_stats()
+        if self.search_cache is not None:
+            stats["search_cache"] = self.search_cache.get_stats()
+        if self.bm25 is not None:
+            stats["bm25"] = self.bm25.get_stats()
+        stats["search_mode"] = self.search_mode
+        
         # Tip dağılımı
         if count > 0:
             all_docs = self.collection.get(include=["metadatas"])
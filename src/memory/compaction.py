@@ -0,0 +1,320 @@
+"""
+EVO-TR: Memory Compaction
+
+auto_save her konuşma çiftini hafızaya yazdığı için collection tekrar eden
+selamlaşmalar ve aynı sorularla sınırsız büyür. Bu modül collection'ı
+sıkıştırır:
+
+- Yakın kopyalar embedding benzerliğiyle kümelenir (HNSW komşu sorgusu,
+  en yeni belge küme temsilcisi olur, diğerleri silinir)
+- Temsilcinin metadata'sına kullanım sayısı (merged_count) ve ilk görülme
+  zamanı (first_seen) yazılır
+- Yaş/kullanım bazlı saklama (isteğe bağlı, max_age_days verilirse):
+  timestamp'i max_age_days'ten eski ve az tekrarlanan belgeler silinir
+  (fact / preference korunur)
+- Collection sayfa sayfa okunur; her sayfanın komşuları hemen sorgulanır,
+  embedding'ler bellekte biriktirilmez
+- Güncelleme ve silmeler batch halinde yapılır; önce/sonra belge sayısı
+  ve arama gecikmesi raporlanır
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+from dataclasses import dataclass, asdict
+from datetime import datetime
+import time
+
+import numpy as np
+
+
+@dataclass
+class CompactionPolicy:
+    """Sıkıştırma kuralları."""
+    similarity_threshold: float = 0.95      # Bu benzerlik ve üstü = yakın kopya
+    neighbors: int = 10                     # Belge başına incelenecek komşu
+    max_age_days: Optional[float] = None    # None = yaşa göre silme yok (kalıcı silme, isteğe bağlı)
+    keep_if_merged: int = 3                 # Bu kadar tekrarlanan belge yaşlansa da kalır
+    protected_types: Tuple[str, ...] = ("fact", "preference")
+    memory_type: Optional[str] = None       # Sadece bu tip (None = tümü)
+    batch_size: int = 500                   # Okuma / güncelleme / silme batch boyutu
+
+
+@dataclass
+class CompactionReport:
+    """Tek sıkıştırma çalışmasının sonucu."""
+    collection: str
+    dry_run: bool
+    before_count: int
+    after_count: int
+    scanned: int
+    clusters: int
+    duplicates_removed: int
+    expired_removed: int
+    merged_updated: int
+    before_latency_ms: float
+    after_latency_ms: float
+    elapsed: float
+
+    @property
+    def removed(self) -> int:
+        return self.duplicates_removed + self.expired_removed
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["removed"] = self.removed
+        return data
+
+
+def _parse_timestamp(value: Any) -> Optional[datetime]:
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class MemoryCompactor:
+    """
+    MemoryHandler collection'ı için yakın kopya temizliği ve saklama politikası.
+
+    Kullanım:
+        compactor = MemoryCompactor(handler, CompactionPolicy(max_age_days=30))
+        report = compactor.run(dry_run=True)   # sadece rapor
+        report = compactor.run()               # uygula
+    """
+
+    def __init__(self, handler: Any, policy: Optional[CompactionPolicy] = None):
+        """
+        MemoryCompactor başlat.
+
+        Args:
+            handler: Sıkıştırılacak MemoryHandler
+            policy: Sıkıştırma kuralları (None = varsayılanlar)
+        """
+        self.handler = handler
+        self.policy = policy or CompactionPolicy()
+
+    @property
+    def _where(self) -> Optional[Dict[str, Any]]:
+        return {"type": self.policy.memory_type} if self.policy.memory_type else None
+
+    # ============ Ölçüm ============
+
+    def measure_latency(self, query_embeddings: np.ndarray, top_k: int = 5) -> float:
+        """
+        Örnek sorgularla ortalama arama gecikmesi (ms).
+
+        Encoder'ı ölçüme katmamak için kayıtlı embedding'ler sorgu olarak kullanılır.
+        """
+        count = self.handler.collection.count()
+        if not count or not len(query_embeddings):
+            return 0.0
+
+        started = time.perf_counter()
+        for embedding in query_embeddings:
+            self.handler.collection.query(
+                query_embeddings=[np.asarray(embedding).tolist()],
+                n_results=min(top_k, count),
+                include=["distances"]
+            )
+        return round((time.perf_counter() - started) / len(query_embeddings) * 1000, 3)
+
+    # ============ Tarama ============
+
+    def _scan(
+        self,
+        sample_queries: int
+    ) -> Tuple[List[str], List[Dict[str, Any]], Dict[str, List[Tuple[str, float]]], np.ndarray]:
+        """
+        Collection'ı batch_size'lık sayfalarla oku; her sayfanın komşuları
+        hemen sorgulanır ve embedding'leri bırakılır.
+
+        Returns:
+            (ids, metadatas, komşular, gecikme ölçümü için örnek embedding'ler)
+        """
+        ids: List[str] = []
+        metadatas: List[Dict[str, Any]] = []
+        neighbors: Dict[str, List[Tuple[str, float]]] = {}
+        samples: List[np.ndarray] = []
+        n_results = min(self.policy.neighbors + 1, self.handler.collection.count())
+        offset = 0
+        while True:
+            page = self.handler.collection.get(
+                where=self._where,
+                include=["metadatas", "embeddings"],
+                limit=self.policy.batch_size,
+                offset=offset
+            )
+            if not page["ids"]:
+                break
+            embeddings = np.asarray(page["embeddings"], dtype=np.float32)
+            ids.extend(page["ids"])
+            metadatas.extend(meta or {} for meta in page["metadatas"])
+            neighbors.update(self._neighbors(page["ids"], embeddings, n_results))
+            missing = sample_queries - sum(len(s) for s in samples)
+            if missing > 0:
+                samples.append(embeddings[:missing])
+            offset += len(page["ids"])
+
+        sample = np.concatenate(samples) if samples else np.zeros((0, 0), dtype=np.float32)
+        return ids, metadatas, neighbors, sample
+
+    def _neighbors(
+        self,
+        ids: List[str],
+        embeddings: np.ndarray,
+        n_results: int
+    ) -> Dict[str, List[Tuple[str, float]]]:
+        """Sayfadaki her belge için benzerlik eşiğini geçen komşular (HNSW indeksiyle)."""
+        threshold = self.policy.similarity_threshold
+        results = self.handler.collection.query(
+            query_embeddings=embeddings.tolist(),
+            n_results=n_results,
+            where=self._where,
+            include=["distances"]
+        )
+        return {
+            doc_id: [
+                (other, 1 - distance)
+                for other, distance in zip(results["ids"][row], results["distances"][row])
+                if other != doc_id and 1 - distance >= threshold
+            ]
+            for row, doc_id in enumerate(ids)
+        }
+
+    # ============ Kümeleme ve saklama ============
+
+    def _cluster(
+        self,
+        ids: List[str],
+        metadatas: List[Dict[str, Any]],
+        neighbors: Dict[str, List[Tuple[str, float]]]
+    ) -> List[List[int]]:
+        """
+        Lider kümeleme: en yeni belgeden başlayarak her atanmamış belge
+        bir küme açar ve eşiği geçen aynı tipteki komşularını toplar.
+
+        Returns:
+            Küme listesi (ilk eleman temsilci), indeks cinsinden
+        """
+        position = {doc_id: i for i, doc_id in enumerate(ids)}
+        order = sorted(range(len(ids)), key=lambda i: metadatas[i].get("timestamp", ""), reverse=True)
+
+        assigned = set()
+        clusters = []
+        for i in order:
+            if i in assigned:
+                continue
+            assigned.add(i)
+            cluster = [i]
+            for other_id, _ in neighbors.get(ids[i], []):
+                j = position.get(other_id)
+                if j is None or j in assigned:
+                    continue
+                if metadatas[j].get("type") != metadatas[i].get("type"):
+                    continue
+                assigned.add(j)
+                cluster.append(j)
+            clusters.append(cluster)
+        return clusters
+
+    def _merged_metadata(self, cluster: List[int], metadatas: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Temsilci metadata'sı + kullanım sayısı ve ilk görülme zamanı."""
+        meta = dict(metadatas[cluster[0]])
+        meta["merged_count"] = sum(int(metadatas[i].get("merged_count", 1)) for i in cluster)
+        first_seen = [metadatas[i].get("first_seen") or metadatas[i].get("timestamp") for i in cluster]
+        first_seen = [ts for ts in first_seen if ts]
+        if first_seen:
+            meta["first_seen"] = min(first_seen)
+        return meta
+
+    def _expired(self, meta: Dict[str, Any], now: datetime) -> bool:
+        """Yaş/kullanım politikasına göre silinmeli mi?"""
+        policy = self.policy
+        if policy.max_age_days is None or meta.get("type") in policy.protected_types:
+            return False
+        if int(meta.get("merged_count", 1)) >= policy.keep_if_merged:
+            return False
+        timestamp = _parse_timestamp(meta.get("timestamp"))
+        if timestamp is None:
+            return False
+        return (now - timestamp).total_seconds() > policy.max_age_days * 86400
+
+    # ============ Çalıştırma ============
+
+    def run(
+        self,
+        dry_run: bool = False,
+        sample_queries: int = 20,
+        now: Optional[datetime] = None
+    ) -> CompactionReport:
+        """
+        Sıkıştırmayı çalıştır.
+
+        Args:
+            dry_run: True ise hiçbir şey yazılmaz, sadece rapor üretilir
+            sample_queries: Gecikme ölçümü için örnek sorgu sayısı
+            now: Yaş hesabı için referans zaman (None = şimdi)
+
+        Returns:
+            CompactionReport
+        """
+        started = time.monotonic()
+        now = now or datetime.now()
+        collection = self.handler.collection
+
+        # Write-behind kuyruğundakiler de sıkıştırmaya dahil olsun
+        self.handler.flush()
+        before_count = collection.count()
+
+        ids, metadatas, neighbors, sample = self._scan(sample_queries)
+        before_latency = self.measure_latency(sample)
+
+        clusters = self._cluster(ids, metadatas, neighbors) if ids else []
+
+        updates: Dict[str, Dict[str, Any]] = {}
+        duplicates: List[str] = []
+        expired: List[str] = []
+        for cluster in clusters:
+            keeper = ids[cluster[0]]
+            meta = self._merged_metadata(cluster, metadatas) if len(cluster) > 1 else metadatas[cluster[0]]
+            duplicates.extend(ids[i] for i in cluster[1:])
+            if self._expired(meta, now):
+                expired.append(keeper)
+            elif len(cluster) > 1:
+                updates[keeper] = meta
+
+        if not dry_run:
+            update_ids = list(updates)
+            batch_size = min(self.policy.batch_size, self.handler.client.get_max_batch_size())
+            for start in range(0, len(update_ids), batch_size):
+                chunk = update_ids[start:start + batch_size]
+                collection.update(ids=chunk, metadatas=[updates[doc_id] for doc_id in chunk])
+            self.handler.delete_many(duplicates + expired, batch_size=batch_size)
+            after_count = collection.count()
+            after_latency = self.measure_latency(sample)
+        else:
+            after_count = before_count - len(duplicates) - len(expired)
+            after_latency = before_latency
+
+        return CompactionReport(
+            collection=collection.name,
+            dry_run=dry_run,
+            before_count=before_count,
+            after_count=after_count,
+            scanned=len(ids),
+            clusters=sum(1 for cluster in clusters if len(cluster) > 1),
+            duplicates_removed=len(duplicates),
+            expired_removed=len(expired),
+            merged_updated=len(updates),
+            before_latency_ms=before_latency,
+            after_latency_ms=after_latency,
+            elapsed=round(time.monotonic() - started, 3)
+        )
+
+
+def compact_memory(
+    handler: Any,
+    policy: Optional[CompactionPolicy] = None,
+    dry_run: bool = False
+) -> CompactionReport:
+    """MemoryCompactor kısayolu."""
+    return MemoryCompactor(handler, policy).run(dry_run=dry_run)
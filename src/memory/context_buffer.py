@@ -4,11 +4,14 @@ EVO-TR: Context Buffer
 Kısa süreli hafıza - son N mesajı token limiti dahilinde tutar.
 """
 
-from typing import List, Dict, Optional, Tuple
+from typing import Deque, List, Dict, Optional, Tuple
+from collections import deque
 from dataclasses import dataclass, field
 from datetime import datetime
 import json
 
+from ..services.token_counter import TokenCounter, get_token_counter
+
 
 @dataclass
 class Message:
@@ -35,8 +38,8 @@ class Message:
     
     @property
     def token_estimate(self) -> int:
-        """Yaklaşık token sayısı (4 karakter = 1 token)."""
-        return len(self.content) // 4 + 1
+        """Token sayısı (süreç geneli sayaç, chat template ek yükü dahil)."""
+        return get_token_counter().count_message(self.content)
 
 
 class ContextBuffer:
@@ -46,7 +49,9 @@ class ContextBuffer:
     Özellikler:
     - Son N mesajı tutar
     - Token limiti kontrolü
-    - Sliding window mantığı
+    - Sliding window mantığı (deque, O(1) ekleme/çıkarma)
+    - Artımlı token toplamı (mesaj başına bir kez sayılır)
+    - Değişmeyen buffer için önbellekli anlık görüntü
     - Chat format export
     """
     
@@ -54,20 +59,29 @@ class ContextBuffer:
         self,
         max_messages: int = 20,
         max_tokens: int = 2000,
-        system_prompt: Optional[str] = None
+        system_prompt: Optional[str] = None,
+        token_counter: Optional[TokenCounter] = None
     ):
         """
         ContextBuffer başlat.
         
         Args:
             max_messages: Maksimum mesaj sayısı
-            max_tokens: Maksimum token (yaklaşık)
+            max_tokens: Maksimum token
             system_prompt: Sabit system prompt
+            token_counter: Token sayacı (None = süreç geneli sayaç)
         """
         self.max_messages = max_messages
         self.max_tokens = max_tokens
+        self.token_counter = token_counter or get_token_counter()
+        self._messages: Deque[Message] = deque()
+        self._message_tokens: Deque[int] = deque()
+        self._total_message_tokens = 0
+        self._system_tokens = 0
+        self._counter_version = self.token_counter.version
+        self._snapshot: Optional[Tuple[Message, ...]] = None
+        self._chat_snapshot: Optional[Tuple[Tuple[str, str], ...]] = None
         self.system_prompt = system_prompt
-        self._messages: List[Message] = []
     
     def add_user_message(
         self, 
@@ -97,36 +111,80 @@ class ContextBuffer:
         )
         self._add_message(message)
     
+    @property
+    def system_prompt(self) -> Optional[str]:
+        return self._system_prompt
+    
+    @system_prompt.setter
+    def system_prompt(self, prompt: Optional[str]) -> None:
+        self._system_prompt = prompt
+        self._system_tokens = self.token_counter.count_message(prompt) if prompt else 0
+    
+    def _push(self, message: Message) -> None:
+        """Mesajı sona ekle ve token toplamını güncelle."""
+        tokens = self.token_counter.count_message(message.content)
+        self._messages.append(message)
+        self._message_tokens.append(tokens)
+        self._total_message_tokens += tokens
+        self._invalidate()
+    
+    def _evict_oldest(self) -> None:
+        """En eski mesajı çıkar ve token toplamını güncelle."""
+        self._messages.popleft()
+        self._total_message_tokens -= self._message_tokens.popleft()
+        self._invalidate()
+    
+    def _invalidate(self) -> None:
+        """Anlık görüntüleri geçersiz kıl."""
+        self._snapshot = None
+        self._chat_snapshot = None
+    
+    def _sync_token_counts(self) -> None:
+        """Tokenizer değiştiyse (tahminden gerçek sayıma geçiş) toplamları yeniden hesapla."""
+        if self._counter_version == self.token_counter.version:
+            return
+        self._counter_version = self.token_counter.version
+        self._message_tokens = deque(self.token_counter.count_message(m.content) for m in self._messages)
+        self._total_message_tokens = sum(self._message_tokens)
+        self.system_prompt = self._system_prompt
+    
     def _add_message(self, message: Message) -> None:
         """Mesaj ekle ve limitleri kontrol et."""
-        self._messages.append(message)
+        self._sync_token_counts()
+        self._push(message)
         self._enforce_limits()
     
     def _enforce_limits(self) -> None:
-        """Mesaj sayısı ve token limitlerini uygula."""
+        """Mesaj sayısı ve token limitlerini uygula (çıkarılan mesaj başına O(1))."""
         # Mesaj sayısı limiti
         while len(self._messages) > self.max_messages:
-            self._messages.pop(0)
+            self._evict_oldest()
         
         # Token limiti
-        while self.total_tokens > self.max_tokens and len(self._messages) > 1:
-            self._messages.pop(0)
+        while self._system_tokens + self._total_message_tokens > self.max_tokens and len(self._messages) > 1:
+            self._evict_oldest()
     
     @property
     def total_tokens(self) -> int:
-        """Toplam yaklaşık token sayısı."""
-        system_tokens = len(self.system_prompt) // 4 if self.system_prompt else 0
-        message_tokens = sum(m.token_estimate for m in self._messages)
-        return system_tokens + message_tokens
+        """Toplam token sayısı (system prompt dahil)."""
+        self._sync_token_counts()
+        return self._system_tokens + self._total_message_tokens
     
     @property
     def message_count(self) -> int:
         """Mesaj sayısı."""
         return len(self._messages)
     
-    def get_messages(self) -> List[Message]:
-        """Tüm mesajları getir."""
-        return self._messages.copy()
+    def get_messages(self) -> Tuple[Message, ...]:
+        """
+        Tüm mesajları getir.
+        
+        Değiştirilemez anlık görüntü döner; buffer değişmedikçe aynı
+        tuple tekrar kullanılır (her çağrıda kopya yapılmaz).
+        """
+        if self._snapshot is None:
+            self._snapshot = tuple(self._messages)
+        return self._snapshot
     
     def get_chat_history(self, include_system: bool = True) -> List[Dict]:
         """
@@ -138,6 +196,9 @@ class ContextBuffer:
         Returns:
             [{"role": "...", "content": "..."}] formatında liste
         """
+        if self._chat_snapshot is None:
+            self._chat_snapshot = tuple((msg.role, msg.content) for msg in self._messages)
+        
         messages = []
         
         if include_system and self.system_prompt:
@@ -146,14 +207,16 @@ class ContextBuffer:
                 "content": self.system_prompt
             })
         
-        for msg in self._messages:
-            messages.append(msg.to_chat_format())
+        # Önbellekteki (role, content) çiftlerinden yeni dict'ler: liste ve
+        # dict'ler çağırana ait, değiştirmek buffer'ı etkilemez
+        messages.extend({"role": role, "content": content} for role, content in self._chat_snapshot)
         
         return messages
     
     def get_last_n_messages(self, n: int) -> List[Message]:
         """Son N mesajı getir."""
-        return self._messages[-n:] if n < len(self._messages) else self._messages.copy()
+        messages = self.get_messages()
+        return list(messages[-n:]) if n < len(messages) else list(messages)
     
     def get_last_user_message(self) -> Optional[Message]:
         """Son kullanıcı mesajını getir."""
@@ -171,11 +234,12 @@ class ContextBuffer:
     
     def get_conversation_pairs(self) -> List[Tuple[Message, Message]]:
         """User-Assistant mesaj çiftlerini getir."""
+        messages = self.get_messages()
         pairs = []
         i = 0
-        while i < len(self._messages) - 1:
-            if self._messages[i].role == "user" and self._messages[i+1].role == "assistant":
-                pairs.append((self._messages[i], self._messages[i+1]))
+        while i < len(messages) - 1:
+            if messages[i].role == "user" and messages[i+1].role == "assistant":
+                pairs.append((messages[i], messages[i+1]))
                 i += 2
             else:
                 i += 1
@@ -188,19 +252,22 @@ class ContextBuffer:
     def clear(self) -> None:
         """Tüm mesajları temizle."""
         self._messages.clear()
+        self._message_tokens.clear()
+        self._total_message_tokens = 0
+        self._invalidate()
     
     def get_context_summary(self) -> str:
         """Bağlam özeti (debugging için)."""
         lines = [
             f"📝 Context Buffer Durumu:",
             f"   Mesaj sayısı: {self.message_count}/{self.max_messages}",
-            f"   Toplam token: ~{self.total_tokens}/{self.max_tokens}",
+            f"   Toplam token: {'' if self.token_counter.is_exact else '~'}{self.total_tokens}/{self.max_tokens}",
             f"   System prompt: {'✅' if self.system_prompt else '❌'}"
         ]
         
         if self._messages:
             lines.append("   Son 3 mesaj:")
-            for msg in self._messages[-3:]:
+            for msg in self.get_messages()[-3:]:
                 preview = msg.content[:50] + "..." if len(msg.content) > 50 else msg.content
                 lines.append(f"     [{msg.role}] {preview}")
         
@@ -234,8 +301,9 @@ class ContextBuffer:
                 intent=msg_data.get("intent"),
                 metadata=msg_data.get("metadata", {})
             )
-            buffer._messages.append(msg)
+            buffer._push(msg)
         
+        buffer._enforce_limits()
         return buffer
 
 
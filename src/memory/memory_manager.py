@@ -7,6 +7,7 @@ Kısa ve uzun süreli hafızayı birleştiren ana hafıza yöneticisi.
 from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime
 import json
+import weakref
 
 from .chromadb_handler import MemoryHandler
 from .context_buffer import ContextBuffer, Message
@@ -33,7 +34,8 @@ class MemoryManager:
         max_context_messages: int = 10,
         max_context_tokens: int = 1500,
         system_prompt: Optional[str] = None,
-        auto_save: bool = True
+        auto_save: bool = True,
+        write_behind: bool = False
     ):
         """
         MemoryManager başlat.
@@ -45,11 +47,13 @@ class MemoryManager:
             max_context_tokens: Maksimum kısa süreli token
             system_prompt: Sabit system prompt
             auto_save: Her konuşmayı otomatik uzun süreli hafızaya kaydet
+            write_behind: Konuşmaları yanıt yolunda değil arka planda toplu yaz
         """
         # Uzun süreli hafıza
         self.long_term = MemoryHandler(
             persist_path=persist_path,
-            collection_name=collection_name
+            collection_name=collection_name,
+            write_behind=write_behind
         )
         
         # Kısa süreli hafıza
@@ -61,14 +65,32 @@ class MemoryManager:
         
         self.auto_save = auto_save
         self._pending_user_message: Optional[Message] = None
+        # Oturum buffer'ları için bekleyen kullanıcı mesajları (web sunucusu)
+        self._pending_by_buffer: "weakref.WeakKeyDictionary[ContextBuffer, Message]" = weakref.WeakKeyDictionary()
         
         print(f"✅ MemoryManager hazır | Auto-save: {auto_save}")
     
+    def new_session_buffer(self) -> ContextBuffer:
+        """Kısa süreli hafızayla aynı limitlere sahip boş oturum buffer'ı."""
+        return ContextBuffer(
+            max_messages=self.short_term.max_messages,
+            max_tokens=self.short_term.max_tokens,
+            system_prompt=self.short_term.system_prompt
+        )
+    
+    def _take_pending(self, buffer: ContextBuffer) -> Optional[Message]:
+        """Buffer'ın bekleyen kullanıcı mesajını al ve temizle."""
+        if buffer is self.short_term:
+            pending, self._pending_user_message = self._pending_user_message, None
+            return pending
+        return self._pending_by_buffer.pop(buffer, None)
+    
     def add_user_message(
         self, 
         content: str, 
         intent: Optional[str] = None,
-        metadata: Optional[Dict] = None
+        metadata: Optional[Dict] = None,
+        buffer: Optional[ContextBuffer] = None
     ) -> None:
         """
         Kullanıcı mesajı ekle.
@@ -77,8 +99,10 @@ class MemoryManager:
             content: Mesaj içeriği
             intent: Tespit edilen intent
             metadata: Ek bilgiler
+            buffer: Oturum buffer'ı (None = ortak kısa süreli hafıza)
         """
-        self.short_term.add_user_message(
+        buffer = buffer if buffer is not None else self.short_term
+        buffer.add_user_message(
             content=content,
             intent=intent,
             metadata=metadata
@@ -86,12 +110,16 @@ class MemoryManager:
         
         # Pending olarak sakla (assistant yanıtı gelince birlikte kaydedilecek)
         if self.auto_save:
-            self._pending_user_message = self.short_term.get_last_user_message()
+            if buffer is self.short_term:
+                self._pending_user_message = buffer.get_last_user_message()
+            else:
+                self._pending_by_buffer[buffer] = buffer.get_last_user_message()
     
     def add_assistant_message(
         self, 
         content: str,
-        metadata: Optional[Dict] = None
+        metadata: Optional[Dict] = None,
+        buffer: Optional[ContextBuffer] = None
     ) -> Optional[str]:
         """
         Asistan mesajı ekle.
@@ -99,24 +127,26 @@ class MemoryManager:
         Args:
             content: Mesaj içeriği
             metadata: Ek bilgiler
+            buffer: Oturum buffer'ı (None = ortak kısa süreli hafıza)
         
         Returns:
             Uzun süreli hafıza ID'si (auto_save=True ise)
         """
-        self.short_term.add_assistant_message(
+        buffer = buffer if buffer is not None else self.short_term
+        buffer.add_assistant_message(
             content=content,
             metadata=metadata
         )
         
         # Uzun süreli hafızaya kaydet
-        if self.auto_save and self._pending_user_message:
+        pending = self._take_pending(buffer)
+        if self.auto_save and pending:
             doc_id = self.long_term.add_conversation(
-                user_message=self._pending_user_message.content,
+                user_message=pending.content,
                 assistant_response=content,
-                intent=self._pending_user_message.intent,
-                topic=self._pending_user_message.metadata.get("topic")
+                intent=pending.intent,
+                topic=pending.metadata.get("topic")
             )
-            self._pending_user_message = None
             return doc_id
         
         return None
@@ -126,7 +156,8 @@ class MemoryManager:
         query: str,
         include_long_term: bool = True,
         long_term_top_k: int = 2,
-        min_similarity: float = 0.4
+        min_similarity: float = 0.4,
+        buffer: Optional[ContextBuffer] = None
     ) -> str:
         """
         RAG için zenginleştirilmiş bağlam oluştur.
@@ -136,32 +167,75 @@ class MemoryManager:
             include_long_term: Uzun süreli hafıza dahil edilsin mi
             long_term_top_k: Kaç uzun süreli hafıza döndürülsün
             min_similarity: Minimum benzerlik skoru
+            buffer: Oturum buffer'ı (None = ortak kısa süreli hafıza)
         
         Returns:
             Formatlanmış bağlam metni
         """
-        context_parts = []
-        
         # 1. Uzun süreli hafızadan ilgili bilgiler
+        long_term_context = ""
         if include_long_term:
             long_term_context = self.long_term.get_relevant_context(
                 query=query,
                 top_k=long_term_top_k
             )
-            if long_term_context:
-                context_parts.append(long_term_context)
         
         # 2. Kısa süreli hafızadan son konuşmalar
-        recent_pairs = self.short_term.get_conversation_pairs()[-2:]  # Son 2 çift
+        return self._join_context(long_term_context, self._recent_context(buffer))
+    
+    def get_augmented_context_batch(
+        self,
+        queries: List[str],
+        include_long_term: bool = True,
+        long_term_top_k: int = 2,
+        min_similarity: float = 0.4,
+        buffer: Optional[ContextBuffer] = None
+    ) -> List[str]:
+        """
+        Birden fazla sorgu için RAG bağlamı (değerlendirme / analiz işleri).
+        
+        Uzun süreli hafıza tek encode + tek ChromaDB sorgusuyla aranır;
+        kısa süreli bağlam tüm sorgularda aynıdır.
+        
+        Args:
+            queries: Kullanıcı sorguları
+            include_long_term: Uzun süreli hafıza dahil edilsin mi
+            long_term_top_k: Sorgu başına kaç uzun süreli hafıza döndürülsün
+            min_similarity: Minimum benzerlik skoru
+            buffer: Oturum buffer'ı (None = ortak kısa süreli hafıza)
+        
+        Returns:
+            Her sorgu için formatlanmış bağlam metni (aynı sırada)
+        """
+        if include_long_term:
+            long_term_contexts = self.long_term.get_relevant_context_batch(
+                queries,
+                top_k=long_term_top_k
+            )
+        else:
+            long_term_contexts = [""] * len(queries)
+        
+        recent_context = self._recent_context(buffer)
+        return [self._join_context(lt, recent_context) for lt in long_term_contexts]
+    
+    def _recent_context(self, buffer: Optional[ContextBuffer] = None) -> str:
+        """Kısa süreli hafızadan son konuşmalar bölümü."""
+        buffer = buffer if buffer is not None else self.short_term
+        recent_pairs = buffer.get_conversation_pairs()[-2:]  # Son 2 çift
         
-        if recent_pairs:
-            recent_context = "💬 Son Konuşmalar:\n"
-            for user_msg, asst_msg in recent_pairs:
-                recent_context += f"Kullanıcı: {user_msg.content[:100]}...\n" if len(user_msg.content) > 100 else f"Kullanıcı: {user_msg.content}\n"
-                recent_context += f"Asistan: {asst_msg.content[:100]}...\n\n" if len(asst_msg.content) > 100 else f"Asistan: {asst_msg.content}\n\n"
-            context_parts.append(recent_context.strip())
+        if not recent_pairs:
+            return ""
         
-        return "\n\n".join(context_parts) if context_parts else ""
+        recent_context = "💬 Son Konuşmalar:\n"
+        for user_msg, asst_msg in recent_pairs:
+            recent_context += f"Kullanıcı: {user_msg.content[:100]}...\n" if len(user_msg.content) > 100 else f"Kullanıcı: {user_msg.content}\n"
+            recent_context += f"Asistan: {asst_msg.content[:100]}...\n\n" if len(asst_msg.content) > 100 else f"Asistan: {asst_msg.content}\n\n"
+        return recent_context.strip()
+    
+    @staticmethod
+    def _join_context(*parts: str) -> str:
+        """Boş olmayan bağlam bölümlerini birleştir."""
+        return "\n\n".join(p for p in parts if p)
     
     def get_chat_messages(self, include_system: bool = True) -> List[Dict]:
         """
@@ -243,6 +317,10 @@ class MemoryManager:
         print(f"🧹 Uzun süreli hafıza temizlendi ({count} belge)")
         return count
     
+    def close(self) -> None:
+        """Bekleyen uzun süreli hafıza yazmalarını bitir."""
+        self.long_term.close()
+    
     def get_stats(self) -> Dict[str, Any]:
         """Hafıza istatistikleri."""
         long_term_stats = self.long_term.get_stats()
@@ -0,0 +1,138 @@
+"""
+EVO-TR: Memory Search Cache
+
+MemoryHandler.search sonuçları için TTL'li LRU cache. Sık tekrarlanan
+sorgular (SSS) encode + HNSW sorgusu yapılmadan cevaplanır.
+
+- Anahtar: (normalize sorgu, top_k, memory_type, min_score)
+- Geçerlilik: TTL + collection başına generation sayacı; her yazma
+  (ekleme, silme, temizleme) sayacı artırır ve eski sonuçlar geçersiz olur
+- Sayaç süreç geneli: aynı collection'ı kullanan tüm handler'lar paylaşır
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+from collections import OrderedDict
+import threading
+import time
+
+
+# (persist_path, collection_name) -> generation
+_generations: Dict[Tuple[str, str], int] = {}
+_generations_lock = threading.Lock()
+
+
+def bump_generation(collection_key: Tuple[str, str]) -> int:
+    """Collection'a yazıldığını bildir (önbellekteki sonuçlar bayatlar)."""
+    with _generations_lock:
+        _generations[collection_key] = _generations.get(collection_key, 0) + 1
+        return _generations[collection_key]
+
+
+def get_generation(collection_key: Tuple[str, str]) -> int:
+    """Collection'ın güncel generation değeri."""
+    return _generations.get(collection_key, 0)
+
+
+def _copy_results(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Çağıranın değiştirebileceği kopya (önbellekteki liste korunur)."""
+    return [{**r, "metadata": dict(r["metadata"] or {})} for r in results]
+
+
+class SearchResultCache:
+    """
+    Arama sonuçları için TTL + generation kontrollü LRU cache.
+
+    Kullanım:
+        cached = cache.get(key)
+        if cached is None:
+            results = ... gerçek arama ...
+            cache.put(key, results, generation)
+    """
+
+    def __init__(
+        self,
+        collection_key: Tuple[str, str],
+        max_size: int = 1024,
+        ttl: float = 300.0
+    ):
+        """
+        SearchResultCache başlat.
+
+        Args:
+            collection_key: (persist_path, collection_name)
+            max_size: Maksimum önbellek girdisi
+            ttl: Sonucun geçerli kalacağı süre (saniye)
+        """
+        self.collection_key = collection_key
+        self.max_size = max_size
+        self.ttl = ttl
+
+        # key -> (generation, expires_at, results)
+        self._entries: "OrderedDict[tuple, Tuple[int, float, List[Dict[str, Any]]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "expired": 0,
+            "invalidated": 0
+        }
+
+    @property
+    def generation(self) -> int:
+        return get_generation(self.collection_key)
+
+    def get(self, key: tuple) -> Optional[List[Dict[str, Any]]]:
+        """Geçerli önbellek sonucu (yoksa None)."""
+        generation = self.generation
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+
+            entry_generation, expires_at, results = entry
+            if entry_generation != generation or now >= expires_at:
+                del self._entries[key]
+                self.stats["invalidated" if entry_generation != generation else "expired"] += 1
+                self.stats["misses"] += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+        return _copy_results(results)
+
+    def put(self, key: tuple, results: List[Dict[str, Any]], generation: int) -> None:
+        """
+        Sonucu sakla.
+
+        Args:
+            key: Önbellek anahtarı
+            results: Arama sonuçları
+            generation: Aramadan ÖNCE okunan generation (arada yazma olduysa
+                girdi ilk okumada geçersiz sayılır)
+        """
+        with self._lock:
+            self._entries[key] = (generation, time.monotonic() + self.ttl, _copy_results(results))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Tüm girdileri at."""
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Hit oranı ve boyut."""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["size"] = len(self._entries)
+
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups * 100, 2) if lookups else 0
+        stats["generation"] = self.generation
+        stats["ttl"] = self.ttl
+        stats["max_size"] = self.max_size
+        return stats
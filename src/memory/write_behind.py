@@ -0,0 +1,358 @@
+"""
+EVO-TR: Write-Behind Memory Buffer
+
+Konuşma hafızalarını yanıt yolundan çıkarır: eklenen belgeler önce
+bellekteki kuyruğa alınır, arka plan thread'i boyut/süre eşiğinde
+hepsini tek encode çağrısı ve tek collection.add ile ChromaDB'ye yazar.
+
+- Boyut (max_batch_size) veya süre (flush_interval) eşiğinde flush
+- Kapanışta (close / atexit) kalanlar yazılır
+- Read-your-writes: henüz yazılmamış belgeler search'te yine bulunur
+- Hatalı batch ikiye bölünerek sorunlu belge ayıklanır; max_retries denemede
+  yazılamayan belge hata listesine alınır, kuyruk max_pending ile sınırlıdır
+"""
+
+from typing import Any, Dict, List, Optional
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+import atexit
+import threading
+import time
+
+import numpy as np
+
+
+@dataclass
+class _PendingMemory:
+    """Kuyrukta bekleyen tek hafıza belgesi."""
+    doc_id: str
+    text: str
+    metadata: Dict[str, Any]
+    embedding: Optional[np.ndarray] = None
+    enqueued_at: float = field(default_factory=time.monotonic)
+    attempts: int = 0
+    error: Optional[str] = None
+
+
+class WriteBehindBuffer:
+    """
+    MemoryHandler için toplu yazma kuyruğu.
+
+    Akış:
+    1. add() belgeyi kuyruğa koyar (encode / disk I/O yok)
+    2. Worker eşik dolunca flush() çağırır
+    3. flush() eksik embedding'leri tek çağrıda encode eder ve
+       tüm belgeleri tek collection.add ile yazar; hata olursa batch
+       ikiye bölünür, yazılamayan belge sonraki flush'ta tekrar denenir
+    4. Yazma bitene kadar belgeler search_pending() ile aranabilir
+    5. Kuyruk max_pending'e ulaşınca add() çağıranın thread'inde flush
+       eder (back-pressure)
+    """
+
+    def __init__(
+        self,
+        handler: Any,
+        max_batch_size: int = 32,
+        flush_interval: float = 2.0,
+        max_retries: int = 3,
+        max_pending: int = 1024
+    ):
+        """
+        WriteBehindBuffer başlat.
+
+        Args:
+            handler: Hedef MemoryHandler (collection ve encoder'ı kullanılır)
+            max_batch_size: Bu kadar belge birikince hemen flush
+            flush_interval: En eski belge bu kadar saniye bekleyince flush
+            max_retries: Belge başına yazma denemesi; sonra hata listesine alınır
+            max_pending: Kuyruk üst sınırı (dolunca add() flush'ı bekler);
+                hata listesi de en fazla bu kadar belge tutar
+        """
+        self.handler = handler
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max(1, max_retries)
+        self.max_pending = max(max_batch_size, max_pending)
+
+        self._pending: "OrderedDict[str, _PendingMemory]" = OrderedDict()
+        self._failed: deque = deque(maxlen=self.max_pending)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+        self._closed = False
+
+        self.stats = {
+            "enqueued": 0,
+            "written": 0,
+            "flushes": 0,
+            "max_batch_seen": 0,
+            "overlay_hits": 0,
+            "errors": 0,
+            "failed": 0,
+            "backpressure_flushes": 0,
+            "total_flush_time": 0.0
+        }
+
+        atexit.register(self.close)
+
+    # ============ Yazma tarafı ============
+
+    def add(self, doc_id: str, text: str, metadata: Dict[str, Any]) -> None:
+        """
+        Belgeyi kuyruğa al.
+
+        Args:
+            doc_id: Belge ID'si (çağıran üretir, hemen döndürülebilir)
+            text: Belge metni
+            metadata: ChromaDB metadata'sı
+        """
+        if self._closed:
+            raise RuntimeError("WriteBehindBuffer kapatıldı")
+
+        # Back-pressure: yazılamayan belgeler en geç max_retries flush'ta
+        # hata listesine düştüğü için kuyruk sınırsız büyümez
+        for _ in range(self.max_retries):
+            if len(self._pending) < self.max_pending:
+                break
+            with self._lock:
+                self.stats["backpressure_flushes"] += 1
+            self.flush()
+
+        with self._lock:
+            self._pending[doc_id] = _PendingMemory(doc_id, text, metadata)
+            self.stats["enqueued"] += 1
+            full = len(self._pending) >= self.max_batch_size
+            self._ensure_worker()
+
+        if full:
+            self._wake.set()
+
+    def discard(self, doc_id: str) -> bool:
+        """Henüz yazılmamış belgeyi kuyruktan çıkar (süren flush'ın bitmesini bekler)."""
+        with self._flush_lock, self._lock:
+            return self._pending.pop(doc_id, None) is not None
+
+    def clear(self) -> int:
+        """Bekleyen tüm belgeleri at (clear_all için)."""
+        with self._flush_lock, self._lock:
+            count = len(self._pending)
+            self._pending.clear()
+        return count
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    def get_failed(self) -> List[Dict[str, Any]]:
+        """max_retries denemede yazılamayan belgeler (en eskiden yeniye)."""
+        with self._lock:
+            return [
+                {"id": p.doc_id, "text": p.text, "metadata": p.metadata,
+                 "attempts": p.attempts, "error": p.error}
+                for p in self._failed
+            ]
+
+    # ============ Flush ============
+
+    def flush(self) -> int:
+        """
+        Bekleyen belgeleri tek batch halinde yaz.
+
+        Returns:
+            Yazılan belge sayısı
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch = list(self._pending.values())
+            if not batch:
+                return 0
+
+            started = time.monotonic()
+            written: List[_PendingMemory] = []
+            failed: List[_PendingMemory] = []
+            if not self._write(batch, written, failed):
+                retried = len(batch) - len(written) - len(failed)
+                print(f"⚠️ Hafıza yazma hatası: {len(written)}/{len(batch)} belge yazıldı, "
+                      f"{retried} tekrar denenecek, {len(failed)} hata listesine alındı")
+
+            # Yan indeksler (BM25) yazma başarılı olduktan sonra güncellenir
+            on_written = getattr(self.handler, "_on_documents_written", None)
+            if written and on_written is not None:
+                try:
+                    on_written([p.doc_id for p in written], [p.text for p in written], [p.metadata for p in written])
+                except Exception as e:
+                    print(f"⚠️ Hafıza indeks güncelleme hatası: {e}")
+
+            # Yazma süresince overlay'de kaldılar; artık ChromaDB'de (veya hata listesinde)
+            with self._lock:
+                for p in written + failed:
+                    if self._pending.get(p.doc_id) is p:
+                        del self._pending[p.doc_id]
+                self._failed.extend(failed)
+                self.stats["failed"] += len(failed)
+                if written:
+                    self.stats["written"] += len(written)
+                    self.stats["flushes"] += 1
+                    self.stats["max_batch_seen"] = max(self.stats["max_batch_seen"], len(written))
+                    self.stats["total_flush_time"] += time.monotonic() - started
+            return len(written)
+
+    def _write(
+        self,
+        batch: List[_PendingMemory],
+        written: List[_PendingMemory],
+        failed: List[_PendingMemory]
+    ) -> bool:
+        """
+        Batch'i tek encode + tek collection.add ile yaz; hata olursa ikiye
+        bölerek sorunlu belgeyi ayıkla (sağlam belgeler yazılmaya devam eder).
+
+        Returns:
+            Tüm batch yazıldıysa True
+        """
+        try:
+            missing = [p for p in batch if p.embedding is None]
+            if missing:
+                vectors = self.handler._embedding_model.encode([p.text for p in missing])
+                for p, vector in zip(missing, vectors):
+                    p.embedding = vector
+
+            self.handler.collection.add(
+                ids=[p.doc_id for p in batch],
+                embeddings=[p.embedding.tolist() for p in batch],
+                documents=[p.text for p in batch],
+                metadatas=[p.metadata for p in batch]
+            )
+        except Exception as e:
+            if len(batch) > 1:
+                mid = len(batch) // 2
+                self._write(batch[:mid], written, failed)
+                self._write(batch[mid:], written, failed)
+                return False
+
+            # Tek belge: kuyrukta kalır, max_retries dolunca hata listesine
+            p = batch[0]
+            p.attempts += 1
+            p.error = str(e)
+            with self._lock:
+                self.stats["errors"] += 1
+            if p.attempts >= self.max_retries:
+                failed.append(p)
+            return False
+
+        written.extend(batch)
+        return True
+
+    # ============ Read-your-writes ============
+
+    def search_pending(
+        self,
+        query_embedding: np.ndarray,
+        top_k: int,
+        memory_type: Optional[str] = None,
+        min_score: float = 0.3
+    ) -> List[Dict[str, Any]]:
+        """
+        Henüz yazılmamış belgelerde cosine benzerlik araması.
+
+        Returns:
+            MemoryHandler.search ile aynı formatta sonuçlar
+        """
+        with self._lock:
+            candidates = [
+                p for p in self._pending.values()
+                if memory_type is None or p.metadata.get("type") == memory_type
+            ]
+        if not candidates:
+            return []
+
+        missing = [p for p in candidates if p.embedding is None]
+        if missing:
+            # Hesaplanan embedding'ler flush'ta tekrar kullanılır
+            vectors = self.handler._embedding_model.encode([p.text for p in missing])
+            for p, vector in zip(missing, vectors):
+                p.embedding = vector
+
+        matrix = np.stack([p.embedding for p in candidates]).astype(np.float32)
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1) * max(float(np.linalg.norm(query)), 1e-12)
+        scores = matrix @ query / np.maximum(norms, 1e-12)
+
+        results = []
+        for i in np.argsort(-scores)[:top_k]:
+            similarity = float(scores[i])
+            if similarity < min_score:
+                break
+            p = candidates[i]
+            results.append({
+                "id": p.doc_id,
+                "text": p.text,
+                "metadata": p.metadata,
+                "similarity": round(similarity, 3)
+            })
+
+        if results:
+            with self._lock:
+                self.stats["overlay_hits"] += len(results)
+        return results
+
+    # ============ Worker ============
+
+    def _ensure_worker(self) -> None:
+        """Arka plan worker'ını (gerekirse) başlat. Lock tutulurken çağrılır."""
+        if self._worker is not None and self._worker.is_alive():
+            return
+        self._worker = threading.Thread(target=self._run, name="memory-write-behind", daemon=True)
+        self._worker.start()
+
+    def _due(self) -> bool:
+        with self._lock:
+            if not self._pending:
+                return False
+            if len(self._pending) >= self.max_batch_size:
+                return True
+            oldest = next(iter(self._pending.values()))
+            return time.monotonic() - oldest.enqueued_at >= self.flush_interval
+
+    def _run(self) -> None:
+        """Eşik dolunca flush et."""
+        while not self._closed:
+            self._wake.wait(timeout=self.flush_interval / 2)
+            self._wake.clear()
+            if self._closed:
+                return
+            if self._due():
+                self.flush()
+
+    def close(self) -> None:
+        """Worker'ı durdur ve kalan belgeleri yaz."""
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        if self._worker is not None:
+            self._worker.join(timeout=5)
+        # Yazılamayan belgeler her flush'ta bir deneme harcar; son turda hata listesine düşer
+        for _ in range(self.max_retries):
+            self.flush()
+            if not self._pending:
+                break
+        atexit.unregister(self.close)
+
+    # ============ İstatistikler ============
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Kuyruk ve flush istatistikleri."""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["pending"] = len(self._pending)
+
+        flushes = stats["flushes"]
+        flush_time = stats.pop("total_flush_time")
+        stats["avg_batch_size"] = round(stats["written"] / flushes, 2) if flushes else 0
+        stats["avg_flush_ms"] = round(flush_time / flushes * 1000, 2) if flushes else 0
+        stats["max_batch_size"] = self.max_batch_size
+        stats["max_pending"] = self.max_pending
+        stats["flush_interval"] = self.flush_interval
+        return stats
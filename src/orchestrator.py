@@ -9,15 +9,19 @@ import sys
 sys.path.insert(0, ".")
 
 from typing import Dict, Optional, Any, List
-from dataclasses import dataclass
+from collections import deque
+from dataclasses import dataclass, asdict
 from datetime import datetime
 import json
 
 from src.router.classifier import IntentClassifier
 from src.experts.lora_manager import LoRAManager
+from src.experts.prefetcher import AdapterPrefetcher
 from src.memory.memory_manager import MemoryManager
 from src.inference.mlx_inference import MLXInference, GenerationConfig, GenerationResult
+from src.services.token_counter import get_token_counter
 from src.ttt.test_time_training import TestTimeTrainer, TTTConfig
+from src.ttt.stream_monitor import StreamQualityMonitor
 
 
 @dataclass
@@ -31,6 +35,21 @@ class ConversationTurn:
     generation_time: float
     tokens_generated: int
     timestamp: datetime
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON'a yazılabilir sözlük."""
+        data = asdict(self)
+        data["timestamp"] = self.timestamp.isoformat()
+        return data
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ConversationTurn":
+        """to_dict çıktısından geri oluştur."""
+        return cls(**{**data, "timestamp": datetime.fromisoformat(data["timestamp"])})
+
+
+# Oturumsuz (CLI) kullanımda tutulacak maksimum konuşma dönüşü
+MAX_HISTORY_TURNS = 1000
 
 
 class EvoTR:
@@ -65,8 +84,13 @@ class EvoTR:
         max_context_tokens: int = 1500,
         use_rag: bool = True,
         auto_adapter: bool = True,
+        shared_base: bool = False,
+        prefetch_adapters: bool = False,
+        prefix_cache_mb: int = 0,
+        memory_write_behind: bool = False,
         use_ttt: bool = True,
         ttt_config: Optional[TTTConfig] = None,
+        stop_on_repetition: bool = True,
         verbose: bool = True
     ):
         """
@@ -84,14 +108,20 @@ class EvoTR:
             max_context_tokens: Maksimum kısa süreli token
             use_rag: RAG kullanılsın mı
             auto_adapter: Otomatik adapter seçimi
+            shared_base: Base model bir kez yüklensin, adapter'lar LoRA ağırlığı olarak değiştirilsin
+            prefetch_adapters: Bir sonraki adapter tahmin edilip arka planda yüklensin
+            prefix_cache_mb: Prompt prefix KV cache bütçesi (0 = kapalı)
+            memory_write_behind: Konuşma hafızaları arka planda toplu yazılsın
             use_ttt: Test-Time Training kullanılsın mı
             ttt_config: TTT konfigürasyonu
+            stop_on_repetition: Tekrar döngüsüne giren üretim max_tokens dolmadan kesilsin
             verbose: Detaylı output
         """
         self.verbose = verbose
         self.use_rag = use_rag
         self.auto_adapter = auto_adapter
         self.use_ttt = use_ttt
+        self.stop_on_repetition = stop_on_repetition
         
         # chromadb_path verilmişse onu kullan
         if chromadb_path:
@@ -112,8 +142,10 @@ class EvoTR:
         self.lora_manager = LoRAManager(
             base_model_path=base_model_path,
             adapters_dir=adapters_dir,
-            cache_adapters=True
+            cache_adapters=True,
+            shared_base=shared_base
         )
+        self.prefetcher = AdapterPrefetcher(self.lora_manager) if prefetch_adapters else None
         
         # 3. Memory Manager
         self._log("🧠 Memory Manager yükleniyor...")
@@ -123,22 +155,30 @@ class EvoTR:
             max_context_messages=max_context_messages,
             max_context_tokens=max_context_tokens,
             system_prompt="Sen EVO-TR, çok yetenekli bir Türkçe AI asistansın.",
-            auto_save=True
+            auto_save=True,
+            write_behind=memory_write_behind
         )
         
+        # Hafıza bütçeleri ve inference istatistikleri için ortak token sayacı
+        # (model tokenizer'ı ilk yüklemede bağlanır)
+        self.token_counter = get_token_counter()
+        
         # 4. Inference Engine
         self._log("⚡ Inference Engine yükleniyor...")
         self.inference = MLXInference()
+        if prefix_cache_mb > 0:
+            self.inference.enable_prefix_cache(max_memory_mb=prefix_cache_mb)
         
         # 5. Test-Time Training
         if self.use_ttt:
             self._log("🎯 Test-Time Training başlatılıyor...")
-            self.ttt = TestTimeTrainer(ttt_config or TTTConfig())
+            # Semantik cache router ile aynı encoder'ı kullanır (sorgu vektörü zaten cache'te)
+            self.ttt = TestTimeTrainer(ttt_config or TTTConfig(), embedding_service=self.router.model)
         else:
             self.ttt = None
         
         # State
-        self._conversation_history: List[ConversationTurn] = []
+        self._conversation_history: deque = deque(maxlen=MAX_HISTORY_TURNS)
         self._current_intent: Optional[str] = None
         
         self._log("✅ EVO-TR hazır!\n")
@@ -148,13 +188,89 @@ class EvoTR:
         if self.verbose:
             print(message)
     
+    def enable_batching(self, max_batch_size: int = 8):
+        """
+        Eşzamanlı istekleri continuous batching scheduler'da birleştir.
+        
+        Shared-base modda tüm adapter'lar aynı modeli paylaştığı için
+        scheduler her adımda isteğin adapter'ını pool üzerinde aktif eder.
+        
+        Returns:
+            ContinuousBatchScheduler
+        """
+        return self.inference.enable_batching(
+            max_batch_size=max_batch_size,
+            adapter_pool=self.lora_manager.get_adapter_pool()
+        )
+    
+    def _session_state(self, session: Optional[Any]):
+        """
+        Konuşma durumunu seç.
+        
+        Web sunucusu her istemci için bir oturum (session_id, buffer, turns)
+        verir; oturum yoksa ortak kısa süreli hafıza ve geçmiş kullanılır.
+        
+        Returns:
+            (ContextBuffer, turn listesi, session_id)
+        """
+        if session is None:
+            return self.memory.short_term, self._conversation_history, "default"
+        return session.buffer, session.turns, session.session_id
+    
+    def _regenerate_fn(self, model: Any, tokenizer: Any, intent: str, adapter_name: Optional[str]):
+        """TTT self-correction için (prompt, max_tokens) -> yanıt fonksiyonu."""
+        def regenerate(prompt: str, max_tokens: int) -> str:
+            return self.inference.generate_response(
+                model=model,
+                tokenizer=tokenizer,
+                user_message=prompt,
+                intent=intent,
+                config=GenerationConfig(max_tokens=max_tokens),
+                adapter=adapter_name
+            ).text
+        return regenerate
+    
+    def _concurrent_generation_safe(self) -> bool:
+        """
+        Arka planda ikinci bir üretim güvenli mi?
+        
+        Sadece batching scheduler ile; shared-base modda ayrıca backend'in her
+        adımda isteğin adapter'ını aktif etmesi gerekir (enable_batching), aksi
+        halde sonraki isteğin adapter geçişi süren düzeltmenin ağırlıklarını değiştirir.
+        """
+        scheduler = self.inference.scheduler
+        if scheduler is None:
+            return False
+        if self.lora_manager.shared_base:
+            return getattr(scheduler.backend, "adapter_pool", None) is not None
+        return True
+    
+    def _quality_monitor(self) -> Optional[StreamQualityMonitor]:
+        """Üretim başına yeni tekrar dedektörü (kapalıysa None)."""
+        return StreamQualityMonitor() if self.stop_on_repetition else None
+    
+    def _schedule_prefetch(
+        self,
+        intent: str,
+        adapter_name: Optional[str],
+        all_scores: Optional[Dict[str, float]],
+        session_id: str = "default"
+    ) -> None:
+        """Generation başlamadan bir sonraki adapter'ı arka planda yükle."""
+        if self.prefetcher is None:
+            return
+        scheduled = self.prefetcher.on_request(session_id, intent, adapter_name, all_scores)
+        if scheduled:
+            self._log(f"🔮 Prefetch: {scheduled}")
+    
     def chat(
         self, 
         message: str,
         force_intent: Optional[str] = None,
         force_adapter: Optional[str] = None,
         include_rag: Optional[bool] = None,
-        use_ttt: Optional[bool] = None
+        use_ttt: Optional[bool] = None,
+        session: Optional[Any] = None
     ) -> str:
         """
         Ana chat fonksiyonu.
@@ -165,13 +281,16 @@ class EvoTR:
             force_adapter: Adapter'ı zorla
             include_rag: RAG kullanımını zorla
             use_ttt: TTT kullanımını zorla
+            session: Konuşma oturumu (None = ortak konuşma)
         
         Returns:
             Asistan yanıtı
         """
         start_time = datetime.now()
+        buffer, history, session_id = self._session_state(session)
         
         # 1. Intent Classification
+        all_scores = None
         if force_intent:
             intent = force_intent
             confidence = 1.0
@@ -179,6 +298,7 @@ class EvoTR:
             classification = self.router.predict(message)
             intent = classification["intent"]
             confidence = classification["confidence"]
+            all_scores = classification.get("all_scores")
         
         self._current_intent = intent
         self._log(f"🎯 Intent: {intent} ({confidence:.0%})")
@@ -193,11 +313,13 @@ class EvoTR:
         elif self.auto_adapter:
             model, tokenizer = self.lora_manager.load_for_intent(intent)
             adapter_name = self.lora_manager.get_current_adapter()
+            self._schedule_prefetch(intent, adapter_name, all_scores, session_id)
         else:
             model, tokenizer = self.lora_manager.get_model_and_tokenizer()
             adapter_name = self.lora_manager.get_current_adapter()
         
         self._log(f"🔌 Adapter: {adapter_name or 'base_model'}")
+        self.token_counter.set_tokenizer(tokenizer)
         
         # 3. TTT Adaptation (Pre-process)
         ttt_enabled = use_ttt if use_ttt is not None else self.use_ttt
@@ -225,45 +347,60 @@ class EvoTR:
         if use_rag:
             context = self.memory.get_augmented_context(
                 query=message,
-                long_term_top_k=2
+                long_term_top_k=2,
+                buffer=buffer
             )
             if context:
                 self._log(f"📚 RAG: {len(context)} karakter bağlam bulundu")
         
         # 5. Mesajı hafızaya ekle (user)
-        self.memory.add_user_message(message, intent=intent)
+        self.memory.add_user_message(message, intent=intent, buffer=buffer)
         
         # 5. Chat history al
         chat_history = []
-        for msg in self.memory.short_term.get_messages()[:-1]:  # Son mesaj hariç
+        for msg in buffer.get_messages()[:-1]:  # Son mesaj hariç
             chat_history.append(msg.to_chat_format())
         
-        # 6. Inference
+        # 6. Inference (tekrar döngüsüne girerse erken kesilir)
+        monitor = self._quality_monitor()
         result = self.inference.generate_response(
             model=model,
             tokenizer=tokenizer,
             user_message=message,
             intent=intent,
             chat_history=chat_history[-6:],  # Son 6 mesaj (3 tur)
-            context=context
+            context=context,
+            adapter=adapter_name,
+            stop_fn=monitor.feed if monitor else None
         )
         
         response = result.text
+        if result.stopped_early:
+            response = monitor.trimmed_text()
+            self._log(f"🔁 Tekrar döngüsü: üretim {result.tokens_generated} token'da durduruldu ({monitor.reason})")
         
         # 7. TTT Post-process (Self-correction, caching)
+        # Cache sadece sorguyla anahtarlanır: oturum geçmişi / hafıza bağlamıyla
+        # üretilen yanıt başka oturuma sunulmasın diye cache'e yazılmaz
         ttt_metadata = {}
         if ttt_enabled and self.ttt:
             response, ttt_metadata = self.ttt.post_process(
                 query=message,
                 response=response,
                 intent=intent,
-                adapter=adapter_name or "base_model"
+                adapter=adapter_name or "base_model",
+                regenerate_fn=self._regenerate_fn(model, tokenizer, intent, adapter_name),
+                tokens_per_second=result.tokens_per_second,
+                cacheable=not chat_history and not context
             )
             if ttt_metadata.get("corrections"):
-                self._log(f"✨ TTT: Yanıt post-process edildi (quality: {ttt_metadata.get('quality_score', 0):.2f})")
+                self._log(
+                    f"✨ TTT: Yanıt post-process edildi (quality: {ttt_metadata.get('quality_score', 0):.2f}, "
+                    f"+{ttt_metadata.get('correction_latency_ms', 0):.0f}ms)"
+                )
         
         # 8. Yanıtı hafızaya ekle (assistant)
-        self.memory.add_assistant_message(response)
+        self.memory.add_assistant_message(response, buffer=buffer)
         
         # 9. Konuşma kaydı
         turn = ConversationTurn(
@@ -276,7 +413,7 @@ class EvoTR:
             tokens_generated=result.tokens_generated,
             timestamp=start_time
         )
-        self._conversation_history.append(turn)
+        history.append(turn)
         
         self._log(f"⏱️ Generation: {result.generation_time:.2f}s, {result.tokens_generated} tokens\n")
         
@@ -287,7 +424,8 @@ class EvoTR:
         message: str,
         force_intent: Optional[str] = None,
         force_adapter: Optional[str] = None,
-        include_rag: Optional[bool] = None
+        include_rag: Optional[bool] = None,
+        session: Optional[Any] = None
     ):
         """
         Streaming chat fonksiyonu.
@@ -297,14 +435,18 @@ class EvoTR:
             force_intent: Intent'i zorla
             force_adapter: Adapter'ı zorla
             include_rag: RAG kullanımını zorla
+            session: Konuşma oturumu (None = ortak konuşma)
         
         Yields:
-            Dict with 'type' ('token', 'meta', 'done') and content
+            Dict with 'type' ('token', 'meta', 'done') and content;
+            tekrar nedeniyle durulduysa 'done' kırpılmış 'text' ve 'stopped_reason' taşır
         """
         import time
         start_time = time.time()
+        buffer, history, session_id = self._session_state(session)
         
         # 1. Intent Classification
+        all_scores = None
         if force_intent:
             intent = force_intent
             confidence = 1.0
@@ -312,6 +454,7 @@ class EvoTR:
             classification = self.router.predict(message)
             intent = classification["intent"]
             confidence = classification["confidence"]
+            all_scores = classification.get("all_scores")
         
         self._current_intent = intent
         
@@ -325,9 +468,11 @@ class EvoTR:
         elif self.auto_adapter:
             model, tokenizer = self.lora_manager.load_for_intent(intent)
             adapter_name = self.lora_manager.get_current_adapter()
+            self._schedule_prefetch(intent, adapter_name, all_scores, session_id)
         else:
             model, tokenizer = self.lora_manager.get_model_and_tokenizer()
             adapter_name = self.lora_manager.get_current_adapter()
+        self.token_counter.set_tokenizer(tokenizer)
         
         # Yield metadata first
         yield {
@@ -344,37 +489,69 @@ class EvoTR:
         if use_rag:
             context = self.memory.get_augmented_context(
                 query=message,
-                long_term_top_k=2
+                long_term_top_k=2,
+                buffer=buffer
             )
         
         # 4. Mesajı hafızaya ekle (user)
-        self.memory.add_user_message(message, intent=intent)
+        self.memory.add_user_message(message, intent=intent, buffer=buffer)
         
         # 5. Chat history al
         chat_history = []
-        for msg in self.memory.short_term.get_messages()[:-1]:
+        for msg in buffer.get_messages()[:-1]:
             chat_history.append(msg.to_chat_format())
         
         # 6. Streaming Inference
         full_response = ""
         token_count = 0
+        monitor = self._quality_monitor()
         
-        for token in self.inference.generate_response_stream(
+        stream = self.inference.generate_response_stream(
             model=model,
             tokenizer=tokenizer,
             user_message=message,
             intent=intent,
             chat_history=chat_history[-6:],
-            context=context
-        ):
-            full_response += token
-            token_count += 1
-            yield {"type": "token", "text": token}
+            context=context,
+            adapter=adapter_name
+        )
+        try:
+            for token in stream:
+                full_response += token
+                token_count += 1
+                yield {"type": "token", "text": token}
+                if monitor is not None and monitor.feed(token):
+                    break
+        finally:
+            # Generator kapanınca scheduler isteği iptal edilir / stream_generate durur
+            stream.close()
+        
+        stopped_reason = monitor.reason if monitor is not None and monitor.stopped else None
+        if stopped_reason:
+            # İstemci tekrarları zaten aldı; hafızaya ve geçmişe kırpılmış yanıt yazılır
+            full_response = monitor.trimmed_text()
+            self._log(f"🔁 Tekrar döngüsü: stream {token_count} token'da durduruldu ({stopped_reason})")
         
         generation_time = time.time() - start_time
         
+        # Stream geri alınamaz: düzeltme arka planda yapılır ve sonraki sorgu için cache'lenir.
+        if (
+            self.ttt is not None and self.use_ttt
+            and self.ttt.config.correct_streamed
+            and self._concurrent_generation_safe()
+        ):
+            self.ttt.post_process_in_background(
+                query=message,
+                response=full_response,
+                intent=intent,
+                adapter=adapter_name or "base_model",
+                regenerate_fn=self._regenerate_fn(model, tokenizer, intent, adapter_name),
+                tokens_per_second=token_count / generation_time if generation_time > 0 else None,
+                cacheable=not chat_history and not context
+            )
+        
         # 7. Yanıtı hafızaya ekle (assistant)
-        self.memory.add_assistant_message(full_response)
+        self.memory.add_assistant_message(full_response, buffer=buffer)
         
         # 8. Konuşma kaydı
         turn = ConversationTurn(
@@ -387,18 +564,28 @@ class EvoTR:
             tokens_generated=token_count,
             timestamp=datetime.now()
         )
-        self._conversation_history.append(turn)
+        history.append(turn)
         
         # Yield completion
-        yield {
+        done = {
             "type": "done",
             "tokens_generated": token_count,
             "generation_time": round(generation_time, 3)
         }
+        if stopped_reason:
+            done["stopped_reason"] = stopped_reason
+            done["text"] = full_response
+        yield done
     
-    def get_conversation_history(self) -> List[ConversationTurn]:
-        """Konuşma geçmişini döndür."""
-        return self._conversation_history.copy()
+    def get_conversation_history(self, session: Optional[Any] = None) -> List[ConversationTurn]:
+        """Konuşma geçmişini döndür (oturum verilirse o oturumun)."""
+        _, history, _ = self._session_state(session)
+        return list(history)
+    
+    def end_session(self, session_id: str) -> None:
+        """Biten web oturumunun orkestratördeki izlerini temizle."""
+        if self.prefetcher is not None:
+            self.prefetcher.forget_session(session_id)
     
     def clear_conversation(self) -> None:
         """Mevcut konuşmayı temizle."""
@@ -422,12 +609,17 @@ class EvoTR:
             "long_term_documents": memory_stats["long_term"]["total_documents"],
             "memory_stats": memory_stats,
             "inference_stats": self.inference.get_stats(),
+            "embedding_stats": self.router.model.get_stats(),
+            "token_counter_stats": self.token_counter.get_stats(),
             "available_adapters": list(self.lora_manager.list_adapters().keys()),
             "use_rag": self.use_rag,
             "auto_adapter": self.auto_adapter,
             "use_ttt": self.use_ttt
         }
         
+        if self.prefetcher:
+            status["prefetch_stats"] = self.prefetcher.get_stats()
+        
         # TTT istatistikleri ekle
         if self.ttt:
             status["ttt_stats"] = self.ttt.get_statistics()
@@ -5,21 +5,37 @@ Gelen kullanıcı mesajını analiz edip doğru adapter'a yönlendirir.
 Similarity-based yaklaşım kullanır.
 """
 
+import hashlib
 import json
+import os
+import re
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 import numpy as np
-from sentence_transformers import SentenceTransformer
+
+from ..services.embedding_service import EmbeddingService, get_embedding_service
+from .knn_index import SampleIndex
 
 
 class IntentClassifier:
     """Similarity-based intent sınıflandırıcı"""
     
+    ROUTING_MODES = ("centroid", "knn")
+    
+    # "auto" indeks bu örnek sayısının üstünde IVF'e geçer
+    IVF_MIN_SAMPLES = 50000
+    
     def __init__(
         self,
         model_path: str = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2",
         dataset_path: str = "./data/intents/intent_dataset.json",
-        mapping_path: str = "./configs/intent_mapping.json"
+        mapping_path: str = "./configs/intent_mapping.json",
+        cache_dir: Optional[str] = "./data/cache/router",
+        mode: str = "centroid",
+        knn_k: int = 10,
+        knn_dtype: str = "float16",
+        knn_index: str = "auto",
+        embedding_service: Optional[EmbeddingService] = None
     ):
         """
         Intent sınıflandırıcıyı başlat.
@@ -28,13 +44,37 @@ class IntentClassifier:
             model_path: Sentence transformer model adı (HuggingFace Hub)
             dataset_path: Intent veri seti yolu
             mapping_path: Intent-adapter mapping dosyası
+            cache_dir: Centroid/örnek embedding cache dizini (None = kapalı)
+            mode: "centroid" (intent ortalaması) veya "knn" (örnek komşuları)
+            knn_k: k-NN modunda oylayan komşu sayısı
+            knn_dtype: Örnek matrisinin saklama tipi ("float32", "float16", "int8")
+            knn_index: "exact", "ivf" veya "auto" (büyük dataset'te ivf)
+            embedding_service: Paylaşımlı encoder (None = süreç geneli servis)
         """
+        if mode not in self.ROUTING_MODES:
+            raise ValueError(f"Bilinmeyen routing modu: {mode}")
+        
         print(f"🔄 Router modeli yükleniyor: {model_path}")
-        self.model = SentenceTransformer(model_path)
+        self.model_path = model_path
+        self.model = embedding_service or get_embedding_service(model_path)
         self.dataset = self._load_dataset(dataset_path)
         self.mapping = self._load_mapping(mapping_path)
-        self.intent_embeddings = self._build_intent_embeddings()
-        print(f"✅ Router hazır! {len(self.intent_embeddings)} intent kategorisi")
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.cache_key = self._compute_cache_key()
+        self.mode = mode
+        self.knn_k = knn_k
+        self._samples = None
+        
+        cached = self._load_cached_centroids()
+        self.intent_embeddings = cached if cached is not None else self._build_intent_embeddings()
+        self.intent_names, self.centroid_matrix = self._build_centroid_matrix(self.intent_embeddings)
+        
+        self.sample_index: Optional[SampleIndex] = None
+        if mode == "knn":
+            self.sample_index = self._build_sample_index(knn_dtype, knn_index)
+            self._knn_columns = [self.sample_index.label_names.index(name) for name in self.intent_names]
+        
+        print(f"✅ Router hazır! {len(self.intent_embeddings)} intent kategorisi ({mode})")
     
     def _load_dataset(self, path: str) -> dict:
         """Veri setini yükle"""
@@ -46,51 +86,222 @@ class IntentClassifier:
         with open(path, "r", encoding="utf-8") as f:
             return json.load(f)
     
-    def _build_intent_embeddings(self) -> Dict[str, np.ndarray]:
-        """Her intent için ortalama embedding hesapla"""
-        print("📊 Intent embedding'leri hesaplanıyor...")
+    def _compute_cache_key(self) -> str:
+        """Dataset, mapping ve model adından cache anahtarı üret"""
+        digest = hashlib.sha256()
+        for part in (self.dataset, self.mapping, self.model_path):
+            digest.update(json.dumps(part, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+        return digest.hexdigest()
+    
+    def _cache_paths(self) -> Dict[str, Path]:
+        """Model adına göre cache dosya yolları"""
+        slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", self.model_path).strip("_")
+        return {
+            "meta": self.cache_dir / f"{slug}.meta.json",
+            "centroids": self.cache_dir / f"{slug}.centroids.npy",
+            "samples": self.cache_dir / f"{slug}.samples.npy"
+        }
+    
+    def _read_cache_meta(self) -> Optional[dict]:
+        """Cache meta dosyasını oku (yoksa/bozuksa None)"""
+        if self.cache_dir is None:
+            return None
+        meta_path = self._cache_paths()["meta"]
+        if not meta_path.exists():
+            return None
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Router cache okunamadı: {e}")
+            return None
+    
+    def _load_cached_centroids(self) -> Optional[Dict[str, np.ndarray]]:
+        """Anahtar eşleşiyorsa centroid'leri diskten yükle"""
+        meta = self._read_cache_meta()
+        if meta is None or meta.get("key") != self.cache_key:
+            return None
+        
+        try:
+            centroids = np.load(self._cache_paths()["centroids"])
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Router cache okunamadı: {e}")
+            return None
+        
+        if len(centroids) != len(meta["intents"]):
+            return None
+        
+        print(f"⚡ Intent embedding'leri cache'den yüklendi ({len(meta['intents'])} intent)")
+        return dict(zip(meta["intents"], centroids))
+    
+    def _encode_samples(self, texts: List[str]) -> tuple:
+        """
+        Örnek metinleri encode et, cache'deki embedding'leri yeniden kullan.
+        
+        Returns:
+            ([n, dim] embedding matrisi, metin hash listesi)
+        """
+        hashes = [hashlib.sha1(text.encode("utf-8")).hexdigest() for text in texts]
         
+        cached_index: Dict[str, int] = {}
+        cached_embeddings = None
+        meta = self._read_cache_meta()
+        if meta is not None and meta.get("model") == self.model_path:
+            try:
+                cached_embeddings = np.load(self._cache_paths()["samples"], mmap_mode="r")
+                cached_hashes = meta.get("sample_hashes", [])
+                if len(cached_hashes) == len(cached_embeddings):
+                    cached_index = {h: i for i, h in enumerate(cached_hashes)}
+                else:
+                    cached_embeddings = None
+            except (OSError, ValueError):
+                cached_index, cached_embeddings = {}, None
+        
+        missing = [i for i, h in enumerate(hashes) if h not in cached_index]
+        if cached_embeddings is None or len(missing) == len(texts):
+            return self.model.encode(texts, use_cache=False), hashes
+        
+        embeddings = np.empty((len(texts), cached_embeddings.shape[1]), dtype=np.float32)
+        reused = [i for i, h in enumerate(hashes) if h in cached_index]
+        embeddings[reused] = cached_embeddings[[cached_index[hashes[i]] for i in reused]]
+        if missing:
+            embeddings[missing] = self.model.encode(
+                [texts[i] for i in missing], use_cache=False
+            )
+        print(f"  ♻️ {len(reused)} örnek cache'den, {len(missing)} yeni örnek encode edildi")
+        
+        return embeddings, hashes
+    
+    def _save_cache(
+        self,
+        intent_embeddings: Dict[str, np.ndarray],
+        sample_embeddings: np.ndarray,
+        sample_hashes: List[str]
+    ) -> None:
+        """Centroid ve örnek embedding'lerini atomik olarak diske yaz"""
+        if self.cache_dir is None:
+            return
+        
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            paths = self._cache_paths()
+            arrays = {
+                "centroids": np.stack(list(intent_embeddings.values())).astype(np.float32),
+                "samples": np.asarray(sample_embeddings, dtype=np.float32)
+            }
+            for name, array in arrays.items():
+                tmp_path = paths[name].with_suffix(".tmp")
+                with open(tmp_path, "wb") as f:
+                    np.save(f, array)
+                os.replace(tmp_path, paths[name])
+            
+            meta = {
+                "key": self.cache_key,
+                "model": self.model_path,
+                "intents": list(intent_embeddings.keys()),
+                "sample_hashes": sample_hashes
+            }
+            tmp_path = paths["meta"].with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            os.replace(tmp_path, paths["meta"])
+        except OSError as e:
+            print(f"⚠️ Router cache yazılamadı: {e}")
+    
+    def _collect_samples(self) -> Dict[str, List[str]]:
+        """Dataset örneklerini intent'e göre grupla"""
         intent_texts = {}
         for sample in self.dataset["intents"]:
             intent = sample["intent"]
             if intent not in intent_texts:
                 intent_texts[intent] = []
             intent_texts[intent].append(sample["text"])
+        return intent_texts
+    
+    def _build_intent_embeddings(self) -> Dict[str, np.ndarray]:
+        """Her intent için ortalama embedding hesapla"""
+        print("📊 Intent embedding'leri hesaplanıyor...")
+        
+        intent_texts = self._collect_samples()
+        
+        # Tüm örnekler tek encode çağrısında (cache'dekiler hariç)
+        all_texts = [text for texts in intent_texts.values() for text in texts]
+        all_embeddings, sample_hashes = self._encode_samples(all_texts)
         
         intent_embeddings = {}
+        offset = 0
         for intent, texts in intent_texts.items():
-            embeddings = self.model.encode(texts, show_progress_bar=False)
+            embeddings = all_embeddings[offset:offset + len(texts)]
+            offset += len(texts)
             intent_embeddings[intent] = np.mean(embeddings, axis=0)
             print(f"  ✓ {intent}: {len(texts)} örnek")
         
+        # k-NN indeksi aynı embedding'leri tekrar encode etmeden kullanır
+        if self.mode == "knn":
+            labels = [intent for intent, texts in intent_texts.items() for _ in texts]
+            self._samples = (all_embeddings, labels)
+        
+        self._save_cache(intent_embeddings, all_embeddings, sample_hashes)
         return intent_embeddings
     
-    def predict(self, text: str) -> Dict:
+    def _build_sample_index(self, dtype: str, index_type: str) -> SampleIndex:
+        """k-NN modu için örnek embedding indeksini oluştur"""
+        if self._samples is None:
+            intent_texts = self._collect_samples()
+            all_texts = [text for texts in intent_texts.values() for text in texts]
+            embeddings, _ = self._encode_samples(all_texts)
+            labels = [intent for intent, texts in intent_texts.items() for _ in texts]
+        else:
+            embeddings, labels = self._samples
+            self._samples = None
+        
+        if index_type == "auto":
+            index_type = "ivf" if len(labels) > self.IVF_MIN_SAMPLES else "exact"
+        
+        index = SampleIndex(embeddings, labels, dtype=dtype, index_type=index_type)
+        print(f"  ✓ k-NN indeksi: {len(index)} örnek, {dtype}, {index_type}")
+        return index
+    
+    @staticmethod
+    def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+        """Satırları L2 normuna böl (sıfır vektörler korunur)"""
+        matrix = np.asarray(matrix, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-12)
+    
+    def _build_centroid_matrix(self, intent_embeddings: Dict[str, np.ndarray]):
         """
-        Metin için intent tahmini yap
+        Centroid'leri normalize edilmiş tek bir matrise diz.
+        
+        Returns:
+            (intent adları, [n_intent, dim] float32 matris)
+        """
+        intent_names = list(intent_embeddings.keys())
+        matrix = np.stack([intent_embeddings[name] for name in intent_names])
+        return intent_names, self._normalize_rows(matrix)
+    
+    def _score(self, query_embeddings: np.ndarray) -> np.ndarray:
+        """
+        Sorgu embedding'lerini tüm intent'lere karşı skorla.
         
         Args:
-            text: Kullanıcı mesajı
+            query_embeddings: [n_query, dim] embedding matrisi
             
         Returns:
-            {
-                "intent": str,
-                "confidence": float,
-                "adapter_id": str,
-                "all_scores": dict
-            }
+            [n_query, n_intent] skor matrisi (centroid: cosine benzerlik,
+            knn: benzerlik ağırlıklı komşu oyu)
         """
-        # Girdi embedding'i
-        query_embedding = self.model.encode([text], show_progress_bar=False)[0]
-        
-        # Tüm intent'lerle benzerlik hesapla
-        scores = {}
-        for intent, intent_emb in self.intent_embeddings.items():
-            similarity = self._cosine_similarity(query_embedding, intent_emb)
-            scores[intent] = float(similarity)
+        if self.sample_index is not None:
+            return self.sample_index.vote(query_embeddings, self.knn_k)[:, self._knn_columns]
+        return self._normalize_rows(query_embeddings) @ self.centroid_matrix.T
+    
+    def _build_result(self, score_row: np.ndarray) -> Dict:
+        """Tek bir skor satırından tahmin sözlüğü oluştur"""
+        scores = {name: float(score) for name, score in zip(self.intent_names, score_row)}
         
         # En yüksek skoru bul
-        best_intent = max(scores, key=scores.get)
+        best_index = int(np.argmax(score_row))
+        best_intent = self.intent_names[best_index]
         confidence = scores[best_intent]
         
         # Confidence threshold kontrolü
@@ -110,14 +321,49 @@ class IntentClassifier:
             "all_scores": scores
         }
     
-    def predict_batch(self, texts: list) -> list:
-        """Birden fazla metin için tahmin yap"""
-        return [self.predict(text) for text in texts]
+    def predict(self, text: str) -> Dict:
+        """
+        Metin için intent tahmini yap
+        
+        Args:
+            text: Kullanıcı mesajı
+            
+        Returns:
+            {
+                "intent": str,
+                "confidence": float,
+                "adapter_id": str,
+                "all_scores": dict
+            }
+        """
+        # Girdi embedding'i
+        query_embedding = self.model.encode([text], show_progress_bar=False)
+        
+        # Tüm intent'lerle benzerlik: tek matris-vektör çarpımı
+        return self._build_result(self._score(query_embedding)[0])
     
-    @staticmethod
-    def _cosine_similarity(a: np.ndarray, b: np.ndarray) -> float:
-        """İki vektör arasındaki cosine benzerliğini hesapla"""
-        return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
+    def predict_batch(self, texts: List[str], batch_size: int = 64) -> List[Dict]:
+        """
+        Birden fazla metin için tahmin yap
+        
+        Tüm metinler tek encode çağrısıyla gömülür ve tek matris
+        çarpımıyla skorlanır.
+        
+        Args:
+            texts: Kullanıcı mesajları
+            batch_size: Encoder batch boyutu
+            
+        Returns:
+            Her metin için predict() ile aynı yapıda sözlük
+        """
+        if not texts:
+            return []
+        
+        query_embeddings = self.model.encode(
+            list(texts), batch_size=batch_size, show_progress_bar=False
+        )
+        score_matrix = self._score(query_embeddings)
+        return [self._build_result(row) for row in score_matrix]
     
     def get_stats(self) -> Dict:
         """Model istatistiklerini döndür"""
@@ -132,7 +378,9 @@ class IntentClassifier:
             "sample_counts": intent_counts,
             "total_samples": sum(intent_counts.values()),
             "confidence_threshold": self.mapping.get("confidence_threshold"),
-            "fallback_adapter": self.mapping.get("fallback_adapter")
+            "fallback_adapter": self.mapping.get("fallback_adapter"),
+            "mode": self.mode,
+            "knn_index": self.sample_index.get_stats() if self.sample_index is not None else None
         }
 
 
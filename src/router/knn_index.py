@@ -0,0 +1,221 @@
+"""
+EVO-TR Router: Örnek Embedding İndeksi
+
+k-NN routing için tüm örnek embedding'lerini kompakt (float16/int8) bir
+matriste tutar. Küçük dataset'lerde kesin (brute-force) arama, büyüklerde
+IVF (k-means kümeleri) ile yaklaşık arama yapar.
+"""
+
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+
+STORAGE_DTYPES = ("float32", "float16", "int8")
+INT8_SCALE = 127.0
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """Satırları L2 normuna böl"""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def _spherical_kmeans(
+    vectors: np.ndarray,
+    n_clusters: int,
+    iterations: int = 10,
+    seed: int = 0
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Normalize vektörler üzerinde basit k-means (cosine).
+
+    Returns:
+        ([n_clusters, dim] normalize merkezler, [n] küme atamaları)
+    """
+    rng = np.random.default_rng(seed)
+    centers = vectors[rng.choice(len(vectors), size=n_clusters, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignments = np.argmax(vectors @ centers.T, axis=1)
+        for c in range(n_clusters):
+            members = vectors[assignments == c]
+            if len(members):
+                centers[c] = members.mean(axis=0)
+        centers = _normalize_rows(centers)
+
+    return centers, np.argmax(vectors @ centers.T, axis=1)
+
+
+class SampleIndex:
+    """
+    Örnek embedding'leri üzerinde top-k cosine arama.
+
+    Özellikler:
+    - Kompakt saklama: float16 veya int8 (satır normalize, sabit ölçek)
+    - Kesin arama: blok blok matris çarpımı, bellek sınırlı
+    - Yaklaşık arama (IVF): sorgu en yakın n_probe kümede aranır
+    """
+
+    def __init__(
+        self,
+        embeddings: np.ndarray,
+        labels: List[str],
+        dtype: str = "float16",
+        index_type: str = "exact",
+        n_lists: Optional[int] = None,
+        n_probe: int = 4,
+        block_size: int = 8192
+    ):
+        """
+        SampleIndex oluştur.
+
+        Args:
+            embeddings: [n, dim] örnek embedding'leri
+            labels: Her örneğin intent etiketi
+            dtype: Saklama tipi ("float32", "float16", "int8")
+            index_type: "exact" veya "ivf"
+            n_lists: IVF küme sayısı (None = sqrt(n))
+            n_probe: IVF'de sorgu başına taranacak küme sayısı
+            block_size: Kesin aramada tek seferde çarpılan satır sayısı
+        """
+        if dtype not in STORAGE_DTYPES:
+            raise ValueError(f"Bilinmeyen saklama tipi: {dtype}")
+        if index_type not in ("exact", "ivf"):
+            raise ValueError(f"Bilinmeyen indeks tipi: {index_type}")
+        if len(embeddings) != len(labels):
+            raise ValueError("Embedding ve etiket sayısı eşleşmiyor")
+
+        normalized = _normalize_rows(embeddings)
+
+        self.dtype = dtype
+        self.index_type = index_type
+        self.block_size = block_size
+        self.label_names: List[str] = list(dict.fromkeys(labels))
+        label_ids = {name: i for i, name in enumerate(self.label_names)}
+        self.label_ids = np.array([label_ids[label] for label in labels], dtype=np.int32)
+        self._matrix = self._quantize(normalized)
+
+        self._list_centers: Optional[np.ndarray] = None
+        self._lists: List[np.ndarray] = []
+        self.n_probe = n_probe
+        if index_type == "ivf":
+            n_lists = n_lists or max(1, int(np.sqrt(len(normalized))))
+            n_lists = min(n_lists, len(normalized))
+            self._list_centers, assignments = _spherical_kmeans(normalized, n_lists)
+            self._lists = [np.flatnonzero(assignments == c) for c in range(n_lists)]
+
+    def __len__(self) -> int:
+        return len(self._matrix)
+
+    def _quantize(self, normalized: np.ndarray) -> np.ndarray:
+        """Normalize embedding'leri saklama tipine çevir"""
+        if self.dtype == "int8":
+            return np.round(normalized * INT8_SCALE).astype(np.int8)
+        return normalized.astype(self.dtype)
+
+    def _dequantize(self, rows: np.ndarray) -> np.ndarray:
+        """Saklanan satırları float32'ye geri çevir"""
+        if self.dtype == "int8":
+            return rows.astype(np.float32) / INT8_SCALE
+        return rows.astype(np.float32, copy=False)
+
+    @staticmethod
+    def _merge_topk(
+        best_sims: np.ndarray,
+        best_ids: np.ndarray,
+        sims: np.ndarray,
+        ids: np.ndarray,
+        k: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Mevcut top-k ile yeni adayları birleştir"""
+        all_sims = np.concatenate([best_sims, sims], axis=1)
+        all_ids = np.concatenate([best_ids, ids], axis=1)
+        keep = np.argpartition(-all_sims, k - 1, axis=1)[:, :k]
+        return (
+            np.take_along_axis(all_sims, keep, axis=1),
+            np.take_along_axis(all_ids, keep, axis=1)
+        )
+
+    def _search_exact(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Tüm örnekler üzerinde blok blok brute-force arama"""
+        n = len(queries)
+        best_sims = np.full((n, 0), -np.inf, dtype=np.float32)
+        best_ids = np.zeros((n, 0), dtype=np.int64)
+
+        for start in range(0, len(self._matrix), self.block_size):
+            block = self._dequantize(self._matrix[start:start + self.block_size])
+            sims = queries @ block.T
+            ids = np.broadcast_to(np.arange(start, start + len(block)), sims.shape)
+            best_sims, best_ids = self._merge_topk(best_sims, best_ids, sims, ids, min(k, best_sims.shape[1] + sims.shape[1]))
+
+        return best_sims, best_ids
+
+    def _search_ivf(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """En yakın n_probe küme içinde arama"""
+        n_probe = min(self.n_probe, len(self._lists))
+        list_sims = queries @ self._list_centers.T
+        probes = np.argpartition(-list_sims, n_probe - 1, axis=1)[:, :n_probe]
+
+        out_sims = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        out_ids = np.zeros((len(queries), k), dtype=np.int64)
+        for q, lists in enumerate(probes):
+            candidates = np.concatenate([self._lists[c] for c in lists])
+            sims = self._dequantize(self._matrix[candidates]) @ queries[q]
+            top = min(k, len(candidates))
+            keep = np.argpartition(-sims, top - 1)[:top]
+            out_sims[q, :top] = sims[keep]
+            out_ids[q, :top] = candidates[keep]
+
+        return out_sims, out_ids
+
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Sorgular için en yakın k örneği bul.
+
+        Args:
+            queries: [n_query, dim] sorgu embedding'leri
+            k: Komşu sayısı
+
+        Returns:
+            ([n_query, k] benzerlikler, [n_query, k] örnek indeksleri).
+            Yetersiz aday varsa benzerlik -inf olur.
+        """
+        queries = _normalize_rows(np.atleast_2d(queries))
+        k = max(1, min(k, len(self._matrix)))
+        if self.index_type == "ivf":
+            return self._search_ivf(queries, k)
+        return self._search_exact(queries, k)
+
+    def vote(self, queries: np.ndarray, k: int) -> np.ndarray:
+        """
+        Benzerlik ağırlıklı k-NN oylaması.
+
+        Intent skoru = o intent'e ait komşuların benzerlik toplamı / k.
+        Komşuların hepsi aynı intent'teyse skor ortalama cosine benzerliğine
+        eşit olur; oylar bölündükçe skor düşer.
+
+        Returns:
+            [n_query, n_label] skor matrisi (sütunlar label_names sırasında)
+        """
+        sims, ids = self.search(queries, k)
+        valid = np.isfinite(sims)
+        weights = np.where(valid, np.maximum(sims, 0.0), 0.0)
+
+        scores = np.zeros((len(sims), len(self.label_names)), dtype=np.float32)
+        rows = np.repeat(np.arange(len(sims)), sims.shape[1])
+        np.add.at(scores, (rows, self.label_ids[ids].ravel()), weights.ravel())
+        return scores / sims.shape[1]
+
+    def get_stats(self) -> Dict:
+        """İndeks istatistikleri"""
+        stats = {
+            "samples": len(self._matrix),
+            "dtype": self.dtype,
+            "index_type": self.index_type,
+            "memory_mb": round(self._matrix.nbytes / (1024 * 1024), 3)
+        }
+        if self.index_type == "ivf":
+            stats["n_lists"] = len(self._lists)
+            stats["n_probe"] = self.n_probe
+        return stats
@@ -0,0 +1,17 @@
+"""
+EVO-TR: Services Module
+
+Bileşenler arasında paylaşılan süreç geneli servisler.
+"""
+
+from .embedding_service import EmbeddingService, get_embedding_service
+from .embedding_batcher import EmbeddingBatcher
+from .token_counter import TokenCounter, get_token_counter
+
+__all__ = [
+    "EmbeddingService",
+    "EmbeddingBatcher",
+    "get_embedding_service",
+    "TokenCounter",
+    "get_token_counter"
+]
@@ -0,0 +1,225 @@
+"""
+EVO-TR: Embedding Batcher
+
+Eşzamanlı encode isteklerini birkaç milisaniye biriktirip tek forward
+pass'te encode eden micro-batching katmanı. Hem senkron (Future.result)
+hem asenkron (await) çağıranlarla kullanılabilir.
+"""
+
+from typing import Callable, Dict, List, Optional, Any
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+import asyncio
+import queue
+import threading
+import time
+import numpy as np
+
+
+@dataclass
+class _EncodeRequest:
+    """Kuyruktaki tek bir encode isteği."""
+    texts: List[str]
+    future: Future
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class EmbeddingBatcher:
+    """
+    Micro-batching encode kuyruğu.
+
+    Akış:
+    1. submit() isteği kuyruğa koyar, Future döner
+    2. Worker ilk istekten sonra max_wait_ms kadar (veya max_batch_size
+       metne ulaşana kadar) diğer istekleri toplar
+    3. Tekrarsız metinler tek encode çağrısıyla işlenir
+    4. Her isteğin Future'ı kendi satırlarıyla tamamlanır
+    """
+
+    def __init__(
+        self,
+        encode_fn: Callable[[List[str]], np.ndarray],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+        latency_window: int = 1000
+    ):
+        """
+        EmbeddingBatcher başlat.
+
+        Args:
+            encode_fn: Metin listesini [n, dim] matrise çeviren fonksiyon
+            max_batch_size: Bir forward pass'teki maksimum metin sayısı
+            max_wait_ms: İlk istekten sonra diğerleri için bekleme süresi
+            latency_window: Yüzdelik gecikme için tutulan son istek sayısı
+        """
+        self.encode_fn = encode_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+
+        self._queue: "queue.Queue[Optional[_EncodeRequest]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._latencies: deque = deque(maxlen=latency_window)
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._worker.start()
+
+        self.stats = {
+            "requests": 0,
+            "cancelled": 0,
+            "batches": 0,
+            "texts": 0,
+            "encoded_texts": 0,
+            "max_batch_seen": 0,
+            "total_queue_wait": 0.0,
+            "total_encode_time": 0.0,
+            "errors": 0
+        }
+
+    # ============ İstek tarafı ============
+
+    def submit(self, texts: List[str]) -> Future:
+        """
+        Encode isteğini kuyruğa al.
+
+        Args:
+            texts: Encode edilecek metinler
+
+        Returns:
+            [len(texts), dim] matris ile tamamlanacak Future
+        """
+        if self._closed:
+            raise RuntimeError("EmbeddingBatcher kapatıldı")
+
+        future: Future = Future()
+        if not texts:
+            future.set_result(np.zeros((0, 0), dtype=np.float32))
+            return future
+
+        with self._lock:
+            self.stats["requests"] += 1
+        self._queue.put(_EncodeRequest(texts=list(texts), future=future))
+        return future
+
+    def encode(self, texts: List[str], timeout: Optional[float] = None) -> np.ndarray:
+        """Senkron encode (çağıran thread sonuç gelene kadar bekler)."""
+        return self.submit(texts).result(timeout=timeout)
+
+    async def encode_async(self, texts: List[str]) -> np.ndarray:
+        """Asenkron encode (event loop bloklanmaz, iptal edilirse istek düşer)."""
+        return await asyncio.wrap_future(self.submit(texts))
+
+    # ============ Worker ============
+
+    def _collect(self, first: _EncodeRequest) -> List[_EncodeRequest]:
+        """İlk istekten sonra bekleme süresi/batch limiti dolana kadar topla."""
+        batch = [first]
+        size = len(first.texts)
+        deadline = time.monotonic() + self.max_wait_ms / 1000
+
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self._closed = True
+                break
+            batch.append(item)
+            size += len(item.texts)
+
+        return batch
+
+    def _process(self, batch: List[_EncodeRequest]) -> None:
+        """Batch'i tek encode çağrısıyla işle ve Future'ları tamamla."""
+        started = time.monotonic()
+        active = [r for r in batch if r.future.set_running_or_notify_cancel()]
+        cancelled = len(batch) - len(active)
+        if not active:
+            with self._lock:
+                self.stats["cancelled"] += cancelled
+            return
+
+        texts = [t for r in active for t in r.texts]
+        unique = list(dict.fromkeys(texts))
+
+        try:
+            encoded = np.asarray(self.encode_fn(unique))
+        except Exception as e:
+            for r in active:
+                r.future.set_exception(e)
+            with self._lock:
+                self.stats["errors"] += 1
+                self.stats["cancelled"] += cancelled
+            return
+
+        finished = time.monotonic()
+        rows = {text: i for i, text in enumerate(unique)}
+        for r in active:
+            r.future.set_result(encoded[[rows[t] for t in r.texts]])
+
+        with self._lock:
+            self.stats["batches"] += 1
+            self.stats["cancelled"] += cancelled
+            self.stats["texts"] += len(texts)
+            self.stats["encoded_texts"] += len(unique)
+            self.stats["max_batch_seen"] = max(self.stats["max_batch_seen"], len(unique))
+            self.stats["total_encode_time"] += finished - started
+            for r in active:
+                self.stats["total_queue_wait"] += started - r.enqueued_at
+                self._latencies.append(finished - r.enqueued_at)
+
+    def _run(self) -> None:
+        """Kuyruğu batch'ler halinde işle, kapanışta kalanları bitir."""
+        while True:
+            first = self._queue.get()
+            if first is None:
+                self._closed = True
+            else:
+                self._process(self._collect(first))
+
+            if self._closed:
+                remaining = []
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is not None:
+                        remaining.append(item)
+                if remaining:
+                    self._process(remaining)
+                return
+
+    def close(self) -> None:
+        """Worker'ı durdur (kuyruktaki istekler tamamlanır)."""
+        if not self._closed:
+            self._queue.put(None)
+        self._worker.join(timeout=5)
+
+    # ============ İstatistikler ============
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Throughput ve gecikme istatistikleri."""
+        with self._lock:
+            stats = dict(self.stats)
+            latencies = sorted(self._latencies)
+
+        batches = stats["batches"]
+        served = len(latencies)
+        encode_time = stats.pop("total_encode_time")
+        queue_wait = stats.pop("total_queue_wait")
+
+        stats["avg_batch_size"] = round(stats["texts"] / batches, 2) if batches else 0
+        stats["avg_encode_ms"] = round(encode_time / batches * 1000, 2) if batches else 0
+        stats["avg_queue_wait_ms"] = round(queue_wait / max(stats["requests"] - stats["cancelled"], 1) * 1000, 2)
+        stats["p50_latency_ms"] = round(latencies[served // 2] * 1000, 2) if served else 0
+        stats["p95_latency_ms"] = round(latencies[min(served - 1, int(served * 0.95))] * 1000, 2) if served else 0
+        stats["texts_per_second"] = round(stats["encoded_texts"] / encode_time, 1) if encode_time > 0 else 0
+        stats["queue_size"] = self._queue.qsize()
+        stats["max_batch_size"] = self.max_batch_size
+        stats["max_wait_ms"] = self.max_wait_ms
+        return stats
@@ -0,0 +1,268 @@
+"""
+EVO-TR: Embedding Service
+
+Router, hafıza ve cache'in ortak kullandığı tek embedding modeli.
+Normalize edilmiş metin -> vektör LRU cache'i ile aynı mesaj
+bir istek boyunca yalnızca bir kez encode edilir.
+"""
+
+from typing import Dict, List, Optional, Union, Any
+from collections import OrderedDict
+import asyncio
+import threading
+import unicodedata
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+from .embedding_batcher import EmbeddingBatcher
+
+
+DEFAULT_EMBEDDING_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+
+
+def normalize_text(text: str) -> str:
+    """Cache anahtarı için metni normalize et (NFC + boşluk sadeleştirme)."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def _canonical_model_name(model_name: str) -> str:
+    """Aynı modelin farklı yazımlarını tek isme indir."""
+    prefix = "sentence-transformers/"
+    return model_name[len(prefix):] if model_name.startswith(prefix) else model_name
+
+
+class EmbeddingService:
+    """
+    Paylaşımlı embedding servisi.
+
+    Özellikler:
+    - Tek model kopyası (lazy yükleme)
+    - Normalize metin anahtarlı LRU cache
+    - SentenceTransformer.encode ile uyumlu arayüz
+    - Thread-safe cache
+    - İsteğe bağlı micro-batching (eşzamanlı istekler tek forward pass)
+    """
+
+    def __init__(
+        self,
+        model_name: str = DEFAULT_EMBEDDING_MODEL,
+        cache_size: int = 4096,
+        model: Optional[Any] = None
+    ):
+        """
+        EmbeddingService başlat.
+
+        Args:
+            model_name: Sentence-transformer model adı
+            cache_size: LRU cache'te tutulacak maksimum vektör sayısı
+            model: Hazır encoder (verilirse model_name yüklenmez)
+        """
+        self.model_name = model_name
+        self.cache_size = cache_size
+        self._model = model
+        self._cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._batcher: Optional[EmbeddingBatcher] = None
+
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "encode_calls": 0,
+            "encoded_texts": 0
+        }
+
+    @property
+    def model(self) -> Any:
+        """Encoder modeli (ilk kullanımda yüklenir)."""
+        if self._model is None:
+            with self._load_lock:
+                if self._model is None:
+                    print(f"📥 Embedding modeli yükleniyor: {self.model_name}")
+                    self._model = SentenceTransformer(self.model_name)
+        return self._model
+
+    def get_sentence_embedding_dimension(self) -> int:
+        """Embedding boyutu."""
+        return self.model.get_sentence_embedding_dimension()
+
+    def _encode_uncached(self, texts: List[str], batch_size: int) -> np.ndarray:
+        """Metinleri modelle tek çağrıda encode et."""
+        embeddings = self.model.encode(texts, batch_size=batch_size, show_progress_bar=False)
+        with self._lock:
+            self.stats["encode_calls"] += 1
+            self.stats["encoded_texts"] += len(texts)
+        return np.asarray(embeddings, dtype=np.float32)
+
+    def _lookup(self, keys: List[str]) -> tuple:
+        """
+        Anahtarları cache'te ara.
+
+        Returns:
+            (vektör listesi - bulunamayanlar None, tekrarsız eksik anahtarlar)
+        """
+        vectors: List[Optional[np.ndarray]] = [None] * len(keys)
+        with self._lock:
+            for i, key in enumerate(keys):
+                cached = self._cache.get(key)
+                if cached is not None:
+                    self._cache.move_to_end(key)
+                    vectors[i] = cached
+            hits = sum(v is not None for v in vectors)
+            self.stats["hits"] += hits
+            self.stats["misses"] += len(keys) - hits
+
+        missing = list(dict.fromkeys(key for key, v in zip(keys, vectors) if v is None))
+        return vectors, missing
+
+    def _fill(
+        self,
+        keys: List[str],
+        vectors: List[Optional[np.ndarray]],
+        missing: List[str],
+        encoded: np.ndarray
+    ) -> List[np.ndarray]:
+        """Yeni vektörleri cache'e yaz ve eksik satırları doldur."""
+        new_vectors = dict(zip(missing, encoded))
+        with self._lock:
+            for key, vector in new_vectors.items():
+                vector.setflags(write=False)
+                self._cache[key] = vector
+                self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return [v if v is not None else new_vectors[key] for key, v in zip(keys, vectors)]
+
+    def encode(
+        self,
+        texts: Union[str, List[str]],
+        batch_size: int = 32,
+        show_progress_bar: bool = False,
+        use_cache: bool = True,
+        **kwargs
+    ) -> np.ndarray:
+        """
+        Metin(ler)i encode et.
+
+        Batching açıksa cache'te olmayan metinler micro-batch kuyruğuna
+        gider ve diğer eşzamanlı isteklerle aynı forward pass'te encode edilir.
+
+        Args:
+            texts: Tek metin veya metin listesi
+            batch_size: Encoder batch boyutu
+            show_progress_bar: SentenceTransformer uyumluluğu için (kullanılmaz)
+            use_cache: LRU cache kullanılsın mı (toplu dataset encode'unda False)
+
+        Returns:
+            Tek metin için [dim], liste için [n, dim] float32 dizi
+        """
+        single = isinstance(texts, str)
+        items = [texts] if single else list(texts)
+        if not items:
+            return np.zeros((0, self.get_sentence_embedding_dimension()), dtype=np.float32)
+
+        keys = [normalize_text(t) for t in items]
+
+        if not use_cache:
+            result = self._encode_uncached(keys, batch_size)
+            return result[0] if single else result
+
+        vectors, missing = self._lookup(keys)
+        if missing:
+            # Tek okuma: eşzamanlı disable_batching() arada None yapabilir
+            batcher = self._batcher
+            if batcher is not None:
+                encoded = batcher.encode(missing)
+            else:
+                encoded = self._encode_uncached(missing, batch_size)
+            vectors = self._fill(keys, vectors, missing, encoded)
+
+        return vectors[0] if single else np.stack(vectors)
+
+    async def encode_async(self, texts: Union[str, List[str]]) -> np.ndarray:
+        """
+        Event loop'u bloklamadan encode et (FastAPI handler'ları için).
+
+        Args:
+            texts: Tek metin veya metin listesi
+
+        Returns:
+            encode() ile aynı
+        """
+        single = isinstance(texts, str)
+        items = [texts] if single else list(texts)
+        if not items:
+            return await asyncio.to_thread(self.encode, items)
+
+        keys = [normalize_text(t) for t in items]
+        vectors, missing = self._lookup(keys)
+        if missing:
+            batcher = self._batcher
+            if batcher is not None:
+                encoded = await batcher.encode_async(missing)
+            else:
+                encoded = await asyncio.to_thread(self._encode_uncached, missing, 32)
+            vectors = self._fill(keys, vectors, missing, encoded)
+
+        return vectors[0] if single else np.stack(vectors)
+
+    def enable_batching(self, max_batch_size: int = 32, max_wait_ms: float = 5.0) -> EmbeddingBatcher:
+        """
+        Eşzamanlı encode isteklerini micro-batch'lemeye başla.
+
+        Args:
+            max_batch_size: Bir forward pass'teki maksimum metin sayısı
+            max_wait_ms: İlk istekten sonra diğerleri için bekleme süresi
+        """
+        self.disable_batching()
+        self._batcher = EmbeddingBatcher(
+            lambda texts: self._encode_uncached(texts, max_batch_size),
+            max_batch_size=max_batch_size,
+            max_wait_ms=max_wait_ms
+        )
+        return self._batcher
+
+    def disable_batching(self) -> None:
+        """Batching'i kapat (kuyruktaki istekler tamamlanır)."""
+        if self._batcher is not None:
+            batcher, self._batcher = self._batcher, None
+            batcher.close()
+
+    def clear_cache(self) -> None:
+        """LRU cache'i temizle."""
+        with self._lock:
+            self._cache.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Servis istatistikleri."""
+        with self._lock:
+            stats = dict(self.stats)
+            cached = len(self._cache)
+
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups * 100, 2) if lookups else 0
+        stats["cached_vectors"] = cached
+        stats["cache_size"] = self.cache_size
+        stats["model"] = self.model_name
+        stats["model_loaded"] = self._model is not None
+        stats["batching"] = self._batcher.get_stats() if self._batcher is not None else None
+        return stats
+
+
+# Süreç geneli servisler (model adı -> servis)
+_services: Dict[str, EmbeddingService] = {}
+_services_lock = threading.Lock()
+
+
+def get_embedding_service(model_name: str = DEFAULT_EMBEDDING_MODEL) -> EmbeddingService:
+    """
+    Model için süreç geneli EmbeddingService döndür.
+
+    "paraphrase-multilingual-MiniLM-L12-v2" ve
+    "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2" aynı servisi paylaşır.
+    """
+    key = _canonical_model_name(model_name)
+    with _services_lock:
+        if key not in _services:
+            _services[key] = EmbeddingService(model_name)
+        return _services[key]
@@ -0,0 +1,200 @@
+"""
+EVO-TR: Token Counter
+
+Context buffer, RAG bağlam bütçesi ve inference istatistiklerinin ortak
+kullandığı token sayacı. Model tokenizer'ı bağlandığında gerçek token
+sayısı, bağlanmadan önce karakter tabanlı tahmin döner. Sayımlar metin
+anahtarlı LRU cache'te tutulur; aynı mesaj her turda yeniden tokenize
+edilmez.
+"""
+
+from typing import Any, Dict, List, Optional
+from collections import OrderedDict
+import hashlib
+import threading
+
+
+# Chat template'in mesaj başına eklediği rol/ayraç token'ları (yaklaşık)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Uzun metinlerde cache anahtarı olarak metnin kendisi yerine hash'i tutulur
+_HASH_KEY_MIN_CHARS = 256
+
+
+def estimate_tokens(text: str) -> int:
+    """Tokenizer yokken kullanılan tahmin (4 karakter = 1 token)."""
+    return len(text) // 4 + 1 if text else 0
+
+
+class TokenCounter:
+    """
+    Tokenizer tabanlı token sayacı.
+
+    Özellikler:
+    - Gerçek tokenizer sayımı (bağlıysa), yoksa tahmin
+    - Metin anahtarlı LRU sayım cache'i
+    - Tokenizer değişince cache temizlenir, version artar
+    - Metni token bütçesine göre kırpma
+    """
+
+    def __init__(self, tokenizer: Optional[Any] = None, cache_size: int = 8192):
+        """
+        TokenCounter başlat.
+
+        Args:
+            tokenizer: encode() metodu olan tokenizer (None = tahmin modu)
+            cache_size: LRU cache'te tutulacak maksimum sayım
+        """
+        self.cache_size = cache_size
+        self._tokenizer = tokenizer
+        self._cache: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.version = 0
+
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "tokenized_chars": 0
+        }
+
+    @property
+    def tokenizer(self) -> Optional[Any]:
+        return self._tokenizer
+
+    @property
+    def is_exact(self) -> bool:
+        """Sayımlar gerçek tokenizer'dan mı geliyor."""
+        return self._tokenizer is not None
+
+    @staticmethod
+    def _vocab_id(tokenizer: Optional[Any]) -> Optional[tuple]:
+        """Aynı sözlüğü kullanan tokenizer'ları tanımak için kimlik."""
+        if tokenizer is None:
+            return None
+        ident = (getattr(tokenizer, "name_or_path", None), getattr(tokenizer, "vocab_size", None))
+        return ident if ident != (None, None) else None
+
+    def set_tokenizer(self, tokenizer: Optional[Any]) -> None:
+        """
+        Tokenizer bağla (veya kaldır).
+
+        Aynı (veya aynı sözlüklü, örn. adapter başına yüklenen) tokenizer
+        verilirse sayımlar korunur; değişirse cache temizlenir ve version
+        artar (önceden hesaplanan toplamlar bayatlamış demektir).
+        """
+        with self._lock:
+            if tokenizer is self._tokenizer:
+                return
+            same_vocab = self._vocab_id(tokenizer) is not None \
+                and self._vocab_id(tokenizer) == self._vocab_id(self._tokenizer)
+            self._tokenizer = tokenizer
+            if same_vocab:
+                return
+            self._cache.clear()
+            self.version += 1
+
+    @staticmethod
+    def _key(text: str) -> str:
+        if len(text) < _HASH_KEY_MIN_CHARS:
+            return text
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def _tokenize_count(self, tokenizer: Optional[Any], text: str) -> int:
+        if tokenizer is None:
+            return estimate_tokens(text)
+        return len(tokenizer.encode(text, add_special_tokens=False))
+
+    def count(self, text: str) -> int:
+        """
+        Metnin token sayısı.
+
+        Args:
+            text: Sayılacak metin
+
+        Returns:
+            Token sayısı (özel token'lar hariç)
+        """
+        if not text:
+            return 0
+
+        key = self._key(text)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.stats["hits"] += 1
+                return cached
+            self.stats["misses"] += 1
+            tokenizer, version = self._tokenizer, self.version
+
+        n = self._tokenize_count(tokenizer, text)
+
+        with self._lock:
+            # Bu arada tokenizer değiştiyse eski sayımı cache'e yazma
+            if version == self.version:
+                self._cache[key] = n
+                self.stats["tokenized_chars"] += len(text)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return n
+
+    def count_many(self, texts: List[str]) -> List[int]:
+        """Birden fazla metnin token sayıları."""
+        return [self.count(t) for t in texts]
+
+    def count_message(self, content: str) -> int:
+        """Chat mesajının template ek yükü dahil token sayısı."""
+        return self.count(content) + MESSAGE_OVERHEAD_TOKENS
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """
+        Metni en fazla max_tokens token olacak şekilde kırp.
+
+        Args:
+            text: Kırpılacak metin
+            max_tokens: Token bütçesi
+
+        Returns:
+            Kırpılmış metin (sığıyorsa olduğu gibi)
+        """
+        if max_tokens <= 0:
+            return ""
+        if self.count(text) <= max_tokens:
+            return text
+
+        tokenizer = self._tokenizer
+        if tokenizer is not None:
+            ids = tokenizer.encode(text, add_special_tokens=False)
+            return tokenizer.decode(ids[:max_tokens])
+        return text[:max(0, (max_tokens - 1) * 4)]
+
+    def clear_cache(self) -> None:
+        """Sayım cache'ini temizle."""
+        with self._lock:
+            self._cache.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Sayaç istatistikleri."""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["cached_counts"] = len(self._cache)
+
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups * 100, 2) if lookups else 0
+        stats["mode"] = "tokenizer" if self.is_exact else "estimate"
+        stats["version"] = self.version
+        return stats
+
+
+# Süreç geneli sayaç (model tokenizer'ı yüklenince bağlanır)
+_counter: Optional[TokenCounter] = None
+_counter_lock = threading.Lock()
+
+
+def get_token_counter() -> TokenCounter:
+    """Süreç geneli TokenCounter döndür."""
+    global _counter
+    with _counter_lock:
+        if _counter is None:
+            _counter = TokenCounter()
+        return _counter
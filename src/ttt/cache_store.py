@@ -0,0 +1,314 @@
+"""
+EVO-TR: Persistent TTT Cache Store
+
+ContextCache girdileri için SQLite (WAL) tabanlı kalıcı depo. Web sunucusu,
+chat_cli.py ve birden fazla worker süreci aynı dosyayı paylaşır; yeniden
+başlatma sonrası cache sıcak yüklenir.
+
+- WAL modu: okuyucular yazarı, yazar okuyucuları bloklamaz (süreçler arası)
+- Thread başına bağlantı, busy_timeout ile kilit beklemesi
+- TTL: created_at (unix zamanı) üzerinden; LRU: last_access üzerinden
+- Semantik mod için sorgu embedding'i BLOB olarak saklanır (yeniden encode yok);
+  yanında encoder kimliği (model adı / boyut) tutulur, encoder değişirse
+  okuyan taraf vektörü kullanmaz
+"""
+
+from typing import Any, Dict, List, Optional
+from pathlib import Path
+import json
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+
+class SQLiteCacheStore:
+    """
+    Süreçler arası paylaşılan cache deposu.
+
+    Kullanım:
+        store = SQLiteCacheStore("./data/cache/ttt_cache.db", max_entries=10000)
+        store.put({...girdi alanları...}, embedding=vector)
+        row = store.get(query_hash)
+        rows = store.load_recent(limit=100, ttl_seconds=3600)
+    """
+
+    _COLUMNS = (
+        "query_hash", "query", "response", "context", "adapter_used",
+        "confidence", "intent", "created_at", "last_access", "hit_count", "embedding",
+        "embedding_model"
+    )
+
+    def __init__(
+        self,
+        path: str = "./data/cache/ttt_cache.db",
+        max_entries: int = 10000,
+        busy_timeout_ms: int = 5000,
+        evict_every: int = 100
+    ):
+        """
+        SQLiteCacheStore başlat.
+
+        Args:
+            path: Veritabanı dosyası
+            max_entries: Depoda tutulacak maksimum girdi (fazlası LRU ile silinir)
+            busy_timeout_ms: Başka süreç yazarken bekleme süresi
+            evict_every: Kaç put'ta bir kapasite temizliği yapılacağı
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.busy_timeout_ms = busy_timeout_ms
+        self.evict_every = evict_every
+
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._puts_since_evict = 0
+
+        self.stats = {
+            "reads": 0,
+            "read_hits": 0,
+            "writes": 0,
+            "evicted": 0,
+            "expired": 0,
+            "errors": 0
+        }
+
+        self._init_db()
+        print(f"✅ SQLiteCacheStore hazır | Path: {self.path} | Entries: {self.count()}")
+
+    # ============ Bağlantı ============
+
+    def _conn(self) -> sqlite3.Connection:
+        """Thread'e ait bağlantı (ilk kullanımda açılır)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=self.busy_timeout_ms / 1000, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def _init_db(self) -> None:
+        """Tabloyu ve indeksleri oluştur."""
+        conn = self._conn()
+        with conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS ttt_cache (
+                    query_hash TEXT PRIMARY KEY,
+                    query TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    context TEXT,
+                    adapter_used TEXT,
+                    confidence REAL,
+                    intent TEXT,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    hit_count INTEGER DEFAULT 0,
+                    embedding BLOB,
+                    embedding_model TEXT
+                )
+            """)
+            # Eski şemada encoder kimliği yok: vektörleri eşleşmez sayılır
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(ttt_cache)")}
+            if "embedding_model" not in columns:
+                conn.execute("ALTER TABLE ttt_cache ADD COLUMN embedding_model TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_ttt_last_access ON ttt_cache(last_access)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_ttt_created_at ON ttt_cache(created_at)")
+
+    # ============ Okuma ============
+
+    @staticmethod
+    def _row_to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        data = dict(row)
+        data["context"] = json.loads(data["context"]) if data["context"] else {}
+        blob = data.pop("embedding")
+        data["embedding"] = np.frombuffer(blob, dtype=np.float32).copy() if blob else None
+        return data
+
+    def get(self, query_hash: str, ttl_seconds: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Girdiyi oku (başka bir sürecin yazdığı olabilir).
+
+        Returns:
+            Girdi alanları + "embedding" (numpy veya None) ve "embedding_model",
+            yoksa/süresi dolduysa None
+        """
+        self.stats["reads"] += 1
+        try:
+            row = self._conn().execute(
+                "SELECT * FROM ttt_cache WHERE query_hash = ?", (query_hash,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            self._error("okuma", e)
+            return None
+
+        if row is None:
+            return None
+        if ttl_seconds is not None and time.time() - row["created_at"] > ttl_seconds:
+            return None
+        self.stats["read_hits"] += 1
+        return self._row_to_dict(row)
+
+    def load_recent(self, limit: int, ttl_seconds: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Sıcak yükleme: süresi dolmamış en son kullanılan girdiler.
+
+        Returns:
+            En eski kullanılandan en yeniye sıralı girdiler (LRU sırası)
+        """
+        min_created = time.time() - ttl_seconds if ttl_seconds is not None else 0.0
+        try:
+            rows = self._conn().execute(
+                "SELECT * FROM ttt_cache WHERE created_at >= ? ORDER BY last_access DESC LIMIT ?",
+                (min_created, limit)
+            ).fetchall()
+        except sqlite3.Error as e:
+            self._error("yükleme", e)
+            return []
+        return [self._row_to_dict(row) for row in reversed(rows)]
+
+    def count(self) -> int:
+        """Depodaki girdi sayısı."""
+        try:
+            return self._conn().execute("SELECT COUNT(*) FROM ttt_cache").fetchone()[0]
+        except sqlite3.Error as e:
+            self._error("sayım", e)
+            return 0
+
+    # ============ Yazma ============
+
+    def put(
+        self,
+        entry: Dict[str, Any],
+        embedding: Optional[np.ndarray] = None,
+        embedding_model: Optional[str] = None
+    ) -> None:
+        """
+        Girdiyi yaz (aynı hash varsa değiştirilir).
+
+        Args:
+            entry: query_hash, query, response, context, adapter_used,
+                confidence, intent, created_at, hit_count alanları
+            embedding: Semantik mod için sorgu vektörü
+            embedding_model: Vektörü üreten encoder kimliği (model adı / boyut)
+        """
+        blob = np.asarray(embedding, dtype=np.float32).tobytes() if embedding is not None else None
+        values = (
+            entry["query_hash"],
+            entry["query"],
+            entry["response"],
+            json.dumps(entry.get("context") or {}, ensure_ascii=False, default=str),
+            entry.get("adapter_used"),
+            entry.get("confidence"),
+            entry.get("intent"),
+            entry["created_at"],
+            time.time(),
+            entry.get("hit_count", 0),
+            blob,
+            embedding_model if blob is not None else None
+        )
+        try:
+            conn = self._conn()
+            with conn:
+                conn.execute(
+                    f"INSERT OR REPLACE INTO ttt_cache ({', '.join(self._COLUMNS)}) "
+                    f"VALUES ({', '.join('?' * len(self._COLUMNS))})",
+                    values
+                )
+            self.stats["writes"] += 1
+        except sqlite3.Error as e:
+            self._error("yazma", e)
+            return
+
+        self._puts_since_evict += 1
+        if self._puts_since_evict >= self.evict_every:
+            self.evict()
+
+    def touch(self, query_hash: str, hit_count: int) -> None:
+        """Hit sonrası LRU zamanını ve hit sayısını güncelle."""
+        try:
+            conn = self._conn()
+            with conn:
+                conn.execute(
+                    "UPDATE ttt_cache SET last_access = ?, hit_count = MAX(hit_count, ?) WHERE query_hash = ?",
+                    (time.time(), hit_count, query_hash)
+                )
+        except sqlite3.Error as e:
+            self._error("güncelleme", e)
+
+    def delete(self, query_hash: str) -> None:
+        """Girdiyi sil."""
+        try:
+            conn = self._conn()
+            with conn:
+                conn.execute("DELETE FROM ttt_cache WHERE query_hash = ?", (query_hash,))
+        except sqlite3.Error as e:
+            self._error("silme", e)
+
+    def evict(self, ttl_seconds: Optional[float] = None) -> int:
+        """
+        Süresi dolanları ve max_entries üstündeki en eski kullanılanları sil.
+
+        Returns:
+            Silinen girdi sayısı
+        """
+        self._puts_since_evict = 0
+        removed = 0
+        try:
+            conn = self._conn()
+            with conn:
+                if ttl_seconds is not None:
+                    cursor = conn.execute(
+                        "DELETE FROM ttt_cache WHERE created_at < ?", (time.time() - ttl_seconds,)
+                    )
+                    self.stats["expired"] += cursor.rowcount
+                    removed += cursor.rowcount
+                cursor = conn.execute("""
+                    DELETE FROM ttt_cache WHERE query_hash IN (
+                        SELECT query_hash FROM ttt_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                    )
+                """, (self.max_entries,))
+                self.stats["evicted"] += cursor.rowcount
+                removed += cursor.rowcount
+        except sqlite3.Error as e:
+            self._error("temizleme", e)
+        return removed
+
+    def clear(self) -> None:
+        """Tüm girdileri sil."""
+        try:
+            conn = self._conn()
+            with conn:
+                conn.execute("DELETE FROM ttt_cache")
+        except sqlite3.Error as e:
+            self._error("temizleme", e)
+
+    def close(self) -> None:
+        """Tüm bağlantıları kapat."""
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+    def _error(self, operation: str, error: Exception) -> None:
+        # Cache hatası yanıt yolunu bozmamalı: logla ve devam et
+        self.stats["errors"] += 1
+        print(f"⚠️ TTT cache {operation} hatası: {error}")
+
+    # ============ İstatistikler ============
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Depo istatistikleri."""
+        stats = dict(self.stats)
+        stats["entries"] = self.count()
+        stats["max_entries"] = self.max_entries
+        stats["path"] = str(self.path)
+        return stats
@@ -0,0 +1,184 @@
+"""
+EVO-TR: Streaming Quality Monitor
+
+Üretim sürerken token'ları tüketip dejenere tekrar döngülerini yakalar;
+döngü bulunduğunda üretim durdurulur ve max_tokens'ın geri kalanı harcanmaz.
+
+- Kelime bazlı rolling hash (n-gram başına O(1) güncelleme)
+- Periyot tespiti: aynı n-gram'ın son görüldüğü konum → döngü periyodu;
+  ardışık eşleşmeler sayılarak blok kaç kez tekrarlandı bulunur
+- Durunca döngünün ilk kopyasından sonrası kırpılabilir (trimmed_text)
+"""
+
+from typing import Any, Callable, Dict, List, Optional
+
+# Rolling hash parametreleri (Mersenne asal modül)
+_HASH_BASE = 1_000_003
+_HASH_MOD = (1 << 61) - 1
+
+
+class StreamQualityMonitor:
+    """
+    Artımlı tekrar dedektörü.
+
+    Kullanım:
+        monitor = StreamQualityMonitor()
+        for token in inference.generate_stream(...):
+            if monitor.feed(token):
+                break                     # döngü: üretimi kes
+        text = monitor.trimmed_text()     # tekrarlar atılmış yanıt
+    """
+
+    def __init__(
+        self,
+        ngram: int = 3,
+        max_repeats: int = 3,
+        min_loop_words: int = 12,
+        max_period: int = 64,
+        on_stop: Optional[Callable[[str], None]] = None
+    ):
+        """
+        StreamQualityMonitor başlat.
+
+        Args:
+            ngram: Karşılaştırılan kelime dizisi uzunluğu
+            max_repeats: Aynı blok bu kadar kez art arda gelirse dur
+            min_loop_words: Durmak için döngünün kapsaması gereken min kelime
+                ("evet evet" gibi kısa doğal tekrarlar durdurmasın)
+            max_period: Aranacak en uzun döngü periyodu (kelime)
+            on_stop: Durma anında sebep ile çağrılır (ör. yeniden deneme tetiklemek için)
+        """
+        self.ngram = ngram
+        self.max_repeats = max_repeats
+        self.min_loop_words = min_loop_words
+        self.max_period = max_period
+        self.on_stop = on_stop
+        self.reset()
+
+    def reset(self) -> None:
+        """Yeni üretim için durumu sıfırla."""
+        self._text: List[str] = []
+        self._length = 0
+        self._partial = ""
+        self._partial_start = 0
+
+        self._word_hashes: List[int] = []
+        self._word_starts: List[int] = []
+        self._rolling = 0
+        self._base_pow = pow(_HASH_BASE, self.ngram - 1, _HASH_MOD)
+        self._last_seen: Dict[int, int] = {}
+
+        self._period = 0
+        self._run = 0
+        self._loop_start: Optional[int] = None
+
+        self.tokens_seen = 0
+        self.stopped = False
+        self.reason: Optional[str] = None
+
+    # ============ Besleme ============
+
+    def feed(self, chunk: str) -> bool:
+        """
+        Üretilen parçayı işle.
+
+        Returns:
+            True ise üretim durdurulmalı
+        """
+        if self.stopped:
+            return True
+        self.tokens_seen += 1
+        self._text.append(chunk)
+
+        for ch in chunk:
+            if ch.isspace():
+                if self._partial:
+                    self._add_word(self._partial, self._partial_start)
+                    self._partial = ""
+                    if self.stopped:
+                        break
+            else:
+                if not self._partial:
+                    self._partial_start = self._length
+                self._partial += ch
+            self._length += 1
+        else:
+            return False
+        return True
+
+    def finish(self) -> bool:
+        """Akış bitti: yarım kalan son kelimeyi de işle."""
+        if self._partial and not self.stopped:
+            self._add_word(self._partial, self._partial_start)
+            self._partial = ""
+        return self.stopped
+
+    def _add_word(self, word: str, start: int) -> None:
+        i = len(self._word_hashes)
+        word_hash = hash(word)
+        self._word_hashes.append(word_hash)
+        self._word_starts.append(start)
+
+        # Son n kelimenin rolling hash'i
+        if i >= self.ngram:
+            self._rolling = (self._rolling - self._word_hashes[i - self.ngram] * self._base_pow) % _HASH_MOD
+        self._rolling = (self._rolling * _HASH_BASE + word_hash) % _HASH_MOD
+        if i < self.ngram - 1:
+            return
+
+        previous = self._last_seen.get(self._rolling)
+        self._last_seen[self._rolling] = i
+        period = i - previous if previous is not None else 0
+
+        if 0 < period <= self.max_period and self._word_hashes[i] == self._word_hashes[i - period]:
+            if period == self._period:
+                self._run += 1
+            else:
+                self._period, self._run = period, 1
+                # Döngünün ikinci kopyası bu n-gram'ın başında başlar
+                self._loop_start = i - self.ngram + 1
+        else:
+            self._period, self._run, self._loop_start = 0, 0, None
+            return
+
+        # Tekrarlanan kelime sayısı + ilk kopya = döngünün kapsadığı metin
+        repeated = self._run + self.ngram - 1
+        copies = repeated / self._period + 1
+        if copies >= self.max_repeats and repeated + self._period >= self.min_loop_words:
+            self._stop(f"repetition_loop(period={self._period})")
+
+    def _stop(self, reason: str) -> None:
+        self.stopped = True
+        self.reason = reason
+        if self.on_stop is not None:
+            self.on_stop(reason)
+
+    # ============ Sonuç ============
+
+    @property
+    def text(self) -> str:
+        """Şimdiye kadar gelen ham metin."""
+        return "".join(self._text)
+
+    def trimmed_text(self) -> str:
+        """Döngü bulunduysa ilk kopyadan sonrası atılmış metin, yoksa ham metin."""
+        text = self.text
+        if not self.stopped or self._loop_start is None:
+            return text
+        return text[:self._word_starts[self._loop_start]].rstrip()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Durum özeti (yanıt metadata'sı için)."""
+        return {
+            "tokens_seen": self.tokens_seen,
+            "words_seen": len(self._word_hashes),
+            "stopped": self.stopped,
+            "reason": self.reason
+        }
+
+
+def has_repetition(text: str, ngram: int = 3, max_repeats: int = 3, min_loop_words: int = 12) -> bool:
+    """Tam metinde dejenere tekrar döngüsü var mı? (StreamQualityMonitor ile aynı kural)"""
+    monitor = StreamQualityMonitor(ngram=ngram, max_repeats=max_repeats, min_loop_words=min_loop_words)
+    monitor.feed(text)
+    return monitor.finish()
@@ -5,22 +5,39 @@ Inference sırasında anlık adaptasyon yetenekleri.
 Model, her sorguya göre kendini dinamik olarak ayarlar.
 
 TTT Yaklaşımları:
-1. Context-Aware Caching: Benzer sorguları cache'le
+1. Context-Aware Caching: Benzer sorguları cache'le (birebir hash veya
+   isteğe bağlı semantik eşleşme)
 2. Dynamic Prompting: Prompt'u dinamik olarak ayarla
 3. Few-Shot Enhancement: Benzer örnekleri retrieval ile bul
 4. Self-Correction: Çıktıyı değerlendir ve düzelt
 """
 
 import json
+import os
+import re
 import time
+import heapq
 import hashlib
-from datetime import datetime, timedelta
+import itertools
+import threading
+from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple, Any, Generator
+from typing import Callable, Dict, List, Optional, Tuple, Any, Generator
 from dataclasses import dataclass, asdict, field
 from enum import Enum
 from collections import OrderedDict
 
+import numpy as np
+
+from .cache_store import SQLiteCacheStore
+from .stream_monitor import has_repetition
+
+
+# Kalıcı, süreçler arası paylaşılan TTT cache'i (web sunucusu, chat_cli.py ve
+# worker'lar aynı dosyayı kullanır). Ortam değişkeniyle açılır:
+#   EVO_TTT_CACHE_PATH=./data/cache/ttt_cache.db
+DEFAULT_CACHE_PATH: Optional[str] = os.getenv("EVO_TTT_CACHE_PATH") or None
+
 
 class AdaptationStrategy(Enum):
     """TTT adaptasyon stratejileri."""
@@ -42,11 +59,25 @@ class TTTConfig:
     similarity_threshold: float = 0.7       # Benzerlik eşiği
     max_few_shot_examples: int = 3          # Max few-shot örnek
     self_correct_iterations: int = 2        # Self-correction iterasyonu
+    correction_budget_ms: float = 4000.0    # İstek başına düzeltmeye eklenebilecek süre
+    correction_max_tokens: int = 256        # Düzeltme iterasyonu başına token sınırı
+    correction_token_budget: int = 512      # İstek başına düzeltmelerde toplam token sınırı
+    correct_streamed: bool = False          # Stream edilen yanıtları arka planda düzeltip cache'le
+    semantic_cache: bool = False            # Cache'te embedding ile eşleşme
+    semantic_threshold: float = 0.92        # Semantik hit için min cosine benzerlik
+    semantic_scope: str = "intent"          # "intent", "adapter", "intent_adapter" veya "global"
+    cache_path: Optional[str] = DEFAULT_CACHE_PATH  # SQLite cache dosyası (None = sadece bellek)
+    cache_store_size: int = 10000           # Kalıcı depoda tutulacak maksimum girdi
 
 
-@dataclass
+@dataclass(slots=True)
 class CacheEntry:
-    """Cache girişi."""
+    """
+    Cache girişi.
+    
+    timestamp (ISO) gösterim ve kalıcılık içindir; süre kontrolü
+    oluşturulurken bir kez hesaplanan monotonic created_at ile yapılır.
+    """
     query: str
     query_hash: str
     response: str
@@ -55,11 +86,24 @@ class CacheEntry:
     confidence: float
     timestamp: str
     hit_count: int = 0
+    intent: Optional[str] = None
+    created_at: Optional[float] = field(default=None, repr=False)  # time.monotonic()
+    
+    def __post_init__(self):
+        if self.created_at is None:
+            age = (datetime.now() - datetime.fromisoformat(self.timestamp)).total_seconds()
+            self.created_at = time.monotonic() - age
+    
+    def expires_at(self, ttl_minutes: float) -> float:
+        """Monotonic saatte sürenin dolacağı an."""
+        return self.created_at + ttl_minutes * 60
     
-    def is_expired(self, ttl_minutes: int) -> bool:
+    def is_expired(self, ttl_minutes: float) -> bool:
         """Cache girişi süresi dolmuş mu?"""
-        created = datetime.fromisoformat(self.timestamp)
-        return datetime.now() - created > timedelta(minutes=ttl_minutes)
+        return time.monotonic() > self.expires_at(ttl_minutes)
+
+
+_NUMBER_PATTERN = re.compile(r"\d+(?:[.,]\d+)?")
 
 
 class ContextCache:
@@ -67,42 +111,266 @@ class ContextCache:
     Context-Aware Cache.
     
     Benzer sorguları cache'leyerek hızlı yanıt verir.
+    
+    Semantik mod (embedding_service verilirse):
+    - Her girdinin normalize sorgu embedding'i sabit boyutlu bir matriste tutulur
+    - Birebir hash bulunamazsa en yakın sorgu tek matris-vektör çarpımıyla bulunur
+    - Eşleşme sadece aynı kapsamdaki (intent / adapter) girdiler arasında aranır
+    - Sayılar farklıysa ("2+3" / "2+4") eşleşme kabul edilmez
+    
+    Kalıcı mod (store verilirse):
+    - Yazmalar SQLite deposuna da gider; başka süreçlerin yazdığı girdiler
+      birebir hash ile depodan okunur
+    - Başlangıçta en son kullanılan girdiler belleğe sıcak yüklenir
+    - Depodaki vektör sadece encoder kimliği (model adı / boyut) aynıysa
+      kullanılır, değilse sorgu yeniden encode edilir
+    
+    Süre yönetimi: girdiler bitiş zamanına göre bir min-heap'te tutulur;
+    put ve lookup süresi dolanları heap'in başından temizler, böylece
+    LRU eviction taze girdileri değil önce bayatları atar.
     """
     
-    def __init__(self, max_size: int = 100, ttl_minutes: int = 60):
+    SCOPES = ("intent", "adapter", "intent_adapter", "global")
+    
+    def __init__(
+        self,
+        max_size: int = 100,
+        ttl_minutes: int = 60,
+        embedding_service: Optional[Any] = None,
+        semantic_threshold: float = 0.92,
+        semantic_scope: str = "intent",
+        store: Optional[SQLiteCacheStore] = None
+    ):
+        """
+        ContextCache başlat.
+        
+        Args:
+            max_size: Maksimum girdi sayısı (bellekte)
+            ttl_minutes: Girdi geçerlilik süresi (dakika)
+            embedding_service: Sorgu encoder'ı (None = sadece birebir eşleşme)
+            semantic_threshold: Semantik hit için minimum cosine benzerlik
+            semantic_scope: Eşleşmenin aranacağı kapsam (SCOPES)
+            store: Süreçler arası kalıcı depo (None = sadece bellek)
+        """
+        if semantic_scope not in self.SCOPES:
+            raise ValueError(f"Geçersiz semantic_scope: {semantic_scope}")
+        
         self.max_size = max_size
         self.ttl_minutes = ttl_minutes
         self.cache: OrderedDict[str, CacheEntry] = OrderedDict()
-        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "semantic_hits": 0, "expired": 0}
+        
+        # (bitiş zamanı, sıra, girdi); silinen/yenilenen girdiler heap'te tembelce atlanır
+        self._expiry_heap: List[Tuple[float, int, CacheEntry]] = []
+        self._heap_seq = itertools.count()
+        
+        # Few-shot araması için girdi başına kelime kümeleri (her çağrıda yeniden hesaplanmaz)
+        self._word_sets: Dict[str, frozenset] = {}
         
-        print(f"✅ ContextCache hazır | Size: {max_size}, TTL: {ttl_minutes}m")
+        # Semantik mod: satır = slot, boş slotların kapsamı -1
+        self.embedding_service = embedding_service
+        self.semantic_threshold = semantic_threshold
+        self.semantic_scope = semantic_scope
+        self._matrix: Optional[np.ndarray] = None
+        self._embedding_dim: Optional[int] = None
+        self._embedding_key: Optional[str] = None
+        self._slot_scopes = np.full(max_size, -1, dtype=np.int32)
+        self._slot_keys: List[Optional[str]] = [None] * max_size
+        self._slots: Dict[str, int] = {}
+        self._free_slots: List[int] = list(range(max_size - 1, -1, -1))
+        self._scope_ids: Dict[Any, int] = {}
+        
+        self.store = store
+        if store is not None:
+            self._warm_load()
+        
+        mode = "semantic" if self.semantic_enabled else "exact"
+        print(f"✅ ContextCache hazır | Size: {max_size}, TTL: {ttl_minutes}m, Mode: {mode}, "
+              f"Loaded: {len(self.cache)}")
+    
+    @property
+    def semantic_enabled(self) -> bool:
+        return self.embedding_service is not None
     
     def _hash_query(self, query: str) -> str:
         """Sorguyu hash'le."""
         normalized = query.lower().strip()
         return hashlib.md5(normalized.encode()).hexdigest()[:16]
     
-    def get(self, query: str) -> Optional[CacheEntry]:
-        """Cache'den al."""
+    def _scope_key(self, intent: Optional[str], adapter: Optional[str]) -> Any:
+        if self.semantic_scope == "intent":
+            return intent
+        if self.semantic_scope == "adapter":
+            return adapter
+        if self.semantic_scope == "intent_adapter":
+            return (intent, adapter)
+        return None
+    
+    def _embed(self, query: str) -> np.ndarray:
+        """Normalize (birim uzunluk) sorgu embedding'i."""
+        vector = np.asarray(self.embedding_service.encode(query.lower().strip()), dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+    
+    @property
+    def embedding_dim(self) -> int:
+        """Encoder'ın vektör boyutu (matris genişliği; depodaki vektörden alınmaz)."""
+        if self._embedding_dim is None:
+            get_dim = getattr(self.embedding_service, "get_sentence_embedding_dimension", None)
+            self._embedding_dim = int(get_dim()) if get_dim is not None else int(self._embed("boyut").shape[0])
+        return self._embedding_dim
+    
+    @property
+    def embedding_key(self) -> Optional[str]:
+        """Depoya vektörle birlikte yazılan encoder kimliği ("model/boyut")."""
+        if self.embedding_service is None:
+            return None
+        if self._embedding_key is None:
+            name = getattr(self.embedding_service, "model_name", "custom")
+            self._embedding_key = f"{name}/{self.embedding_dim}"
+        return self._embedding_key
+    
+    def _row_vector(self, row: Dict[str, Any]) -> Optional[np.ndarray]:
+        """Depo satırının vektörü; başka encoder ile üretildiyse None (yeniden encode)."""
+        if not self.semantic_enabled or row.get("embedding_model") != self.embedding_key:
+            return None
+        return row["embedding"]
+    
+    def _remove(self, query_hash: str) -> None:
+        """Girdiyi ve semantik slotunu sil."""
+        self.cache.pop(query_hash, None)
+        self._word_sets.pop(query_hash, None)
+        slot = self._slots.pop(query_hash, None)
+        if slot is not None:
+            self._slot_scopes[slot] = -1
+            self._slot_keys[slot] = None
+            self._free_slots.append(slot)
+    
+    def _sweep_expired(self) -> int:
+        """
+        Süresi dolan girdileri heap'in başından sil (amortize O(log n)).
+        
+        Returns:
+            Silinen girdi sayısı
+        """
+        now = time.monotonic()
+        removed = 0
+        heap = self._expiry_heap
+        while heap and heap[0][0] <= now:
+            _, _, entry = heapq.heappop(heap)
+            if self.cache.get(entry.query_hash) is entry:
+                self._remove(entry.query_hash)
+                removed += 1
+        
+        # Silinmiş girdilerin kayıtları birikirse heap'i yeniden kur
+        if len(heap) > 2 * self.max_size + 64:
+            self._expiry_heap = [item for item in heap if self.cache.get(item[2].query_hash) is item[2]]
+            heapq.heapify(self._expiry_heap)
+        
+        self.stats["expired"] += removed
+        return removed
+    
+    def _index(
+        self,
+        query_hash: str,
+        query: str,
+        scope: Any,
+        vector: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """Girdinin embedding'ini matrise yaz (vector verilmezse encode edilir)."""
+        dim = self.embedding_dim
+        if vector is None or vector.shape[0] != dim:
+            vector = self._embed(query)
+        if self._matrix is None:
+            self._matrix = np.zeros((self.max_size, dim), dtype=np.float32)
+        slot = self._free_slots.pop()
+        self._matrix[slot] = vector
+        self._slot_scopes[slot] = self._scope_ids.setdefault(scope, len(self._scope_ids))
+        self._slot_keys[slot] = query_hash
+        self._slots[query_hash] = slot
+        return vector
+    
+    def _nearest(
+        self,
+        query: str,
+        intent: Optional[str],
+        adapter: Optional[str]
+    ) -> Tuple[Optional[str], float]:
+        """Aynı kapsamdaki en yakın girdi: (query_hash, benzerlik)."""
+        scope_id = self._scope_ids.get(self._scope_key(intent, adapter))
+        if self._matrix is None or scope_id is None:
+            return None, 0.0
+        
+        scores = self._matrix @ self._embed(query)
+        scores[self._slot_scopes != scope_id] = -np.inf
+        slot = int(np.argmax(scores))
+        similarity = float(scores[slot])
+        if similarity < self.semantic_threshold:
+            return None, similarity
+        
+        query_hash = self._slot_keys[slot]
+        # Paraphrase olsa da farklı sayılar farklı cevap demektir
+        if _NUMBER_PATTERN.findall(query) != _NUMBER_PATTERN.findall(self.cache[query_hash].query):
+            return None, similarity
+        return query_hash, similarity
+    
+    def lookup(
+        self,
+        query: str,
+        intent: Optional[str] = None,
+        adapter: Optional[str] = None
+    ) -> Tuple[Optional[CacheEntry], float]:
+        """
+        Önce birebir hash, semantik mod açıksa ardından en yakın sorgu.
+        
+        Returns:
+            (girdi veya None, benzerlik - birebir hit için 1.0)
+        """
+        self._sweep_expired()
         query_hash = self._hash_query(query)
+        similarity = 1.0
         
-        if query_hash in self.cache:
-            entry = self.cache[query_hash]
-            
-            # TTL kontrolü
-            if entry.is_expired(self.ttl_minutes):
-                del self.cache[query_hash]
-                self.stats["misses"] += 1
-                return None
-            
-            # Hit count artır ve sona taşı (LRU)
-            entry.hit_count += 1
-            self.cache.move_to_end(query_hash)
-            self.stats["hits"] += 1
-            return entry
+        # Başka bir sürecin yazdığı girdi olabilir
+        if query_hash not in self.cache and self.store is not None:
+            row = self.store.get(query_hash, ttl_seconds=self.ttl_minutes * 60)
+            if row is not None:
+                self._insert(self._entry_from_row(row), self._row_vector(row))
         
-        self.stats["misses"] += 1
-        return None
+        semantic = query_hash not in self.cache and self.semantic_enabled
+        
+        if semantic:
+            query_hash, similarity = self._nearest(query, intent, adapter)
+        
+        entry = self.cache.get(query_hash) if query_hash is not None else None
+        if entry is None:
+            self.stats["misses"] += 1
+            return None, similarity
+        
+        # TTL kontrolü
+        if entry.is_expired(self.ttl_minutes):
+            self._remove(query_hash)
+            if self.store is not None:
+                self.store.delete(query_hash)
+            self.stats["misses"] += 1
+            return None, similarity
+        
+        # Hit count artır ve sona taşı (LRU)
+        entry.hit_count += 1
+        self.cache.move_to_end(query_hash)
+        if self.store is not None:
+            self.store.touch(query_hash, entry.hit_count)
+        self.stats["hits"] += 1
+        if semantic:
+            self.stats["semantic_hits"] += 1
+        return entry, similarity
+    
+    def get(
+        self,
+        query: str,
+        intent: Optional[str] = None,
+        adapter: Optional[str] = None
+    ) -> Optional[CacheEntry]:
+        """Cache'den al."""
+        return self.lookup(query, intent=intent, adapter=adapter)[0]
     
     def put(
         self,
@@ -110,49 +378,101 @@ class ContextCache:
         response: str,
         context: Dict[str, Any],
         adapter_used: str,
-        confidence: float
+        confidence: float,
+        intent: Optional[str] = None
     ) -> CacheEntry:
         """Cache'e ekle."""
-        query_hash = self._hash_query(query)
-        
-        # Eviction gerekli mi?
-        while len(self.cache) >= self.max_size:
-            oldest_key = next(iter(self.cache))
-            del self.cache[oldest_key]
-            self.stats["evictions"] += 1
-        
+        created_at = time.time()
         entry = CacheEntry(
             query=query,
-            query_hash=query_hash,
+            query_hash=self._hash_query(query),
             response=response,
             context=context,
             adapter_used=adapter_used,
             confidence=confidence,
-            timestamp=datetime.now().isoformat()
+            timestamp=datetime.fromtimestamp(created_at).isoformat(),
+            intent=intent,
+            created_at=time.monotonic()
         )
         
-        self.cache[query_hash] = entry
+        vector = self._insert(entry)
+        if self.store is not None:
+            # Depo süreçler arası paylaşıldığı için duvar saati kullanır
+            self.store.put(
+                {**asdict(entry), "created_at": created_at},
+                embedding=vector,
+                embedding_model=self.embedding_key
+            )
         return entry
     
+    def _insert(self, entry: CacheEntry, vector: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+        """
+        Girdiyi belleğe al (gerekirse LRU eviction).
+        
+        Returns:
+            Semantik modda girdinin embedding'i
+        """
+        self._remove(entry.query_hash)
+        
+        # Önce süresi dolanlar, hâlâ doluysa en eski kullanılanlar
+        # (sadece bellekten; depo kendi kapasitesini yönetir)
+        self._sweep_expired()
+        while len(self.cache) >= self.max_size:
+            oldest_key = next(iter(self.cache))
+            self._remove(oldest_key)
+            self.stats["evictions"] += 1
+        
+        self.cache[entry.query_hash] = entry
+        heapq.heappush(self._expiry_heap, (entry.expires_at(self.ttl_minutes), next(self._heap_seq), entry))
+        if self.semantic_enabled:
+            return self._index(
+                entry.query_hash, entry.query, self._scope_key(entry.intent, entry.adapter_used), vector
+            )
+        return None
+    
+    @staticmethod
+    def _entry_from_row(row: Dict[str, Any]) -> CacheEntry:
+        """Depo satırından CacheEntry."""
+        return CacheEntry(
+            query=row["query"],
+            query_hash=row["query_hash"],
+            response=row["response"],
+            context=row["context"],
+            adapter_used=row["adapter_used"],
+            confidence=row["confidence"],
+            timestamp=datetime.fromtimestamp(row["created_at"]).isoformat(),
+            hit_count=row["hit_count"],
+            intent=row["intent"]
+        )
+    
+    def _warm_load(self) -> None:
+        """Depodan en son kullanılan, süresi dolmamış girdileri yükle."""
+        ttl_seconds = self.ttl_minutes * 60
+        self.store.evict(ttl_seconds=ttl_seconds)
+        for row in self.store.load_recent(self.max_size, ttl_seconds=ttl_seconds):
+            self._insert(self._entry_from_row(row), self._row_vector(row))
+    
     def get_similar(self, query: str, threshold: float = 0.7) -> List[CacheEntry]:
         """Benzer sorguları bul (basit keyword matching)."""
         query_words = set(query.lower().split())
-        similar = []
+        if not query_words:
+            return []
         
-        for entry in self.cache.values():
-            if entry.is_expired(self.ttl_minutes):
+        similar = []
+        for query_hash, entry in self.cache.items():
+            entry_words = self._word_sets.get(query_hash)
+            if entry_words is None:
+                entry_words = self._word_sets[query_hash] = frozenset(entry.query.lower().split())
+            if not entry_words:
                 continue
             
-            entry_words = set(entry.query.lower().split())
+            # Jaccard similarity (süre kontrolü sadece eşiği geçenler için)
+            intersection = len(query_words & entry_words)
+            union = len(query_words | entry_words)
+            similarity = intersection / union if union > 0 else 0
             
-            # Jaccard similarity
-            if query_words and entry_words:
-                intersection = len(query_words & entry_words)
-                union = len(query_words | entry_words)
-                similarity = intersection / union if union > 0 else 0
-                
-                if similarity >= threshold:
-                    similar.append(entry)
+            if similarity >= threshold and not entry.is_expired(self.ttl_minutes):
+                similar.append(entry)
         
         return similar
     
@@ -167,13 +487,21 @@ class ContextCache:
             "hits": self.stats["hits"],
             "misses": self.stats["misses"],
             "hit_rate": round(hit_rate * 100, 2),
-            "evictions": self.stats["evictions"]
+            "evictions": self.stats["evictions"],
+            "semantic_hits": self.stats["semantic_hits"],
+            "expired": self.stats["expired"],
+            "mode": "semantic" if self.semantic_enabled else "exact",
+            "store": self.store.get_stats() if self.store is not None else None
         }
     
     def clear(self):
-        """Cache'i temizle."""
-        self.cache.clear()
-        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        """Cache'i temizle (kalıcı depo dahil)."""
+        for query_hash in list(self.cache):
+            self._remove(query_hash)
+        self._expiry_heap.clear()
+        if self.store is not None:
+            self.store.clear()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "semantic_hits": 0, "expired": 0}
 
 
 class DynamicPromptGenerator:
@@ -329,15 +657,10 @@ class SelfCorrector:
             score = 0
             return score, issues
         
-        # Tekrar kontrolü
-        words = response.split()
-        if len(words) > 5:
-            # Ardışık tekrarları kontrol et
-            for i in range(len(words) - 3):
-                if words[i:i+3] == words[i+3:i+6]:
-                    issues.append("repetition")
-                    score -= 0.2
-                    break
+        # Tekrar kontrolü: art arda tekrarlanan kelime blokları (rolling hash, tek geçiş)
+        if has_repetition(response, max_repeats=2, min_loop_words=6):
+            issues.append("repetition")
+            score -= 0.2
         
         # Cümle tamamlama kontrolü
         if not response.rstrip().endswith(('.', '!', '?', ':', '```')):
@@ -418,13 +741,31 @@ class TestTimeTrainer:
     Inference sırasında tüm adaptasyon stratejilerini koordine eder.
     """
     
-    def __init__(self, config: Optional[TTTConfig] = None):
+    def __init__(
+        self,
+        config: Optional[TTTConfig] = None,
+        embedding_service: Optional[Any] = None
+    ):
+        """
+        TestTimeTrainer başlat.
+        
+        Args:
+            config: TTT konfigürasyonu
+            embedding_service: Semantik cache için encoder (config.semantic_cache açıksa gerekli)
+        """
         self.config = config or TTTConfig()
         
         # Bileşenler
         self.cache = ContextCache(
             max_size=self.config.cache_size,
-            ttl_minutes=self.config.cache_ttl_minutes
+            ttl_minutes=self.config.cache_ttl_minutes,
+            embedding_service=embedding_service if self.config.semantic_cache else None,
+            semantic_threshold=self.config.semantic_threshold,
+            semantic_scope=self.config.semantic_scope,
+            store=SQLiteCacheStore(
+                self.config.cache_path,
+                max_entries=self.config.cache_store_size
+            ) if self.config.cache_path else None
         )
         self.prompt_generator = DynamicPromptGenerator()
         self.self_corrector = SelfCorrector(
@@ -436,9 +777,17 @@ class TestTimeTrainer:
             "total_queries": 0,
             "cache_hits": 0,
             "corrections_made": 0,
+            "corrections_accepted": 0,
+            "corrections_skipped_budget": 0,
             "few_shot_used": 0
         }
         
+        # Intent başına düzeltme maliyeti / kazancı (nerede açılmalı kararı için)
+        self.correction_stats: Dict[str, Dict[str, float]] = {}
+        
+        # Arka plan düzeltmeleri cache'e yazarken adapt() ile çakışmasın
+        self._lock = threading.RLock()
+        
         print(f"✅ TestTimeTrainer hazır")
         print(f"   Strategies: {self.config.strategies}")
     
@@ -461,7 +810,7 @@ class TestTimeTrainer:
                 "strategies_applied": List[str]
             }
         """
-        self.stats["total_queries"] += 1
+        self._count("total_queries")
         context = context or {}
         
         result = {
@@ -472,13 +821,15 @@ class TestTimeTrainer:
             "strategies_applied": []
         }
         
-        # 1. Context Cache kontrolü
+        # 1. Context Cache kontrolü (birebir, semantik mod açıksa benzer sorgu)
         if "context_cache" in self.config.strategies:
-            cached = self.cache.get(query)
+            with self._lock:
+                cached, similarity = self.cache.lookup(query, intent=intent, adapter=adapter)
             if cached:
                 result["cached_response"] = cached.response
+                result["cache_similarity"] = round(similarity, 3)
                 result["strategies_applied"].append("context_cache")
-                self.stats["cache_hits"] += 1
+                self._count("cache_hits")
                 return result
         
         # 2. Dinamik prompt oluştur
@@ -492,10 +843,11 @@ class TestTimeTrainer:
         
         # 3. Few-shot örnekleri bul
         if "few_shot" in self.config.strategies:
-            similar = self.cache.get_similar(
-                query,
-                threshold=self.config.similarity_threshold
-            )
+            with self._lock:
+                similar = self.cache.get_similar(
+                    query,
+                    threshold=self.config.similarity_threshold
+                )
             if similar:
                 result["few_shot_examples"] = [
                     {"query": s.query, "response": s.response[:300]}
@@ -507,7 +859,7 @@ class TestTimeTrainer:
                     intent=intent
                 )
                 result["strategies_applied"].append("few_shot")
-                self.stats["few_shot_used"] += 1
+                self._count("few_shot_used")
         
         return result
     
@@ -517,11 +869,27 @@ class TestTimeTrainer:
         response: str,
         intent: str,
         adapter: str,
-        context: Optional[Dict[str, Any]] = None
+        context: Optional[Dict[str, Any]] = None,
+        regenerate_fn: Optional[Callable[[str, int], str]] = None,
+        tokens_per_second: Optional[float] = None,
+        cacheable: bool = True
     ) -> Tuple[str, Dict[str, Any]]:
         """
         Yanıtı post-process et (self-correction dahil).
         
+        Args:
+            query: Kullanıcı sorgusu
+            response: Model yanıtı
+            intent: Intent
+            adapter: Kullanılan adapter
+            context: Cache'e yazılacak bağlam
+            regenerate_fn: (düzeltme prompt'u, max_tokens) -> yeni yanıt.
+                Verilmezse sorunlar sadece metadata'ya yazılır.
+            tokens_per_second: İlk yanıtın ölçülen üretim hızı; düzeltmenin
+                max_tokens'ı kalan süre bütçesine sığacak şekilde buna göre ayarlanır
+            cacheable: False ise yanıt cache'e yazılmaz (oturum geçmişi veya
+                hafıza bağlamıyla üretilen yanıtlar; cache sadece sorgu ile anahtarlanır)
+        
         Returns:
             (final_response, metadata)
         """
@@ -531,59 +899,203 @@ class TestTimeTrainer:
             "quality_score": 1.0,
             "cached": False
         }
+        final_response = response
         
         # Self-correction
         if "self_correct" in self.config.strategies:
-            current_response = response
-            
-            for iteration in range(self.self_corrector.max_iterations):
-                quality_score, issues = self.self_corrector.evaluate_response(
+            final_response = self._self_correct(
+                query, response, intent, metadata, regenerate_fn, tokens_per_second
+            )
+        
+        # Cache'e ekle (düzeltildiyse düzeltilmiş yanıt)
+        if cacheable and "context_cache" in self.config.strategies:
+            with self._lock:
+                self.cache.put(
                     query=query,
-                    response=current_response,
+                    response=final_response,
+                    context=context or {},
+                    adapter_used=adapter,
+                    confidence=metadata["quality_score"],
                     intent=intent
                 )
-                
-                metadata["quality_score"] = quality_score
-                
-                if not self.self_corrector.should_correct(quality_score, issues):
-                    break
-                
-                # Düzeltme gerekli - not: Burada gerçek model çağrısı yapılır
-                # Şimdilik sadece metadata'yı güncelliyoruz
-                metadata["corrections"].append({
-                    "iteration": iteration + 1,
-                    "issues": issues,
-                    "score_before": quality_score
-                })
-                self.stats["corrections_made"] += 1
-                
-                # Gerçek düzeltme için model çağrısı gerekir
-                # correction_prompt = self.self_corrector.generate_correction_prompt(
-                #     query, current_response, issues
-                # )
-                # current_response = model.generate(correction_prompt)
-                break  # Simülasyon - gerçekte döngü devam eder
-        
-        # Cache'e ekle
-        if "context_cache" in self.config.strategies:
-            self.cache.put(
+            metadata["cached"] = True
+        
+        return final_response, metadata
+    
+    def _self_correct(
+        self,
+        query: str,
+        response: str,
+        intent: str,
+        metadata: Dict[str, Any],
+        regenerate_fn: Optional[Callable[[str, int], str]],
+        tokens_per_second: Optional[float] = None
+    ) -> str:
+        """
+        Değerlendir → düzeltme prompt'u → yeniden üret döngüsü.
+        
+        Süre ve token bütçesi aşılacaksa durur; yeni yanıt sadece
+        kalite skoru arttıysa kabul edilir. Üretim hızı biliniyorsa
+        max_tokens kalan süreye sığacak kadar küçültülür (intent'in
+        geçmişi olmasa bile ilk düzeltme bütçeyi aşmaz).
+        """
+        started = time.monotonic()
+        budget_ms = self.config.correction_budget_ms
+        tokens_left = self.config.correction_token_budget
+        
+        current_response = response
+        quality_score, issues = self.self_corrector.evaluate_response(
+            query=query,
+            response=current_response,
+            intent=intent
+        )
+        metadata["quality_score"] = quality_score
+        initial_score = quality_score
+        
+        for iteration in range(self.self_corrector.max_iterations):
+            if not self.self_corrector.should_correct(quality_score, issues):
+                break
+            
+            correction = {
+                "iteration": iteration + 1,
+                "issues": issues,
+                "score_before": quality_score
+            }
+            metadata["corrections"].append(correction)
+            self._count("corrections_made")
+            
+            if regenerate_fn is None:
+                break
+            
+            # Bu intent'te bir düzeltme ortalama ne kadar sürüyor? Bütçeye sığmıyorsa deneme
+            remaining_ms = budget_ms - (time.monotonic() - started) * 1000
+            expected_ms = self._avg_correction_ms(intent)
+            max_tokens = min(self.config.correction_max_tokens, tokens_left)
+            if tokens_per_second and tokens_per_second > 0:
+                # Ölçülen hızla kalan sürede üretilebilecek token sayısı
+                max_tokens = min(max_tokens, int(tokens_per_second * remaining_ms / 1000))
+            if expected_ms > remaining_ms or max_tokens <= 0:
+                correction["skipped"] = "budget"
+                self._count("corrections_skipped_budget")
+                break
+            
+            prompt = self.self_corrector.generate_correction_prompt(query, current_response, issues)
+            call_started = time.monotonic()
+            try:
+                candidate = regenerate_fn(prompt, max_tokens)
+            except Exception as e:
+                correction["error"] = str(e)
+                break
+            latency_ms = (time.monotonic() - call_started) * 1000
+            tokens_left -= max_tokens
+            
+            new_score, new_issues = self.self_corrector.evaluate_response(
                 query=query,
-                response=response,
-                context=context or {},
-                adapter_used=adapter,
-                confidence=metadata["quality_score"]
+                response=candidate,
+                intent=intent
             )
-            metadata["cached"] = True
+            accepted = new_score > quality_score
+            correction.update({
+                "score_after": new_score,
+                "latency_ms": round(latency_ms, 1),
+                "accepted": accepted
+            })
+            self._record_correction_cost(intent, latency_ms, new_score - quality_score if accepted else 0.0, accepted)
+            
+            if not accepted:
+                break
+            
+            self.self_corrector.record_correction(query, current_response, candidate, issues)
+            self._count("corrections_accepted")
+            current_response, quality_score, issues = candidate, new_score, new_issues
+            metadata["quality_score"] = quality_score
+        
+        if metadata["corrections"]:
+            metadata["correction_latency_ms"] = round((time.monotonic() - started) * 1000, 1)
+            metadata["quality_gain"] = round(quality_score - initial_score, 3)
+        return current_response
+    
+    def _count(self, key: str) -> None:
+        # Arka plan düzeltme thread'i de sayaçları günceller
+        with self._lock:
+            self.stats[key] += 1
+    
+    def _avg_correction_ms(self, intent: str) -> float:
+        with self._lock:
+            entry = self.correction_stats.get(intent)
+            if not entry or not entry["attempts"]:
+                return 0.0
+            return entry["total_latency_ms"] / entry["attempts"]
+    
+    def _record_correction_cost(self, intent: str, latency_ms: float, gain: float, accepted: bool) -> None:
+        with self._lock:
+            entry = self.correction_stats.setdefault(
+                intent, {"attempts": 0, "accepted": 0, "total_latency_ms": 0.0, "total_gain": 0.0}
+            )
+            entry["attempts"] += 1
+            entry["accepted"] += int(accepted)
+            entry["total_latency_ms"] += latency_ms
+            entry["total_gain"] += gain
+    
+    def post_process_in_background(
+        self,
+        query: str,
+        response: str,
+        intent: str,
+        adapter: str,
+        regenerate_fn: Callable[[str, int], str],
+        context: Optional[Dict[str, Any]] = None,
+        tokens_per_second: Optional[float] = None,
+        cacheable: bool = True
+    ) -> threading.Thread:
+        """
+        Yanıt kullanıcıya gittikten sonra düzelt ve cache'le (streaming için).
         
-        return response, metadata
+        Kullanıcı ilk yanıtı bekletilmeden alır; düzeltilmiş yanıt aynı /
+        benzer sorgunun bir sonraki gelişinde cache'ten döner. regenerate_fn
+        başka bir üretimle eşzamanlı çalışabilmelidir (batching scheduler).
+        """
+        thread = threading.Thread(
+            target=self.post_process,
+            kwargs={
+                "query": query,
+                "response": response,
+                "intent": intent,
+                "adapter": adapter,
+                "context": context,
+                "regenerate_fn": regenerate_fn,
+                "tokens_per_second": tokens_per_second,
+                "cacheable": cacheable
+            },
+            name="ttt-self-correct",
+            daemon=True
+        )
+        thread.start()
+        return thread
+    
+    def get_correction_report(self) -> Dict[str, Dict[str, Any]]:
+        """Intent başına ortalama ek gecikme ve kalite kazancı."""
+        report = {}
+        with self._lock:
+            entries = {intent: dict(entry) for intent, entry in self.correction_stats.items()}
+        for intent, entry in entries.items():
+            attempts = entry["attempts"]
+            report[intent] = {
+                "attempts": attempts,
+                "acceptance_rate": round(entry["accepted"] / attempts, 3) if attempts else 0,
+                "avg_latency_ms": round(entry["total_latency_ms"] / attempts, 1) if attempts else 0,
+                "avg_quality_gain": round(entry["total_gain"] / attempts, 3) if attempts else 0
+            }
+        return report
     
     def get_statistics(self) -> Dict[str, Any]:
         """TTT istatistikleri."""
         return {
             "config": asdict(self.config),
-            "stats": self.stats,
+            "stats": dict(self.stats),
             "cache_stats": self.cache.get_stats(),
-            "correction_history_size": len(self.self_corrector.correction_history)
+            "correction_history_size": len(self.self_corrector.correction_history),
+            "correction_by_intent": self.get_correction_report()
         }
 
 
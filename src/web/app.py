@@ -4,17 +4,22 @@ EVO-TR Web API - Main Application
 FastAPI application with all endpoints.
 """
 
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import HTMLResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
 import asyncio
 import json
+import os
 import time
 from pathlib import Path
 
+from .worker import InferenceWorker, QueueFullError
+from .sessions import Session, SessionStore, is_valid_session_id, new_session_id
+
 
 def create_app() -> FastAPI:
     """Create and configure FastAPI application."""
@@ -61,6 +66,7 @@ class ChatResponse(BaseModel):
     confidence: float
     tokens_generated: int
     generation_time: float
+    session_id: Optional[str] = None
 
 
 class MemorySearchRequest(BaseModel):
@@ -97,6 +103,9 @@ class SystemStatus(BaseModel):
     active_adapter: Optional[str]
     memory_usage_mb: float
     uptime_seconds: float
+    adapter_cache: Optional[Dict[str, Any]] = None
+    inference_queue: Optional[Dict[str, Any]] = None
+    sessions: Optional[Dict[str, Any]] = None
 
 
 class FeedbackRequest(BaseModel):
@@ -122,6 +131,31 @@ class FeedbackResponse(BaseModel):
 
 # ============== Global State ==============
 
+# Continuous batching: EVO_INFERENCE_BATCH_SIZE=8 runs up to 8 generations
+# concurrently through one decode loop (orchestrator.enable_batching). 0 (the
+# default) keeps the plain generate path.
+INFERENCE_BATCH_SIZE = int(os.getenv("EVO_INFERENCE_BATCH_SIZE", "0"))
+
+# Inference worker: generation runs off the event loop. Without the batching
+# scheduler the orchestrator is not thread-safe, so one job runs at a time and
+# the rest wait in the queue; with it, one worker per batch slot.
+INFERENCE_CONCURRENCY = max(1, INFERENCE_BATCH_SIZE)
+INFERENCE_QUEUE_DEPTH = 8
+
+# Per-client conversation state. Clients pass the id back in the X-Session-ID
+# header or the session cookie; idle / overflow sessions are spilled to disk.
+SESSION_HEADER = "X-Session-ID"
+SESSION_COOKIE = "evo_session"
+MAX_SESSIONS = 256
+SESSION_IDLE_TIMEOUT = 30 * 60
+SESSION_SPILL_DIR = "./data/sessions"
+
+# Embedding micro-batching (concurrent /chat, /route, /memory/search encodes
+# are collected for a few ms and encoded in one forward pass)
+EMBEDDING_BATCH_SIZE = 32
+EMBEDDING_BATCH_WAIT_MS = 5.0
+
+
 class AppState:
     """Application state management."""
     
@@ -131,20 +165,44 @@ class AppState:
         self.model_loaded = False
         self.active_connections: List[WebSocket] = []
         self.feedback_db = None
+        self.worker = InferenceWorker(
+            max_concurrency=INFERENCE_CONCURRENCY,
+            max_queue_depth=INFERENCE_QUEUE_DEPTH
+        )
+        self.sessions = SessionStore(
+            max_sessions=MAX_SESSIONS,
+            idle_timeout=SESSION_IDLE_TIMEOUT,
+            spill_dir=SESSION_SPILL_DIR
+        )
+        self._init_lock = asyncio.Lock()
     
     async def initialize(self):
-        """Initialize the orchestrator and model."""
-        if self.orchestrator is None:
+        """Initialize the orchestrator and model (off the event loop)."""
+        async with self._init_lock:
+            if self.orchestrator is not None:
+                return
             try:
                 import sys
                 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
-                from src.orchestrator import EvoTR
+                from src.orchestrator import EvoTR, ConversationTurn
                 from src.lifecycle.feedback import FeedbackDatabase
                 
-                self.orchestrator = EvoTR(
+                # The persistent TTT cache is enabled with EVO_TTT_CACHE_PATH (the
+                # TTTConfig default), so chat_cli.py and other workers share it
+                self.orchestrator = await asyncio.to_thread(
+                    EvoTR,
                     base_model_path="./models/base/qwen-2.5-3b-instruct",
-                    adapters_dir="./adapters"
+                    adapters_dir="./adapters",
+                    # Conversation memories are written in batches off the reply path
+                    memory_write_behind=True
                 )
+                if INFERENCE_BATCH_SIZE > 0:
+                    self.orchestrator.enable_batching(max_batch_size=INFERENCE_BATCH_SIZE)
+                
+                # New sessions inherit the orchestrator's short-term memory limits
+                self.sessions.buffer_factory = self.orchestrator.memory.new_session_buffer
+                self.sessions.turn_factory = ConversationTurn.from_dict
+                self.sessions.on_evict = self.orchestrator.end_session
                 
                 # Initialize feedback database
                 self.feedback_db = FeedbackDatabase("./data/feedback.db")
@@ -161,12 +219,50 @@ class AppState:
 state = AppState()
 
 
+async def resolve_session(request: Request) -> Session:
+    """Session for an HTTP request (header, then cookie; new id if missing or invalid)."""
+    session_id = request.headers.get(SESSION_HEADER) or request.cookies.get(SESSION_COOKIE)
+    if not is_valid_session_id(session_id):
+        session_id = new_session_id()
+    # May restore a spilled session or spill others: file I/O stays off the event loop
+    return await run_in_threadpool(state.sessions.get_or_create, session_id)
+
+
+def attach_session(response: Response, session: Session) -> None:
+    """Echo the session id so the client can send it back."""
+    response.headers[SESSION_HEADER] = session.session_id
+    response.set_cookie(SESSION_COOKIE, session.session_id, httponly=True, samesite="lax")
+
+
+def get_shared_embedding_service():
+    """Process-wide embedding service shared by router and memory."""
+    import sys
+    sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+    from src.services.embedding_service import get_embedding_service
+    return get_embedding_service()
+
+
+async def warm_embedding(text: str) -> None:
+    """
+    Encode text through the micro-batching queue without blocking the event loop.
+    
+    The vector lands in the shared LRU cache, so the synchronous router/memory
+    calls that follow are cache hits.
+    """
+    if text:
+        await get_shared_embedding_service().encode_async(text)
+
+
 # ============== Startup/Shutdown ==============
 
 @app.on_event("startup")
 async def startup_event():
     """Initialize on startup."""
     print("🚀 EVO-TR API starting...")
+    get_shared_embedding_service().enable_batching(
+        max_batch_size=EMBEDDING_BATCH_SIZE,
+        max_wait_ms=EMBEDDING_BATCH_WAIT_MS
+    )
     # Lazy loading - don't load model on startup
     # await state.initialize()
 
@@ -175,6 +271,11 @@ async def startup_event():
 async def shutdown_event():
     """Cleanup on shutdown."""
     print("👋 EVO-TR API shutting down...")
+    get_shared_embedding_service().disable_batching()
+    state.worker.shutdown()
+    state.sessions.close()
+    if state.orchestrator is not None:
+        state.orchestrator.memory.close()
 
 
 # ============== REST Endpoints ==============
@@ -216,13 +317,24 @@ async def get_status():
     
     memory_mb = psutil.Process().memory_info().rss / (1024 * 1024)
     
+    # Adapter cache counters (when the orchestrator is loaded)
+    active_adapter = None
+    adapter_cache = None
+    if state.orchestrator is not None:
+        lora_status = state.orchestrator.lora_manager.get_status()
+        active_adapter = lora_status["current_adapter"]
+        adapter_cache = lora_status["cache"]
+    
     return SystemStatus(
         status="running",
         model_loaded=state.model_loaded,
         adapters_available=adapters,
-        active_adapter=None,
+        active_adapter=active_adapter,
         memory_usage_mb=round(memory_mb, 2),
-        uptime_seconds=round(state.get_uptime(), 2)
+        uptime_seconds=round(state.get_uptime(), 2),
+        adapter_cache=adapter_cache,
+        inference_queue=state.worker.get_stats(),
+        sessions=state.sessions.get_stats()
     )
 
 
@@ -269,7 +381,7 @@ async def list_adapters():
 
 
 @app.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, http_request: Request, http_response: Response):
     """
     Chat endpoint.
     
@@ -283,19 +395,22 @@ async def chat(request: ChatRequest):
     if not state.model_loaded:
         raise HTTPException(status_code=503, detail="Model not loaded")
     
+    session = await resolve_session(http_request)
+    attach_session(http_response, session)
+    
     try:
         start_time = time.time()
+        await warm_embedding(request.message)
         
-        # Use orchestrator for routing and generation
-        response = state.orchestrator.chat(
-            message=request.message,
-            force_adapter=request.adapter
+        # Routing + generation on the inference worker; the last turn is read
+        # in the same job so concurrent requests can't interleave
+        response, last_turn = await state.worker.run(
+            _chat_with_turn,
+            request.message,
+            request.adapter,
+            session
         )
         
-        # Get details from last conversation turn
-        history = state.orchestrator.get_conversation_history()
-        last_turn = history[-1] if history else None
-        
         generation_time = time.time() - start_time
         
         return ChatResponse(
@@ -304,15 +419,27 @@ async def chat(request: ChatRequest):
             adapter_used=last_turn.adapter_used or "base_model" if last_turn else "base_model",
             confidence=last_turn.confidence if last_turn else 0.0,
             tokens_generated=last_turn.tokens_generated if last_turn else 0,
-            generation_time=round(generation_time, 3)
+            generation_time=round(generation_time, 3),
+            session_id=session.session_id
         )
     
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _chat_with_turn(message: str, adapter: Optional[str], session: Session):
+    """Run orchestrator.chat and return (response, last turn). Executes on the worker."""
+    previous = session.turns[-1] if session.turns else None
+    response = state.orchestrator.chat(message=message, force_adapter=adapter, session=session)
+    # TTT cache hits return without recording a turn
+    last_turn = session.turns[-1] if session.turns else None
+    return response, last_turn if last_turn is not previous else None
+
+
 @app.post("/chat/stream")
-async def chat_stream(request: ChatRequest):
+async def chat_stream(request: ChatRequest, http_request: Request):
     """
     Streaming chat endpoint.
     
@@ -322,6 +449,7 @@ async def chat_stream(request: ChatRequest):
     - meta: {type: 'meta', intent, confidence, adapter}
     - token: {type: 'token', text}
     - done: {type: 'done', tokens_generated, generation_time}
+      (plus stopped_reason and the trimmed text when a repetition loop was cut off)
     - error: {type: 'error', message}
     """
     if state.orchestrator is None:
@@ -330,21 +458,31 @@ async def chat_stream(request: ChatRequest):
     if not state.model_loaded:
         raise HTTPException(status_code=503, detail="Model not loaded")
     
+    session = await resolve_session(http_request)
+    await warm_embedding(request.message)
+    try:
+        handle = state.worker.stream(
+            state.orchestrator.chat_stream,
+            message=request.message,
+            force_adapter=request.adapter,
+            session=session
+        )
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    
     async def generate():
         try:
-            # Use real streaming from orchestrator
-            for chunk in state.orchestrator.chat_stream(
-                message=request.message,
-                force_adapter=request.adapter
-            ):
+            # Tokens arrive from the inference worker through an asyncio.Queue
+            async for chunk in handle:
                 yield f"data: {json.dumps(chunk)}\n\n"
-                # Small delay to prevent buffer issues
-                await asyncio.sleep(0.01)
         
         except Exception as e:
             yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
+        finally:
+            # Client disconnected (or stream finished): stop generation
+            handle.cancel()
     
-    return StreamingResponse(
+    response = StreamingResponse(
         generate(),
         media_type="text/event-stream",
         headers={
@@ -353,6 +491,8 @@ async def chat_stream(request: ChatRequest):
             "X-Accel-Buffering": "no"
         }
     )
+    attach_session(response, session)
+    return response
 
 
 @app.post("/memory/search")
@@ -369,6 +509,8 @@ async def search_memory(request: MemorySearchRequest):
         raise HTTPException(status_code=503, detail="Model not loaded")
     
     try:
+        await warm_embedding(request.query)
+        
         # Use memory manager to search
         results = state.orchestrator.memory_manager.search(
             query=request.query,
@@ -435,6 +577,7 @@ async def route_message(message: str):
         sys.path.insert(0, str(Path(__file__).parent.parent.parent))
         from src.router.api import route_with_details
         
+        await warm_embedding(message)
         result = route_with_details(message)
         return result
     
@@ -449,24 +592,36 @@ async def websocket_chat(websocket: WebSocket):
     """
     WebSocket endpoint for real-time chat.
     
+    Each connection is its own session; pass ?session_id=... to resume one.
+    
     Protocol:
     - Client sends: {"message": "...", "adapter": null}
     - Server sends: {"type": "meta", "intent": "...", "confidence": ..., "adapter": "..."}
     - Server sends: {"type": "token", "text": "..."} for each token
     - Server sends: {"type": "done", "tokens_generated": ..., "generation_time": ...}
+      (plus "stopped_reason" and the trimmed "text" when a repetition loop was cut off)
     """
     await websocket.accept()
     state.active_connections.append(websocket)
+    session = None
+    resumable = False
     
     try:
         # Initialize if needed
         if state.orchestrator is None:
             await state.initialize()
         
+        requested_id = websocket.query_params.get("session_id")
+        resumable = is_valid_session_id(requested_id)
+        session = await run_in_threadpool(
+            state.sessions.get_or_create, requested_id if resumable else new_session_id()
+        )
+        
         # Send connection status
         await websocket.send_json({
             "type": "connected",
-            "model_loaded": state.model_loaded
+            "model_loaded": state.model_loaded,
+            "session_id": session.session_id
         })
         
         while True:
@@ -480,23 +635,42 @@ async def websocket_chat(websocket: WebSocket):
                 continue
             
             try:
-                # Use real streaming
-                for chunk in state.orchestrator.chat_stream(
+                await warm_embedding(message)
+                session = await run_in_threadpool(state.sessions.get_or_create, session.session_id)
+                handle = state.worker.stream(
+                    state.orchestrator.chat_stream,
                     message=message,
-                    force_adapter=adapter
-                ):
-                    await websocket.send_json(chunk)
-                    await asyncio.sleep(0.01)  # Small delay for smooth streaming
+                    force_adapter=adapter,
+                    session=session
+                )
+            except QueueFullError as e:
+                await websocket.send_json({"type": "error", "code": 429, "message": str(e)})
+                continue
+            except Exception as e:
+                await websocket.send_json({"type": "error", "message": str(e)})
+                continue
             
+            try:
+                async for chunk in handle:
+                    await websocket.send_json(chunk)
+            except WebSocketDisconnect:
+                raise
             except Exception as e:
                 await websocket.send_json({
                     "type": "error",
                     "message": str(e)
                 })
+            finally:
+                # Stops generation if the client went away mid-stream
+                handle.cancel()
     
     except WebSocketDisconnect:
         if websocket in state.active_connections:
             state.active_connections.remove(websocket)
+        # Anonymous connections can't be resumed, so their state goes now;
+        # named sessions stay until the idle timeout
+        if session is not None and not resumable:
+            await run_in_threadpool(state.sessions.end, session.session_id)
         print(f"WebSocket disconnected. Active: {len(state.active_connections)}")
 
 
@@ -552,16 +726,23 @@ async def get_feedback_stats():
 # ============== Conversation History ==============
 
 @app.get("/history")
-async def get_conversation_history():
-    """Get conversation history from memory."""
+async def get_conversation_history(http_request: Request):
+    """Get the conversation history of the caller's session."""
     await state.initialize()
     
     if state.orchestrator is None:
         return {"conversations": [], "total": 0}
     
+    session_id = http_request.headers.get(SESSION_HEADER) or http_request.cookies.get(SESSION_COOKIE)
+    if not is_valid_session_id(session_id):
+        return {"conversations": [], "total": 0}
+    
     try:
-        # Get recent conversations from memory
-        history = state.orchestrator.get_conversation_history()
+        # Read-only lookup: unknown ids must not create sessions (or evict real ones)
+        session = await run_in_threadpool(state.sessions.get, session_id, restore=True)
+        if session is None:
+            return {"conversations": [], "total": 0}
+        history = state.orchestrator.get_conversation_history(session)
         
         conversations = []
         for turn in history[-50:]:  # Son 50 mesaj
@@ -579,12 +760,13 @@ async def get_conversation_history():
 
 
 @app.delete("/history")
-async def clear_history():
-    """Clear conversation history."""
+async def clear_history(http_request: Request):
+    """Clear the conversation history of the caller's session."""
     await state.initialize()
     
-    if state.orchestrator:
-        state.orchestrator.clear_conversation()
+    session_id = http_request.headers.get(SESSION_HEADER) or http_request.cookies.get(SESSION_COOKIE)
+    if is_valid_session_id(session_id):
+        await run_in_threadpool(state.sessions.end, session_id)
     
     return {"success": True, "message": "Conversation history cleared"}
 
@@ -600,12 +782,19 @@ async def memory_search_get(query: str, limit: int = 5):
         return {"results": [], "query": query}
     
     try:
+        await warm_embedding(query)
         results = state.orchestrator.memory.search(query, n_results=limit)
         return {"results": results, "query": query, "count": len(results)}
     except Exception as e:
         return {"results": [], "query": query, "error": str(e)}
 
 
+@app.get("/embeddings/stats")
+async def embedding_stats():
+    """Shared embedding cache and micro-batching stats (batch size, queue wait, latency)."""
+    return get_shared_embedding_service().get_stats()
+
+
 @app.get("/memory/stats")
 async def memory_stats():
     """Get memory statistics."""
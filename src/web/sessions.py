@@ -0,0 +1,325 @@
+"""
+EVO-TR Web API - Session Store
+
+Per-client conversation state. Each session owns its own ContextBuffer
+(short-term memory fed to the model) and turn history, so concurrent
+HTTP / WebSocket clients no longer share one global conversation.
+
+- Keyed by session id (X-Session-ID header / cookie, or one per WebSocket)
+- Idle-timeout eviction and a max-sessions cap (least recently used first)
+- Optional spill-to-disk: evicted sessions are written as JSON and
+  transparently restored on their next request
+"""
+
+from typing import Any, Callable, Deque, Dict, List, Optional
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field, is_dataclass, asdict
+from datetime import datetime
+from pathlib import Path
+import json
+import re
+import threading
+import time
+import uuid
+
+
+# Session ids end up in file names, so only a conservative alphabet is accepted
+_SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def new_session_id() -> str:
+    """Generate a fresh session id."""
+    return uuid.uuid4().hex
+
+
+def is_valid_session_id(session_id: Optional[str]) -> bool:
+    """True if the id is safe to use as a store key and file name."""
+    return bool(session_id) and _SESSION_ID_PATTERN.match(session_id) is not None
+
+
+def _default_buffer_factory():
+    from ..memory.context_buffer import ContextBuffer
+    return ContextBuffer()
+
+
+@dataclass
+class Session:
+    """Conversation state of a single client."""
+    session_id: str
+    buffer: Any
+    turns: Deque[Any]
+    created_at: float = field(default_factory=time.time)
+    last_seen: float = field(default_factory=time.monotonic)
+
+    def touch(self) -> None:
+        self.last_seen = time.monotonic()
+
+
+class SessionStore:
+    """
+    In-memory session store with idle eviction and a size cap.
+
+    Sessions are handed to EvoTR.chat / chat_stream, which read and write
+    session.buffer and session.turns instead of the orchestrator's globals.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = 256,
+        idle_timeout: float = 1800.0,
+        max_turns: int = 100,
+        spill_dir: Optional[str] = None,
+        sweep_interval: float = 60.0,
+        buffer_factory: Optional[Callable[[], Any]] = None,
+        turn_factory: Optional[Callable[[Dict[str, Any]], Any]] = None,
+        on_evict: Optional[Callable[[str], None]] = None
+    ):
+        """
+        Args:
+            max_sessions: Max sessions kept in memory (LRU beyond that)
+            idle_timeout: Seconds without a request before a session is evicted
+            max_turns: Turns kept per session
+            spill_dir: Directory for evicted sessions (None = drop them)
+            sweep_interval: Min seconds between opportunistic idle sweeps
+            buffer_factory: Creates the ContextBuffer of a new session
+            turn_factory: Rebuilds a turn from its dict form when restoring
+            on_evict: Called with the session id when a session leaves memory
+        """
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.max_turns = max_turns
+        self.spill_dir = Path(spill_dir) if spill_dir else None
+        self.sweep_interval = sweep_interval
+        self.buffer_factory = buffer_factory or _default_buffer_factory
+        self.turn_factory = turn_factory
+        self.on_evict = on_evict
+
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+
+        self.stats = {
+            "created": 0,
+            "restored": 0,
+            "ended": 0,
+            "evicted_idle": 0,
+            "evicted_capacity": 0,
+            "spilled": 0,
+            "spill_errors": 0
+        }
+
+    # ============ Lookup ============
+
+    def get_or_create(self, session_id: str) -> Session:
+        """
+        Return the session, restoring it from disk or creating it if needed.
+
+        Raises:
+            ValueError: if the session id is not a valid id
+        """
+        if not is_valid_session_id(session_id):
+            raise ValueError(f"Invalid session id: {session_id!r}")
+
+        self._maybe_sweep()
+
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                self._sessions.move_to_end(session_id)
+                session.touch()
+                return session
+
+            session = self._restore(session_id)
+            if session is None:
+                session = Session(
+                    session_id=session_id,
+                    buffer=self.buffer_factory(),
+                    turns=deque(maxlen=self.max_turns)
+                )
+                self.stats["created"] += 1
+            else:
+                self.stats["restored"] += 1
+
+            self._sessions[session_id] = session
+            evicted = self._pop_over_capacity()
+
+        self._spill_all(evicted)
+        return session
+
+    def get(self, session_id: Optional[str], restore: bool = False) -> Optional[Session]:
+        """
+        Return a session without creating it (None if unknown).
+
+        With restore=True a spilled session is loaded back from disk; unknown
+        ids still never allocate a session or a spill file.
+        """
+        if not is_valid_session_id(session_id):
+            return None
+        evicted: List[Session] = []
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                self._sessions.move_to_end(session_id)
+                session.touch()
+            elif restore:
+                session = self._restore(session_id)
+                if session is not None:
+                    self.stats["restored"] += 1
+                    self._sessions[session_id] = session
+                    evicted = self._pop_over_capacity()
+        self._spill_all(evicted)
+        return session
+
+    def end(self, session_id: str) -> bool:
+        """Drop a session from memory and disk. Returns True if it existed."""
+        if not is_valid_session_id(session_id):
+            return False
+        with self._lock:
+            existed = self._sessions.pop(session_id, None) is not None
+        path = self._spill_path(session_id)
+        if path is not None and path.exists():
+            path.unlink()
+            existed = True
+        if existed:
+            self.stats["ended"] += 1
+            self._notify_evicted(session_id)
+        return existed
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    # ============ Eviction ============
+
+    def _pop_over_capacity(self) -> List[Session]:
+        """Remove least recently used sessions beyond max_sessions (lock held)."""
+        evicted = []
+        while len(self._sessions) > self.max_sessions:
+            _, session = self._sessions.popitem(last=False)
+            evicted.append(session)
+            self.stats["evicted_capacity"] += 1
+        return evicted
+
+    def _maybe_sweep(self) -> None:
+        if time.monotonic() - self._last_sweep >= self.sweep_interval:
+            self.sweep()
+
+    def sweep(self) -> int:
+        """
+        Evict sessions idle for longer than idle_timeout.
+
+        Returns:
+            Number of evicted sessions
+        """
+        now = time.monotonic()
+        evicted = []
+        with self._lock:
+            self._last_sweep = now
+            # OrderedDict is in last-use order, so idle sessions are at the front
+            while self._sessions:
+                session = next(iter(self._sessions.values()))
+                if now - session.last_seen < self.idle_timeout:
+                    break
+                self._sessions.popitem(last=False)
+                evicted.append(session)
+                self.stats["evicted_idle"] += 1
+
+        self._spill_all(evicted)
+        return len(evicted)
+
+    def close(self) -> None:
+        """Spill every live session (server shutdown)."""
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        self._spill_all(sessions)
+
+    # ============ Spill to disk ============
+
+    def _spill_path(self, session_id: str) -> Optional[Path]:
+        if self.spill_dir is None:
+            return None
+        return self.spill_dir / f"{session_id}.json"
+
+    @staticmethod
+    def _turn_to_dict(turn: Any) -> Dict[str, Any]:
+        if hasattr(turn, "to_dict"):
+            return turn.to_dict()
+        if is_dataclass(turn):
+            data = asdict(turn)
+            return {k: v.isoformat() if isinstance(v, datetime) else v for k, v in data.items()}
+        return dict(turn)
+
+    def _notify_evicted(self, session_id: str) -> None:
+        if self.on_evict is None:
+            return
+        try:
+            self.on_evict(session_id)
+        except Exception as e:
+            print(f"⚠️ Session eviction hook failed ({session_id}): {e}")
+
+    def _spill_all(self, sessions: List[Session]) -> None:
+        for session in sessions:
+            self._spill(session)
+            self._notify_evicted(session.session_id)
+
+    def _spill(self, session: Session) -> None:
+        """Write an evicted session to disk (no-op without spill_dir)."""
+        path = self._spill_path(session.session_id)
+        if path is None or (session.buffer.message_count == 0 and not session.turns):
+            return
+        data = {
+            "session_id": session.session_id,
+            "created_at": session.created_at,
+            "buffer": session.buffer.export_to_json(),
+            "turns": [self._turn_to_dict(t) for t in session.turns]
+        }
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(".tmp")
+            tmp_path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+            tmp_path.replace(path)
+            self.stats["spilled"] += 1
+        except (OSError, TypeError, ValueError) as e:
+            self.stats["spill_errors"] += 1
+            print(f"⚠️ Session spill failed ({session.session_id}): {e}")
+
+    def _restore(self, session_id: str) -> Optional[Session]:
+        """Load a spilled session and remove its file (lock held)."""
+        path = self._spill_path(session_id)
+        if path is None or not path.exists():
+            return None
+
+        from ..memory.context_buffer import ContextBuffer
+
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+            buffer = ContextBuffer.from_json(data["buffer"])
+            factory = self.turn_factory or (lambda d: d)
+            turns = deque((factory(t) for t in data.get("turns", [])), maxlen=self.max_turns)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"⚠️ Session restore failed ({session_id}): {e}")
+            return None
+        finally:
+            path.unlink(missing_ok=True)
+
+        return Session(
+            session_id=session_id,
+            buffer=buffer,
+            turns=turns,
+            created_at=data.get("created_at", time.time())
+        )
+
+    # ============ Stats ============
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Live session count, evictions and spill counters."""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["active"] = len(self._sessions)
+        stats["max_sessions"] = self.max_sessions
+        stats["idle_timeout"] = self.idle_timeout
+        stats["spill_enabled"] = self.spill_dir is not None
+        return stats
@@ -0,0 +1,272 @@
+"""
+EVO-TR Web API - Inference Worker
+
+Runs blocking orchestrator calls (chat / chat_stream) on dedicated worker
+threads so the asyncio event loop keeps serving other requests.
+
+- Bounded request queue with back-pressure (QueueFullError -> HTTP 429)
+- Streaming: tokens are forwarded into an asyncio.Queue per request
+- Cancellation: queued jobs are skipped, running streams stop at the next chunk
+"""
+
+from typing import Any, Callable, Dict, Optional
+from dataclasses import dataclass, field
+import asyncio
+import queue
+import threading
+import time
+
+
+class QueueFullError(Exception):
+    """Raised when the inference queue is at its depth limit."""
+
+
+_DONE = object()
+
+
+@dataclass
+class _Job:
+    """A single unit of work for the inference worker."""
+    fn: Callable[..., Any]
+    args: tuple
+    kwargs: Dict[str, Any]
+    loop: asyncio.AbstractEventLoop
+    streaming: bool
+    future: Optional[asyncio.Future] = None
+    chunks: Optional[asyncio.Queue] = None
+    cancel_event: threading.Event = field(default_factory=threading.Event)
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class _JobError:
+    """Exception raised inside a streaming job, delivered to the consumer."""
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+class StreamHandle:
+    """
+    Async iterator over the chunks produced by a streaming job.
+
+    Call cancel() (e.g. when the client disconnects) to stop generation.
+    """
+
+    def __init__(self, job: _Job):
+        self._job = job
+
+    def __aiter__(self) -> "StreamHandle":
+        return self
+
+    async def __anext__(self) -> Any:
+        item = await self._job.chunks.get()
+        if item is _DONE:
+            raise StopAsyncIteration
+        if isinstance(item, _JobError):
+            raise item.error
+        return item
+
+    def cancel(self) -> None:
+        """Stop the job (skipped if still queued, closed at the next chunk if running)."""
+        self._job.cancel_event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._job.cancel_event.is_set()
+
+
+class InferenceWorker:
+    """
+    Thread-backed inference worker with a bounded queue.
+
+    The orchestrator is not thread-safe (shared model, adapter state and
+    memory), so the default concurrency is 1; raise it only for backends
+    that support parallel requests.
+    """
+
+    def __init__(self, max_concurrency: int = 1, max_queue_depth: int = 8):
+        """
+        Args:
+            max_concurrency: Number of worker threads running jobs in parallel
+            max_queue_depth: Max jobs waiting (not yet running) before 429
+        """
+        self.max_concurrency = max_concurrency
+        self.max_queue_depth = max_queue_depth
+
+        self._queue: "queue.Queue[Optional[_Job]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._threads: list = []
+        self._waiting = 0
+        self._running = 0
+
+        self.stats = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "cancelled": 0,
+            "rejected": 0,
+            "total_queue_wait": 0.0,
+            "total_run_time": 0.0
+        }
+
+    # ============ Submission ============
+
+    def _ensure_started(self) -> None:
+        """Start worker threads on first use."""
+        if self._threads:
+            return
+        for i in range(self.max_concurrency):
+            thread = threading.Thread(target=self._run, name=f"inference-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _enqueue(self, job: _Job) -> None:
+        """Admit a job or raise QueueFullError."""
+        with self._lock:
+            if self._waiting >= self.max_queue_depth:
+                self.stats["rejected"] += 1
+                raise QueueFullError(
+                    f"Inference queue full ({self._waiting}/{self.max_queue_depth} waiting)"
+                )
+            self._waiting += 1
+            self.stats["submitted"] += 1
+            self._ensure_started()
+        self._queue.put(job)
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Run a blocking call on the worker and await its result.
+
+        Raises:
+            QueueFullError: if the queue is at its depth limit
+        """
+        loop = asyncio.get_running_loop()
+        job = _Job(fn=fn, args=args, kwargs=kwargs, loop=loop, streaming=False,
+                   future=loop.create_future())
+        self._enqueue(job)
+        try:
+            return await job.future
+        except asyncio.CancelledError:
+            job.cancel_event.set()
+            raise
+
+    def stream(self, fn: Callable[..., Any], *args, **kwargs) -> StreamHandle:
+        """
+        Run a generator function on the worker and stream its items.
+
+        Must be called from within the event loop.
+
+        Raises:
+            QueueFullError: if the queue is at its depth limit
+        """
+        loop = asyncio.get_running_loop()
+        job = _Job(fn=fn, args=args, kwargs=kwargs, loop=loop, streaming=True,
+                   chunks=asyncio.Queue())
+        self._enqueue(job)
+        return StreamHandle(job)
+
+    # ============ Worker threads ============
+
+    @staticmethod
+    def _deliver(job: _Job, item: Any) -> None:
+        """Hand a chunk to the event loop thread."""
+        try:
+            job.loop.call_soon_threadsafe(job.chunks.put_nowait, item)
+        except RuntimeError:
+            # Event loop already closed (server shutting down)
+            job.cancel_event.set()
+
+    @staticmethod
+    def _resolve(job: _Job, result: Any = None, error: Optional[BaseException] = None) -> None:
+        """Complete (or cancel) an awaited job from the worker thread."""
+        def _set():
+            if job.future.done():
+                return
+            if job.cancel_event.is_set():
+                job.future.cancel()
+            elif error is not None:
+                job.future.set_exception(error)
+            else:
+                job.future.set_result(result)
+        try:
+            job.loop.call_soon_threadsafe(_set)
+        except RuntimeError:
+            pass
+
+    def _execute(self, job: _Job) -> str:
+        """Run one job; returns the outcome name for stats."""
+        if job.streaming:
+            generator = None
+            try:
+                generator = job.fn(*job.args, **job.kwargs)
+                for chunk in generator:
+                    if job.cancel_event.is_set():
+                        return "cancelled"
+                    self._deliver(job, chunk)
+            except Exception as e:
+                self._deliver(job, _JobError(e))
+                return "failed"
+            finally:
+                if generator is not None and hasattr(generator, "close"):
+                    generator.close()
+                self._deliver(job, _DONE)
+            return "completed"
+
+        try:
+            result = job.fn(*job.args, **job.kwargs)
+        except Exception as e:
+            self._resolve(job, error=e)
+            return "failed"
+        self._resolve(job, result=result)
+        return "completed"
+
+    def _run(self) -> None:
+        """Worker thread loop."""
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+
+            started = time.monotonic()
+            with self._lock:
+                self._waiting -= 1
+                self._running += 1
+                self.stats["total_queue_wait"] += started - job.enqueued_at
+
+            if job.cancel_event.is_set():
+                outcome = "cancelled"
+                if job.streaming:
+                    self._deliver(job, _DONE)
+                else:
+                    self._resolve(job)
+            else:
+                outcome = self._execute(job)
+
+            with self._lock:
+                self._running -= 1
+                self.stats[outcome] += 1
+                self.stats["total_run_time"] += time.monotonic() - started
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        """Stop worker threads after the jobs already queued."""
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        self._threads = []
+
+    # ============ Stats ============
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Queue depth, throughput and wait times."""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["waiting"] = self._waiting
+            stats["running"] = self._running
+
+        started = stats["completed"] + stats["failed"] + stats["cancelled"]
+        stats["avg_queue_wait_ms"] = round(stats.pop("total_queue_wait") / started * 1000, 2) if started else 0
+        stats["avg_run_time_ms"] = round(stats.pop("total_run_time") / started * 1000, 2) if started else 0
+        stats["max_concurrency"] = self.max_concurrency
+        stats["max_queue_depth"] = self.max_queue_depth
+        return stats
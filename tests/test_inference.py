@@ -0,0 +1,550 @@
+"""
+EVO-TR: Inference Unit Tests
+
+Deterministik sahte backend ile continuous batching scheduler testleri.
+"""
+
+import pytest
+import sys
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+# Proje root'unu path'e ekle
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import mlx.core as mx
+from mlx_lm.generate import generate_step
+from mlx_lm.models import llama
+from mlx_lm.models.cache import make_prompt_cache
+
+from src.inference import mlx_inference
+from src.inference.mlx_inference import MLXInference, GenerationConfig
+from src.inference.prefix_cache import PromptPrefixCache
+from src.inference.scheduler import (
+    ContinuousBatchScheduler, DecodeBackend, DecodeStep, MLXDecodeBackend, _MLXSequence
+)
+
+
+class FakeBackend(DecodeBackend):
+    """
+    Prompt'tan deterministik token üreten backend.
+
+    "<prompt>:<i> " parçaları üretir; prompt "eos" ile bitiyorsa
+    3 token sonra EOS döner. gate verilirse her step onu bekler,
+    delay verilirse her step o kadar sürer.
+    """
+
+    def __init__(self, gate=None, delay=0.0):
+        self.gate = gate
+        self.delay = delay
+        self.steps = []
+        self.released = []
+
+    def prefill(self, request):
+        request.prompt_tokens = len(request.prompt.split())
+        return {"prompt": request.prompt, "i": 0, "max": request.max_tokens}
+
+    def step(self, model, states):
+        if self.gate is not None:
+            self.gate.wait(timeout=5)
+        if self.delay:
+            time.sleep(self.delay)
+        self.steps.append((model, [s["prompt"] for s in states]))
+        outputs = []
+        for s in states:
+            if s["prompt"].endswith("eos") and s["i"] == 3:
+                outputs.append(DecodeStep("", True, "stop", tokens=0))
+                continue
+            text = f"{s['prompt']}:{s['i']} "
+            s["i"] += 1
+            if s["i"] >= s["max"]:
+                outputs.append(DecodeStep(text, True, "length"))
+            else:
+                outputs.append(DecodeStep(text))
+        return outputs
+
+    def release(self, state):
+        self.released.append(state["prompt"])
+
+
+class TestContinuousBatchScheduler:
+    """Continuous batching scheduler testleri."""
+
+    def test_single_request_matches_sequential_output(self):
+        """Tek istek sıralı üretimle aynı metni vermeli."""
+        scheduler = ContinuousBatchScheduler(FakeBackend())
+        text = scheduler.generate("model", None, "a", max_tokens=3)
+        scheduler.close()
+
+        assert text == "a:0 a:1 a:2 "
+
+    def test_requests_share_decode_steps(self):
+        """Eşzamanlı istekler aynı adımda birlikte ilerlemeli."""
+        gate = threading.Event()
+        backend = FakeBackend(gate)
+        scheduler = ContinuousBatchScheduler(backend, max_batch_size=4)
+
+        requests = [scheduler.submit("model", None, p, max_tokens=4) for p in ("a", "b", "c")]
+        gate.set()
+        texts = [r.result(timeout=5) for r in requests]
+        scheduler.close()
+
+        assert texts == [f"{p}:0 {p}:1 {p}:2 {p}:3 " for p in ("a", "b", "c")]
+        assert max(len(prompts) for _, prompts in backend.steps) >= 2
+        assert scheduler.get_stats()["avg_batch_size"] > 1
+
+    def test_new_request_joins_running_batch(self):
+        """Çalışan batch'e yeni istek token sınırında katılmalı."""
+        backend = FakeBackend(delay=0.002)
+        scheduler = ContinuousBatchScheduler(backend, max_batch_size=4)
+
+        long_request = scheduler.submit("model", None, "long", max_tokens=200)
+        first_chunk = next(iter(long_request))
+        short = scheduler.submit("model", None, "short", max_tokens=2)
+        assert short.result(timeout=5) == "short:0 short:1 "
+
+        assert any(prompts == ["long", "short"] for _, prompts in backend.steps)
+        long_request.result(timeout=5)
+        scheduler.close()
+
+        assert first_chunk == "long:0 "
+        assert short.finished_at < long_request.finished_at
+
+    def test_finished_sequence_retired_without_stalling(self):
+        """Biten dizi batch'ten çıkmalı, diğeri devam etmeli."""
+        backend = FakeBackend(threading.Event())
+        scheduler = ContinuousBatchScheduler(backend, max_batch_size=4)
+
+        early = scheduler.submit("model", None, "x eos", max_tokens=50)
+        late = scheduler.submit("model", None, "y", max_tokens=6)
+        backend.gate.set()
+        assert early.result(timeout=5) == "x eos:0 x eos:1 x eos:2 "
+        late.result(timeout=5)
+        scheduler.close()
+
+        assert early.finish_reason == "stop"
+        assert early.tokens == 3
+        assert late.finish_reason == "length"
+        assert backend.steps[-1][1] == ["y"]
+        assert sorted(backend.released) == ["x eos", "y"]
+
+    def test_groups_by_adapter(self):
+        """Farklı adapter'lar aynı step'e karışmamalı."""
+        backend = FakeBackend(threading.Event())
+        scheduler = ContinuousBatchScheduler(backend, max_batch_size=8)
+
+        requests = [
+            scheduler.submit("model", None, "m1", max_tokens=3, adapter="math"),
+            scheduler.submit("model", None, "p1", max_tokens=3, adapter="python"),
+            scheduler.submit("model", None, "m2", max_tokens=3, adapter="math")
+        ]
+        backend.gate.set()
+        for r in requests:
+            r.result(timeout=5)
+        scheduler.close()
+
+        for _, prompts in backend.steps:
+            groups = {p[0] for p in prompts}
+            assert len(groups) == 1
+        assert scheduler.get_stats()["group_switches"] >= 2
+
+    def test_max_batch_size_respected(self):
+        """Aktif dizi sayısı max_batch_size'ı aşmamalı."""
+        backend = FakeBackend(threading.Event())
+        scheduler = ContinuousBatchScheduler(backend, max_batch_size=2)
+
+        requests = [scheduler.submit("model", None, f"r{i}", max_tokens=3) for i in range(5)]
+        backend.gate.set()
+        for r in requests:
+            r.result(timeout=5)
+        scheduler.close()
+
+        assert max(len(prompts) for _, prompts in backend.steps) <= 2
+        assert scheduler.get_stats()["max_active_seen"] <= 2
+        assert scheduler.get_stats()["completed"] == 5
+
+    def test_cancel_retires_sequence(self):
+        """İptal edilen istek bir sonraki adımda batch'ten çıkmalı."""
+        backend = FakeBackend(delay=0.001)
+        scheduler = ContinuousBatchScheduler(backend)
+
+        request = scheduler.submit("model", None, "c", max_tokens=10_000)
+        stream = iter(request)
+        next(stream)
+        request.cancel()
+        remaining = list(stream)
+        scheduler.close()
+
+        assert request.done
+        assert request.tokens < 10_000
+        assert len(remaining) < 10_000
+        assert scheduler.get_stats()["cancelled"] == 1
+        assert backend.released == ["c"]
+
+    def test_per_request_metrics(self):
+        """İstek bazında queue wait ve tokens/sec raporlanmalı."""
+        scheduler = ContinuousBatchScheduler(FakeBackend())
+        request = scheduler.submit("model", None, "bir iki", max_tokens=5)
+        request.result(timeout=5)
+        scheduler.close()
+
+        metrics = request.get_metrics()
+        assert metrics["tokens"] == 5
+        assert metrics["prompt_tokens"] == 2
+        assert metrics["queue_wait_ms"] >= 0
+        assert metrics["tokens_per_second"] > 0
+        assert scheduler.get_stats()["tokens"] == 5
+
+    def test_backend_error_fails_request(self):
+        """Backend hatası isteğe iletilmeli, scheduler çalışmaya devam etmeli."""
+
+        class FailingBackend(FakeBackend):
+            def prefill(self, request):
+                if request.prompt == "bad":
+                    raise ValueError("prefill hatası")
+                return super().prefill(request)
+
+        scheduler = ContinuousBatchScheduler(FailingBackend())
+        bad = scheduler.submit("model", None, "bad", max_tokens=3)
+        good = scheduler.submit("model", None, "good", max_tokens=2)
+
+        with pytest.raises(ValueError):
+            bad.result(timeout=5)
+        assert good.result(timeout=5) == "good:0 good:1 "
+        scheduler.close()
+
+    def test_adapter_swaps_bounded_by_quantum(self):
+        """Shared-base modda adapter her token'da değil, her quantum'da değişmeli."""
+
+        class CountingPool:
+            def __init__(self):
+                self.lock = threading.RLock()
+                self.active = None
+                self.swaps = 0
+
+            def activate(self, name):
+                if name != self.active:
+                    self.active = name
+                    self.swaps += 1
+
+        class SequenceBackend(MLXDecodeBackend):
+            def __init__(self, gate, adapter_pool):
+                super().__init__(adapter_pool=adapter_pool)
+                self.gate = gate
+
+            def prefill(self, request):
+                detokenizer = SimpleNamespace(last_segment="t ", add_token=lambda token: None, finalize=lambda: None)
+                return _MLXSequence(tokens=iter(lambda: 1, None), detokenizer=detokenizer,
+                                    eos_token_ids=[0], max_tokens=request.max_tokens, adapter=request.adapter)
+
+            def step(self, model, states):
+                self.gate.wait(timeout=5)
+                return super().step(model, states)
+
+        pool = CountingPool()
+        backend = SequenceBackend(threading.Event(), pool)
+        scheduler = ContinuousBatchScheduler(backend, max_batch_size=8, group_quantum=8)
+
+        requests = [
+            scheduler.submit("model", None, "q", max_tokens=16, adapter=adapter)
+            for adapter in ("math", "math", "python", "python")
+        ]
+        backend.gate.set()
+        for r in requests:
+            r.result(timeout=5)
+        scheduler.close()
+
+        # 2 grup x 16 token, quantum 8: token başına geçişte ~32 olurdu
+        assert pool.swaps <= 5
+        assert scheduler.get_stats()["group_switches"] == pool.swaps
+        assert all(r.tokens == 16 for r in requests)
+
+
+class TestMLXInferenceBatching:
+    """MLXInference'ın scheduler entegrasyonu."""
+
+    def test_generate_through_scheduler(self):
+        """generate() aynı imza ile scheduler'ı kullanmalı."""
+        inference = MLXInference(GenerationConfig(max_tokens=3))
+        inference.enable_batching(backend=FakeBackend())
+
+        result = inference.generate("model", None, "q")
+        stats = inference.get_stats()
+        inference.disable_batching()
+
+        assert result.text == "q:0 q:1 q:2 "
+        assert result.tokens_generated == 3
+        assert result.queue_time >= 0
+        assert stats["total_tokens"] == 3
+        assert stats["scheduler"]["completed"] == 1
+
+    def test_generate_stream_through_scheduler(self):
+        """generate_stream() parçaları sırayla vermeli, erken kapanışta iptal etmeli."""
+        inference = MLXInference()
+        scheduler = inference.enable_batching(backend=FakeBackend(delay=0.001))
+
+        chunks = list(inference.generate_stream("model", None, "s", GenerationConfig(max_tokens=2)))
+        stream = inference.generate_stream("model", None, "t", GenerationConfig(max_tokens=10_000))
+        next(stream)
+        stream.close()
+        inference.disable_batching()
+
+        assert chunks == ["s:0 ", "s:1 "]
+        assert scheduler.get_stats()["cancelled"] == 1
+        # Erken kapanan akış da istatistiklere girmeli
+        assert inference.get_stats()["total_generations"] == 2
+
+    def test_generate_stop_fn_cancels_request(self):
+        """stop_fn True dönünce istek iptal edilmeli, kalan token'lar üretilmemeli."""
+        inference = MLXInference(GenerationConfig(max_tokens=10_000))
+        scheduler = inference.enable_batching(backend=FakeBackend(delay=0.001))
+
+        result = inference.generate("model", None, "q", stop_fn=lambda text: text == "q:2 ")
+        inference.disable_batching()
+
+        assert result.text == "q:0 q:1 q:2 "
+        assert result.stopped_early is True
+        assert result.tokens_generated < 10_000
+        assert scheduler.get_stats()["cancelled"] == 1
+        # Sonuç ve istatistikler batch'ten çıkmış dizinin son metriklerini göstermeli
+        assert inference.get_stats()["total_tokens"] == result.tokens_generated
+
+
+TINY_MODEL_ARGS = dict(
+    model_type="llama",
+    hidden_size=16,
+    num_hidden_layers=2,
+    intermediate_size=32,
+    num_attention_heads=2,
+    num_key_value_heads=2,
+    rms_norm_eps=1e-5,
+    vocab_size=64
+)
+
+
+def make_tiny_model():
+    """Her çağrıda aynı ağırlıklara sahip küçük bir llama modeli."""
+    mx.random.seed(0)
+    model = llama.Model(llama.ModelArgs(**TINY_MODEL_ARGS))
+    mx.eval(model.parameters())
+    return model
+
+
+def run_prompt(model, tokens, cache, max_tokens=4):
+    """Prompt'u (cache ile) işle; üretilen token'ları ve ilk logprob'u döndür."""
+    out, first = [], None
+    for token, logprobs in generate_step(mx.array(tokens), model, max_tokens=max_tokens, prompt_cache=cache):
+        if first is None:
+            first = logprobs
+        out.append(int(token))
+    return out, first
+
+
+class CharTokenizer:
+    """Karakter başına bir token üreten sahte tokenizer."""
+
+    bos_token = None
+
+    def encode(self, text, add_special_tokens=True):
+        return [ord(c) % TINY_MODEL_ARGS["vocab_size"] for c in text]
+
+
+def fake_stream_generate(calls):
+    """Küçük model üzerinde prompt_cache'i gerçekten kullanan stream_generate."""
+    def _stream(model, tokenizer, prompt, max_tokens, prompt_cache=None, **kwargs):
+        calls.append(list(prompt))
+        n = 0
+        for n, (token, _) in enumerate(generate_step(mx.array(prompt), model, max_tokens=max_tokens,
+                                                     prompt_cache=prompt_cache), start=1):
+            yield SimpleNamespace(text=f"<{int(token)}>", token=int(token),
+                                  generation_tokens=n, prompt_tokens=len(prompt))
+    return _stream
+
+
+SYSTEM_IDS = list(range(1, 21))
+
+
+class TestPromptPrefixCache:
+    """Prompt prefix KV cache testleri."""
+
+    def test_cached_prefix_matches_full_prefill(self):
+        """Önek cache'ten gelince çıktı tam prefill ile aynı olmalı."""
+        model = make_tiny_model()
+        prefix_cache = PromptPrefixCache(min_prefix_tokens=4)
+        turn2 = SYSTEM_IDS + [30, 31, 32]
+
+        cache, reused = prefix_cache.fetch("math", SYSTEM_IDS + [22], model)
+        assert reused == 0
+        generated, _ = run_prompt(model, SYSTEM_IDS + [22], cache)
+        assert prefix_cache.store("math", SYSTEM_IDS + [22] + generated, cache)
+
+        cache, reused = prefix_cache.fetch("math", turn2, model)
+        cached_out, cached_logprobs = run_prompt(model, turn2[reused:], cache)
+        full_out, full_logprobs = run_prompt(model, turn2, make_prompt_cache(model))
+
+        assert reused == len(SYSTEM_IDS)
+        assert cached_out == full_out
+        assert mx.allclose(cached_logprobs, full_logprobs, atol=1e-4).item()
+
+    def test_longer_entry_trimmed_and_preserved(self):
+        """Daha uzun girdi kopyalanıp kırpılmalı, saklanan girdi bozulmamalı."""
+        model = make_tiny_model()
+        prefix_cache = PromptPrefixCache(min_prefix_tokens=4)
+        cache = make_prompt_cache(model)
+        run_prompt(model, SYSTEM_IDS, cache, max_tokens=1)
+        prefix_cache.store(None, SYSTEM_IDS, cache)
+
+        copy_a, reused_a = prefix_cache.fetch(None, SYSTEM_IDS[:10] + [40, 41])
+        copy_b, reused_b = prefix_cache.fetch(None, SYSTEM_IDS + [50])
+
+        assert reused_a == 10 and copy_a[0].offset == 10
+        assert reused_b == len(SYSTEM_IDS) and copy_b[0].offset == len(SYSTEM_IDS)
+
+    def test_fetch_copies_only_shared_prefix(self):
+        """Hit'te saklanan cache'in tamamı değil sadece ortak önek kopyalanmalı."""
+        model = make_tiny_model()
+        prefix_cache = PromptPrefixCache(min_prefix_tokens=4)
+        cache = make_prompt_cache(model)
+        run_prompt(model, SYSTEM_IDS, cache, max_tokens=1)
+        prefix_cache.store(None, SYSTEM_IDS, cache)
+        stored_mb = prefix_cache.get_stats()["memory_mb"]
+
+        fetched, reused = prefix_cache.fetch(None, SYSTEM_IDS[:10] + [40, 41])
+        assert reused == 10
+        assert all(layer.keys.shape[2] == 10 for layer in fetched)
+
+        # Kopya üzerinde üretim saklanan girdiyi değiştirmemeli
+        run_prompt(model, [40, 41], fetched)
+        again, reused = prefix_cache.fetch(None, SYSTEM_IDS + [50])
+        full_out, _ = run_prompt(model, SYSTEM_IDS + [50], make_prompt_cache(model))
+        cached_out, _ = run_prompt(model, [50], again)
+        assert reused == len(SYSTEM_IDS)
+        assert cached_out == full_out
+        assert prefix_cache.get_stats()["memory_mb"] == stored_mb
+
+    def test_adapters_do_not_share_entries(self):
+        """Farklı adapter'ın KV durumu kullanılmamalı."""
+        model = make_tiny_model()
+        prefix_cache = PromptPrefixCache(min_prefix_tokens=4)
+        cache = make_prompt_cache(model)
+        run_prompt(model, SYSTEM_IDS, cache, max_tokens=1)
+        prefix_cache.store("python", SYSTEM_IDS, cache)
+
+        _, reused = prefix_cache.fetch("history", SYSTEM_IDS + [9])
+        assert reused == 0
+
+    def test_memory_budget_evicts_lru(self):
+        """Bütçe aşılınca en eski girdi çıkmalı."""
+        model = make_tiny_model()
+        probe = make_prompt_cache(model)
+        run_prompt(model, SYSTEM_IDS, probe, max_tokens=1)
+        entry_bytes = sum(layer.nbytes for layer in probe)
+
+        prefix_cache = PromptPrefixCache(max_bytes=int(entry_bytes * 2.5), min_prefix_tokens=4)
+        for first in (1, 2, 3):
+            cache = make_prompt_cache(model)
+            tokens = [first * 10 + i for i in range(12)]
+            run_prompt(model, tokens, cache, max_tokens=1)
+            prefix_cache.store(None, tokens, cache)
+
+        stats = prefix_cache.get_stats()
+        assert stats["entries"] == 2
+        assert stats["evictions"] == 1
+        _, reused = prefix_cache.fetch(None, [10 + i for i in range(12)] + [5])
+        assert reused == 0
+
+    def test_extended_entry_replaces_prefix(self):
+        """Aynı konuşmanın devamı eski girdinin yerini almalı."""
+        model = make_tiny_model()
+        prefix_cache = PromptPrefixCache(min_prefix_tokens=4)
+        for tokens in (SYSTEM_IDS[:10], SYSTEM_IDS):
+            cache = make_prompt_cache(model)
+            run_prompt(model, tokens, cache, max_tokens=1)
+            prefix_cache.store(None, tokens, cache)
+
+        assert prefix_cache.get_stats()["entries"] == 1
+
+
+class TestMLXInferencePrefixCache:
+    """MLXInference'ın prefix cache entegrasyonu."""
+
+    def test_second_turn_prefills_only_new_tokens(self, monkeypatch):
+        """İkinci turda sadece yeni kısım modele verilmeli."""
+        calls = []
+        monkeypatch.setattr(mlx_inference, "stream_generate", fake_stream_generate(calls))
+        model, tokenizer = make_tiny_model(), CharTokenizer()
+        inference = MLXInference(GenerationConfig(max_tokens=3))
+        inference.enable_prefix_cache(max_memory_mb=16)
+
+        system = "Sen EVO-TR, yardımsever bir asistansın. "
+        first = inference.generate(model, tokenizer, system + "Merhaba", adapter="general")
+        second = inference.generate(model, tokenizer, system + "Merhaba" + first.text + "Nasılsın?",
+                                    adapter="general")
+        stats = inference.get_stats()["prefix_cache"]
+
+        assert len(calls[0]) == len(system + "Merhaba")
+        assert len(calls[1]) < len(system)
+        assert second.prompt_tokens == len(system + "Merhaba" + first.text + "Nasılsın?")
+        assert second.tokens_generated == 3
+        assert stats["hits"] == 1
+        assert stats["reused_tokens"] > 0
+
+    def test_stream_stores_on_early_close(self, monkeypatch):
+        """Stream erken kapatılsa da KV durumu saklanmalı."""
+        calls = []
+        monkeypatch.setattr(mlx_inference, "stream_generate", fake_stream_generate(calls))
+        model, tokenizer = make_tiny_model(), CharTokenizer()
+        inference = MLXInference(GenerationConfig(max_tokens=20))
+        inference.enable_prefix_cache(max_memory_mb=16)
+
+        stream = inference.generate_stream(model, tokenizer, "Bir sistem mesajı ve soru", adapter="science")
+        next(stream)
+        stream.close()
+
+        assert inference.prefix_cache.get_stats()["stores"] == 1
+
+
+class TestTokenAccounting:
+    """Inference istatistiklerinde gerçek token sayıları."""
+
+    def test_generate_reports_model_token_counts(self, monkeypatch):
+        """Token sayıları len(text)//4 yerine modelden gelmeli."""
+        monkeypatch.setattr(mlx_inference, "stream_generate", fake_stream_generate([]))
+        inference = MLXInference(GenerationConfig(max_tokens=5))
+
+        result = inference.generate(make_tiny_model(), CharTokenizer(), "Türkçe bir soru")
+        stats = inference.get_stats()
+
+        assert result.prompt_tokens == len("Türkçe bir soru")
+        assert result.tokens_generated == 5
+        assert stats["total_tokens"] == 5
+
+    def test_generate_stop_fn_direct(self, monkeypatch):
+        """Scheduler olmadan da stop_fn üretimi kesmeli ve sayımlar doğru kalmalı."""
+        monkeypatch.setattr(mlx_inference, "stream_generate", fake_stream_generate([]))
+        inference = MLXInference(GenerationConfig(max_tokens=20))
+        seen = []
+
+        def stop_fn(text):
+            seen.append(text)
+            return len(seen) == 2
+
+        result = inference.generate(make_tiny_model(), CharTokenizer(), "soru", stop_fn=stop_fn)
+
+        assert result.stopped_early is True
+        assert result.tokens_generated == 2
+        assert result.text == "".join(seen)
+        assert inference.get_stats()["total_tokens"] == 2
+
+    def test_stream_updates_stats(self, monkeypatch):
+        """Streaming generation da istatistiklere eklenmeli."""
+        monkeypatch.setattr(mlx_inference, "stream_generate", fake_stream_generate([]))
+        inference = MLXInference(GenerationConfig(max_tokens=4))
+
+        chunks = list(inference.generate_stream(make_tiny_model(), CharTokenizer(), "soru"))
+
+        assert len(chunks) == 4
+        assert inference.get_stats()["total_generations"] == 1
+        assert inference.get_stats()["total_tokens"] == 4
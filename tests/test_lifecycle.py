@@ -309,6 +309,21 @@ class TestAsyncProcessor:
         
         assert report.summary["total_conversations"] == 5
         assert report.summary["success_rate"] == 1.0
+    
+    def test_sync_to_memory_partial_failure(self, temp_log_dir):
+        """Sonraki batch hata verse de yazılan bilgiler sayılmalı"""
+        from src.lifecycle.async_processor import ExtractedFact
+        
+        class FailingHandler:
+            def add_memories_bulk(self, items, memory_type, progress=None):
+                list(items)
+                progress({"added": 2})
+                raise RuntimeError("disk dolu")
+        
+        processor = create_async_processor(log_dir=temp_log_dir, memory_handler=FailingHandler())
+        facts = [ExtractedFact(f"Bilgi {i}", "soru", 0.9, "general") for i in range(3)]
+        
+        assert processor.sync_to_memory(facts) == 2
 
 
 # ============ SelfImprovementPipeline Tests ============
@@ -0,0 +1,371 @@
+"""
+EVO-TR: LoRA Manager Unit Tests
+
+Küçük sentetik model ve sahte adapter dosyaları ile LoRAManager testleri.
+"""
+
+import pytest
+import sys
+import json
+from pathlib import Path
+
+# Proje root'unu path'e ekle
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import mlx.core as mx
+from mlx.utils import tree_flatten
+from mlx_lm.models import llama
+from mlx_lm.tuner.utils import linear_to_lora_layers
+from mlx_lm.utils import load_adapters
+
+from src.experts import lora_manager
+from src.experts.lora_manager import LoRAManager
+from src.experts.adapter_cache import AdapterCache, CostAwarePolicy
+from src.experts.prefetcher import AdapterPrefetcher
+from src.inference.scheduler import MLXDecodeBackend, _MLXSequence
+
+
+TINY_MODEL_ARGS = dict(
+    model_type="llama",
+    hidden_size=16,
+    num_hidden_layers=2,
+    intermediate_size=32,
+    num_attention_heads=2,
+    num_key_value_heads=2,
+    rms_norm_eps=1e-5,
+    vocab_size=32
+)
+
+TEST_INPUT = mx.array([[1, 2, 3, 4, 5]])
+
+
+def make_tiny_model():
+    """Her çağrıda aynı ağırlıklara sahip küçük bir llama modeli."""
+    mx.random.seed(0)
+    model = llama.Model(llama.ModelArgs(**TINY_MODEL_ARGS))
+    mx.eval(model.parameters())
+    return model
+
+
+def write_fake_adapter(adapters_dir: Path, name: str, seed: int, scale: float = 10.0, rank: int = 4, num_layers: int = 2):
+    """Rastgele LoRA ağırlıklarıyla adapters.safetensors + config yaz."""
+    probe = make_tiny_model()
+    linear_to_lora_layers(probe, num_layers, {"rank": rank, "scale": scale, "dropout": 0.0})
+
+    mx.random.seed(seed)
+    weights = {
+        k: mx.random.normal(v.shape) * 0.1
+        for k, v in tree_flatten(probe.parameters())
+        if k.endswith(("lora_a", "lora_b"))
+    }
+
+    adapter_dir = adapters_dir / name
+    adapter_dir.mkdir(parents=True)
+    mx.save_safetensors(str(adapter_dir / "adapters.safetensors"), weights)
+    with open(adapter_dir / "adapter_config.json", "w") as f:
+        json.dump({
+            "fine_tune_type": "lora",
+            "num_layers": num_layers,
+            "lora_parameters": {"rank": rank, "scale": scale, "dropout": 0.0}
+        }, f)
+
+    return adapter_dir, sum(v.nbytes for v in weights.values())
+
+
+def reference_logits(adapter_dir=None):
+    """mlx_lm'in kendi yükleme yolu ile beklenen çıktı."""
+    model = make_tiny_model()
+    if adapter_dir is not None:
+        load_adapters(model, str(adapter_dir))
+    model.eval()
+    return model(TEST_INPUT)
+
+
+@pytest.fixture
+def adapters_dir(tmp_path):
+    """İki sahte adapter içeren dizin."""
+    root = tmp_path / "adapters"
+    write_fake_adapter(root, "tr_chat_v2", seed=1)
+    write_fake_adapter(root, "python_coder_v2", seed=2, scale=20.0)
+    return root
+
+
+@pytest.fixture
+def load_calls(monkeypatch):
+    """mlx_lm.load yerine sentetik model döndür, çağrıları say."""
+    calls = []
+
+    def fake_load(path, adapter_path=None):
+        calls.append(adapter_path)
+        model = make_tiny_model()
+        if adapter_path is not None:
+            load_adapters(model, adapter_path)
+            model.eval()
+        return model, object()
+
+    monkeypatch.setattr(lora_manager, "load", fake_load)
+    return calls
+
+
+class TestSharedBase:
+    """Shared-base adapter modu testleri."""
+
+    def test_base_loaded_once(self, adapters_dir, load_calls):
+        """Adapter değişimlerinde base model tekrar yüklenmemeli."""
+        manager = LoRAManager(adapters_dir=str(adapters_dir), shared_base=True)
+
+        manager.load_adapter("tr_chat_v2")
+        manager.load_adapter("python_coder_v2")
+        manager.load_adapter("tr_chat_v2")
+        manager.load_base_model()
+
+        assert load_calls == [None]
+
+    def test_tokenizer_and_model_shared(self, adapters_dir, load_calls):
+        """Tüm adapter'lar aynı model ve tokenizer nesnesini paylaşmalı."""
+        manager = LoRAManager(adapters_dir=str(adapters_dir), shared_base=True)
+
+        model_a, tok_a = manager.load_adapter("tr_chat_v2")
+        model_b, tok_b = manager.load_adapter("python_coder_v2")
+
+        assert model_a is model_b
+        assert tok_a is tok_b
+
+    def test_outputs_match_full_load(self, adapters_dir, load_calls):
+        """Swap edilen adapter çıktısı tam yükleme ile aynı olmalı."""
+        manager = LoRAManager(adapters_dir=str(adapters_dir), shared_base=True)
+
+        for name in ["tr_chat_v2", "python_coder_v2", "tr_chat_v2"]:
+            model, _ = manager.load_adapter(name)
+            expected = reference_logits(adapters_dir / name)
+            assert mx.allclose(model(TEST_INPUT), expected, atol=1e-4).item()
+
+    def test_base_model_restored(self, adapters_dir, load_calls):
+        """load_base_model LoRA katkısını kaldırmalı."""
+        manager = LoRAManager(adapters_dir=str(adapters_dir), shared_base=True)
+
+        manager.load_adapter("python_coder_v2")
+        model, _ = manager.load_base_model()
+
+        assert manager.get_current_adapter() is None
+        assert mx.allclose(model(TEST_INPUT), reference_logits(), atol=1e-4).item()
+
+    def test_status_reports_pooled_adapters(self, tmp_path, load_calls):
+        """Status sadece adapter ağırlıklarının boyutunu raporlamalı."""
+        root = tmp_path / "adapters"
+        _, size = write_fake_adapter(root, "math_expert", seed=3)
+
+        manager = LoRAManager(adapters_dir=str(root), shared_base=True)
+        manager.load_adapter("math_expert")
+        status = manager.get_status()
+
+        assert status["shared_base"] is True
+        assert status["pooled_adapters"] == ["math_expert"]
+        assert status["pooled_adapter_mb"] == round(size / (1024 * 1024), 2)
+
+    def test_batched_steps_use_request_adapter(self, adapters_dir, load_calls):
+        """İstek yolu adapter değiştirse de her dizi kendi adapter'ı ile decode edilmeli."""
+        manager = LoRAManager(adapters_dir=str(adapters_dir), shared_base=True)
+        model, _ = manager.load_adapter("tr_chat_v2")
+        backend = MLXDecodeBackend(adapter_pool=manager.get_adapter_pool())
+        outputs = {"tr_chat_v2": [], "python_coder_v2": []}
+
+        def decode(name):
+            while True:
+                outputs[name].append(model(TEST_INPUT))
+                yield 1
+
+        detokenizer = type("Detok", (), {"last_segment": "", "add_token": lambda self, t: None})()
+        sequences = {
+            name: _MLXSequence(tokens=decode(name), detokenizer=detokenizer, eos_token_ids=[0],
+                               max_tokens=10, adapter=name)
+            for name in outputs
+        }
+
+        backend.step(model, [sequences["tr_chat_v2"]])
+        manager.load_adapter("python_coder_v2")       # başka isteğin geçişi
+        backend.step(model, [sequences["tr_chat_v2"]])
+        backend.step(model, [sequences["python_coder_v2"]])
+
+        for name, logits in outputs.items():
+            expected = reference_logits(adapters_dir / name)
+            assert all(mx.allclose(out, expected, atol=1e-4).item() for out in logits)
+
+    def test_cache_disabled_keeps_only_active_adapter(self, adapters_dir, load_calls):
+        """cache_adapters=False: pool'da sadece aktif adapter kalmalı, cache'e yazılmamalı."""
+        manager = LoRAManager(adapters_dir=str(adapters_dir), shared_base=True, cache_adapters=False)
+
+        manager.load_adapter("tr_chat_v2")
+        model, _ = manager.load_adapter("python_coder_v2")
+        status = manager.get_status()
+
+        assert status["pooled_adapters"] == ["python_coder_v2"]
+        assert status["cached_adapters"] == []
+        assert mx.allclose(model(TEST_INPUT), reference_logits(adapters_dir / "python_coder_v2"), atol=1e-4).item()
+
+    def test_default_mode_loads_full_model(self, adapters_dir, load_calls):
+        """Varsayılan mod eski davranışı korumalı."""
+        manager = LoRAManager(adapters_dir=str(adapters_dir))
+
+        manager.load_adapter("tr_chat_v2")
+        manager.load_adapter("python_coder_v2")
+
+        assert len(load_calls) == 2
+        assert all(path is not None for path in load_calls)
+
+
+class TestAdapterCache:
+    """Bellek bütçeli AdapterCache testleri."""
+
+    def test_lru_eviction(self):
+        """Bütçe aşılınca en eski kullanılan çıkmalı."""
+        cache = AdapterCache(max_bytes=200, policy="lru")
+        cache.put("a", 1, size_bytes=100)
+        cache.put("b", 2, size_bytes=100)
+        cache.get("a")
+
+        evicted = cache.put("c", 3, size_bytes=100)
+
+        assert evicted == ["b"]
+        assert cache.keys() == ["a", "c"]
+        assert cache.get_stats()["evictions"] == 1
+
+    def test_lfu_eviction(self):
+        """LFU en az hit alanı çıkarmalı."""
+        cache = AdapterCache(max_bytes=200, policy="lfu")
+        cache.put("a", 1, size_bytes=100)
+        cache.put("b", 2, size_bytes=100)
+        cache.get("b")
+        cache.get("a")
+        cache.get("a")
+
+        assert cache.put("c", 3, size_bytes=100) == ["b"]
+
+    def test_cost_aware_keeps_expensive_hot_adapter(self):
+        """Sık istenen ve yavaş yüklenen adapter cache'de kalmalı."""
+        frequency = {"hot": 50, "cold": 1}
+        cache = AdapterCache(max_bytes=200, policy=CostAwarePolicy(lambda n: frequency.get(n, 0)))
+        cache.put("hot", 1, size_bytes=100, load_time=3.0)
+        cache.put("cold", 2, size_bytes=100, load_time=3.0)
+
+        assert cache.put("new", 3, size_bytes=100, load_time=1.0) == ["cold"]
+
+    def test_protected_and_oversized(self):
+        """Korunan kayıt çıkarılmamalı, bütçeden büyük kayıt reddedilmeli."""
+        evicted = []
+        cache = AdapterCache(max_bytes=150, on_evict=lambda name, value: evicted.append(name))
+        cache.put("active", 1, size_bytes=100)
+
+        cache.put("other", 2, size_bytes=100, protect=["active"])
+        cache.put("huge", 3, size_bytes=500)
+
+        assert "active" in cache
+        assert "huge" not in cache
+        assert evicted == []
+        assert cache.get_stats()["rejected"] == 1
+
+    def test_hit_miss_counters(self):
+        """Hit/miss sayaçları ve hit rate."""
+        cache = AdapterCache()
+        cache.put("a", 1, size_bytes=10)
+        cache.get("a")
+        cache.get("b")
+
+        stats = cache.get_stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["hit_rate"] == 50.0
+
+    def test_shared_base_budget_evicts_pool_weights(self, adapters_dir, load_calls):
+        """Bütçe tek adapter alıyorsa pool'da sadece aktif adapter kalmalı."""
+        _, size = write_fake_adapter(adapters_dir, "math_expert", seed=3)
+        manager = LoRAManager(
+            adapters_dir=str(adapters_dir),
+            shared_base=True,
+            cache_max_bytes=size
+        )
+
+        manager.load_adapter("tr_chat_v2")
+        model, _ = manager.load_adapter("math_expert")
+        status = manager.get_status()
+
+        assert status["pooled_adapters"] == ["math_expert"]
+        assert status["cache"]["evictions"] == 1
+        assert mx.allclose(model(TEST_INPUT), reference_logits(adapters_dir / "math_expert"), atol=1e-4).item()
+
+
+class FakeManager:
+    """Prefetcher için minimal LoRAManager taklidi."""
+
+    def __init__(self):
+        self.prefetched = []
+
+    def get_adapter_for_intent(self, intent):
+        return LoRAManager.ADAPTER_REGISTRY.get(intent)
+
+    def prefetch(self, adapter_name):
+        self.prefetched.append(adapter_name)
+        return True
+
+
+class TestAdapterPrefetcher:
+    """Tahmine dayalı adapter ön yükleme testleri."""
+
+    def test_router_scores_drive_prediction(self):
+        """Geçiş verisi yokken router'ın ikinci adayı ön yüklenmeli."""
+        manager = FakeManager()
+        prefetcher = AdapterPrefetcher(manager)
+        scores = {"general_chat": 0.80, "code_python": 0.78, "history": 0.30}
+
+        scheduled = prefetcher.on_request("s1", "general_chat", "tr_chat_v2", scores)
+        prefetcher.wait_idle()
+
+        assert scheduled == ["python_coder_v2"]
+        assert manager.prefetched == ["python_coder_v2"]
+        prefetcher.close()
+
+    def test_transitions_learned_per_session(self):
+        """Tekrarlanan geçişler tahmini belirlemeli."""
+        prefetcher = AdapterPrefetcher(FakeManager(), transition_weight=1.0)
+        for _ in range(3):
+            prefetcher.on_request("s1", "code_python", "python_coder_v2")
+            prefetcher.on_request("s1", "code_math", "math_expert")
+
+        prediction = prefetcher.predict("code_python", exclude="python_coder_v2")
+
+        assert prediction[0] == ("math_expert", 1.0)
+        prefetcher.close()
+
+    def test_accuracy_and_wasted_loads(self):
+        """Doğru ve boşa giden ön yüklemeler sayılmalı."""
+        prefetcher = AdapterPrefetcher(FakeManager())
+        scores = {"general_chat": 0.80, "code_python": 0.78}
+
+        prefetcher.on_request("s1", "general_chat", "tr_chat_v2", scores)
+        prefetcher.wait_idle()
+        prefetcher.on_request("s1", "code_python", "python_coder_v2", {"code_python": 0.9, "general_chat": 0.88})
+        prefetcher.wait_idle()
+        prefetcher.on_request("s1", "history", "history_expert")
+
+        stats = prefetcher.get_stats()
+        assert stats["predictions"] == 2
+        assert stats["correct_predictions"] == 1
+        assert stats["useful_loads"] == 1
+        assert stats["wasted_loads"] == 1
+        assert stats["accuracy"] == 50.0
+        prefetcher.close()
+
+    def test_prefetch_makes_next_switch_a_cache_hit(self, adapters_dir, load_calls):
+        """Shared base'de ön yüklenen adapter aktif edilmeden pool'a girmeli."""
+        manager = LoRAManager(adapters_dir=str(adapters_dir), shared_base=True)
+        manager.load_adapter("tr_chat_v2")
+
+        assert manager.prefetch("python_coder_v2") is True
+        assert manager.get_current_adapter() == "tr_chat_v2"
+        assert manager.prefetch("python_coder_v2") is False
+
+        model, _ = manager.load_adapter("python_coder_v2")
+        status = manager.get_status()
+
+        assert status["cache"]["adapters"]["python_coder_v2"]["hits"] == 1
+        assert mx.allclose(model(TEST_INPUT), reference_logits(adapters_dir / "python_coder_v2"), atol=1e-4).item()
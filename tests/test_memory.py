@@ -4,6 +4,7 @@ EVO-TR: Memory Module Unit Tests
 Hafıza sistemi testleri.
 """
 
+import functools
 import pytest
 import sys
 import os
@@ -16,6 +17,7 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 from src.memory.chromadb_handler import MemoryHandler
 from src.memory.context_buffer import ContextBuffer, Message
 from src.memory.memory_manager import MemoryManager
+from src.services.token_counter import TokenCounter, MESSAGE_OVERHEAD_TOKENS
 
 
 # Test için geçici dizin
@@ -120,6 +122,90 @@ class TestContextBuffer:
         msg = buffer.get_last_user_message()
         assert msg.intent == "code_python"
         assert msg.metadata["topic"] == "programming"
+    
+    def test_token_limit_uses_tokenizer_counts(self):
+        """Tokenizer bağlıyken limit gerçek token sayısıyla uygulanmalı."""
+        
+        class WordTokenizer:
+            def encode(self, text, add_special_tokens=False):
+                return text.split()
+        
+        counter = TokenCounter(tokenizer=WordTokenizer())
+        buffer = ContextBuffer(max_messages=100, max_tokens=2 * (3 + MESSAGE_OVERHEAD_TOKENS), token_counter=counter)
+        
+        # Karakter tahmini ~50 token derdi, gerçek sayım 3 token
+        buffer.add_user_message("uzuuuuuuuuuuuuuuuuuuuuuuuuuuuuun " * 3)
+        buffer.add_user_message("bir iki üç")
+        assert buffer.message_count == 2
+        
+        buffer.add_user_message("dört beş altı")
+        assert buffer.message_count == 2
+        assert buffer.total_tokens == 2 * (3 + MESSAGE_OVERHEAD_TOKENS)
+    
+    def test_running_total_matches_recount(self):
+        """Artımlı toplam, mesajlar baştan sayılınca çıkan değere eşit olmalı."""
+        counter = TokenCounter()
+        buffer = ContextBuffer(max_messages=50, max_tokens=400, system_prompt="Sistem", token_counter=counter)
+        
+        for i in range(200):
+            buffer.add_user_message("x" * (i % 37) + f" mesaj {i}")
+        
+        recount = counter.count_message("Sistem") + sum(
+            counter.count_message(m.content) for m in buffer.get_messages()
+        )
+        assert buffer.total_tokens == recount
+        assert buffer.total_tokens <= 400
+    
+    def test_tokenizer_change_resyncs_total(self):
+        """Tokenizer bağlanınca toplam gerçek sayımla yeniden hesaplanmalı."""
+        
+        class WordTokenizer:
+            name_or_path = "word"
+            vocab_size = 100
+            
+            def encode(self, text, add_special_tokens=False):
+                return text.split()
+        
+        counter = TokenCounter()
+        buffer = ContextBuffer(max_messages=10, max_tokens=10000, token_counter=counter)
+        buffer.add_user_message("bir iki üç dört beş altı yedi sekiz")
+        
+        counter.set_tokenizer(WordTokenizer())
+        assert buffer.total_tokens == 8 + MESSAGE_OVERHEAD_TOKENS
+    
+    def test_snapshot_reused_until_change(self):
+        """Buffer değişmedikçe aynı anlık görüntü dönmeli."""
+        buffer = ContextBuffer()
+        buffer.add_user_message("Soru")
+        
+        first = buffer.get_messages()
+        assert buffer.get_messages() is first
+        
+        buffer.add_assistant_message("Cevap")
+        second = buffer.get_messages()
+        assert second is not first
+        assert [m.content for m in second] == ["Soru", "Cevap"]
+        
+        history = buffer.get_chat_history(include_system=False)
+        history.append({"role": "user", "content": "çağıranın listesi"})
+        history[0]["content"] = "değiştirildi"
+        assert buffer.get_chat_history(include_system=False) == [
+            {"role": "user", "content": "Soru"},
+            {"role": "assistant", "content": "Cevap"}
+        ]
+    
+    def test_json_roundtrip_keeps_totals(self):
+        """JSON'dan yüklenen buffer token toplamını korumalı."""
+        buffer = ContextBuffer(max_messages=5, max_tokens=1000, system_prompt="Sen bir asistansın.")
+        buffer.add_user_message("Merhaba")
+        buffer.add_assistant_message("Selam, nasıl yardımcı olabilirim?")
+        
+        restored = ContextBuffer.from_json(buffer.export_to_json())
+        
+        assert restored.message_count == 2
+        assert restored.total_tokens == buffer.total_tokens
+        restored.add_user_message("Yeni mesaj")
+        assert restored.message_count == 3
 
 
 class TestMemoryHandler:
@@ -401,6 +487,551 @@ class TestMemoryManager:
         assert messages[2]["role"] == "assistant"
 
 
+class WordHashEncoder:
+    """Kelime hash'lerinden deterministik embedding üreten encoder (model indirmeden)."""
+    
+    dim = 64
+    
+    def __init__(self):
+        self.calls = []
+    
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+    
+    def encode(self, texts, show_progress_bar=False, batch_size=32):
+        import zlib
+        import numpy as np
+        self.calls.append(list(texts))
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for word in text.lower().split():
+                out[i, zlib.crc32(word.encode("utf-8")) % self.dim] += 1.0
+            out[i, 0] += 0.1
+        return out
+
+
+@pytest.fixture
+def encoder():
+    """Encode çağrılarını kaydeden sahte encoder."""
+    return WordHashEncoder()
+
+
+@pytest.fixture
+def make_handler(tmp_path, encoder):
+    """
+    WordHashEncoder kullanan MemoryHandler fabrikası.
+    
+    Aynı testte üretilen handler'lar aynı dizini ve embedding servisini paylaşır;
+    test bitince hepsi kapatılır.
+    """
+    from src.services.embedding_service import EmbeddingService
+    service = EmbeddingService(model=encoder)
+    handlers = []
+    
+    def make(collection_name, write_behind=False, hybrid_search=False, **kwargs):
+        handler = MemoryHandler(
+            persist_path=str(tmp_path / "chromadb"),
+            collection_name=collection_name,
+            embedding_service=service,
+            write_behind=write_behind,
+            hybrid_search=hybrid_search,
+            **kwargs
+        )
+        handlers.append(handler)
+        return handler
+    
+    yield make
+    for handler in handlers:
+        handler.close()
+
+
+class TestWriteBehind:
+    """Write-behind konuşma hafızası testleri."""
+    
+    @pytest.fixture
+    def handler(self, make_handler):
+        return make_handler(
+            "test_write_behind",
+            write_behind=True,
+            write_batch_size=4,
+            write_flush_interval=60.0
+        )
+    
+    def test_conversation_is_deferred(self, handler, encoder):
+        """add_conversation encode/yazma yapmadan dönmeli."""
+        doc_id = handler.add_conversation("Benim adım Kaan", "Merhaba Kaan!")
+        
+        assert doc_id is not None
+        assert handler.collection.count() == 0
+        assert encoder.calls == []
+        assert handler.get_stats()["total_documents"] == 1
+    
+    def test_read_your_writes(self, handler):
+        """Yazılmamış konuşma search'te bulunmalı."""
+        doc_id = handler.add_conversation("Benim adım Kaan", "Merhaba Kaan!")
+        
+        results = handler.search("benim adım", top_k=3, min_score=0.1)
+        
+        assert results[0]["id"] == doc_id
+        assert handler.collection.count() == 0
+    
+    def test_flush_writes_one_batch(self, handler, encoder):
+        """Kuyruk tek encode + tek collection.add ile yazılmalı."""
+        for i in range(3):
+            handler.add_conversation(f"soru {i}", f"cevap {i}")
+        
+        assert handler.flush() == 3
+        assert handler.collection.count() == 3
+        assert len(encoder.calls) == 1
+        stats = handler.get_stats()["write_behind"]
+        assert stats["flushes"] == 1
+        assert stats["pending"] == 0
+    
+    def test_flush_invalidates_search_cache(self, handler):
+        """Dense modda da flush arama cache neslini artırmalı (overlay'den çıkan belge kaybolmasın)."""
+        from src.memory.search_cache import get_generation
+        handler.add_conversation("Benim adım Kaan", "Merhaba Kaan!")
+        generation = get_generation(handler._collection_key)
+        
+        handler.flush()
+        
+        assert handler.bm25 is None
+        assert get_generation(handler._collection_key) > generation
+    
+    def test_size_threshold_triggers_flush(self, handler):
+        """write_batch_size dolunca arka planda yazılmalı."""
+        import time
+        for i in range(4):
+            handler.add_conversation(f"soru {i}", f"cevap {i}")
+        
+        deadline = time.time() + 5
+        while handler.collection.count() < 4 and time.time() < deadline:
+            time.sleep(0.02)
+        
+        assert handler.collection.count() == 4
+    
+    def test_delete_pending(self, handler):
+        """Yazılmamış belge silinince hiç yazılmamalı."""
+        doc_id = handler.add_conversation("geçici", "silinecek")
+        handler.delete(doc_id)
+        handler.flush()
+        
+        assert handler.collection.count() == 0
+    
+    def test_close_flushes(self, handler):
+        """Kapanışta bekleyenler yazılmalı."""
+        handler.add_conversation("son mesaj", "kapanış")
+        handler.close()
+        
+        assert handler.collection.count() == 1
+    
+    def test_bad_document_does_not_block_batch(self, handler):
+        """Reddedilen belge ayıklanmalı, max_retries sonra hata listesine düşmeli."""
+        handler.add_conversation("soru 1", "cevap 1")
+        bad_id = handler.add_memory("bozuk metadata", metadata={"tags": {"set"}}, defer=True)
+        handler.add_conversation("soru 2", "cevap 2")
+        
+        assert handler.flush() == 2
+        assert handler.collection.count() == 2
+        assert handler.write_behind.pending_count == 1
+        
+        handler.flush()
+        handler.flush()
+        failed = handler.write_behind.get_failed()
+        
+        assert handler.write_behind.pending_count == 0
+        assert [f["id"] for f in failed] == [bad_id]
+        assert failed[0]["attempts"] == 3
+        assert handler.get_stats()["write_behind"]["failed"] == 1
+    
+    def test_backpressure_bounds_queue(self, handler):
+        """Kuyruk max_pending'e ulaşınca add() flush etmeli, kuyruk büyümemeli."""
+        buffer = handler.write_behind
+        buffer.max_pending = 4
+        for i in range(4):
+            handler.add_memory(f"bozuk {i}", metadata={"tags": {i}}, defer=True)
+        
+        handler.add_conversation("sağlam", "belge")
+        handler.flush()
+        
+        assert buffer.pending_count == 0
+        assert len(buffer.get_failed()) == 4
+        assert handler.collection.count() == 1
+        assert buffer.get_stats()["backpressure_flushes"] >= 1
+
+
+class TestBulkIngestion:
+    """add_memories_bulk testleri."""
+    
+    @pytest.fixture
+    def handler(self, make_handler):
+        return make_handler("test_bulk")
+    
+    def test_bulk_add_in_batches(self, handler, encoder):
+        """Generator girdisi batch'ler halinde encode edilip yazılmalı."""
+        items = ((f"bilgi numarası {i}", {"topic": "test"}) for i in range(10))
+        
+        stats = handler.add_memories_bulk(items, batch_size=4)
+        
+        assert stats["added"] == 10
+        assert stats["batches"] == 3
+        assert handler.collection.count() == 10
+        assert [len(c) for c in encoder.calls] == [4, 4, 2]
+        assert stats["docs_per_second"] > 0
+    
+    def test_bulk_deduplicates_by_content(self, handler):
+        """Aynı içerik aynı çağrıda ve tekrar aktarımda atlanmalı."""
+        first = handler.add_memories_bulk(["Python 1991", "Python  1991", "Ankara başkent"])
+        second = handler.add_memories_bulk(["Ankara başkent", "Yeni bilgi"])
+        
+        assert first["added"] == 2
+        assert first["duplicates"] == 1
+        assert second["added"] == 1
+        assert second["duplicates"] == 1
+        assert handler.collection.count() == 3
+    
+    def test_bulk_without_dedupe_uses_full_ids(self, handler):
+        """deduplicate=False tam uuid kullanmalı, aynı metinler ayrı belge olmalı."""
+        stats = handler.add_memories_bulk(["aynı bilgi"] * 3, deduplicate=False)
+        ids = handler.collection.get(include=[])["ids"]
+        
+        assert stats["added"] == 3
+        assert handler.collection.count() == 3
+        assert all(len(doc_id) == 32 for doc_id in ids)
+    
+    def test_bulk_metadata_and_types(self, handler):
+        """Tip ve metadata girdiden alınmalı, boş metinler atlanmalı."""
+        stats = handler.add_memories_bulk([
+            ("Kullanıcı çay sever", {"source": "import", "tags": ["içecek"]}, "preference"),
+            ("", None),
+            "Düz metin bilgi"
+        ])
+        
+        assert stats["added"] == 2
+        assert stats["skipped"] == 1
+        
+        results = handler.search("çay sever", top_k=1, memory_type="preference", min_score=0.1)
+        assert results[0]["metadata"]["source"] == "import"
+        assert results[0]["metadata"]["tags"] == '["içecek"]'
+
+
+class TestSearchCache:
+    """Arama sonucu cache testleri."""
+    
+    @pytest.fixture
+    def make_handler(self, make_handler):
+        return functools.partial(make_handler, "test_search_cache")
+    
+    def test_repeated_query_hits_cache(self, make_handler):
+        """Aynı (normalize) sorgu ikinci kez ChromaDB'ye gitmemeli."""
+        handler = make_handler()
+        handler.add_memory("Türk kahvesi tarifi", memory_type="fact")
+        
+        first = handler.search("kahvesi tarifi", min_score=0.1)
+        second = handler.search("  kahvesi   tarifi ", min_score=0.1)
+        
+        assert first == second
+        stats = handler.get_stats()["search_cache"]
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+    
+    def test_write_invalidates(self, make_handler):
+        """add_memory / delete sonrası sonuçlar yenilenmeli."""
+        handler = make_handler()
+        handler.search("kahve tarifi", min_score=0.1)
+        
+        doc_id = handler.add_memory("kahve tarifi burada")
+        assert handler.search("kahve tarifi", min_score=0.1)[0]["id"] == doc_id
+        
+        handler.delete(doc_id)
+        assert handler.search("kahve tarifi", min_score=0.1) == []
+        assert handler.search_cache.get_stats()["invalidated"] == 2
+    
+    def test_other_handler_writes_invalidate(self, make_handler):
+        """Aynı collection'a başka handler yazınca da geçersiz olmalı."""
+        reader = make_handler()
+        writer = make_handler()
+        assert reader.search("ankara başkent", min_score=0.1) == []
+        
+        writer.add_memory("ankara başkent")
+        
+        assert len(reader.search("ankara başkent", min_score=0.1)) == 1
+    
+    def test_ttl_expiry(self, make_handler):
+        """TTL dolan sonuç tekrar aranmalı."""
+        import time
+        handler = make_handler(search_cache_ttl=0.05)
+        handler.search("bir şey", min_score=0.1)
+        time.sleep(0.1)
+        handler.search("bir şey", min_score=0.1)
+        
+        assert handler.search_cache.get_stats()["expired"] == 1
+    
+    def test_cached_results_are_copies(self, make_handler):
+        """Dönen sonucu değiştirmek önbelleği bozmamalı."""
+        handler = make_handler()
+        handler.add_memory("izmir ege")
+        
+        handler.search("izmir ege", min_score=0.1)[0]["metadata"]["type"] = "bozuk"
+        
+        assert handler.search("izmir ege", min_score=0.1)[0]["metadata"]["type"] == "conversation"
+
+
+class TestBatchSearch:
+    """search_batch / get_relevant_context_batch testleri."""
+    
+    @pytest.fixture
+    def handler(self, make_handler, encoder):
+        handler = make_handler("test_batch_search", search_cache_size=0)
+        handler.add_memories_bulk([
+            "Türk kahvesi cezvede pişirilir",
+            "Python listeleri sorted ile sıralanır",
+            "Ankara Türkiye'nin başkentidir"
+        ])
+        encoder.calls.clear()
+        return handler
+    
+    def test_matches_single_search(self, handler):
+        """Batch sonuçları tek tek aramayla aynı olmalı."""
+        queries = ["kahvesi cezvede", "Python listeleri", "başkentidir Ankara"]
+        
+        batch = handler.search_batch(queries, top_k=2, min_score=0.1)
+        single = [handler.search(q, top_k=2, min_score=0.1) for q in queries]
+        
+        assert batch == single
+        assert batch[0][0]["text"] == "Türk kahvesi cezvede pişirilir"
+    
+    def test_one_encode_for_all_queries(self, handler, encoder):
+        """Tüm sorgular tek encode çağrısında vektörleştirilmeli."""
+        handler.search_batch(["kahve", "python", "ankara", "kahve"], min_score=0.1)
+        
+        assert len(encoder.calls) == 1
+        assert len(encoder.calls[0]) == 3
+    
+    def test_context_batch(self, handler):
+        """Her sorgu kendi bağlamını almalı."""
+        contexts = handler.get_relevant_context_batch(["kahvesi cezvede", "bilinmeyen sorgu xyz"], top_k=1)
+        
+        assert "cezvede" in contexts[0]
+        assert len(contexts) == 2
+
+
+class TestHybridSearch:
+    """BM25 indeksi ve hibrit (dense + leksikal) arama testleri."""
+    
+    DOCS = [
+        "Cumhuriyet 1923 yılında ilan edildi",
+        "Türk kahvesi cezvede pişirilir",
+        "Boğaz köprüsü İstanbul'da iki yakayı bağlar",
+        "config_loader modülü ayarları okur"
+    ]
+    
+    @pytest.fixture
+    def make_handler(self, make_handler):
+        return functools.partial(make_handler, "test_hybrid", hybrid_search=True, search_cache_size=0)
+    
+    def test_turkish_normalization(self):
+        """Türkçe büyük/küçük harf ve ekler aynı terime inmeli."""
+        from src.memory.bm25_index import normalize_turkish, tokenize
+        
+        assert normalize_turkish("IŞIK İstanbul") == "isik istanbul"
+        assert tokenize("İstanbul'da") == tokenize("ISTANBUL")[:1] + ["da"]
+        assert tokenize("config_loader 1923") == ["config_loader", "1923"]
+    
+    def test_bm25_index_ranking(self):
+        """Nadir terimi içeren belge en üstte olmalı."""
+        from src.memory.bm25_index import BM25Index
+        
+        index = BM25Index()
+        index.add_many((str(i), text, "fact") for i, text in enumerate(self.DOCS))
+        
+        assert index.search("1923")[0][0] == "0"
+        assert index.search("istanbul")[0][0] == "2"
+        assert index.search("1923", memory_type="conversation") == []
+        
+        index.remove("0")
+        assert index.search("1923") == []
+    
+    def test_hybrid_finds_exact_terms(self, make_handler):
+        """Dense aramanın kaçırdığı birebir terimleri hibrit arama bulmalı."""
+        handler = make_handler()
+        handler.add_memories_bulk(self.DOCS)
+        
+        dense = handler.search("ISTANBUL", top_k=2, min_score=0.5, mode="dense")
+        hybrid = handler.search("ISTANBUL", top_k=2, min_score=0.5)
+        
+        assert dense == []
+        assert hybrid[0]["text"] == self.DOCS[2]
+        assert "rrf_score" in hybrid[0] and "bm25_score" in hybrid[0]
+        assert handler.search("config_loader", top_k=1)[0]["text"] == self.DOCS[3]
+    
+    def test_unknown_mode_rejected(self, make_handler):
+        """Yazım hatalı mode sessizce dense aramaya düşmemeli."""
+        handler = make_handler()
+        
+        with pytest.raises(ValueError):
+            handler.search("1923", mode="bm25")
+        with pytest.raises(ValueError):
+            handler.search_batch(["1923"], mode="Hybrid")
+    
+    def test_incremental_updates(self, make_handler):
+        """Ekleme, write-behind flush ve silme indeksi güncellemeli."""
+        handler = make_handler(write_behind=True, write_flush_interval=60)
+        doc_id = handler.add_memory("Sözleşme numarası ABC123 olarak kaydedildi")
+        handler.add_memory("Toplantı 2031 yılına ertelendi", defer=True)
+        
+        assert doc_id in handler.bm25
+        handler.flush()
+        assert handler.search("2031", top_k=1, min_score=0.9)[0]["text"].startswith("Toplantı")
+        
+        handler.delete(doc_id)
+        assert doc_id not in handler.bm25
+        assert handler.search("abc123", top_k=3, min_score=0.9) == []
+    
+    def test_persistence_and_rebuild(self, make_handler, tmp_path):
+        """İndeks snapshot + günlükten yüklenmeli, yoksa ChromaDB'den kurulmalı."""
+        handler = make_handler()
+        handler.add_memories_bulk(self.DOCS[:2])
+        handler.add_memory(self.DOCS[2])
+        log_files = list((tmp_path / "chromadb").glob("bm25_test_hybrid*"))
+        assert log_files
+        
+        reloaded = make_handler()
+        assert len(reloaded.bm25) == 3
+        assert reloaded.bm25.search("istanbul")[0][0] in reloaded.collection.get()["ids"]
+        
+        for path in log_files:
+            path.unlink()
+        rebuilt = make_handler()
+        assert len(rebuilt.bm25) == 3
+        assert rebuilt.get_stats()["search_mode"] == "hybrid"
+
+
+class TestCompaction:
+    """Hafıza sıkıştırma (yakın kopya + saklama) testleri."""
+    
+    @pytest.fixture
+    def handler(self, make_handler):
+        return make_handler("test_compaction", hybrid_search=True)
+    
+    def _add(self, handler, text, timestamp, memory_type="conversation"):
+        doc_id = handler.add_memory(text, memory_type=memory_type)
+        meta = handler.collection.get(ids=[doc_id])["metadatas"][0]
+        handler.collection.update(ids=[doc_id], metadatas=[{**meta, "timestamp": timestamp}])
+        return doc_id
+    
+    def test_merges_near_duplicates(self, handler):
+        """Aynı selamlaşmalar tek belgeye inmeli, en yenisi kalmalı."""
+        from src.memory.compaction import MemoryCompactor, CompactionPolicy
+        
+        for day in range(1, 5):
+            self._add(handler, "Kullanıcı: merhaba\nAsistan: merhaba nasılsın", f"2026-01-0{day}T10:00:00")
+        newest = self._add(handler, "Kullanıcı: merhaba\nAsistan: merhaba nasılsın", "2026-01-09T10:00:00")
+        other = self._add(handler, "Kullanıcı: python listeleri\nAsistan: sorted kullan", "2026-01-05T10:00:00")
+        
+        report = MemoryCompactor(handler, CompactionPolicy(max_age_days=None)).run()
+        
+        assert report.before_count == 6 and report.after_count == 2
+        assert report.duplicates_removed == 4 and report.clusters == 1
+        assert set(handler.collection.get()["ids"]) == {newest, other}
+        kept = handler.collection.get(ids=[newest])["metadatas"][0]
+        assert kept["merged_count"] == 5
+        assert kept["first_seen"] == "2026-01-01T10:00:00"
+        assert len(handler.bm25) == 2
+        assert report.to_dict()["removed"] == 4
+    
+    def test_scan_is_paged(self, handler):
+        """Collection batch_size'lık sayfalarla okunmalı; yaşa göre silme varsayılan olarak kapalı."""
+        from src.memory.compaction import MemoryCompactor, CompactionPolicy
+        
+        for day in range(1, 6):
+            self._add(handler, "Kullanıcı: günaydın\nAsistan: günaydın", f"2020-01-0{day}T10:00:00")
+        self._add(handler, "Kullanıcı: python listeleri\nAsistan: sorted kullan", "2020-01-05T10:00:00")
+        
+        collection = handler.collection
+        page_sizes = []
+        
+        class RecordingCollection:
+            def __getattr__(self, name):
+                return getattr(collection, name)
+            
+            def get(self, **kwargs):
+                page = collection.get(**kwargs)
+                if "embeddings" in kwargs.get("include", []):
+                    page_sizes.append(len(page["ids"]))
+                return page
+        
+        handler.collection = RecordingCollection()
+        report = MemoryCompactor(handler, CompactionPolicy(batch_size=2)).run()
+        handler.collection = collection
+        
+        assert page_sizes == [2, 2, 2, 0]
+        assert report.duplicates_removed == 4 and report.expired_removed == 0
+        assert collection.count() == 2
+    
+    def test_retention_policy(self, handler):
+        """Eski ve az kullanılan konuşmalar silinmeli; fact ve sık tekrarlananlar kalmalı."""
+        from datetime import datetime
+        from src.memory.compaction import MemoryCompactor, CompactionPolicy
+        
+        old = self._add(handler, "Kullanıcı: hava nasıl\nAsistan: güneşli", "2025-01-01T10:00:00")
+        fact = self._add(handler, "Ankara Türkiye'nin başkentidir", "2025-01-01T10:00:00", "fact")
+        recent = self._add(handler, "Kullanıcı: kahve tarifi\nAsistan: cezve kullan", "2026-01-01T10:00:00")
+        for month in range(1, 4):
+            self._add(handler, "Kullanıcı: saat kaç\nAsistan: bilmiyorum", f"2025-0{month}-01T10:00:00")
+        
+        policy = CompactionPolicy(max_age_days=90, keep_if_merged=3)
+        compactor = MemoryCompactor(handler, policy)
+        
+        dry = compactor.run(dry_run=True, now=datetime(2026, 1, 15))
+        assert dry.after_count == 3 and handler.collection.count() == 6
+        
+        report = compactor.run(now=datetime(2026, 1, 15))
+        remaining = set(handler.collection.get()["ids"])
+        
+        assert report.expired_removed == 1 and report.duplicates_removed == 2
+        assert old not in remaining
+        assert {fact, recent} <= remaining
+        assert len(remaining) == 3
+    
+    def test_async_processor_hook(self, handler, tmp_path):
+        """Gece analizi politika verildiğinde sıkıştırmayı çalıştırmalı."""
+        from src.lifecycle.async_processor import create_async_processor
+        from src.memory.compaction import CompactionPolicy
+        
+        for _ in range(3):
+            handler.add_memory("Kullanıcı: selam\nAsistan: selam")
+        processor = create_async_processor(
+            log_dir=str(tmp_path / "logs"),
+            memory_handler=handler,
+            compaction_policy=CompactionPolicy(max_age_days=None)
+        )
+        
+        results = processor.run_full_analysis("2026-01-01")
+        
+        assert results["memory_compaction"]["after_count"] == 1
+        assert handler.collection.count() == 1
+    
+    def test_compaction_only_handler(self, handler, tmp_path):
+        """compaction_handler sıkıştırılmalı ama çıkarılan bilgiler ona yazılmamalı."""
+        from src.lifecycle.async_processor import create_async_processor
+        from src.memory.compaction import CompactionPolicy
+        
+        for _ in range(2):
+            handler.add_memory("Kullanıcı: selam\nAsistan: selam")
+        processor = create_async_processor(
+            log_dir=str(tmp_path / "logs"),
+            compaction_handler=handler,
+            compaction_policy=CompactionPolicy(max_age_days=None)
+        )
+        processor.sync_to_memory = lambda facts: pytest.fail("bilgi senkronu çalışmamalı")
+        
+        results = processor.run_full_analysis("2026-01-01")
+        
+        assert "facts_synced_to_memory" not in results
+        assert results["memory_compaction"]["after_count"] == 1
+
+
 class TestSemanticSimilarity:
     """Semantik benzerlik testleri."""
     
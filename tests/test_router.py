@@ -4,12 +4,18 @@ EVO-TR Router Unit Testleri
 
 import pytest
 import sys
+import json
+import zlib
 from pathlib import Path
 
+import numpy as np
+
 # Proje kökünü path'e ekle
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+from src.services import embedding_service
 from src.router.classifier import IntentClassifier, classify, route, get_classifier
+from src.router.knn_index import SampleIndex
 from src.router.api import route_message, route_with_details, get_router_info
 
 
@@ -153,5 +159,233 @@ class TestEdgeCases:
         assert result is not None
 
 
+class FakeEncoder:
+    """Kelime hash'lerinden deterministik embedding üreten encoder."""
+    
+    dim = 32
+    
+    def __init__(self, model_path=None):
+        self.encode_calls = 0
+    
+    def encode(self, texts, show_progress_bar=False, batch_size=32):
+        self.encode_calls += 1
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for word in text.lower().split():
+                out[i, zlib.crc32(word.encode("utf-8")) % self.dim] += 1.0
+            out[i, 0] += 0.1
+        return out
+
+
+def use_fake_encoder(monkeypatch):
+    """Süreç geneli embedding servisini sahte encoder ile sıfırla"""
+    monkeypatch.setattr(embedding_service, "SentenceTransformer", FakeEncoder)
+    monkeypatch.setattr(embedding_service, "_services", {})
+
+
+@pytest.fixture
+def fake_classifier(monkeypatch, tmp_path):
+    """Gerçek dataset ve mapping, sahte encoder ile classifier"""
+    use_fake_encoder(monkeypatch)
+    return IntentClassifier(cache_dir=str(tmp_path / "router_cache"))
+
+
+class TestVectorizedScoring:
+    """Centroid matrisi ile vektörel skorlama testleri"""
+    
+    MESSAGES = [
+        "Merhaba, nasılsın?",
+        "Python'da liste nasıl oluşturulur?",
+        "DNA yapısını açıkla",
+        "Osmanlı İmparatorluğu ne zaman kuruldu?",
+        ""
+    ]
+    
+    def test_centroid_matrix_normalized(self, fake_classifier):
+        """Centroid matrisi intent başına normalize bir satır içermeli"""
+        matrix = fake_classifier.centroid_matrix
+        assert matrix.shape == (len(fake_classifier.intent_embeddings), FakeEncoder.dim)
+        assert np.allclose(np.linalg.norm(matrix, axis=1), 1.0, atol=1e-5)
+    
+    def test_matches_per_intent_cosine(self, fake_classifier):
+        """Matris skorları intent başına cosine ile aynı olmalı"""
+        text = "Python'da liste nasıl oluşturulur?"
+        query = fake_classifier.model.encode([text])[0]
+        result = fake_classifier.predict(text)
+        
+        for intent, centroid in fake_classifier.intent_embeddings.items():
+            expected = float(
+                np.dot(query, centroid) / (np.linalg.norm(query) * np.linalg.norm(centroid))
+            )
+            assert result["all_scores"][intent] == pytest.approx(expected, abs=1e-5)
+        assert result["intent"] == max(result["all_scores"], key=result["all_scores"].get)
+    
+    def test_predict_batch_single_encode(self, fake_classifier):
+        """predict_batch tek encode çağrısı yapmalı ve predict ile aynı sonucu vermeli"""
+        calls_before = fake_classifier.model.get_stats()["encode_calls"]
+        batch = fake_classifier.predict_batch(self.MESSAGES)
+        assert fake_classifier.model.get_stats()["encode_calls"] == calls_before + 1
+        
+        for text, result in zip(self.MESSAGES, batch):
+            single = fake_classifier.predict(text)
+            assert result["intent"] == single["intent"]
+            assert result["adapter_id"] == single["adapter_id"]
+            assert result["confidence"] == pytest.approx(single["confidence"], abs=1e-6)
+    
+    def test_predict_batch_empty(self, fake_classifier):
+        """Boş liste boş sonuç döndürmeli"""
+        assert fake_classifier.predict_batch([]) == []
+
+
+
+class TestCentroidCache:
+    """Diskteki centroid cache testleri"""
+    
+    @pytest.fixture
+    def setup(self, monkeypatch, tmp_path):
+        """Sahte encoder, geçici dataset kopyası ve cache dizini"""
+        use_fake_encoder(monkeypatch)
+        root = Path(__file__).parent.parent
+        dataset = json.loads((root / "data/intents/intent_dataset.json").read_text(encoding="utf-8"))
+        dataset_path = tmp_path / "intent_dataset.json"
+        dataset_path.write_text(json.dumps(dataset, ensure_ascii=False), encoding="utf-8")
+        
+        def build():
+            return IntentClassifier(
+                dataset_path=str(dataset_path),
+                mapping_path=str(root / "configs/intent_mapping.json"),
+                cache_dir=str(tmp_path / "cache")
+            )
+        
+        return build, dataset, dataset_path
+    
+    def test_unchanged_dataset_skips_encoding(self, setup):
+        """Dataset değişmediyse encoder hiç çağrılmamalı"""
+        build, _, _ = setup
+        first = build()
+        encoded_before = first.model.get_stats()["encoded_texts"]
+        second = build()
+        
+        assert second.model.get_stats()["encoded_texts"] == encoded_before
+        assert second.intent_names == first.intent_names
+        assert np.allclose(second.centroid_matrix, first.centroid_matrix)
+    
+    def test_added_samples_encoded_incrementally(self, setup, monkeypatch):
+        """Yeni örnek eklenince sadece o örnek encode edilmeli"""
+        build, dataset, dataset_path = setup
+        build()
+        
+        dataset["intents"].append({"text": "yepyeni bir tarih sorusu", "intent": "history"})
+        dataset_path.write_text(json.dumps(dataset, ensure_ascii=False), encoding="utf-8")
+        
+        encoded = []
+        original_encode = FakeEncoder.encode
+        
+        def tracking_encode(self, texts, **kwargs):
+            encoded.extend(texts)
+            return original_encode(self, texts, **kwargs)
+        
+        monkeypatch.setattr(FakeEncoder, "encode", tracking_encode)
+        rebuilt = build()
+        
+        assert encoded == ["yepyeni bir tarih sorusu"]
+        
+        fresh = IntentClassifier(
+            dataset_path=str(dataset_path),
+            mapping_path=str(Path(__file__).parent.parent / "configs/intent_mapping.json"),
+            cache_dir=None
+        )
+        assert np.allclose(rebuilt.centroid_matrix, fresh.centroid_matrix, atol=1e-6)
+
+
+
+class TestKNNRouting:
+    """k-NN routing modu testleri"""
+    
+    @pytest.fixture
+    def knn_classifier(self, monkeypatch, tmp_path):
+        use_fake_encoder(monkeypatch)
+        return IntentClassifier(cache_dir=str(tmp_path / "cache"), mode="knn", knn_k=1, knn_dtype="float32")
+    
+    def test_same_result_shape(self, knn_classifier):
+        """Sonuç sözlüğü centroid moduyla aynı yapıda olmalı"""
+        result = knn_classifier.predict("Merhaba, nasılsın?")
+        
+        assert set(result.keys()) == {"intent", "confidence", "adapter_id", "all_scores"}
+        assert set(result["all_scores"].keys()) == set(knn_classifier.intent_embeddings.keys())
+    
+    def test_dataset_sample_routes_to_own_intent(self, knn_classifier):
+        """k=1 ile dataset örneği kendi intent'ine yönlenmeli"""
+        sample = knn_classifier.dataset["intents"][0]
+        result = knn_classifier.predict(sample["text"])
+        
+        assert result["all_scores"][result["intent"]] == pytest.approx(1.0, abs=1e-5)
+    
+    def test_predict_batch_matches_predict(self, knn_classifier):
+        """predict_batch ve predict aynı sonucu vermeli"""
+        texts = [s["text"] for s in knn_classifier.dataset["intents"][:20]]
+        for text, result in zip(texts, knn_classifier.predict_batch(texts)):
+            assert result["intent"] == knn_classifier.predict(text)["intent"]
+    
+    def test_stats_report_index(self, knn_classifier):
+        """get_stats indeks bilgisini içermeli"""
+        stats = knn_classifier.get_stats()
+        assert stats["mode"] == "knn"
+        assert stats["knn_index"]["samples"] == len(knn_classifier.dataset["intents"])
+
+
+class TestSampleIndex:
+    """SampleIndex testleri"""
+    
+    @pytest.fixture
+    def data(self):
+        rng = np.random.default_rng(0)
+        embeddings = rng.normal(size=(500, 16)).astype(np.float32)
+        labels = [f"intent_{i % 5}" for i in range(500)]
+        queries = rng.normal(size=(20, 16)).astype(np.float32)
+        return embeddings, labels, queries
+    
+    def test_multimodal_intent(self):
+        """İki ayrı kümeli intent, ortalaması kaybolsa da doğru bulunmalı"""
+        embeddings = np.array([[1, 0, 0], [-1, 0, 0], [0, 1, 0]], dtype=np.float32)
+        index = SampleIndex(embeddings, ["a", "a", "b"], dtype="float32")
+        
+        scores = index.vote(np.array([[-0.9, 0.3, 0]], dtype=np.float32), k=1)
+        
+        assert index.label_names[int(np.argmax(scores[0]))] == "a"
+    
+    @pytest.mark.parametrize("dtype", ["float16", "int8"])
+    def test_compact_storage_close_to_float32(self, data, dtype):
+        """Kompakt saklama float32 skorlarına yakın olmalı"""
+        embeddings, labels, queries = data
+        exact = SampleIndex(embeddings, labels, dtype="float32")
+        compact = SampleIndex(embeddings, labels, dtype=dtype)
+        
+        compact_sims, _ = compact.search(queries, k=10)
+        exact_sims, _ = exact.search(queries, k=10)
+        
+        assert np.allclose(np.sort(compact_sims, axis=1), np.sort(exact_sims, axis=1), atol=0.02)
+        assert compact.get_stats()["memory_mb"] < exact.get_stats()["memory_mb"]
+    
+    def test_blocked_exact_search(self, data):
+        """Bloklu arama tek blokla aynı komşuları bulmalı"""
+        embeddings, labels, queries = data
+        full = SampleIndex(embeddings, labels, dtype="float32")
+        blocked = SampleIndex(embeddings, labels, dtype="float32", block_size=64)
+        
+        _, full_ids = full.search(queries, k=5)
+        _, blocked_ids = blocked.search(queries, k=5)
+        
+        assert np.array_equal(np.sort(full_ids, axis=1), np.sort(blocked_ids, axis=1))
+    
+    def test_ivf_full_probe_equals_exact(self, data):
+        """Tüm kümeler taranınca IVF kesin aramayla aynı olmalı"""
+        embeddings, labels, queries = data
+        exact = SampleIndex(embeddings, labels, dtype="float32")
+        ivf = SampleIndex(embeddings, labels, dtype="float32", index_type="ivf", n_lists=8, n_probe=8)
+        
+        assert np.allclose(ivf.vote(queries, k=10), exact.vote(queries, k=10), atol=1e-5)
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
@@ -0,0 +1,267 @@
+"""
+EVO-TR: Services Unit Tests
+
+Paylaşımlı servis testleri.
+"""
+
+import pytest
+import sys
+import asyncio
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+# Proje root'unu path'e ekle
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.services import embedding_service
+from src.services.embedding_service import EmbeddingService, get_embedding_service
+from src.services.embedding_batcher import EmbeddingBatcher
+from src.services.token_counter import TokenCounter, estimate_tokens
+
+
+class FakeEncoder:
+    """Kelime hash'lerinden deterministik embedding üreten encoder."""
+
+    dim = 16
+
+    def __init__(self, model_path=None):
+        self.calls = []
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+    def encode(self, texts, show_progress_bar=False, batch_size=32):
+        self.calls.append(list(texts))
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for word in text.lower().split():
+                out[i, zlib.crc32(word.encode("utf-8")) % self.dim] += 1.0
+            out[i, 0] += 0.1
+        return out
+
+
+@pytest.fixture
+def service():
+    return EmbeddingService(model=FakeEncoder(), cache_size=3)
+
+
+class TestEmbeddingService:
+    """EmbeddingService testleri."""
+
+    def test_normalized_text_hits_cache(self, service):
+        """Boşluk farkı olan aynı metin tekrar encode edilmemeli."""
+        first = service.encode("Merhaba   dünya")
+        second = service.encode(" Merhaba dünya ")
+
+        assert np.array_equal(first, second)
+        assert service.get_stats()["encode_calls"] == 1
+        assert service.get_stats()["hits"] == 1
+
+    def test_batch_encodes_only_missing_once(self, service):
+        """Batch'te sadece eksik ve tekrarsız metinler encode edilmeli."""
+        service.encode("a")
+        result = service.encode(["a", "b", "b"])
+
+        assert result.shape == (3, FakeEncoder.dim)
+        assert service.model.calls[-1] == ["b"]
+        assert np.array_equal(result[1], result[2])
+
+    def test_lru_eviction(self, service):
+        """cache_size aşılınca en eski vektör çıkmalı."""
+        service.encode(["a", "b", "c"])
+        service.encode("a")
+        service.encode("d")
+        service.encode("b")
+
+        assert service.model.calls[-1] == ["b"]
+        assert service.get_stats()["cached_vectors"] == 3
+
+    def test_use_cache_false_bypasses_lru(self, service):
+        """Toplu encode cache'i doldurmamalı."""
+        service.encode(["x", "y"], use_cache=False)
+
+        assert service.get_stats()["cached_vectors"] == 0
+        assert service.get_stats()["encoded_texts"] == 2
+
+    def test_process_wide_service_shared(self, monkeypatch):
+        """Aynı modelin iki yazımı tek servisi (ve tek modeli) paylaşmalı."""
+        monkeypatch.setattr(embedding_service, "SentenceTransformer", FakeEncoder)
+        monkeypatch.setattr(embedding_service, "_services", {})
+
+        a = get_embedding_service("paraphrase-multilingual-MiniLM-L12-v2")
+        b = get_embedding_service("sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
+
+        assert a is b
+        assert a.get_stats()["model_loaded"] is False
+        assert a.get_sentence_embedding_dimension() == FakeEncoder.dim
+
+    def test_router_and_memory_share_encode(self, monkeypatch, tmp_path):
+        """Aynı mesaj routing ve hafıza aramasında bir kez encode edilmeli."""
+        from src.router.classifier import IntentClassifier
+        from src.memory.chromadb_handler import MemoryHandler
+
+        monkeypatch.setattr(embedding_service, "SentenceTransformer", FakeEncoder)
+        monkeypatch.setattr(embedding_service, "_services", {})
+
+        router = IntentClassifier(cache_dir=None)
+        memory = MemoryHandler(persist_path=str(tmp_path / "chroma"), collection_name="shared_test")
+        assert router.model is memory._embedding_model
+
+        message = "Python'da liste nasıl oluşturulur?"
+        router.predict(message)
+        calls_after_routing = router.model.get_stats()["encode_calls"]
+        memory.search(message)
+        memory.add_memory(message)
+
+        assert router.model.get_stats()["encode_calls"] == calls_after_routing
+
+
+class TestEmbeddingBatcher:
+    """Micro-batching kuyruğu testleri."""
+
+    @pytest.fixture
+    def encoder(self):
+        return FakeEncoder()
+
+    def test_concurrent_sync_callers_share_batch(self, encoder):
+        """Eşzamanlı thread'lerin istekleri tek forward pass'te toplanmalı."""
+        batcher = EmbeddingBatcher(encoder.encode, max_batch_size=64, max_wait_ms=100)
+        texts = [f"mesaj {i}" for i in range(8)]
+        start = threading.Barrier(len(texts))
+
+        def call(text):
+            start.wait()
+            return batcher.encode([text])
+
+        with ThreadPoolExecutor(max_workers=len(texts)) as pool:
+            results = list(pool.map(call, texts))
+        batcher.close()
+
+        for text, result in zip(texts, results):
+            assert np.array_equal(result[0], encoder.encode([text])[0])
+        stats = batcher.get_stats()
+        assert stats["requests"] == 8
+        assert stats["batches"] < 8
+
+    def test_async_callers(self, encoder):
+        """await ile çağıranlar da aynı batch'i paylaşmalı."""
+        batcher = EmbeddingBatcher(encoder.encode, max_batch_size=64, max_wait_ms=50)
+
+        async def run():
+            return await asyncio.gather(*[batcher.encode_async([f"soru {i}"]) for i in range(5)])
+
+        results = asyncio.run(run())
+        batcher.close()
+
+        assert [r.shape for r in results] == [(1, FakeEncoder.dim)] * 5
+        assert batcher.get_stats()["batches"] == 1
+
+    def test_max_batch_size_and_dedup(self, encoder):
+        """Batch limiti aşılmamalı, tekrar eden metinler bir kez encode edilmeli."""
+        batcher = EmbeddingBatcher(encoder.encode, max_batch_size=4, max_wait_ms=50)
+        futures = [batcher.submit([f"m{i % 3}"]) for i in range(9)]
+        results = [f.result(timeout=5) for f in futures]
+        batcher.close()
+
+        assert all(len(call) <= 3 for call in encoder.calls)
+        assert np.array_equal(results[0], results[3])
+        assert batcher.get_stats()["max_batch_seen"] <= 4
+
+    def test_cancelled_request_skipped(self, encoder):
+        """İptal edilen istek encode edilmemeli."""
+        batcher = EmbeddingBatcher(encoder.encode, max_batch_size=64, max_wait_ms=50)
+        cancelled = batcher.submit(["iptal"])
+        kept = batcher.submit(["devam"])
+        cancelled.cancel()
+        kept.result(timeout=5)
+        batcher.close()
+
+        assert all("iptal" not in call for call in encoder.calls)
+        assert batcher.get_stats()["cancelled"] == 1
+
+    def test_service_routes_misses_through_batcher(self, service):
+        """Batching açıkken servis cache miss'lerini kuyruğa göndermeli."""
+        service.enable_batching(max_batch_size=8, max_wait_ms=20)
+        first = service.encode("merhaba dünya")
+        second = asyncio.run(service.encode_async("merhaba dünya"))
+        stats = service.get_stats()
+        service.disable_batching()
+
+        assert np.array_equal(first, second)
+        assert stats["batching"]["requests"] == 1
+        assert stats["hits"] == 1
+
+
+class WordTokenizer:
+    """Kelime başına bir token üreten sahte tokenizer."""
+
+    def __init__(self, name="word-tokenizer"):
+        self.name_or_path = name
+        self.vocab_size = 1000
+        self.calls = 0
+
+    def encode(self, text, add_special_tokens=False):
+        self.calls += 1
+        return text.split()
+
+    def decode(self, ids):
+        return " ".join(ids)
+
+
+class TestTokenCounter:
+    """Token sayacı testleri."""
+
+    def test_estimate_without_tokenizer(self):
+        """Tokenizer yokken karakter tahmini kullanılmalı."""
+        counter = TokenCounter()
+
+        assert counter.count("a" * 40) == estimate_tokens("a" * 40)
+        assert counter.get_stats()["mode"] == "estimate"
+
+    def test_tokenizer_counts_cached(self):
+        """Aynı metin ikinci kez tokenize edilmemeli."""
+        tokenizer = WordTokenizer()
+        counter = TokenCounter(tokenizer=tokenizer)
+        long_text = "kelime " * 100
+
+        assert counter.count("bir iki üç") == 3
+        assert counter.count("bir iki üç") == 3
+        assert counter.count(long_text) == 100
+        assert counter.count(long_text) == 100
+        assert tokenizer.calls == 2
+        assert counter.get_stats()["hits"] == 2
+
+    def test_lru_eviction(self):
+        """cache_size aşılınca en eski sayım çıkmalı."""
+        counter = TokenCounter(tokenizer=WordTokenizer(), cache_size=2)
+        counter.count_many(["a", "b", "c"])
+
+        assert counter.get_stats()["cached_counts"] == 2
+
+    def test_tokenizer_change_invalidates(self):
+        """Farklı sözlüklü tokenizer cache'i temizlemeli, aynı sözlük korumalı."""
+        counter = TokenCounter()
+        counter.count("bir iki")
+        counter.set_tokenizer(WordTokenizer())
+        assert counter.version == 1
+        assert counter.count("bir iki") == 2
+
+        # Adapter başına yüklenen aynı tokenizer sayımları bozmamalı
+        counter.set_tokenizer(WordTokenizer())
+        assert counter.version == 1
+        assert counter.get_stats()["cached_counts"] == 1
+
+        counter.set_tokenizer(WordTokenizer(name="other"))
+        assert counter.version == 2
+        assert counter.get_stats()["cached_counts"] == 0
+
+    def test_truncate(self):
+        """Metin token bütçesine kırpılmalı."""
+        counter = TokenCounter(tokenizer=WordTokenizer())
+
+        assert counter.truncate("bir iki üç dört", 2) == "bir iki"
+        assert counter.truncate("bir", 5) == "bir"
@@ -9,6 +9,8 @@ from pathlib import Path
 from datetime import datetime, timedelta
 from dataclasses import asdict
 
+import numpy as np
+
 # Add src to path
 sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
 
@@ -21,6 +23,7 @@ from ttt.test_time_training import (
     TestTimeTrainer,
     AdaptationStrategy
 )
+from ttt.stream_monitor import StreamQualityMonitor, has_repetition
 
 
 # ============================================================
@@ -693,6 +696,218 @@ class TestTestTimeTrainer:
         assert trainer.stats["total_queries"] == initial_queries + 1
 
 
+# ============================================================
+# Self-Correction Loop Tests
+# ============================================================
+
+class TestSelfCorrectionLoop:
+    """Model-in-the-loop self-correction Tests"""
+    
+    GOOD = "Python'da liste köşeli parantezle oluşturulur: my_list = [1, 2, 3]."
+    
+    def make_trainer(self, **kwargs):
+        config = TTTConfig(strategies=["context_cache", "self_correct"], **kwargs)
+        return TestTimeTrainer(config)
+    
+    def test_correction_replaces_response(self):
+        """Improved answer is returned and cached"""
+        trainer = self.make_trainer()
+        prompts = []
+        
+        def regenerate(prompt, max_tokens):
+            prompts.append((prompt, max_tokens))
+            return self.GOOD
+        
+        final, metadata = trainer.post_process(
+            "Python'da liste nasıl?", "Liste", "coding_python", "python_coder", regenerate_fn=regenerate
+        )
+        
+        assert final == self.GOOD
+        assert "Önceki yanıt: Liste" in prompts[0][0]
+        assert prompts[0][1] == 256
+        assert metadata["corrections"][0]["accepted"] is True
+        assert metadata["quality_gain"] > 0
+        assert trainer.cache.get("Python'da liste nasıl?").response == self.GOOD
+        assert trainer.get_statistics()["correction_by_intent"]["coding_python"]["attempts"] == 1
+        
+    def test_worse_answer_rejected(self):
+        """A regeneration that scores lower keeps the original"""
+        trainer = self.make_trainer()
+        
+        final, metadata = trainer.post_process(
+            "Selam", "Merhaba", "greeting", "tr_chat", regenerate_fn=lambda prompt, max_tokens: ""
+        )
+        
+        assert final == "Merhaba"
+        assert metadata["corrections"][0]["accepted"] is False
+        assert trainer.stats["corrections_accepted"] == 0
+        
+    def test_latency_budget(self):
+        """Intents whose corrections exceed the budget are skipped"""
+        import time
+        trainer = self.make_trainer(correction_budget_ms=30)
+        
+        def slow(prompt, max_tokens):
+            time.sleep(0.05)
+            return "Kısa"
+        
+        trainer.post_process("Soru bir", "Cevap", "math", "math_expert", regenerate_fn=slow)
+        _, metadata = trainer.post_process("Soru iki", "Cevap", "math", "math_expert", regenerate_fn=slow)
+        
+        assert metadata["corrections"][0]["skipped"] == "budget"
+        assert trainer.stats["corrections_skipped_budget"] == 1
+        
+    def test_first_correction_sized_to_budget(self):
+        """Without history, measured tokens/s caps max_tokens to the remaining budget"""
+        trainer = self.make_trainer(correction_budget_ms=1000)
+        calls = []
+        
+        trainer.post_process("Soru", "Cevap", "math", "math_expert",
+                             regenerate_fn=lambda p, n: calls.append(n) or self.GOOD,
+                             tokens_per_second=50)
+        _, metadata = trainer.post_process("Başka soru", "Cevap", "science", "science_expert",
+                                           regenerate_fn=lambda p, n: calls.append(n) or self.GOOD,
+                                           tokens_per_second=0.5)
+        
+        assert 0 < calls[0] <= 50
+        assert len(calls) == 1
+        assert metadata["corrections"][0]["skipped"] == "budget"
+        
+    def test_token_budget(self):
+        """Zero token budget means no regeneration"""
+        trainer = self.make_trainer(correction_token_budget=0)
+        calls = []
+        
+        trainer.post_process("Soru", "Cevap", "math", "math_expert",
+                             regenerate_fn=lambda p, n: calls.append(n) or self.GOOD)
+        
+        assert calls == []
+        
+    def test_regenerate_error_keeps_original(self):
+        """Errors during regeneration do not break post-processing"""
+        trainer = self.make_trainer()
+        
+        def broken(prompt, max_tokens):
+            raise RuntimeError("model busy")
+        
+        final, metadata = trainer.post_process("Soru", "Cevap", "math", "math_expert", regenerate_fn=broken)
+        
+        assert final == "Cevap"
+        assert metadata["corrections"][0]["error"] == "model busy"
+        
+    def test_context_dependent_answer_not_cached(self):
+        """Answers built from session history / memory context never reach the cache"""
+        trainer = self.make_trainer()
+        
+        _, metadata = trainer.post_process("Benim adım ne?", "Adın Kaan.", "memory_recall", "tr_chat",
+                                           cacheable=False)
+        
+        assert metadata["cached"] is False
+        assert trainer.adapt("Benim adım ne?", "memory_recall", "tr_chat")["cached_response"] is None
+        
+    def test_background_correction(self):
+        """Streamed answers are corrected off the reply path"""
+        trainer = self.make_trainer()
+        
+        thread = trainer.post_process_in_background(
+            "Python'da liste nasıl?", "Liste", "coding_python", "python_coder",
+            regenerate_fn=lambda prompt, max_tokens: self.GOOD
+        )
+        thread.join(timeout=5)
+        
+        assert trainer.adapt("Python'da liste nasıl?", "coding_python", "python_coder")["cached_response"] == self.GOOD
+
+
+# ============================================================
+# Streaming Quality Monitor Tests
+# ============================================================
+
+class TestStreamQualityMonitor:
+    """Üretim sırasında tekrar döngüsü tespiti"""
+    
+    INTRO = "Python'da liste oluşturmak için köşeli parantez kullanılır. "
+    LOOP = "Listeler sıralıdır ve değiştirilebilir. "
+    
+    @staticmethod
+    def feed_words(monitor, text):
+        """Metni kelime kelime token gibi besle; durduğu token sayısını döndür"""
+        for count, token in enumerate(text.split(" "), start=1):
+            if monitor.feed(token + " "):
+                return count
+        return None
+    
+    def test_stops_on_loop(self):
+        """Aynı cümle tekrarlanınca max_tokens dolmadan durmalı"""
+        monitor = StreamQualityMonitor()
+        text = self.INTRO + self.LOOP * 50
+        
+        stopped_at = self.feed_words(monitor, text)
+        
+        assert monitor.stopped
+        assert monitor.reason.startswith("repetition_loop")
+        assert stopped_at is not None and stopped_at < len(text.split(" ")) // 4
+        
+    def test_trimmed_text_keeps_first_copy(self):
+        """Kırpılmış metin giriş + döngünün ilk kopyası olmalı"""
+        monitor = StreamQualityMonitor()
+        self.feed_words(monitor, self.INTRO + self.LOOP * 50)
+        
+        assert monitor.trimmed_text() == (self.INTRO + self.LOOP).strip()
+        
+    def test_normal_text_not_stopped(self):
+        """Doğal metin (kısa tekrarlar dahil) durdurulmamalı"""
+        monitor = StreamQualityMonitor()
+        text = (
+            "Evet evet, anladım. Python'da liste köşeli parantezle oluşturulur. "
+            "Liste elemanlarına indeksle erişilir. Liste elemanları değiştirilebilir. "
+            "Bir listeye append ile eleman eklenir, pop ile eleman çıkarılır."
+        )
+        
+        assert self.feed_words(monitor, text) is None
+        assert not monitor.finish()
+        assert monitor.trimmed_text() == monitor.text
+        
+    def test_single_word_loop(self):
+        """Tek kelimelik dejenere döngü de yakalanmalı"""
+        monitor = StreamQualityMonitor()
+        
+        assert self.feed_words(monitor, "Cevap: " + "çok " * 100) is not None
+        assert monitor.trimmed_text() == "Cevap: çok"
+        
+    def test_split_tokens(self):
+        """Kelimeler token'lara bölünse de aynı sonuç"""
+        monitor = StreamQualityMonitor()
+        text = self.INTRO + self.LOOP * 20
+        
+        for i in range(0, len(text), 3):
+            if monitor.feed(text[i:i + 3]):
+                break
+        
+        assert monitor.stopped
+        assert monitor.trimmed_text() == (self.INTRO + self.LOOP).strip()
+        
+    def test_on_stop_callback(self):
+        """Durma anında callback (ör. yeniden deneme) tetiklenmeli"""
+        reasons = []
+        monitor = StreamQualityMonitor(on_stop=reasons.append)
+        self.feed_words(monitor, self.LOOP * 20)
+        
+        assert reasons == [monitor.reason]
+        assert monitor.feed("devam") is True
+        
+    def test_evaluate_response_repetition(self):
+        """SelfCorrector aynı tespit ile tekrarı işaretlemeli"""
+        corrector = SelfCorrector()
+        
+        _, issues = corrector.evaluate_response("Soru", "bir iki üç bir iki üç dört.", None)
+        _, clean = corrector.evaluate_response("Soru", "Bir iki üç dört beş altı yedi.", None)
+        
+        assert "repetition" in issues
+        assert "repetition" not in clean
+        assert has_repetition(self.LOOP * 5)
+        assert not has_repetition(self.INTRO)
+
+
 # ============================================================
 # Integration Tests
 # ============================================================
@@ -794,6 +1009,266 @@ class TestTTTIntegration:
             assert cached.context.get("user_id") == "test_user"
 
 
+# ============================================================
+# Expiry Tests
+# ============================================================
+
+class TestCacheExpiry:
+    """Monotonic expiry and heap-based TTL eviction Tests"""
+    
+    def test_entry_uses_slots(self):
+        """Entries carry no per-instance __dict__"""
+        cache = ContextCache(max_size=10)
+        entry = cache.put("Q", "R", {}, "tr_chat", 0.9)
+        
+        assert not hasattr(entry, "__dict__")
+        
+    def test_expiry_does_not_parse_timestamp(self):
+        """ISO timestamp is parsed once at construction"""
+        old_time = (datetime.now() - timedelta(hours=2)).isoformat()
+        entry = CacheEntry("Q", "h", "R", {}, "tr_chat", 0.9, timestamp=old_time)
+        entry.timestamp = "not-a-timestamp"
+        
+        assert entry.is_expired(60) is True
+        assert entry.is_expired(180) is False
+        
+    def test_put_drops_expired_before_lru(self):
+        """A full cache sheds stale entries instead of fresh LRU ones"""
+        import time
+        cache = ContextCache(max_size=3, ttl_minutes=0.0005)
+        cache.put("Q1", "R1", {}, "tr_chat", 0.9)
+        cache.put("Q2", "R2", {}, "tr_chat", 0.9)
+        time.sleep(0.05)
+        cache.ttl_minutes = 60
+        cache.put("Q3", "R3", {}, "tr_chat", 0.9)
+        cache.put("Q4", "R4", {}, "tr_chat", 0.9)
+        cache.put("Q5", "R5", {}, "tr_chat", 0.9)
+        
+        stats = cache.get_stats()
+        assert stats["expired"] == 2
+        assert stats["evictions"] == 0
+        assert [e.query for e in cache.cache.values()] == ["Q3", "Q4", "Q5"]
+        
+    def test_heap_stays_bounded(self):
+        """Re-putting the same key does not grow the expiry heap forever"""
+        cache = ContextCache(max_size=5)
+        for i in range(1000):
+            cache.put("Aynı soru", f"R{i}", {}, "tr_chat", 0.9)
+        
+        assert len(cache.cache) == 1
+        assert len(cache._expiry_heap) <= 2 * cache.max_size + 65
+
+
+# ============================================================
+# Semantic Cache Tests
+# ============================================================
+
+class BagOfWordsEncoder:
+    """Word-order independent encoder (no model download)"""
+    
+    dim = 64
+    
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+    
+    def encode(self, text):
+        import re
+        import zlib
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()):
+            vector[zlib.crc32(word.encode("utf-8")) % self.dim] += 1.0
+        return vector
+
+
+class TestSemanticCache:
+    """Semantic ContextCache Tests"""
+    
+    def make_cache(self, **kwargs):
+        return ContextCache(max_size=10, embedding_service=BagOfWordsEncoder(), **kwargs)
+    
+    def test_paraphrase_hit(self):
+        """Reordered query should hit the semantic path"""
+        cache = self.make_cache()
+        cache.put("Python'da liste nasıl oluşturulur?", "my_list = []", {}, "python_coder", 0.9,
+                  intent="coding_python")
+        
+        entry, similarity = cache.lookup("liste nasıl oluşturulur Python'da", intent="coding_python")
+        
+        assert entry is not None and entry.response == "my_list = []"
+        assert similarity >= cache.semantic_threshold
+        assert cache.get_stats()["semantic_hits"] == 1
+        
+    def test_exact_path_still_used(self):
+        """Exact query returns similarity 1.0"""
+        cache = self.make_cache()
+        cache.put("Merhaba", "Selam!", {}, "tr_chat", 0.9, intent="greeting")
+        
+        entry, similarity = cache.lookup("merhaba ", intent="greeting")
+        
+        assert entry is not None and similarity == 1.0
+        assert cache.get_stats()["semantic_hits"] == 0
+        
+    def test_scope_and_threshold(self):
+        """Other intents and dissimilar queries must miss"""
+        cache = self.make_cache()
+        cache.put("liste nasıl oluşturulur", "my_list = []", {}, "python_coder", 0.9,
+                  intent="coding_python")
+        
+        assert cache.get("oluşturulur nasıl liste", intent="math") is None
+        assert cache.get("sözlük nasıl silinir", intent="coding_python") is None
+        
+        global_cache = self.make_cache(semantic_scope="global")
+        global_cache.put("liste nasıl oluşturulur", "my_list = []", {}, "python_coder", 0.9,
+                         intent="coding_python")
+        assert global_cache.get("oluşturulur nasıl liste", intent="math") is not None
+        
+    def test_numbers_must_match(self):
+        """Same wording with different numbers is not a hit"""
+        cache = self.make_cache(semantic_threshold=0.5)
+        cache.put("12 ile 7 toplamı kaç", "19", {}, "math_expert", 0.9, intent="math")
+        
+        assert cache.get("toplamı kaç 12 ile 8", intent="math") is None
+        assert cache.get("toplamı kaç 12 ile 7", intent="math").response == "19"
+        
+    def test_eviction_frees_slots(self):
+        """Evicted entries must not be served from the matrix"""
+        cache = ContextCache(max_size=3, embedding_service=BagOfWordsEncoder())
+        for i in range(6):
+            cache.put(f"soru numara{i} hakkında", f"cevap {i}", {}, "tr_chat", 0.9)
+        
+        assert len(cache.cache) == 3
+        assert cache.get("hakkında numara0 soru") is None
+        assert cache.get("hakkında numara5 soru").response == "cevap 5"
+        
+    def test_trainer_semantic_hit(self):
+        """TestTimeTrainer serves paraphrased queries from cache"""
+        config = TTTConfig(semantic_cache=True)
+        trainer = TestTimeTrainer(config, embedding_service=BagOfWordsEncoder())
+        trainer.post_process("Ankara nerede", "Ankara İç Anadolu'dadır.", "history", "history_expert")
+        
+        result = trainer.adapt("nerede Ankara?", "history", "history_expert")
+        
+        assert result["cached_response"] == "Ankara İç Anadolu'dadır."
+        assert trainer.cache.get_stats()["semantic_hits"] == 1
+
+
+# ============================================================
+# Persistent Cache Tests
+# ============================================================
+
+class TestPersistentCache:
+    """SQLite-backed ContextCache Tests"""
+    
+    def make_cache(self, path, **kwargs):
+        from ttt.cache_store import SQLiteCacheStore
+        return ContextCache(max_size=10, store=SQLiteCacheStore(str(path)), **kwargs)
+    
+    def test_warm_load_after_restart(self, tmp_path):
+        """A new cache on the same file starts warm"""
+        db = tmp_path / "ttt_cache.db"
+        first = self.make_cache(db)
+        first.put("Merhaba", "Selam!", {"k": [1]}, "tr_chat", 0.9, intent="greeting")
+        first.get("Merhaba")
+        first.store.close()
+        
+        second = self.make_cache(db)
+        entry = second.get("Merhaba")
+        
+        assert entry.response == "Selam!"
+        assert entry.context == {"k": [1]}
+        assert entry.intent == "greeting"
+        assert entry.hit_count == 2
+        
+    def test_shared_between_caches(self, tmp_path):
+        """Entries written by another process are read through the store"""
+        db = tmp_path / "ttt_cache.db"
+        writer = self.make_cache(db)
+        reader = self.make_cache(db)
+        
+        writer.put("Ankara nerede", "İç Anadolu'da.", {}, "history_expert", 0.9)
+        
+        assert len(reader.cache) == 0
+        assert reader.get("Ankara nerede").response == "İç Anadolu'da."
+        assert reader.store.get_stats()["entries"] == 1
+        
+    def test_expired_rows_not_loaded(self, tmp_path):
+        """Rows older than the TTL are dropped at startup"""
+        db = tmp_path / "ttt_cache.db"
+        cache = self.make_cache(db)
+        cache.put("Eski soru", "Eski cevap", {}, "tr_chat", 0.9)
+        conn = cache.store._conn()
+        with conn:
+            conn.execute("UPDATE ttt_cache SET created_at = created_at - 7200")
+        
+        restarted = self.make_cache(db)
+        
+        assert restarted.get("Eski soru") is None
+        assert restarted.store.count() == 0
+        
+    def test_store_capacity(self, tmp_path):
+        """Store keeps only the most recently used max_entries rows"""
+        from ttt.cache_store import SQLiteCacheStore
+        store = SQLiteCacheStore(str(tmp_path / "ttt_cache.db"), max_entries=5, evict_every=1)
+        cache = ContextCache(max_size=3, store=store)
+        
+        for i in range(8):
+            cache.put(f"Soru {i}", f"Cevap {i}", {}, "tr_chat", 0.9)
+        
+        assert store.count() == 5
+        assert len(cache.cache) == 3
+        # Evicted from memory but still served from the store
+        assert cache.get("Soru 4").response == "Cevap 4"
+        
+    def test_semantic_warm_load_reuses_embeddings(self, tmp_path):
+        """Stored vectors are reused instead of re-encoding"""
+        db = tmp_path / "ttt_cache.db"
+        self.make_cache(db, embedding_service=BagOfWordsEncoder()).put(
+            "liste nasıl oluşturulur", "my_list = []", {}, "python_coder", 0.9, intent="coding_python"
+        )
+        
+        class CountingEncoder(BagOfWordsEncoder):
+            calls = 0
+            
+            def encode(self, text):
+                CountingEncoder.calls += 1
+                return super().encode(text)
+        
+        restarted = self.make_cache(db, embedding_service=CountingEncoder())
+        
+        assert CountingEncoder.calls == 0
+        assert restarted.get("oluşturulur nasıl liste", intent="coding_python").response == "my_list = []"
+        
+    def test_vectors_from_other_encoder_reencoded(self, tmp_path):
+        """Rows written with a different encoder (dimension) are re-encoded, not reused"""
+        db = tmp_path / "ttt_cache.db"
+        
+        class SmallEncoder(BagOfWordsEncoder):
+            dim = 4
+        
+        self.make_cache(db, embedding_service=SmallEncoder()).put(
+            "liste nasıl oluşturulur", "my_list = []", {}, "python_coder", 0.9, intent="coding_python"
+        )
+        restarted = self.make_cache(db, embedding_service=BagOfWordsEncoder())
+        
+        assert restarted._matrix.shape == (10, BagOfWordsEncoder.dim)
+        assert restarted.get("oluşturulur nasıl liste", intent="coding_python").response == "my_list = []"
+        assert restarted.get("tamamen farklı soru", intent="coding_python") is None
+        
+    def test_legacy_rows_without_encoder_id(self, tmp_path):
+        """Rows from the old schema keep working; their vectors are not trusted"""
+        db = tmp_path / "ttt_cache.db"
+        cache = self.make_cache(db, embedding_service=BagOfWordsEncoder())
+        cache.put("Merhaba dünya", "Selam!", {}, "tr_chat", 0.9, intent="greeting")
+        conn = cache.store._conn()
+        with conn:
+            conn.execute("UPDATE ttt_cache SET embedding = ?, embedding_model = NULL",
+                         (np.ones(4, dtype=np.float32).tobytes(),))
+        
+        restarted = self.make_cache(db, embedding_service=BagOfWordsEncoder())
+        
+        assert restarted.get("dünya merhaba", intent="greeting").response == "Selam!"
+
+
 # ============================================================
 # Performance Tests
 # ============================================================
@@ -819,6 +1294,23 @@ class TestTTTPerformance:
         
         assert elapsed < 0.1  # Should be under 100ms
         
+    def test_large_cache_performance(self):
+        """Tens of thousands of entries stay fast to fill and query"""
+        cache = ContextCache(max_size=20000)
+        
+        import time
+        start = time.time()
+        
+        for i in range(25000):
+            cache.put(f"Query {i}", f"Response {i}", {}, "tr_chat", 0.9)
+        for i in range(5000, 10000):
+            cache.get(f"Query {i}")
+        
+        elapsed = time.time() - start
+        
+        assert len(cache.cache) == 20000
+        assert elapsed < 2.0
+        
     def test_similar_search_performance(self):
         """Test similar query search performance"""
         cache = ContextCache(max_size=100)
@@ -415,5 +415,245 @@ class TestFeedbackDatabase:
             assert len(feedback_id) > 0
 
 
+class TestInferenceWorker:
+    """Test the off-loop inference worker."""
+    
+    def test_event_loop_stays_responsive(self):
+        """A blocking job must not freeze other coroutines."""
+        import asyncio
+        import time
+        from src.web.worker import InferenceWorker
+        
+        worker = InferenceWorker()
+        ticks = []
+        
+        async def ticker():
+            for _ in range(5):
+                ticks.append(time.monotonic())
+                await asyncio.sleep(0.01)
+        
+        async def main():
+            result, _ = await asyncio.gather(worker.run(time.sleep, 0.2), ticker())
+            return result
+        
+        asyncio.run(main())
+        worker.shutdown()
+        
+        assert len(ticks) == 5
+        assert ticks[-1] - ticks[0] < 0.2
+    
+    def test_queue_depth_rejects(self):
+        """Jobs beyond the queue depth should raise QueueFullError."""
+        import asyncio
+        import threading
+        from src.web.worker import InferenceWorker, QueueFullError
+        
+        worker = InferenceWorker(max_concurrency=1, max_queue_depth=1)
+        release = threading.Event()
+        
+        async def main():
+            running = asyncio.ensure_future(worker.run(release.wait))
+            while worker.get_stats()["running"] == 0:
+                await asyncio.sleep(0.01)
+            waiting = asyncio.ensure_future(worker.run(lambda: "queued"))
+            await asyncio.sleep(0)
+            with pytest.raises(QueueFullError):
+                await worker.run(lambda: "rejected")
+            release.set()
+            return await asyncio.gather(running, waiting)
+        
+        results = asyncio.run(main())
+        worker.shutdown()
+        
+        assert results[1] == "queued"
+        assert worker.get_stats()["rejected"] == 1
+    
+    def test_stream_and_cancel(self):
+        """Streaming delivers chunks; cancel stops the generator."""
+        import asyncio
+        import time
+        from src.web.worker import InferenceWorker
+        
+        worker = InferenceWorker()
+        produced = []
+        
+        def generate(n):
+            for i in range(n):
+                produced.append(i)
+                time.sleep(0.01)
+                yield {"type": "token", "text": str(i)}
+        
+        async def main():
+            full = [chunk async for chunk in worker.stream(generate, 3)]
+            handle = worker.stream(generate, 1000)
+            received = 0
+            async for _ in handle:
+                received += 1
+                if received == 2:
+                    handle.cancel()
+            return full
+        
+        full = asyncio.run(main())
+        worker.shutdown()
+        
+        assert [c["text"] for c in full] == ["0", "1", "2"]
+        assert len(produced) < 100
+        assert worker.get_stats()["cancelled"] == 1
+    
+    def test_chat_returns_429_when_queue_full(self, monkeypatch):
+        """/chat should answer 429 under back-pressure."""
+        import importlib
+        from fastapi.testclient import TestClient
+        from src.web.worker import InferenceWorker
+        
+        # src.web re-exports the FastAPI instance as "app", so import the module by name
+        app_module = importlib.import_module("src.web.app")
+        
+        async def no_warm(text):
+            return None
+        
+        monkeypatch.setattr(app_module.state, "orchestrator", object())
+        monkeypatch.setattr(app_module.state, "model_loaded", True)
+        monkeypatch.setattr(app_module.state, "worker", InferenceWorker(max_queue_depth=0))
+        monkeypatch.setattr(app_module, "warm_embedding", no_warm)
+        
+        client = TestClient(app_module.app)
+        response = client.post("/chat", json={"message": "merhaba"})
+        
+        assert response.status_code == 429
+
+
+
+class TestSessionStore:
+    """Per-client session store tests."""
+    
+    def test_sessions_are_isolated(self):
+        """Each session id gets its own buffer and turn history."""
+        from src.web.sessions import SessionStore
+        
+        store = SessionStore()
+        a = store.get_or_create("client-a")
+        b = store.get_or_create("client-b")
+        a.buffer.add_user_message("Benim adım Kaan")
+        
+        assert store.get_or_create("client-a") is a
+        assert a.buffer.message_count == 1
+        assert b.buffer.message_count == 0
+    
+    def test_invalid_session_id_rejected(self):
+        """Ids that aren't file-name safe are rejected."""
+        from src.web.sessions import SessionStore, is_valid_session_id
+        
+        assert not is_valid_session_id("../../etc/passwd")
+        assert not is_valid_session_id("")
+        with pytest.raises(ValueError):
+            SessionStore().get_or_create("a/b")
+    
+    def test_idle_sessions_evicted(self):
+        """sweep() drops sessions idle for longer than the timeout."""
+        import time
+        from src.web.sessions import SessionStore
+        
+        evicted = []
+        store = SessionStore(idle_timeout=0.05, on_evict=evicted.append)
+        store.get_or_create("old")
+        time.sleep(0.1)
+        store.get_or_create("fresh")
+        
+        assert store.sweep() == 1
+        assert "old" not in store
+        assert "fresh" in store
+        assert evicted == ["old"]
+        assert store.get_stats()["evicted_idle"] == 1
+    
+    def test_capacity_evicts_least_recently_used(self):
+        """Beyond max_sessions the least recently used session goes."""
+        from src.web.sessions import SessionStore
+        
+        store = SessionStore(max_sessions=2)
+        store.get_or_create("s1")
+        store.get_or_create("s2")
+        store.get_or_create("s1")  # s2 is now the oldest
+        store.get_or_create("s3")
+        
+        assert len(store) == 2
+        assert "s1" in store and "s3" in store
+        assert store.get_stats()["evicted_capacity"] == 1
+    
+    def test_spill_and_restore(self, tmp_path):
+        """Evicted sessions are written to disk and restored on next use."""
+        from src.web.sessions import SessionStore
+        
+        store = SessionStore(max_sessions=1, spill_dir=str(tmp_path))
+        session = store.get_or_create("spilled")
+        session.buffer.add_user_message("Merhaba")
+        session.buffer.add_assistant_message("Selam!")
+        session.turns.append({"user_message": "Merhaba", "assistant_response": "Selam!"})
+        
+        store.get_or_create("other")
+        assert (tmp_path / "spilled.json").exists()
+        
+        restored = store.get_or_create("spilled")
+        assert restored is not session
+        assert [m.content for m in restored.buffer.get_messages()] == ["Merhaba", "Selam!"]
+        assert restored.turns[0]["assistant_response"] == "Selam!"
+        assert not (tmp_path / "spilled.json").exists()
+        assert store.get_stats()["restored"] == 1
+    
+    def test_read_only_lookup(self, tmp_path):
+        """get() never creates sessions; restore=True only reloads spilled ones."""
+        from src.web.sessions import SessionStore
+        
+        store = SessionStore(max_sessions=1, spill_dir=str(tmp_path))
+        store.get_or_create("real").buffer.add_user_message("Merhaba")
+        store.get_or_create("other")
+        
+        assert store.get("random-id", restore=True) is None
+        assert "other" in store
+        assert list(tmp_path.iterdir()) == [tmp_path / "real.json"]
+        assert store.get("real", restore=True).buffer.message_count == 1
+    
+    def test_chat_uses_caller_session(self, monkeypatch):
+        """/chat passes the caller's session to the orchestrator and echoes its id."""
+        import importlib
+        from fastapi.testclient import TestClient
+        from src.web.sessions import SessionStore
+        
+        app_module = importlib.import_module("src.web.app")
+        
+        class FakeTurn:
+            intent = "general_chat"
+            adapter_used = None
+            confidence = 1.0
+            tokens_generated = 1
+        
+        class FakeOrchestrator:
+            def chat(self, message, force_adapter=None, session=None):
+                session.buffer.add_user_message(message)
+                session.turns.append(FakeTurn())
+                return f"{session.session_id}:{len(session.turns)}"
+        
+        async def no_warm(text):
+            return None
+        
+        monkeypatch.setattr(app_module.state, "orchestrator", FakeOrchestrator())
+        monkeypatch.setattr(app_module.state, "model_loaded", True)
+        monkeypatch.setattr(app_module.state, "sessions", SessionStore())
+        monkeypatch.setattr(app_module, "warm_embedding", no_warm)
+        
+        client = TestClient(app_module.app)
+        first = client.post("/chat", json={"message": "a"}, headers={"X-Session-ID": "alice"})
+        second = client.post("/chat", json={"message": "b"}, headers={"X-Session-ID": "alice"})
+        other = client.post("/chat", json={"message": "c"}, headers={"X-Session-ID": "bob"})
+        client.cookies.clear()
+        anonymous = client.post("/chat", json={"message": "d"})
+        
+        assert first.json()["response"] == "alice:1"
+        assert second.json()["response"] == "alice:2"
+        assert other.json()["response"] == "bob:1"
+        assert anonymous.headers["X-Session-ID"] not in ("alice", "bob")
+        assert anonymous.json()["session_id"] == anonymous.headers["X-Session-ID"]
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])